@@ -1,5 +1,6 @@
 from django.apps import AppConfig
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -8,6 +9,8 @@ class KnowledgeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'knowledge'
     verbose_name = '知识库管理'
+    # 启动 Web 服务的命令（sys.argv[0]）
+    SERVER_COMMANDS = ('uvicorn', 'gunicorn', 'daphne')
 
     def ready(self):
         """应用启动时的初始化"""
@@ -17,6 +20,12 @@ class KnowledgeConfig(AppConfig):
         
         # 注册信号处理器
         import knowledge.signals  # noqa
+        # 注册 Celery worker 启动时的模型预热
+        from .model_warmup import ModelWarmup
+
+        # Web 服务进程在接收请求前后台加载 BM25 / 本地嵌入模型
+        if 'runserver' in sys.argv or os.path.basename(sys.argv[0]) in self.SERVER_COMMANDS:
+            ModelWarmup.preload_in_background()
 
         # 只有在运行服务器时才执行预热，避免在迁移等命令中执行
         if 'runserver' in sys.argv:
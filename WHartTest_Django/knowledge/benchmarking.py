@@ -0,0 +1,400 @@
+"""
+知识库入库与检索基准测试
+生成可配置规模和中英文比例的合成语料，用确定性的哈希嵌入模型和 BM25 编码器代替真实模型，
+在 Qdrant 本地模式（内存或本地目录）中执行 VectorStoreManager 的入库和 similarity_search，
+测量的是 WHartTest 自身的分块、编码调度、写入和检索开销，不受嵌入服务和网络影响：
+
+- 入库：分块/秒，以及稠密嵌入、稀疏编码、Qdrant 写入和其余开销（分块、保存分块记录）的耗时拆分
+- 检索：p50/p95/p99 延迟（dense / hybrid 客户端融合 / hybrid_server 服务端融合）
+- 进程峰值常驻内存
+
+基准数据（项目、知识库、文档、分块记录）在事务中创建，结束后回滚，不会留在数据库中。
+报告为 JSON 结构，可保存后用于不同提交之间的对比（见 compare_reports）
+"""
+import hashlib
+import logging
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from langchain.embeddings.base import Embeddings
+from langchain_core.documents import Document as LangChainDocument
+from qdrant_client import QdrantClient
+
+from projects.models import Project
+from .models import Document, KnowledgeBase, KnowledgeGlobalConfig
+from .services import VectorStoreManager
+
+logger = logging.getLogger(__name__)
+
+MODES = ('dense', 'hybrid', 'hybrid_server')
+
+# 英文按单词、中文按单字切分，稠密嵌入和 BM25 编码共用
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9]+|[\u4e00-\u9fff]')
+
+EN_WORDS = (
+    'test case requirement login user password order payment invoice report module interface '
+    'response request status error timeout retry validation boundary field input output page '
+    'button form submit cancel search filter export import upload download permission role '
+    'admin account session token cache database query index transaction rollback commit '
+    'deploy release version build pipeline regression smoke performance load stress latency '
+    'throughput concurrency lock queue message event notification email mobile browser api '
+    'endpoint parameter header payload schema json xml csv encoding locale currency discount '
+    'coupon cart checkout shipping address inventory product catalog price tax refund audit'
+).split()
+
+ZH_WORDS = (
+    '测试 用例 需求 登录 用户 密码 订单 支付 发票 报表 模块 接口 响应 请求 状态 错误 超时 重试 校验 边界 '
+    '字段 输入 输出 页面 按钮 表单 提交 取消 搜索 筛选 导出 导入 上传 下载 权限 角色 管理员 账号 会话 令牌 '
+    '缓存 数据库 查询 索引 事务 回滚 部署 发布 版本 构建 流水线 回归 冒烟 性能 负载 压力 延迟 吞吐量 并发 '
+    '队列 消息 事件 通知 邮件 移动端 浏览器 参数 格式 编码 货币 折扣 优惠券 购物车 结算 配送 地址 库存 商品'
+).split()
+
+
+@dataclass
+class SyntheticCorpus:
+    """合成语料：文档列表（标题, 段落列表）和从语料中抽取的查询"""
+    documents: List[Tuple[str, List[str]]]
+    queries: List[str]
+
+    @property
+    def characters(self) -> int:
+        return sum(len(paragraph) for _, paragraphs in self.documents for paragraph in paragraphs)
+
+
+def _sentence(rng: random.Random, chinese: bool) -> str:
+    if chinese:
+        return ''.join(rng.choice(ZH_WORDS) for _ in range(rng.randint(6, 14))) + '。'
+    words = [rng.choice(EN_WORDS) for _ in range(rng.randint(8, 18))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def generate_corpus(documents: int = 20, paragraphs: int = 10, zh_ratio: float = 0.5,
+                    queries: int = 50, seed: int = 42) -> SyntheticCorpus:
+    """
+    生成合成语料，相同参数生成的语料完全相同
+    每个段落以 zh_ratio 的概率为中文，否则为英文；查询为随机抽取的语料句子
+    """
+    rng = random.Random(seed)
+    corpus_documents = []
+    sentences = []
+    for doc_index in range(documents):
+        doc_paragraphs = []
+        for _ in range(paragraphs):
+            chinese = rng.random() < zh_ratio
+            paragraph_sentences = [_sentence(rng, chinese) for _ in range(rng.randint(3, 8))]
+            sentences.extend(paragraph_sentences)
+            doc_paragraphs.append(('' if chinese else ' ').join(paragraph_sentences))
+        corpus_documents.append((f'synthetic-{doc_index:05d}', doc_paragraphs))
+
+    picks = [rng.choice(sentences) for _ in range(queries)] if sentences else []
+    return SyntheticCorpus(documents=corpus_documents, queries=picks)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'big')
+
+
+class HashEmbeddings(Embeddings):
+    """
+    确定性的假嵌入模型：文本向量为各个词的随机向量之和（按词哈希生成）再归一化，
+    词重合度高的文本余弦相似度也高，检索结果和分数分布接近真实模型
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self._token_vectors: Dict[str, np.ndarray] = {}
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            vector = np.random.default_rng(_token_hash(token)).standard_normal(self.dimension).astype(np.float32)
+            self._token_vectors[token] = vector
+        return vector
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            vector += self._token_vector(token)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+@dataclass
+class HashSparseVector:
+    """与 FastEmbed SparseEmbedding 相同结构的稀疏向量（indices / values 为 numpy 数组）"""
+    indices: np.ndarray
+    values: np.ndarray
+
+
+class HashSparseEncoder:
+    """确定性的假 BM25 编码器：词哈希作为维度，文档按词频饱和加权，查询各词权重为 1"""
+
+    VOCAB_SIZE = 1 << 20
+    K1 = 1.2
+
+    def _encode(self, text: str, query: bool) -> HashSparseVector:
+        counts: Dict[int, int] = {}
+        for token in tokenize(text):
+            index = _token_hash(token) % self.VOCAB_SIZE
+            counts[index] = counts.get(index, 0) + 1
+        indices = np.array(sorted(counts), dtype=np.int64)
+        if query:
+            values = np.ones(len(indices), dtype=np.float32)
+        else:
+            tf = np.array([counts[index] for index in indices], dtype=np.float32)
+            values = tf * (self.K1 + 1) / (tf + self.K1)
+        return HashSparseVector(indices=indices, values=values)
+
+    def encode_query(self, text: str) -> HashSparseVector:
+        return self._encode(text, query=True)
+
+    def encode_documents(self, texts: List[str]) -> List[HashSparseVector]:
+        return [self._encode(text, query=False) for text in texts]
+
+
+class _Timings:
+    """按名称累计耗时"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+        return timed
+
+    def get(self, name: str) -> float:
+        return self.seconds.get(name, 0.0)
+
+
+class _TimedClient:
+    """包装 Qdrant 客户端，统计写入耗时"""
+
+    def __init__(self, client: QdrantClient, timings: _Timings):
+        self._client = client
+        self.upsert = timings.wrap('upsert', client.upsert)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class BenchmarkVectorStoreManager(VectorStoreManager):
+    """使用指定嵌入模型、稀疏编码器和 Qdrant 客户端的向量存储管理器，不读取全局嵌入配置"""
+
+    def __init__(self, knowledge_base: KnowledgeBase, embeddings: Embeddings,
+                 sparse_encoder, client: QdrantClient):
+        self._benchmark_embeddings = embeddings
+        self._benchmark_sparse_encoder = sparse_encoder
+        super().__init__(knowledge_base)
+        self._qdrant_client = client
+
+    @classmethod
+    def _get_global_config(cls):
+        # 未保存的配置：维度校验结果只记录在对象上，不会写入全局配置
+        return KnowledgeGlobalConfig(embedding_service='custom', model_name='benchmark-hash-embeddings')
+
+    def _get_embeddings_instance(self):
+        return self._benchmark_embeddings
+
+    def _get_sparse_encoder(self):
+        return self._benchmark_sparse_encoder
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序数据的分位数（最近秩法）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(np.ceil(q / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存(MB)，不支持的平台返回 0"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def open_qdrant_client(path: Optional[str] = None) -> QdrantClient:
+    """Qdrant 本地模式客户端：指定目录时数据写入该目录，否则在内存中"""
+    return QdrantClient(path=path) if path else QdrantClient(':memory:')
+
+
+def _run_mode(mode: str, corpus: SyntheticCorpus, project: Project, client: QdrantClient,
+              dimension: int, chunk_size: int, chunk_overlap: int, top_k: int,
+              score_threshold: float) -> Dict[str, Any]:
+    """在新的知识库中入库整个语料并执行全部查询"""
+    knowledge_base = KnowledgeBase.objects.create(
+        name=f'benchmark-{mode}', project=project, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+        fusion_mode='server' if mode == 'hybrid_server' else 'client',
+    )
+    timings = _Timings()
+    embeddings = HashEmbeddings(dimension)
+    sparse_encoder = HashSparseEncoder() if mode != 'dense' else None
+    if sparse_encoder is not None:
+        sparse_encoder.encode_documents = timings.wrap('sparse_encode', sparse_encoder.encode_documents)
+
+    manager = BenchmarkVectorStoreManager(knowledge_base, embeddings, sparse_encoder, client)
+    manager._embed_documents = timings.wrap('dense_embed', manager._embed_documents)
+    try:
+        _ = manager.vector_store
+        manager._qdrant_client = _TimedClient(client, timings)
+        start = time.perf_counter()
+        chunks = 0
+        for title, paragraphs in corpus.documents:
+            document = Document.objects.create(
+                knowledge_base=knowledge_base, title=title, document_type='txt', status='processing',
+            )
+            pages = [LangChainDocument(page_content='\n\n'.join(paragraphs), metadata={'source': title})]
+            chunks += manager.add_documents(pages, document)
+        ingest_seconds = time.perf_counter() - start
+
+        latencies = []
+        results = 0
+        for query in corpus.queries:
+            start = time.perf_counter()
+            results += len(manager.similarity_search(query, k=top_k, score_threshold=score_threshold))
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        VectorStoreManager._vector_store_cache.pop(str(knowledge_base.id), None)
+        collection_name = manager._get_collection_name()
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+
+    latencies.sort()
+    encode_seconds = timings.get('dense_embed') + timings.get('sparse_encode')
+    return {
+        'mode': mode,
+        'ingest': {
+            'chunks': chunks,
+            'seconds': round(ingest_seconds, 4),
+            'chunks_per_second': round(chunks / ingest_seconds, 1) if ingest_seconds else 0.0,
+            'dense_embed_seconds': round(timings.get('dense_embed'), 4),
+            'sparse_encode_seconds': round(timings.get('sparse_encode'), 4),
+            'upsert_seconds': round(timings.get('upsert'), 4),
+            # 分块、构建 PointStruct、保存分块记录和检查点
+            'other_seconds': round(max(0.0, ingest_seconds - encode_seconds - timings.get('upsert')), 4),
+        },
+        'query': {
+            'queries': len(latencies),
+            'avg_results': round(results / len(latencies), 2) if latencies else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+        },
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_benchmark(documents: int = 20, paragraphs: int = 10, zh_ratio: float = 0.5, queries: int = 50,
+                  modes=MODES, dimension: int = 384, chunk_size: int = 500, chunk_overlap: int = 50,
+                  top_k: int = 5, score_threshold: float = 0.0, qdrant_path: Optional[str] = None,
+                  seed: int = 42) -> Dict[str, Any]:
+    """
+    执行基准测试并返回报告
+    嵌入缓存和查询向量缓存在测试期间关闭，每次入库和查询都实际计算
+    """
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        raise ValueError(f"不支持的检索模式: {', '.join(sorted(unknown))}")
+
+    corpus = generate_corpus(documents, paragraphs, zh_ratio, queries, seed)
+    report = {
+        'created_at': timezone.now().isoformat(),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'qdrant': 'path' if qdrant_path else 'memory',
+        'params': {
+            'documents': documents, 'paragraphs': paragraphs, 'zh_ratio': zh_ratio, 'queries': queries,
+            'dimension': dimension, 'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap,
+            'top_k': top_k, 'score_threshold': score_threshold, 'seed': seed,
+        },
+        'corpus_characters': corpus.characters,
+        'runs': [],
+    }
+
+    client = open_qdrant_client(qdrant_path)
+    try:
+        with override_settings(KNOWLEDGE_EMBEDDING_CACHE_BACKEND='none', KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES=0), \
+                transaction.atomic():
+            project = Project.objects.create(name=f'benchmark-{uuid.uuid4().hex[:12]}')
+            for mode in modes:
+                logger.info(f"⏱️ 基准测试: {mode}")
+                report['runs'].append(_run_mode(
+                    mode, corpus, project, client, dimension, chunk_size, chunk_overlap, top_k, score_threshold,
+                ))
+            # 基准数据不保留
+            transaction.set_rollback(True)
+    finally:
+        client.close()
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """按模式对比两次报告的入库吞吐量和检索延迟，返回相对变化（正数表示变好）"""
+    baseline_runs = {run['mode']: run for run in baseline.get('runs', [])}
+    rows = []
+    for run in current.get('runs', []):
+        previous = baseline_runs.get(run['mode'])
+        if previous is None:
+            continue
+
+        def change(old, new, higher_is_better):
+            if not old:
+                return None
+            delta = (new - old) / old
+            return round(delta if higher_is_better else -delta, 4)
+
+        rows.append({
+            'mode': run['mode'],
+            'chunks_per_second': change(
+                previous['ingest']['chunks_per_second'], run['ingest']['chunks_per_second'], True
+            ),
+            'p50_ms': change(previous['query']['p50_ms'], run['query']['p50_ms'], False),
+            'p95_ms': change(previous['query']['p95_ms'], run['query']['p95_ms'], False),
+            'p99_ms': change(previous['query']['p99_ms'], run['query']['p99_ms'], False),
+        })
+    return rows
@@ -0,0 +1,312 @@
+"""
+嵌入向量缓存
+按 (嵌入模型, 分块文本哈希) 缓存稠密向量，重新处理或重复上传文档时
+未变化的分块直接复用缓存向量，只对新内容调用嵌入服务
+
+支持两种存储：
+- db:   Django 数据库（EmbeddingCacheEntry 表）
+- disk: 本地 SQLite 文件（不占用业务数据库）
+"""
+import array
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """计算分块文本哈希（与 DocumentChunk.embedding_hash 保持一致）"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def pack_vector(vector: List[float]) -> bytes:
+    """将向量压缩为 float32 二进制"""
+    return array.array('f', vector).tobytes()
+
+
+def unpack_vector(data: bytes) -> List[float]:
+    """从 float32 二进制还原向量"""
+    values = array.array('f')
+    values.frombytes(bytes(data))
+    return values.tolist()
+
+
+class DatabaseEmbeddingCacheBackend:
+    """基于 Django 数据库的缓存存储"""
+
+    name = 'db'
+
+    def get_many(self, model_key: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        from .models import EmbeddingCacheEntry
+
+        hashes = list(hashes)
+        if not hashes:
+            return {}
+        rows = EmbeddingCacheEntry.objects.filter(
+            model_key=model_key, content_hash__in=hashes
+        ).values_list('content_hash', 'vector')
+        found = {content: unpack_vector(vector) for content, vector in rows}
+        if found:
+            EmbeddingCacheEntry.objects.filter(
+                model_key=model_key, content_hash__in=list(found)
+            ).update(last_used_at=timezone.now())
+        return found
+
+    def set_many(self, model_key: str, items: Dict[str, List[float]]):
+        from .models import EmbeddingCacheEntry
+
+        entries = [
+            EmbeddingCacheEntry(
+                model_key=model_key,
+                content_hash=content,
+                vector=pack_vector(vector),
+                dimension=len(vector),
+            )
+            for content, vector in items.items()
+        ]
+        EmbeddingCacheEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+    def count(self) -> int:
+        from .models import EmbeddingCacheEntry
+
+        return EmbeddingCacheEntry.objects.count()
+
+    def evict(self, max_entries: int) -> int:
+        """按最后使用时间淘汰超出容量的条目"""
+        from .models import EmbeddingCacheEntry
+
+        excess = self.count() - max_entries
+        if excess <= 0:
+            return 0
+        stale_ids = list(
+            EmbeddingCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:excess]
+        )
+        deleted, _ = EmbeddingCacheEntry.objects.filter(pk__in=stale_ids).delete()
+        return deleted
+
+    def invalidate(self, keep_model_key: Optional[str] = None) -> int:
+        from .models import EmbeddingCacheEntry
+
+        queryset = EmbeddingCacheEntry.objects.all()
+        if keep_model_key:
+            queryset = queryset.exclude(model_key=keep_model_key)
+        deleted, _ = queryset.delete()
+        return deleted
+
+
+class DiskEmbeddingCacheBackend:
+    """基于本地 SQLite 文件的缓存存储"""
+
+    name = 'disk'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS embedding_cache ('
+                ' model_key TEXT NOT NULL,'
+                ' content_hash TEXT NOT NULL,'
+                ' vector BLOB NOT NULL,'
+                ' last_used REAL NOT NULL,'
+                ' PRIMARY KEY (model_key, content_hash))'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache (last_used)'
+            )
+
+    def get_many(self, model_key: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        hashes = list(hashes)
+        found = {}
+        # SQLite 默认最多 999 个绑定参数，分批查询
+        with self._lock, self._conn:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f'SELECT content_hash, vector FROM embedding_cache '
+                    f'WHERE model_key = ? AND content_hash IN ({placeholders})',
+                    [model_key, *batch]
+                ).fetchall()
+                found.update({content: unpack_vector(vector) for content, vector in rows})
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    'UPDATE embedding_cache SET last_used = ? WHERE model_key = ? AND content_hash = ?',
+                    [(now, model_key, content) for content in found]
+                )
+        return found
+
+    def set_many(self, model_key: str, items: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embedding_cache (model_key, content_hash, vector, last_used) '
+                'VALUES (?, ?, ?, ?)',
+                [(model_key, content, pack_vector(vector), now) for content, vector in items.items()]
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+
+    def evict(self, max_entries: int) -> int:
+        excess = self.count() - max_entries
+        if excess <= 0:
+            return 0
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'DELETE FROM embedding_cache WHERE rowid IN ('
+                ' SELECT rowid FROM embedding_cache ORDER BY last_used LIMIT ?)',
+                (excess,)
+            )
+        return cursor.rowcount
+
+    def invalidate(self, keep_model_key: Optional[str] = None) -> int:
+        with self._lock, self._conn:
+            if keep_model_key:
+                cursor = self._conn.execute(
+                    'DELETE FROM embedding_cache WHERE model_key != ?', (keep_model_key,)
+                )
+            else:
+                cursor = self._conn.execute('DELETE FROM embedding_cache')
+        return cursor.rowcount
+
+
+class EmbeddingCache:
+    """嵌入向量缓存（带命中统计和容量淘汰）"""
+
+    _default = None
+    _default_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+
+    # 超出容量时淘汰到容量的该比例，避免每次写入都触发淘汰
+    EVICTION_LOW_WATERMARK = 0.9
+
+    def __init__(self, backend, max_entries: int = 200000):
+        self.backend = backend
+        self.max_entries = max_entries
+        # 近似条目数：首次写入时统计一次，之后按写入数量累加，超出容量时才执行淘汰
+        self._approx_entries: Optional[int] = None
+        self._count_lock = threading.Lock()
+
+    @classmethod
+    def get_default(cls) -> Optional['EmbeddingCache']:
+        """按 settings 创建进程级缓存实例，禁用时返回 None"""
+        backend_name = getattr(settings, 'KNOWLEDGE_EMBEDDING_CACHE_BACKEND', 'db')
+        if backend_name == 'none':
+            return None
+
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    max_entries = getattr(settings, 'KNOWLEDGE_EMBEDDING_CACHE_MAX_ENTRIES', 200000)
+                    if backend_name == 'disk':
+                        backend = DiskEmbeddingCacheBackend(settings.KNOWLEDGE_EMBEDDING_CACHE_PATH)
+                    else:
+                        backend = DatabaseEmbeddingCacheBackend()
+                    cls._default = cls(backend, max_entries=max_entries)
+                    logger.info(f"📦 嵌入缓存已启用: backend={backend.name}, 容量={max_entries}")
+        return cls._default
+
+    @staticmethod
+    def model_key(config) -> str:
+        """
+        缓存使用的模型标识（嵌入服务 + 模型名称 + API地址）
+        不同地址部署的同名模型可能不同，API地址取哈希以控制标识长度
+        """
+        key = f"{config.embedding_service}:{config.model_name}"
+        if getattr(config, 'api_base_url', None):
+            key += f"@{hashlib.sha1(config.api_base_url.rstrip('/').encode()).hexdigest()[:12]}"
+        return key
+
+    @classmethod
+    def _record(cls, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """获取当前进程的命中统计"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+        return stats
+
+    def embed_documents(self, model_key: str, texts: List[str],
+                        embed_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """
+        先查缓存，只对未命中的文本调用 embed_fn，结果写回缓存
+        缓存读写失败时降级为直接调用 embed_fn
+        """
+        if not texts:
+            return []
+
+        hashes = [content_hash(text) for text in texts]
+        try:
+            cached = self.backend.get_many(model_key, set(hashes))
+        except Exception as e:
+            logger.warning(f"⚠️ 读取嵌入缓存失败，跳过缓存: {e}")
+            self._record(errors=1)
+            return embed_fn(texts)
+
+        # 同一文档内重复的分块只嵌入一次
+        missing: Dict[str, str] = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+
+        hits = sum(1 for text_hash in hashes if text_hash in cached)
+        self._record(hits=hits, misses=len(texts) - hits)
+
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            cached.update(fresh)
+            try:
+                self.backend.set_many(model_key, fresh)
+                self._evict_if_needed(len(fresh))
+            except Exception as e:
+                logger.warning(f"⚠️ 写入嵌入缓存失败: {e}")
+                self._record(errors=1)
+
+        logger.info(f"📦 嵌入缓存: 命中 {hits}/{len(texts)}, 新嵌入 {len(missing)}")
+        return [cached[text_hash] for text_hash in hashes]
+
+    def _evict_if_needed(self, written: int):
+        """按近似条目数判断是否超出容量，超出时淘汰到低水位"""
+        with self._count_lock:
+            if self._approx_entries is None:
+                self._approx_entries = self.backend.count()
+            else:
+                self._approx_entries += written
+            if self._approx_entries <= self.max_entries:
+                return
+            target = int(self.max_entries * self.EVICTION_LOW_WATERMARK)
+            evicted = self.backend.evict(target)
+            # 有淘汰时剩余条目数即为 target；未淘汰说明近似值偏大（重复写入），下次写入时重新统计
+            self._approx_entries = target if evicted else None
+        if evicted:
+            self._record(evictions=evicted)
+
+    def invalidate(self, keep_model_key: Optional[str] = None) -> int:
+        """清理缓存；指定 keep_model_key 时只保留该模型的条目"""
+        with self._count_lock:
+            self._approx_entries = None
+        deleted = self.backend.invalidate(keep_model_key)
+        logger.info(f"🧹 已清理 {deleted} 条嵌入缓存")
+        return deleted
@@ -86,10 +86,8 @@ class KnowledgeRAGService:
             top_k = state.get("top_k", 5)
             similarity_threshold = state.get("similarity_threshold", 0.7)
 
-            # 执行检索
-            search_results = service.vector_manager.similarity_search(
-                state["question"], k=top_k, score_threshold=similarity_threshold
-            )
+            # 执行检索（相同查询命中检索结果缓存）
+            search_results = service.search(state["question"], top_k, similarity_threshold)
 
             retrieval_time = time.time() - start_time
 
@@ -238,15 +236,13 @@ class KnowledgeRAGService:
             return error_response
 
     def _log_query(self, state: RAGState, user):
-        """记录查询日志"""
+        """记录查询日志（缓冲后批量写入，不阻塞查询请求）"""
         try:
-            from .models import QueryLog
+            from .query_log_buffer import record_query_log
 
-            knowledge_base = KnowledgeBase.objects.get(id=state["knowledge_base_id"])
-
-            QueryLog.objects.create(
-                knowledge_base=knowledge_base,
-                user=user,
+            record_query_log(
+                knowledge_base_id=state["knowledge_base_id"],
+                user_id=user.id,
                 query=state["question"],
                 response=state["answer"],
                 retrieved_chunks=[{
@@ -511,9 +507,7 @@ def create_knowledge_tool(knowledge_base_id: str, user, similarity_threshold: fl
             service = KnowledgeBaseService(knowledge_base)
 
             # 执行检索
-            search_results = service.vector_manager.similarity_search(
-                query, k=top_k, score_threshold=similarity_threshold
-            )
+            search_results = service.search(query, top_k, similarity_threshold)
 
             if not search_results:
                 return "未找到相关信息。"
@@ -0,0 +1,46 @@
+"""
+向量存储配置迁移命令
+把知识库的量化、磁盘存储和 HNSW 配置应用到已有的 Qdrant 集合（只提交有变化的配置项），
+用于 API 更新时迁移失败后的重试，或批量迁移升级前创建的集合
+
+示例:
+    python manage.py apply_vector_storage --kb-id <uuid>
+    python manage.py apply_vector_storage
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.models import KnowledgeBase
+from knowledge.services import VectorStoreManager
+
+
+class Command(BaseCommand):
+    help = '将知识库的向量存储配置迁移到已有的 Qdrant 集合'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kb-id', type=str, help='只迁移指定知识库（默认迁移所有启用的知识库）')
+
+    def handle(self, *args, **options):
+        if options['kb_id']:
+            knowledge_bases = KnowledgeBase.objects.filter(id=options['kb_id'])
+            if not knowledge_bases.exists():
+                raise CommandError(f"知识库不存在: {options['kb_id']}")
+        else:
+            knowledge_bases = KnowledgeBase.objects.filter(is_active=True)
+
+        failed = 0
+        for knowledge_base in knowledge_bases:
+            try:
+                changes = VectorStoreManager.get_manager(knowledge_base).apply_storage_settings()
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"❌ {knowledge_base.name}: {e}")
+                continue
+            if changes is None:
+                self.stdout.write(f"  {knowledge_base.name}: 有文档正在入库，稍后重试")
+            elif changes:
+                self.stdout.write(f"✅ {knowledge_base.name}: {', '.join(changes)}")
+            else:
+                self.stdout.write(f"  {knowledge_base.name}: 无需迁移")
+
+        if failed:
+            raise CommandError(f"{failed} 个知识库迁移失败")
@@ -0,0 +1,134 @@
+"""
+混合检索基准测试命令
+对比客户端 RRF 融合（两次 search 请求）与服务端融合（Query API prefetch + Fusion.RRF）
+的检索延迟和响应数据量
+"""
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.models import KnowledgeBase
+from knowledge.services import VectorStoreManager
+
+
+class _MeasuringClient:
+    """包装 Qdrant 客户端，统计请求次数和返回的点数据量（按 JSON 序列化后的字节数估算）"""
+
+    def __init__(self, client):
+        self._client = client
+        self.requests = 0
+        self.bytes = 0
+
+    def reset(self):
+        self.requests = 0
+        self.bytes = 0
+
+    def _measure(self, points):
+        self.bytes += sum(len(point.model_dump_json()) for point in points)
+
+    def search(self, *args, **kwargs):
+        self.requests += 1
+        results = self._client.search(*args, **kwargs)
+        self._measure(results)
+        return results
+
+    def query_batch_points(self, *args, **kwargs):
+        self.requests += 1
+        responses = self._client.query_batch_points(*args, **kwargs)
+        for response in responses:
+            self._measure(response.points)
+        return responses
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class Command(BaseCommand):
+    help = '对比客户端融合与服务端融合混合检索的延迟和传输数据量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kb-id', type=str, required=True, help='要测试的知识库ID')
+        parser.add_argument(
+            '--query', action='append', dest='queries',
+            help='测试查询，可重复指定；未指定时使用知识库中前几个分块的开头作为查询'
+        )
+        parser.add_argument('--top-k', type=int, default=5, help='返回结果数量')
+        parser.add_argument('--repeat', type=int, default=10, help='每个查询重复次数')
+        parser.add_argument('--json', action='store_true', help='以 JSON 格式输出结果')
+
+    def handle(self, *args, **options):
+        try:
+            knowledge_base = KnowledgeBase.objects.get(id=options['kb_id'])
+        except KnowledgeBase.DoesNotExist:
+            raise CommandError(f"知识库不存在: {options['kb_id']}")
+
+        manager = VectorStoreManager(knowledge_base)
+        if not manager.sparse_encoder:
+            raise CommandError('BM25 稀疏编码器不可用，无法对比混合检索')
+
+        queries = options['queries'] or self._sample_queries(knowledge_base)
+        if not queries:
+            raise CommandError('知识库没有分块，请通过 --query 指定查询')
+
+        # 查询向量只计算一次，基准只比较 Qdrant 部分
+        query_vectors = [manager.encode_query(query) for query in queries]
+        client = _MeasuringClient(manager.qdrant_client)
+        manager._qdrant_client = client
+
+        report = {
+            'knowledge_base': str(knowledge_base.id),
+            'queries': len(queries),
+            'repeat': options['repeat'],
+            'top_k': options['top_k'],
+            'modes': {},
+        }
+        for mode, search in (
+            ('client', manager._hybrid_similarity_search),
+            ('server', manager._server_hybrid_similarity_search),
+        ):
+            report['modes'][mode] = self._run(
+                client, search, query_vectors, options['top_k'], options['repeat'],
+                search_filter=manager._scope_filter(None),
+            )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"知识库: {knowledge_base.name}, 查询数: {len(queries)}, 重复: {options['repeat']}")
+        for mode, stats in report['modes'].items():
+            self.stdout.write(
+                f"  {mode:<6} p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms "
+                f"请求数/次={stats['requests_per_search']:.1f} 数据量/次={stats['bytes_per_search']:.0f}B"
+            )
+
+    def _sample_queries(self, knowledge_base, limit: int = 5):
+        """从知识库分块中截取查询文本"""
+        from knowledge.models import DocumentChunk
+
+        contents = DocumentChunk.objects.filter(
+            document__knowledge_base=knowledge_base
+        ).values_list('content', flat=True)[:limit]
+        return [content[:50] for content in contents]
+
+    def _run(self, client, search, query_vectors, top_k: int, repeat: int, search_filter=None):
+        """执行检索并统计延迟分位数、请求次数和数据量"""
+        client.reset()
+        latencies = []
+        for _ in range(repeat):
+            for dense_vector, sparse_query in query_vectors:
+                start = time.perf_counter()
+                search(dense_vector, sparse_query, top_k, 0.0, search_filter)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        latencies.sort()
+        total = len(latencies)
+        return {
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(latencies[min(total - 1, int(total * 0.95))], 3),
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'requests_per_search': client.requests / total,
+            'bytes_per_search': client.bytes / total,
+        }
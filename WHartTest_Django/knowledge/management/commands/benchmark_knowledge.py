@@ -0,0 +1,112 @@
+"""
+知识库入库与检索基准测试命令
+用合成语料和确定性的假嵌入模型，在 Qdrant 本地模式中测量入库吞吐量（及嵌入 / 写入耗时拆分）、
+dense / hybrid / hybrid_server 三种检索方式的 p50/p95/p99 延迟和进程峰值内存，
+结果可保存为 JSON，与其他提交的结果对比
+
+示例:
+    python manage.py benchmark_knowledge --documents 200 --zh-ratio 0.7 --output bench.json
+    python manage.py benchmark_knowledge --mode hybrid --mode hybrid_server --qdrant-path /tmp/bench_qdrant
+    python manage.py benchmark_knowledge --baseline bench_main.json
+"""
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.benchmarking import MODES, compare_reports, run_benchmark
+
+
+class Command(BaseCommand):
+    help = '用合成语料测量知识库入库吞吐量、检索延迟和内存占用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=20, help='合成文档数量')
+        parser.add_argument('--paragraphs', type=int, default=10, help='每个文档的段落数')
+        parser.add_argument('--zh-ratio', type=float, default=0.5, help='中文段落比例（0-1）')
+        parser.add_argument('--queries', type=int, default=50, help='查询数量')
+        parser.add_argument(
+            '--mode', action='append', dest='modes', choices=MODES,
+            help=f"检索方式，可重复指定（默认 {' / '.join(MODES)}）"
+        )
+        parser.add_argument('--dim', type=int, default=384, help='假嵌入向量维度')
+        parser.add_argument('--chunk-size', type=int, default=500, help='分块大小')
+        parser.add_argument('--chunk-overlap', type=int, default=50, help='分块重叠')
+        parser.add_argument('--top-k', type=int, default=5, help='返回结果数量')
+        parser.add_argument('--score-threshold', type=float, default=0.0, help='相似度阈值')
+        parser.add_argument('--qdrant-path', type=str, help='Qdrant 本地模式数据目录（默认在内存中）')
+        parser.add_argument('--seed', type=int, default=42, help='语料随机种子')
+        parser.add_argument('--output', type=str, help='将 JSON 结果写入指定文件')
+        parser.add_argument('--baseline', type=str, help='与之前保存的 JSON 结果对比')
+        parser.add_argument('--json', action='store_true', help='以 JSON 格式输出结果')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['zh_ratio'] <= 1:
+            raise CommandError('--zh-ratio 必须在 0 到 1 之间')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"无法读取对比结果 {options['baseline']}: {e}")
+
+        # 检索过程的逐条 INFO 日志会计入延迟，默认只保留警告
+        if options['verbosity'] < 2:
+            logging.getLogger('knowledge').setLevel(logging.WARNING)
+
+        report = run_benchmark(
+            documents=options['documents'],
+            paragraphs=options['paragraphs'],
+            zh_ratio=options['zh_ratio'],
+            queries=options['queries'],
+            modes=options['modes'] or MODES,
+            dimension=options['dim'],
+            chunk_size=options['chunk_size'],
+            chunk_overlap=options['chunk_overlap'],
+            top_k=options['top_k'],
+            score_threshold=options['score_threshold'],
+            qdrant_path=options['qdrant_path'],
+            seed=options['seed'],
+        )
+        if baseline is not None:
+            report['comparison'] = {
+                'baseline_revision': baseline.get('revision'),
+                'runs': compare_reports(baseline, report),
+            }
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        params = report['params']
+        self.stdout.write(
+            f"版本: {report['revision'] or '-'}  Qdrant: {report['qdrant']}  文档: {params['documents']}  "
+            f"中文比例: {params['zh_ratio']}  维度: {params['dimension']}  查询: {params['queries']}"
+        )
+        for run in report['runs']:
+            ingest, query = run['ingest'], run['query']
+            self.stdout.write(
+                f"  {run['mode']:<14} 入库 {ingest['chunks']} 块 {ingest['chunks_per_second']} 块/s "
+                f"(嵌入 {ingest['dense_embed_seconds']}s 稀疏 {ingest['sparse_encode_seconds']}s "
+                f"写入 {ingest['upsert_seconds']}s 其他 {ingest['other_seconds']}s)  "
+                f"检索 p50={query['p50_ms']}ms p95={query['p95_ms']}ms p99={query['p99_ms']}ms"
+            )
+        self.stdout.write(f"  峰值内存: {report['peak_rss_mb']}MB")
+
+        if baseline is not None:
+            self.stdout.write(f"对比 {report['comparison']['baseline_revision'] or options['baseline']}（正数为改善）:")
+            for row in report['comparison']['runs']:
+                changes = '  '.join(
+                    f"{key}={'-' if row[key] is None else f'{row[key]:+.1%}'}"
+                    for key in ('chunks_per_second', 'p50_ms', 'p95_ms', 'p99_ms')
+                )
+                self.stdout.write(f"  {row['mode']:<14} {changes}")
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"结果已写入 {options['output']}"))
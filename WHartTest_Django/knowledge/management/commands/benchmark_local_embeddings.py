@@ -0,0 +1,103 @@
+"""
+本地嵌入模型基准测试命令
+测量 FastEmbed 本地模型的加载耗时、常驻内存和不同批大小下的吞吐量，
+用于为 embedding_service='local' 选择模型、批大小和线程数
+
+示例:
+    python manage.py benchmark_local_embeddings --model BAAI/bge-small-zh-v1.5 --threads 4 --batch-size 16 --batch-size 64
+"""
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from knowledge.services import FastEmbedEmbeddings
+
+
+def _rss_mb() -> float:
+    """当前进程常驻内存(MB)，非 Linux 系统读取不到时返回 0"""
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class Command(BaseCommand):
+    help = '测量本地 FastEmbed 嵌入模型的内存占用和吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, default=FastEmbedEmbeddings.DEFAULT_MODEL, help='FastEmbed 模型名称')
+        parser.add_argument('--threads', type=int, default=0, help='推理线程数，0 表示自动')
+        parser.add_argument(
+            '--batch-size', type=int, action='append', dest='batch_sizes',
+            help='测试的批大小，可重复指定（默认 8/32/128）'
+        )
+        parser.add_argument('--texts', type=int, default=512, help='每轮嵌入的文本数量')
+        parser.add_argument('--text-length', type=int, default=400, help='每条文本的字符数（模拟分块大小）')
+        parser.add_argument('--json', action='store_true', help='以 JSON 格式输出结果')
+
+    def handle(self, *args, **options):
+        threads = options['threads'] or None
+        batch_sizes = options['batch_sizes'] or [8, 32, 128]
+        sample = '知识库文档分块示例内容，用于测量本地嵌入模型吞吐量。Knowledge base chunk sample. '
+        texts = [
+            (f'{i} ' + sample * (options['text_length'] // len(sample) + 1))[:options['text_length']]
+            for i in range(options['texts'])
+        ]
+
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        embeddings = FastEmbedEmbeddings(model_name=options['model'], threads=threads)
+        load_seconds = time.perf_counter() - start
+        dimension = len(embeddings.embed_query('warmup'))
+        rss_loaded = _rss_mb()
+
+        report = {
+            'model': options['model'],
+            'threads': threads or 'auto',
+            'cpu_count': os.cpu_count(),
+            'dimension': dimension,
+            'load_seconds': round(load_seconds, 3),
+            'rss_before_mb': round(rss_before, 1),
+            'rss_loaded_mb': round(rss_loaded, 1),
+            'runs': [],
+        }
+
+        for batch_size in batch_sizes:
+            embeddings.batch_size = batch_size
+            start = time.perf_counter()
+            embeddings.embed_documents(texts)
+            elapsed = time.perf_counter() - start
+
+            query_start = time.perf_counter()
+            for text in texts[:32]:
+                embeddings.embed_query(text[:50])
+            query_ms = (time.perf_counter() - query_start) * 1000 / min(32, len(texts))
+
+            report['runs'].append({
+                'batch_size': batch_size,
+                'texts_per_second': round(len(texts) / elapsed, 1),
+                'query_latency_ms': round(query_ms, 2),
+                'rss_mb': round(_rss_mb(), 1),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(
+            f"模型: {report['model']}  维度: {dimension}  线程: {report['threads']}  CPU: {report['cpu_count']}"
+        )
+        self.stdout.write(
+            f"加载耗时: {report['load_seconds']}s  内存: {report['rss_before_mb']}MB -> {report['rss_loaded_mb']}MB"
+        )
+        for run in report['runs']:
+            self.stdout.write(
+                f"  batch={run['batch_size']:<4} 吞吐={run['texts_per_second']} 条/s  "
+                f"查询延迟={run['query_latency_ms']}ms  内存={run['rss_mb']}MB"
+            )
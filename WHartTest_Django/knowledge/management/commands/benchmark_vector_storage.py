@@ -0,0 +1,223 @@
+"""
+向量存储配置基准测试命令
+在临时集合中对比不同量化 / 磁盘存储 / HNSW 配置的召回率、检索延迟和内存占用估算，
+用于为知识库选择 quantization、vectors_on_disk、hnsw_m 等配置
+
+召回率以 numpy 暴力计算的余弦相似度 top_k 为基准；
+Qdrant 接口不提供单个集合的内存占用，内存按向量数、维度和配置估算
+
+示例:
+    python manage.py benchmark_vector_storage --kb-id <uuid>
+    python manage.py benchmark_vector_storage --synthetic 50000 --dim 768 --config none --config scalar --config binary,on_disk
+"""
+import json
+import statistics
+import time
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from qdrant_client import models
+
+from knowledge.models import KnowledgeBase
+from knowledge.services import VectorStoreManager
+
+DEFAULT_CONFIGS = ['none', 'scalar', 'binary', 'scalar,on_disk']
+DEFAULT_HNSW_M = 16
+
+
+def parse_config(text: str) -> SimpleNamespace:
+    """
+    解析测试配置：逗号分隔的量化方式（none/scalar/binary）和选项
+    on_disk、payload_on_disk、m=<N>、ef=<N>，例如 "scalar,on_disk,m=32"
+    """
+    config = SimpleNamespace(
+        label=text, quantization='none', vectors_on_disk=False, payload_on_disk=False,
+        hnsw_m=None, hnsw_ef_construct=None,
+    )
+    for token in filter(None, (part.strip() for part in text.split(','))):
+        if token in ('none', 'scalar', 'binary'):
+            config.quantization = token
+        elif token == 'on_disk':
+            config.vectors_on_disk = True
+        elif token == 'payload_on_disk':
+            config.payload_on_disk = True
+        elif token.startswith('m='):
+            config.hnsw_m = int(token[2:])
+        elif token.startswith('ef='):
+            config.hnsw_ef_construct = int(token[3:])
+        else:
+            raise CommandError(f"无法识别的配置项: {token}")
+    return config
+
+
+def estimate_memory(config: SimpleNamespace, count: int, dim: int) -> dict:
+    """估算集合常驻内存(MB)：原始向量（未存磁盘时）+ 量化向量 + HNSW 图链接"""
+    raw = count * dim * 4
+    quantized = {'none': 0, 'scalar': count * dim, 'binary': count * dim // 8}[config.quantization]
+    hnsw = count * (config.hnsw_m or DEFAULT_HNSW_M) * 2 * 8
+    ram = (0 if config.vectors_on_disk else raw) + quantized + hnsw
+    return {
+        'raw_vectors_mb': round(raw / 1024 ** 2, 2),
+        'quantized_vectors_mb': round(quantized / 1024 ** 2, 2),
+        'hnsw_mb': round(hnsw / 1024 ** 2, 2),
+        'estimated_ram_mb': round(ram / 1024 ** 2, 2),
+    }
+
+
+def brute_force_top_k(vectors: np.ndarray, queries: np.ndarray, top_k: int) -> list:
+    """余弦相似度暴力检索，作为召回率基准"""
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_normalized = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = query_normalized @ normalized.T
+    return [set(np.argsort(-row)[:top_k].tolist()) for row in scores]
+
+
+class Command(BaseCommand):
+    help = '对比不同向量量化 / 磁盘存储 / HNSW 配置的召回率、延迟和内存占用'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--kb-id', type=str, help='使用指定知识库集合中的稠密向量')
+        source.add_argument('--synthetic', type=int, help='使用指定数量的随机向量')
+        parser.add_argument('--dim', type=int, default=768, help='随机向量维度（配合 --synthetic）')
+        parser.add_argument('--limit', type=int, default=20000, help='从知识库读取的最大向量数')
+        parser.add_argument(
+            '--config', action='append', dest='configs',
+            help=f"测试配置，可重复指定（默认 {' / '.join(DEFAULT_CONFIGS)}）"
+        )
+        parser.add_argument('--queries', type=int, default=100, help='查询数量')
+        parser.add_argument('--top-k', type=int, default=10, help='召回率计算的 top_k')
+        parser.add_argument('--json', action='store_true', help='以 JSON 格式输出结果')
+
+    def handle(self, *args, **options):
+        configs = [parse_config(text) for text in (options['configs'] or DEFAULT_CONFIGS)]
+
+        if options['kb_id']:
+            try:
+                knowledge_base = KnowledgeBase.objects.get(id=options['kb_id'])
+            except KnowledgeBase.DoesNotExist:
+                raise CommandError(f"知识库不存在: {options['kb_id']}")
+            client = VectorStoreManager(knowledge_base).qdrant_client
+            vectors = self._load_vectors(client, f"kb_{knowledge_base.id}", options['limit'])
+            source = f"kb_{knowledge_base.id}"
+        else:
+            client = VectorStoreManager._get_shared_qdrant_client(VectorStoreManager._get_qdrant_url())
+            vectors = np.random.default_rng(42).standard_normal(
+                (options['synthetic'], options['dim'])
+            ).astype(np.float32)
+            source = 'synthetic'
+
+        if len(vectors) <= options['top_k']:
+            raise CommandError('向量数量不足，无法计算召回率')
+
+        # 查询取自数据集中的向量并加入噪声，模拟与文档相近但不完全相同的查询
+        rng = np.random.default_rng(7)
+        picks = rng.choice(len(vectors), size=min(options['queries'], len(vectors)), replace=False)
+        queries = vectors[picks] + rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32) * 0.1
+        expected = brute_force_top_k(vectors, queries, options['top_k'])
+
+        report = {
+            'source': source,
+            'vectors': len(vectors),
+            'dimension': int(vectors.shape[1]),
+            'queries': len(queries),
+            'top_k': options['top_k'],
+            'runs': [],
+        }
+        for config in configs:
+            report['runs'].append(self._run(client, config, vectors, queries, expected, options['top_k']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(
+            f"数据: {source}  向量数: {report['vectors']}  维度: {report['dimension']}  "
+            f"查询数: {report['queries']}  top_k: {report['top_k']}"
+        )
+        for run in report['runs']:
+            self.stdout.write(
+                f"  {run['config']:<22} recall@{report['top_k']}={run['recall']:.4f} "
+                f"p50={run['p50_ms']:.2f}ms p95={run['p95_ms']:.2f}ms "
+                f"内存≈{run['memory']['estimated_ram_mb']}MB 写入={run['upload_seconds']}s"
+            )
+
+    def _load_vectors(self, client, collection_name: str, limit: int) -> np.ndarray:
+        """从知识库集合中滚动读取稠密向量"""
+        if not client.collection_exists(collection_name):
+            raise CommandError(f"集合不存在: {collection_name}")
+        vectors, offset = [], None
+        while len(vectors) < limit:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=min(1000, limit - len(vectors)),
+                offset=offset,
+                with_payload=False,
+                with_vectors=[VectorStoreManager.DENSE_VECTOR_NAME],
+            )
+            vectors.extend(point.vector[VectorStoreManager.DENSE_VECTOR_NAME] for point in points)
+            if offset is None:
+                break
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _run(self, client, config, vectors: np.ndarray, queries: np.ndarray, expected: list, top_k: int) -> dict:
+        """在临时集合中写入向量并执行检索，测试结束后删除集合"""
+        collection_name = f"bench_{uuid.uuid4().hex[:12]}"
+        storage = VectorStoreManager.storage_options(config)
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(
+                size=vectors.shape[1], distance=models.Distance.COSINE, on_disk=storage['vectors_on_disk'],
+            ),
+            on_disk_payload=storage['payload_on_disk'],
+            hnsw_config=storage['hnsw_config'],
+            quantization_config=storage['quantization_config'],
+        )
+        try:
+            start = time.perf_counter()
+            for offset in range(0, len(vectors), 1000):
+                batch = vectors[offset:offset + 1000]
+                client.upsert(
+                    collection_name=collection_name,
+                    points=models.Batch(ids=list(range(offset, offset + len(batch))), vectors=batch.tolist()),
+                    wait=True,
+                )
+            self._wait_indexed(client, collection_name)
+            upload_seconds = time.perf_counter() - start
+
+            search_params = VectorStoreManager.search_params(config)
+            latencies, hits = [], 0
+            for query, truth in zip(queries, expected):
+                start = time.perf_counter()
+                results = client.search(
+                    collection_name=collection_name,
+                    query_vector=query.tolist(),
+                    search_params=search_params,
+                    limit=top_k,
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(truth & {point.id for point in results})
+        finally:
+            client.delete_collection(collection_name)
+
+        latencies.sort()
+        total = len(latencies)
+        return {
+            'config': config.label,
+            'recall': round(hits / (total * top_k), 4),
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(latencies[min(total - 1, int(total * 0.95))], 3),
+            'upload_seconds': round(upload_seconds, 2),
+            'memory': estimate_memory(config, len(vectors), vectors.shape[1]),
+        }
+
+    def _wait_indexed(self, client, collection_name: str, timeout: float = 600):
+        """等待优化器完成索引构建，避免在未建索引的段上测量延迟"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if client.get_collection(collection_name).status == models.CollectionStatus.GREEN:
+                return
+            time.sleep(0.5)
+        self.stderr.write(f"⚠️ 集合 {collection_name} 索引构建超时，延迟数据可能偏高")
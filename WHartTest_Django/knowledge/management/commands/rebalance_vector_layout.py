@@ -0,0 +1,48 @@
+"""
+向量集合布局迁移命令
+按分块数把知识库在共享集合与独立集合之间迁移（阈值见 KNOWLEDGE_SHARED_COLLECTION_* 配置），
+入库完成后会自动检查，本命令用于批量迁移或调整阈值后立即生效
+
+示例:
+    python manage.py rebalance_vector_layout --dry-run
+    python manage.py rebalance_vector_layout --kb-id <uuid>
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.models import KnowledgeBase
+from knowledge.services import VectorStoreManager
+
+
+class Command(BaseCommand):
+    help = '按知识库规模在共享集合与独立集合之间迁移向量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kb-id', type=str, help='只检查指定知识库（默认检查所有知识库）')
+        parser.add_argument('--dry-run', action='store_true', help='只列出需要迁移的知识库')
+
+    def handle(self, *args, **options):
+        knowledge_bases = KnowledgeBase.objects.all()
+        if options['kb_id']:
+            knowledge_bases = knowledge_bases.filter(id=options['kb_id'])
+            if not knowledge_bases.exists():
+                raise CommandError(f"知识库不存在: {options['kb_id']}")
+
+        failed = 0
+        for knowledge_base in knowledge_bases:
+            try:
+                manager = VectorStoreManager.get_manager(knowledge_base)
+                if options['dry_run']:
+                    target = manager.target_layout()
+                    if target != knowledge_base.vector_layout:
+                        self.stdout.write(f"  {knowledge_base.name}: {knowledge_base.vector_layout} -> {target}")
+                    continue
+                target = manager.rebalance_layout()
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"❌ {knowledge_base.name}: {e}")
+                continue
+            if target:
+                self.stdout.write(f"✅ {knowledge_base.name}: 已迁移到 {target}")
+
+        if failed:
+            raise CommandError(f"{failed} 个知识库迁移失败")
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0009_change_api_base_url_to_charfield'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgeglobalconfig',
+            name='embedding_batch_size',
+            field=models.PositiveIntegerField(default=32, help_text='单次嵌入请求包含的文本数量（仅自定义API生效）', verbose_name='嵌入批大小'),
+        ),
+        migrations.AddField(
+            model_name='knowledgeglobalconfig',
+            name='embedding_concurrency',
+            field=models.PositiveIntegerField(default=4, help_text='同时进行的嵌入批次请求数量（仅自定义API生效）', verbose_name='嵌入并发数'),
+        ),
+    ]
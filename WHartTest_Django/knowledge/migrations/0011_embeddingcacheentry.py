@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0010_embedding_batch_settings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_key', models.CharField(max_length=200, verbose_name='嵌入模型标识')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='内容哈希')),
+                ('vector', models.BinaryField(verbose_name='向量数据')),
+                ('dimension', models.PositiveIntegerField(verbose_name='向量维度')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('last_used_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='最后使用时间')),
+            ],
+            options={
+                'verbose_name': '嵌入向量缓存',
+                'verbose_name_plural': '嵌入向量缓存',
+                'unique_together': {('model_key', 'content_hash')},
+            },
+        ),
+    ]
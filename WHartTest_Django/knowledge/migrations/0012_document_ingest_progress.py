@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-17 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0011_embeddingcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='ingest_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='入库指纹'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processed_chunks',
+            field=models.PositiveIntegerField(default=0, verbose_name='已入库分块数'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='total_chunks',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='分块总数'),
+        ),
+    ]
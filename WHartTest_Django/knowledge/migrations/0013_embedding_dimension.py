@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-17 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0012_document_ingest_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='vector_dimension',
+            field=models.PositiveIntegerField(blank=True, help_text='创建向量集合时记录', null=True, verbose_name='向量维度'),
+        ),
+        migrations.AddField(
+            model_name='knowledgeglobalconfig',
+            name='embedding_dimension',
+            field=models.PositiveIntegerField(blank=True, help_text='首次校验嵌入服务时自动记录', null=True, verbose_name='嵌入向量维度'),
+        ),
+        migrations.AddField(
+            model_name='knowledgeglobalconfig',
+            name='validated_signature',
+            field=models.CharField(blank=True, help_text='记录维度时的嵌入配置签名，配置变化后重新校验', max_length=64, null=True, verbose_name='已校验的嵌入配置'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0013_embedding_dimension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='fusion_mode',
+            field=models.CharField(choices=[('client', '客户端融合'), ('server', '服务端融合')], default='client', help_text='client: 分别检索后在应用内 RRF 融合；server: 使用 Qdrant Query API 在服务端 RRF 融合', max_length=20, verbose_name='混合检索融合方式'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0014_knowledgebase_fusion_mode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='knowledgeglobalconfig',
+            name='embedding_batch_size',
+            field=models.PositiveIntegerField(default=32, help_text='单次嵌入请求（或本地模型单次推理）包含的文本数量（自定义API和本地模型生效）', verbose_name='嵌入批大小'),
+        ),
+        migrations.AlterField(
+            model_name='knowledgeglobalconfig',
+            name='embedding_service',
+            field=models.CharField(choices=[('openai', 'OpenAI'), ('azure_openai', 'Azure OpenAI'), ('ollama', 'Ollama'), ('custom', '自定义API'), ('local', '本地模型（FastEmbed）')], default='custom', help_text='选择嵌入服务提供商', max_length=50, verbose_name='嵌入服务'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-17 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0015_local_embedding_service'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='file_digest',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='文件SHA-256'),
+        ),
+        migrations.CreateModel(
+            name='ParsedContentEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parser_key', models.CharField(max_length=100, verbose_name='解析器标识')),
+                ('file_digest', models.CharField(max_length=64, verbose_name='文件摘要')),
+                ('data', models.BinaryField(verbose_name='解析结果')),
+                ('page_count', models.PositiveIntegerField(default=0, verbose_name='页数')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='压缩后大小(字节)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('last_used_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='最后使用时间')),
+            ],
+            options={
+                'verbose_name': '文档解析缓存',
+                'verbose_name_plural': '文档解析缓存',
+                'unique_together': {('parser_key', 'file_digest')},
+            },
+        ),
+    ]
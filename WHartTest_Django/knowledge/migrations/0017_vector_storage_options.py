@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0016_parsed_content_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='hnsw_ef_construct',
+            field=models.PositiveIntegerField(blank=True, help_text='构建索引时的候选数，留空使用 Qdrant 默认值（100）', null=True, verbose_name='HNSW ef_construct'),
+        ),
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='hnsw_m',
+            field=models.PositiveIntegerField(blank=True, help_text='每个节点的连接数，留空使用 Qdrant 默认值（16）', null=True, verbose_name='HNSW M'),
+        ),
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='payload_on_disk',
+            field=models.BooleanField(default=False, verbose_name='Payload存储在磁盘'),
+        ),
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='quantization',
+            field=models.CharField(choices=[('none', '不量化（float32）'), ('scalar', '标量量化（int8）'), ('binary', '二值量化')], default='none', help_text='量化后的稠密向量常驻内存用于检索，再用原始向量重排序', max_length=10, verbose_name='向量量化'),
+        ),
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='vectors_on_disk',
+            field=models.BooleanField(default=False, help_text='原始稠密向量和稀疏索引存储在磁盘上，建议与量化同时开启', verbose_name='向量存储在磁盘'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0017_vector_storage_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='vector_layout',
+            field=models.CharField(choices=[('dedicated', '独立集合'), ('shared', '共享集合')], default='dedicated', help_text='由系统按知识库规模自动迁移', max_length=20, verbose_name='向量集合布局'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-17 06:39
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_query_counts(apps, schema_editor):
+    """按已有查询日志初始化知识库的查询次数"""
+    KnowledgeBase = apps.get_model('knowledge', 'KnowledgeBase')
+    QueryLog = apps.get_model('knowledge', 'QueryLog')
+
+    counts = QueryLog.objects.values('knowledge_base_id').annotate(total=models.Count('id'))
+    for row in counts:
+        KnowledgeBase.objects.filter(pk=row['knowledge_base_id']).update(query_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0018_knowledge_base_vector_layout'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='query_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='查询次数'),
+        ),
+        migrations.RunPython(backfill_query_counts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='querylog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='查询时间'),
+        ),
+        migrations.AddIndex(
+            model_name='querylog',
+            index=models.Index(fields=['knowledge_base', '-created_at'], name='knowledge_querylog_kb_recent'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-17 06:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+# icontains 在 PostgreSQL 上编译为 UPPER(列) LIKE UPPER(%s)，trigram 索引建在同样的表达式上才会被使用。
+# 中文内容没有可用的 tsvector 分词配置，子串检索统一使用 pg_trgm；SQLite 仍为 LIKE 全表扫描
+TRIGRAM_INDEXES = {
+    'knowledge_doc_title_trgm': 'title',
+    'knowledge_doc_content_trgm': 'content',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON knowledge_document USING gin (UPPER({column}) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0019_query_log_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['knowledge_base', 'status', '-uploaded_at', '-id'], name='knowledge_doc_kb_recent'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
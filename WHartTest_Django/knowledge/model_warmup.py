@@ -0,0 +1,189 @@
+"""
+本地模型启动预热
+BM25 稀疏编码器和本地稠密嵌入模型（embedding_service='local'）原本在每个进程第一次检索 / 入库时才加载，
+首个请求要承担模型加载（甚至下载）的延迟。这里在接收请求之前加载：
+
+- Web 进程：应用启动后在后台线程中加载（AppConfig.ready）
+- Celery prefork worker：主进程在创建子进程前加载 BM25 编码器，子进程 fork 后以写时复制方式共享；
+  ONNX Runtime 会话不能跨 fork 使用，本地稠密模型在每个子进程启动后（worker_process_init）于后台线程中加载
+- Celery threads/solo worker：主进程加载全部模型，所有任务线程共享
+
+加载状态、耗时和常驻内存增量通过 ModelWarmup.status() 查看（system_status 接口），
+全部加载完成后发送 models_ready 信号
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# 模型预热完成（sender=ModelWarmup, models=各模型的加载统计）
+models_ready = Signal()
+
+
+def current_rss_mb() -> float:
+    """当前进程常驻内存(MB)，非 Linux 系统读取不到时返回 0"""
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class ModelWarmup:
+    """进程级模型预热（带加载统计）"""
+
+    _lock = threading.Lock()
+    _ready = threading.Event()
+    _state: Dict[str, Any] = {
+        'status': 'pending',
+        'pid': None,
+        'started_at': None,
+        'finished_at': None,
+        'error': None,
+        'models': {},
+    }
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return getattr(settings, 'KNOWLEDGE_PRELOAD_MODELS', True)
+
+    @classmethod
+    def _reset_after_fork(cls):
+        """fork 出的子进程继承了父进程的状态，只保留已加载模型的记录"""
+        if cls._state['pid'] not in (None, os.getpid()):
+            cls._ready.clear()
+            cls._state.update(status='pending', pid=None, started_at=None, finished_at=None, error=None)
+            for model in cls._state['models'].values():
+                model['inherited'] = True
+
+    @classmethod
+    def status(cls) -> Dict[str, Any]:
+        """当前进程的预热状态：status 为 pending / loading / ready / failed / disabled"""
+        with cls._lock:
+            cls._reset_after_fork()
+            state = dict(cls._state)
+            state['models'] = {name: dict(model) for name, model in cls._state['models'].items()}
+        state['ready'] = state['status'] == 'ready'
+        return state
+
+    @classmethod
+    def wait(cls, timeout: Optional[float] = None) -> bool:
+        """等待预热完成，返回是否已完成"""
+        return cls._ready.wait(timeout)
+
+    @classmethod
+    def _load(cls, name: str, loader):
+        """加载单个模型并记录耗时和常驻内存增量"""
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        loaded = loader()
+        stats = {
+            'loaded': loaded is not None,
+            'load_seconds': round(time.perf_counter() - start, 3),
+            'rss_delta_mb': round(current_rss_mb() - rss_before, 1),
+        }
+        with cls._lock:
+            cls._state['models'][name] = stats
+        logger.info(f"🔥 模型预热: {name} 耗时 {stats['load_seconds']}s, 内存 +{stats['rss_delta_mb']}MB")
+
+    @classmethod
+    def preload(cls, sparse: bool = True, dense: bool = True) -> Dict[str, Any]:
+        """在当前线程中加载模型；已加载的模型直接复用，重复调用开销很小"""
+        if not cls.enabled():
+            with cls._lock:
+                cls._state['status'] = 'disabled'
+            return cls.status()
+
+        with cls._lock:
+            cls._reset_after_fork()
+            cls._state.update(status='loading', pid=os.getpid(), started_at=time.time(), error=None)
+
+        try:
+            if sparse:
+                cls._load('bm25', _load_sparse_encoder)
+            if dense:
+                cls._load('local_embedding', _load_local_embedding_model)
+        except Exception as e:
+            logger.warning(f"⚠️ 模型预热失败，将在首次使用时加载: {e}")
+            with cls._lock:
+                cls._state.update(status='failed', error=str(e), finished_at=time.time())
+            return cls.status()
+        finally:
+            close_old_connections()
+
+        with cls._lock:
+            cls._state.update(status='ready', finished_at=time.time())
+        cls._ready.set()
+        models_ready.send(sender=cls, models=cls.status()['models'])
+        return cls.status()
+
+    @classmethod
+    def preload_in_background(cls, **kwargs) -> threading.Thread:
+        """在后台线程中加载模型，不阻塞进程启动"""
+        thread = threading.Thread(target=cls.preload, kwargs=kwargs, name='model-warmup', daemon=True)
+        thread.start()
+        return thread
+
+
+def _load_sparse_encoder():
+    from .services import VectorStoreManager
+
+    encoder = VectorStoreManager.load_sparse_encoder()
+    if encoder is not None:
+        # 首次编码会初始化分词器和停用词表
+        encoder.encode_query('预热 warmup')
+    return encoder
+
+
+def _load_local_embedding_model():
+    """嵌入服务为本地模型时加载 FastEmbed 稠密模型，其他嵌入服务无需加载"""
+    from .models import KnowledgeGlobalConfig
+    from .services import FastEmbedEmbeddings
+
+    config = KnowledgeGlobalConfig.objects.filter(pk=1).first()
+    if config is None or config.embedding_service != 'local':
+        return None
+
+    threads = getattr(settings, 'KNOWLEDGE_LOCAL_EMBEDDING_THREADS', None) or None
+    model = FastEmbedEmbeddings._load_model(config.model_name or FastEmbedEmbeddings.DEFAULT_MODEL, threads)
+    # 首次推理会分配 ONNX Runtime 的内存池
+    list(model.query_embed('预热 warmup'))
+    return model
+
+
+def _is_prefork(pool_cls) -> bool:
+    name = pool_cls if isinstance(pool_cls, str) else getattr(pool_cls, '__module__', '')
+    return not name or 'prefork' in name or name == 'processes'
+
+
+def _preload_before_fork(sender=None, **kwargs):
+    """worker 主进程启动：prefork 只加载可 fork 共享的 BM25 编码器，其他池加载全部模型"""
+    prefork = _is_prefork(getattr(sender, 'pool_cls', None))
+    ModelWarmup.preload(sparse=True, dense=not prefork)
+    if prefork:
+        # 子进程不能复用主进程的数据库连接
+        connections.close_all()
+
+
+def _preload_in_child(**kwargs):
+    """prefork 子进程启动：后台加载本地稠密模型（BM25 编码器已从主进程继承）"""
+    ModelWarmup.preload_in_background(sparse=True, dense=True)
+
+
+try:
+    from celery.signals import worker_init, worker_process_init
+
+    worker_init.connect(_preload_before_fork, weak=False)
+    worker_process_init.connect(_preload_in_child, weak=False)
+except ImportError:  # pragma: no cover
+    pass
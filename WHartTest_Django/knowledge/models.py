@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
 from projects.models import Project
+import hashlib
 import uuid
 import os
 
@@ -16,6 +18,7 @@ class KnowledgeGlobalConfig(models.Model):
         ('azure_openai', 'Azure OpenAI'),
         ('ollama', 'Ollama'),
         ('custom', '自定义API'),
+        ('local', '本地模型（FastEmbed）'),
     ]
     
     embedding_service = models.CharField(
@@ -47,6 +50,30 @@ class KnowledgeGlobalConfig(models.Model):
     )
     chunk_size = models.PositiveIntegerField(_('默认分块大小'), default=1000)
     chunk_overlap = models.PositiveIntegerField(_('默认分块重叠'), default=200)
+    embedding_batch_size = models.PositiveIntegerField(
+        _('嵌入批大小'),
+        default=32,
+        help_text=_('单次嵌入请求（或本地模型单次推理）包含的文本数量（自定义API和本地模型生效）')
+    )
+    embedding_concurrency = models.PositiveIntegerField(
+        _('嵌入并发数'),
+        default=4,
+        help_text=_('同时进行的嵌入批次请求数量（仅自定义API生效）')
+    )
+    # 嵌入服务首次校验通过后记录，之后创建管理器和集合时不再探测
+    embedding_dimension = models.PositiveIntegerField(
+        _('嵌入向量维度'),
+        null=True,
+        blank=True,
+        help_text=_('首次校验嵌入服务时自动记录')
+    )
+    validated_signature = models.CharField(
+        _('已校验的嵌入配置'),
+        max_length=64,
+        blank=True,
+        null=True,
+        help_text=_('记录维度时的嵌入配置签名，配置变化后重新校验')
+    )
     
     updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
     updated_by = models.ForeignKey(
@@ -76,6 +103,16 @@ class KnowledgeGlobalConfig(models.Model):
         config, _ = cls.objects.get_or_create(pk=1)
         return config
 
+    def embedding_signature(self) -> str:
+        """决定向量维度的嵌入配置签名（服务 + 地址 + 模型）"""
+        raw = f"{self.embedding_service}|{self.api_base_url or ''}|{self.model_name}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @property
+    def is_embedding_validated(self) -> bool:
+        """当前嵌入配置是否已校验并记录维度"""
+        return bool(self.embedding_dimension) and self.validated_signature == self.embedding_signature()
+
 
 class KnowledgeBase(models.Model):
     """
@@ -105,6 +142,61 @@ class KnowledgeBase(models.Model):
     # 文档处理配置（可覆盖全局默认值）
     chunk_size = models.PositiveIntegerField(_('分块大小'), default=1000)
     chunk_overlap = models.PositiveIntegerField(_('分块重叠'), default=200)
+    vector_dimension = models.PositiveIntegerField(
+        _('向量维度'), null=True, blank=True, help_text=_('创建向量集合时记录')
+    )
+    FUSION_MODE_CHOICES = [
+        ('client', '客户端融合'),
+        ('server', '服务端融合'),
+    ]
+    fusion_mode = models.CharField(
+        _('混合检索融合方式'),
+        max_length=20,
+        choices=FUSION_MODE_CHOICES,
+        default='client',
+        help_text=_('client: 分别检索后在应用内 RRF 融合；server: 使用 Qdrant Query API 在服务端 RRF 融合')
+    )
+
+    # 向量存储配置（修改后对已有集合执行 apply_vector_storage 迁移）
+    QUANTIZATION_CHOICES = [
+        ('none', '不量化（float32）'),
+        ('scalar', '标量量化（int8）'),
+        ('binary', '二值量化'),
+    ]
+    quantization = models.CharField(
+        _('向量量化'),
+        max_length=10,
+        choices=QUANTIZATION_CHOICES,
+        default='none',
+        help_text=_('量化后的稠密向量常驻内存用于检索，再用原始向量重排序')
+    )
+    vectors_on_disk = models.BooleanField(
+        _('向量存储在磁盘'), default=False,
+        help_text=_('原始稠密向量和稀疏索引存储在磁盘上，建议与量化同时开启')
+    )
+    payload_on_disk = models.BooleanField(_('Payload存储在磁盘'), default=False)
+    hnsw_m = models.PositiveIntegerField(
+        _('HNSW M'), null=True, blank=True, help_text=_('每个节点的连接数，留空使用 Qdrant 默认值（16）')
+    )
+    hnsw_ef_construct = models.PositiveIntegerField(
+        _('HNSW ef_construct'), null=True, blank=True, help_text=_('构建索引时的候选数，留空使用 Qdrant 默认值（100）')
+    )
+
+    # 向量集合布局：小知识库共用按 knowledge_base_id 分区的共享集合，分块数超过阈值后自动迁移到独立集合
+    VECTOR_LAYOUT_CHOICES = [
+        ('dedicated', '独立集合'),
+        ('shared', '共享集合'),
+    ]
+    vector_layout = models.CharField(
+        _('向量集合布局'),
+        max_length=20,
+        choices=VECTOR_LAYOUT_CHOICES,
+        default='dedicated',
+        help_text=_('由系统按知识库规模自动迁移')
+    )
+
+    # 查询次数（查询日志批量写入时累加，统计接口不再对查询日志执行 COUNT）
+    query_count = models.PositiveIntegerField(_('查询次数'), default=0, editable=False)
 
     class Meta:
         verbose_name = _('知识库')
@@ -173,8 +265,14 @@ class Document(models.Model):
     )
     error_message = models.TextField(_('错误信息'), blank=True, null=True)
 
+    # 流式入库进度（每批分块提交后更新，失败后可从检查点继续）
+    total_chunks = models.PositiveIntegerField(_('分块总数'), null=True, blank=True)
+    processed_chunks = models.PositiveIntegerField(_('已入库分块数'), default=0)
+    ingest_fingerprint = models.CharField(_('入库指纹'), max_length=64, blank=True, null=True)
+
     # 元数据
     file_size = models.PositiveIntegerField(_('文件大小(字节)'), null=True, blank=True)
+    file_digest = models.CharField(_('文件SHA-256'), max_length=64, blank=True, null=True)
     page_count = models.PositiveIntegerField(_('页数'), null=True, blank=True)
     word_count = models.PositiveIntegerField(_('字数'), null=True, blank=True)
 
@@ -192,10 +290,43 @@ class Document(models.Model):
         verbose_name = _('文档')
         verbose_name_plural = _('文档')
         ordering = ['-uploaded_at']
+        indexes = [
+            # 知识库内容列表按 (上传时间, ID) 键集分页
+            models.Index(
+                fields=['knowledge_base', 'status', '-uploaded_at', '-id'], name='knowledge_doc_kb_recent'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.knowledge_base.name} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 加载时的文件名，保存时据此判断文件是否被替换
+        loaded_file = instance.__dict__.get('file')
+        instance._loaded_file_name = getattr(loaded_file, 'name', loaded_file) or None
+        return instance
+
+    def save(self, *args, **kwargs):
+        # 替换文件后清空文件摘要：解析结果缓存按摘要查找，沿用旧摘要会返回旧文件的解析结果
+        if self.file_digest and hasattr(self, '_loaded_file_name') and (self.file.name or None) != self._loaded_file_name:
+            self.file_digest = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'file_digest'}
+        super().save(*args, **kwargs)
+        self._loaded_file_name = self.file.name or None
+
+    @property
+    def progress(self):
+        """处理进度百分比"""
+        if self.status == 'completed':
+            return 100
+        if not self.total_chunks:
+            return 0
+        return min(100, int(self.processed_chunks * 100 / self.total_chunks))
+
     @property
     def file_extension(self):
         """获取文件扩展名"""
@@ -269,12 +400,59 @@ class QueryLog(models.Model):
     generation_time = models.FloatField(_('生成耗时(秒)'), null=True, blank=True)
     total_time = models.FloatField(_('总耗时(秒)'), null=True, blank=True)
 
-    created_at = models.DateTimeField(_('查询时间'), auto_now_add=True)
+    # 日志批量写入时保留查询发生的时间
+    created_at = models.DateTimeField(_('查询时间'), default=timezone.now, editable=False)
 
     class Meta:
         verbose_name = _('查询日志')
         verbose_name_plural = _('查询日志')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['knowledge_base', '-created_at'], name='knowledge_querylog_kb_recent'),
+        ]
 
     def __str__(self):
         return f"{self.knowledge_base.name} - {self.query[:50]}..."
+
+
+class EmbeddingCacheEntry(models.Model):
+    """
+    嵌入向量缓存，按 (嵌入模型, 分块文本哈希) 存储稠密向量
+    重新处理文档时未变化的分块直接复用缓存向量，不再调用嵌入服务
+    """
+    model_key = models.CharField(_('嵌入模型标识'), max_length=200)
+    content_hash = models.CharField(_('内容哈希'), max_length=64)
+    vector = models.BinaryField(_('向量数据'))
+    dimension = models.PositiveIntegerField(_('向量维度'))
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    last_used_at = models.DateTimeField(_('最后使用时间'), auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = _('嵌入向量缓存')
+        verbose_name_plural = _('嵌入向量缓存')
+        unique_together = ['model_key', 'content_hash']
+
+    def __str__(self):
+        return f"{self.model_key} - {self.content_hash}"
+
+
+class ParsedContentEntry(models.Model):
+    """
+    文档解析结果缓存，按 (解析器, 文件 SHA-256) 存储压缩后的文本和页面元数据
+    同一文件的重新处理、内容预览和需求内容提取不再重复解析原文件
+    """
+    parser_key = models.CharField(_('解析器标识'), max_length=100)
+    file_digest = models.CharField(_('文件摘要'), max_length=64)
+    data = models.BinaryField(_('解析结果'))
+    page_count = models.PositiveIntegerField(_('页数'), default=0)
+    size = models.PositiveIntegerField(_('压缩后大小(字节)'), default=0)
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    last_used_at = models.DateTimeField(_('最后使用时间'), auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = _('文档解析缓存')
+        verbose_name_plural = _('文档解析缓存')
+        unique_together = ['parser_key', 'file_digest']
+
+    def __str__(self):
+        return f"{self.parser_key} - {self.file_digest}"
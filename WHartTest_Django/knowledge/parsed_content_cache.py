@@ -0,0 +1,269 @@
+"""
+文档解析结果缓存
+按 (解析器, 文件 SHA-256) 缓存解析出的文本和页面元数据，同一文件只解析一次：
+知识库文档的处理、重新处理、内容预览以及需求文档的内容提取都直接复用缓存结果
+
+支持两种存储（内容经 zlib 压缩）：
+- db:   Django 数据库（ParsedContentEntry 表）
+- disk: 本地目录，每个条目一个文件
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 解析结果以 (page_content, metadata) 列表存储，与解析进程池的返回格式一致
+ParsedPage = Tuple[str, dict]
+
+# 解析逻辑变化导致结果不同时递增，旧缓存自动失效
+PARSER_VERSION = 1
+
+
+def file_digest(file_obj_or_path) -> str:
+    """计算文件内容的 SHA-256（支持文件路径或 Django FieldFile）"""
+    digest = hashlib.sha256()
+    if isinstance(file_obj_or_path, (str, os.PathLike)):
+        with open(file_obj_or_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    else:
+        file_obj_or_path.open('rb')
+        file_obj_or_path.seek(0)
+        for block in file_obj_or_path.chunks():
+            digest.update(block)
+        file_obj_or_path.seek(0)
+    return digest.hexdigest()
+
+
+def pack_pages(pages: List[ParsedPage]) -> bytes:
+    """将解析结果序列化并压缩"""
+    return zlib.compress(json.dumps(pages, ensure_ascii=False, default=str).encode(), 6)
+
+
+def unpack_pages(data: bytes) -> List[ParsedPage]:
+    """解压并还原解析结果"""
+    return [(content, metadata) for content, metadata in json.loads(zlib.decompress(bytes(data)))]
+
+
+class DatabaseParsedContentBackend:
+    """基于 Django 数据库的缓存存储"""
+
+    name = 'db'
+
+    def get(self, parser_key: str, digest: str) -> Optional[bytes]:
+        from .models import ParsedContentEntry
+
+        data = ParsedContentEntry.objects.filter(
+            parser_key=parser_key, file_digest=digest
+        ).values_list('data', flat=True).first()
+        if data is not None:
+            ParsedContentEntry.objects.filter(
+                parser_key=parser_key, file_digest=digest
+            ).update(last_used_at=timezone.now())
+        return data
+
+    def set(self, parser_key: str, digest: str, data: bytes, page_count: int):
+        from .models import ParsedContentEntry
+
+        ParsedContentEntry.objects.update_or_create(
+            parser_key=parser_key, file_digest=digest,
+            defaults={'data': data, 'page_count': page_count, 'size': len(data)},
+        )
+
+    def count(self) -> int:
+        from .models import ParsedContentEntry
+
+        return ParsedContentEntry.objects.count()
+
+    def evict(self, max_entries: int) -> int:
+        """按最后使用时间淘汰超出容量的条目"""
+        from .models import ParsedContentEntry
+
+        excess = self.count() - max_entries
+        if excess <= 0:
+            return 0
+        stale_ids = list(
+            ParsedContentEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:excess]
+        )
+        deleted, _ = ParsedContentEntry.objects.filter(pk__in=stale_ids).delete()
+        return deleted
+
+
+class DiskParsedContentBackend:
+    """基于本地目录的缓存存储，按最后访问时间（文件 mtime）淘汰"""
+
+    name = 'disk'
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, parser_key: str, digest: str) -> str:
+        safe_key = parser_key.replace(':', '_').replace('/', '_')
+        return os.path.join(self.path, digest[:2], f"{digest}.{safe_key}.zz")
+
+    def get(self, parser_key: str, digest: str) -> Optional[bytes]:
+        entry_path = self._entry_path(parser_key, digest)
+        try:
+            with open(entry_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(entry_path)
+        return data
+
+    def set(self, parser_key: str, digest: str, data: bytes, page_count: int):
+        entry_path = self._entry_path(parser_key, digest)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # 先写临时文件再原子替换，并发读取不会读到半个文件
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path)
+
+    def _entries(self) -> List[Tuple[float, str]]:
+        entries = []
+        for shard in os.scandir(self.path):
+            if shard.is_dir():
+                entries.extend(
+                    (entry.stat().st_mtime, entry.path)
+                    for entry in os.scandir(shard.path) if entry.name.endswith('.zz')
+                )
+        return entries
+
+    def count(self) -> int:
+        return len(self._entries())
+
+    def evict(self, max_entries: int) -> int:
+        entries = self._entries()
+        excess = len(entries) - max_entries
+        if excess <= 0:
+            return 0
+        deleted = 0
+        for _, entry_path in sorted(entries)[:excess]:
+            try:
+                os.remove(entry_path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
+
+
+class ParsedContentCache:
+    """文档解析结果缓存（带命中统计和容量淘汰）"""
+
+    _default = None
+    _default_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+
+    # 超出容量时淘汰到容量的该比例，避免每次写入都触发淘汰
+    EVICTION_LOW_WATERMARK = 0.9
+
+    def __init__(self, backend, max_entries: int = 2000):
+        self.backend = backend
+        self.max_entries = max_entries
+        # 近似条目数：首次写入时统计一次，之后按写入数量累加，超出容量时才执行淘汰
+        self._approx_entries: Optional[int] = None
+        self._count_lock = threading.Lock()
+
+    @classmethod
+    def get_default(cls) -> Optional['ParsedContentCache']:
+        """按 settings 创建进程级缓存实例，禁用时返回 None"""
+        backend_name = getattr(settings, 'KNOWLEDGE_PARSED_CONTENT_CACHE_BACKEND', 'db')
+        if backend_name == 'none':
+            return None
+
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    max_entries = getattr(settings, 'KNOWLEDGE_PARSED_CONTENT_CACHE_MAX_ENTRIES', 2000)
+                    if backend_name == 'disk':
+                        backend = DiskParsedContentBackend(settings.KNOWLEDGE_PARSED_CONTENT_CACHE_PATH)
+                    else:
+                        backend = DatabaseParsedContentBackend()
+                    cls._default = cls(backend, max_entries=max_entries)
+                    logger.info(f"📦 文档解析缓存已启用: backend={backend.name}, 容量={max_entries}")
+        return cls._default
+
+    @staticmethod
+    def parser_key(app: str, document_type: str) -> str:
+        """缓存使用的解析器标识（应用 + 文档类型 + 解析逻辑版本）"""
+        return f"{app}:{document_type}:v{PARSER_VERSION}"
+
+    @classmethod
+    def _record(cls, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """获取当前进程的命中统计"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+        return stats
+
+    def get(self, parser_key: str, digest: str) -> Optional[List[ParsedPage]]:
+        """读取缓存的解析结果，未命中或读取失败时返回 None"""
+        try:
+            data = self.backend.get(parser_key, digest)
+            if data is not None:
+                pages = unpack_pages(data)
+                self._record(hits=1)
+                return pages
+        except Exception as e:
+            logger.warning(f"⚠️ 读取文档解析缓存失败: {e}")
+            self._record(errors=1)
+            return None
+        self._record(misses=1)
+        return None
+
+    def set(self, parser_key: str, digest: str, pages: List[ParsedPage]):
+        """写入解析结果，写入失败只记录警告"""
+        try:
+            self.backend.set(parser_key, digest, pack_pages(pages), len(pages))
+            self._evict_if_needed()
+        except Exception as e:
+            logger.warning(f"⚠️ 写入文档解析缓存失败: {e}")
+            self._record(errors=1)
+
+    def _evict_if_needed(self):
+        """按近似条目数判断是否超出容量，超出时淘汰到低水位"""
+        with self._count_lock:
+            if self._approx_entries is None:
+                self._approx_entries = self.backend.count()
+            else:
+                self._approx_entries += 1
+            if self._approx_entries <= self.max_entries:
+                return
+            target = int(self.max_entries * self.EVICTION_LOW_WATERMARK)
+            evicted = self.backend.evict(target)
+            # 有淘汰时剩余条目数即为 target；未淘汰说明近似值偏大（重复写入），下次写入时重新统计
+            self._approx_entries = target if evicted else None
+        if evicted:
+            self._record(evictions=evicted)
+
+    def get_or_parse(self, parser_key: str, digest: str, parse_fn) -> List[ParsedPage]:
+        """读取缓存，未命中时调用 parse_fn() 解析并写回"""
+        pages = self.get(parser_key, digest)
+        if pages is not None:
+            return pages
+
+        start = time.perf_counter()
+        pages = parse_fn()
+        if pages:
+            self.set(parser_key, digest, pages)
+        logger.info(f"📦 文档解析缓存未命中，解析耗时 {time.perf_counter() - start:.2f}s")
+        return pages
@@ -0,0 +1,347 @@
+"""
+文档解析进程池
+PDF/DOCX/PPTX 等加载器的解析是 CPU 密集型的，并且一直持有 GIL，
+因此放到独立的进程池中执行，不占用 worker 线程：
+- 解析进程池在进程内长期复用：每个文档解析期间独占一个进程池，解析结束后放回空闲列表；
+  单次解析任务有超时（非 PDF 文件按整个文件计，PDF 按页段计），超时后只终止本次解析占用的进程池，
+  同时在解析的其他文档不受影响，下一次解析时重新创建
+- 解析进程按常驻内存（RSS）限制内存，超出后解析进程退出，不会拖垮 worker
+- 多页 PDF 按页段并行解析，并按页序流式返回给分块器
+- 某一页解析失败或导致解析进程崩溃时，只跳过这一页，错误汇总后写入文档的 error_message
+
+本模块不依赖 Django，解析进程以 spawn 方式启动，不需要初始化 Django
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 解析结果在进程间以 (page_content, metadata) 元组传递
+ParsedPage = Tuple[str, dict]
+
+
+class DocumentParseError(Exception):
+    """文档解析失败（超时、超出内存限制或所有页面都解析失败）"""
+
+
+# 解析进程检查常驻内存的间隔(秒)
+MEMORY_CHECK_INTERVAL = 0.2
+
+
+def _init_parse_worker(memory_limit_mb: int, worker_pids):
+    """解析进程初始化：登记进程号（超时时据此终止），并启动内存检查线程"""
+    with worker_pids.get_lock():
+        for slot, pid in enumerate(worker_pids):
+            if not pid:
+                worker_pids[slot] = os.getpid()
+                break
+    if memory_limit_mb > 0:
+        threading.Thread(target=_watch_memory, args=(memory_limit_mb,), daemon=True).start()
+
+
+def _watch_memory(memory_limit_mb: int):
+    """
+    常驻内存超过上限时结束解析进程（仅 Linux 支持）
+    不使用 RLIMIT_AS：地址空间包含共享库和线程栈等未实际占用的映射，与实际内存占用相差很大；
+    也不使用 ru_maxrss：Linux 上子进程会继承父进程的内存峰值
+    """
+    try:
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        with open('/proc/self/statm') as statm:
+            statm.read()
+    except (ValueError, OSError, AttributeError):
+        logger.warning("⚠️ 当前平台不支持限制解析进程内存")
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    while True:
+        with open('/proc/self/statm') as statm:
+            rss = int(statm.read().split()[1]) * page_size
+        if rss > limit:
+            logger.warning(f"⚠️ 解析进程内存超过 {memory_limit_mb}MB，进程退出")
+            os._exit(1)
+        time.sleep(MEMORY_CHECK_INTERVAL)
+
+
+def parse_file(loader_class, file_path: str, loader_kwargs: dict) -> List[ParsedPage]:
+    """用 LangChain 加载器解析整个文件（在解析进程中执行）"""
+    docs = loader_class(file_path, **loader_kwargs).load()
+    return [(doc.page_content, doc.metadata) for doc in docs]
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """统计 PDF 页数（在解析进程中执行）"""
+    import pypdf
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def parse_pdf_pages(file_path: str, start: int, end: int) -> List[Tuple[int, Optional[ParsedPage], Optional[str]]]:
+    """
+    解析 PDF 的 [start, end) 页（在解析进程中执行）
+    单页抛出异常不会影响同一页段的其他页，返回 (页码, 解析结果, 错误信息) 列表
+    页面文本和元数据与 PyPDFLoader 的按页输出保持一致
+    """
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    total = len(reader.pages)
+    labels = reader.page_labels
+    results = []
+    for number in range(start, min(end, total)):
+        try:
+            text = reader.pages[number].extract_text(extraction_mode='plain').strip()
+            metadata = {
+                'source': file_path,
+                'total_pages': total,
+                'page': number,
+                'page_label': labels[number],
+            }
+            results.append((number, (text, metadata), None))
+        except Exception as e:
+            results.append((number, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class DocumentParsePool:
+    """单个文档的解析进程池（带进程级统计），load / iter_pdf_pages 结束时把进程池放回空闲列表"""
+
+    # 当前进程不允许创建子进程（例如 Celery prefork 的守护子进程）时改为在进程内解析
+    _unavailable = False
+
+    # 空闲的进程池，按 (进程数, 内存上限) 分组：[(executor, 解析进程号数组)]
+    _idle_lock = threading.Lock()
+    _idle: Dict[Tuple[int, int], list] = {}
+
+    _stats_lock = threading.Lock()
+    _stats = {'files': 0, 'pages': 0, 'page_failures': 0, 'timeouts': 0, 'restarts': 0, 'inline': 0}
+
+    def __init__(self, workers: int = 2, timeout: float = 300, memory_limit_mb: int = 2048,
+                 pages_per_task: int = 8):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.pages_per_task = max(1, pages_per_task)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._worker_pids = None
+
+    @classmethod
+    def from_settings(cls) -> Optional['DocumentParsePool']:
+        """按 settings 创建解析池，进程数为 0 时返回 None（在调用线程内解析）"""
+        from django.conf import settings
+
+        workers = getattr(settings, 'KNOWLEDGE_PARSE_WORKERS', 2)
+        if workers <= 0:
+            return None
+        return cls(
+            workers=workers,
+            timeout=getattr(settings, 'KNOWLEDGE_PARSE_TIMEOUT', 300),
+            memory_limit_mb=getattr(settings, 'KNOWLEDGE_PARSE_MEMORY_LIMIT_MB', 2048),
+            pages_per_task=getattr(settings, 'KNOWLEDGE_PARSE_PDF_PAGES_PER_TASK', 8),
+        )
+
+    @classmethod
+    def _record(cls, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        """获取当前进程的解析统计"""
+        with cls._stats_lock:
+            return dict(cls._stats)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """取出一个空闲的进程池供本次解析独占，没有空闲的进程池时新建"""
+        if self._executor is None:
+            key = (self.workers, self.memory_limit_mb)
+            with self._idle_lock:
+                idle = self._idle.get(key)
+                if idle:
+                    self._executor, self._worker_pids = idle.pop()
+            if self._executor is None:
+                context = multiprocessing.get_context('spawn')
+                self._worker_pids = context.Array('i', self.workers)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_parse_worker,
+                    initargs=(self.memory_limit_mb, self._worker_pids),
+                )
+                logger.debug(f"📄 文档解析进程池已创建: 进程数={self.workers}, 内存上限={self.memory_limit_mb}MB")
+        return self._executor
+
+    def close(self, terminate: bool = False):
+        """
+        结束本次解析：进程池放回空闲列表，供之后的解析复用；
+        terminate=True 时丢弃进程池并强制结束仍在运行的解析进程（只影响本次解析）
+        """
+        executor, self._executor = self._executor, None
+        worker_pids, self._worker_pids = self._worker_pids, None
+        if executor is None:
+            return
+        if not terminate:
+            with self._idle_lock:
+                self._idle.setdefault((self.workers, self.memory_limit_mb), []).append((executor, worker_pids))
+            return
+
+        self._record(restarts=1)
+        # 只终止仍然存活的子进程，已退出的进程号可能已被系统复用
+        alive = {process.pid for process in multiprocessing.active_children()}
+        for pid in worker_pids:
+            if pid in alive:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args) -> Future:
+        """提交解析任务；无法创建解析进程时在当前线程内执行并返回已完成的 Future"""
+        if not DocumentParsePool._unavailable:
+            try:
+                try:
+                    return self._get_executor().submit(fn, *args)
+                except BrokenProcessPool:
+                    # 空闲期间解析进程已退出：丢弃进程池后重新创建
+                    self.close(terminate=True)
+                    return self._get_executor().submit(fn, *args)
+            except (AssertionError, OSError) as e:
+                logger.warning(f"⚠️ 无法创建文档解析进程，改为在当前进程内解析: {e}")
+                DocumentParsePool._unavailable = True
+                executor, self._executor, self._worker_pids = self._executor, None, None
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+        self._record(inline=1)
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _call(self, fn, *args):
+        """在解析进程中执行单个任务并等待结果"""
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.close(terminate=True)
+            self._record(timeouts=1)
+            raise DocumentParseError(f"文档解析超时（超过 {self.timeout} 秒）")
+        except BrokenProcessPool:
+            self.close(terminate=True)
+            raise DocumentParseError("解析进程异常退出（可能超出内存限制）")
+        except MemoryError:
+            raise DocumentParseError("文档解析内存不足")
+
+    def load(self, loader_class, file_path: str, loader_kwargs: Optional[dict] = None) -> List[ParsedPage]:
+        """在解析进程中用指定加载器解析整个文件"""
+        try:
+            pages = self._call(parse_file, loader_class, file_path, loader_kwargs or {})
+        finally:
+            self.close()
+        self._record(files=1, pages=len(pages))
+        return pages
+
+    def iter_pdf_pages(self, file_path: str, errors: List[str]) -> Iterator[ParsedPage]:
+        """
+        按页段并行解析 PDF，按页序逐页产出
+        - 同时在解析的页段数不超过进程数，分块器消费速度慢时不会堆积解析结果
+        - 解析进程崩溃时，把当时在解析的页段拆成单页逐个重试，仍然崩溃的页面记为失败
+        - 失败页面的错误信息追加到 errors，所有页面都失败时抛出 DocumentParseError
+        """
+        try:
+            total = self._call(count_pdf_pages, file_path)
+        except Exception:
+            self.close()
+            raise
+        self._record(files=1)
+        pending = deque(
+            (start, min(start + self.pages_per_task, total))
+            for start in range(0, total, self.pages_per_task)
+        )
+        suspects = deque()
+        in_flight: Dict[Future, Tuple[int, int]] = {}
+        parsed: Dict[int, Optional[ParsedPage]] = {}
+        next_page = 0
+        yielded = 0
+
+        def fail(start: int, end: int, reason: str):
+            label = f"第 {start + 1} 页" if end - start == 1 else f"第 {start + 1}-{end} 页"
+            errors.append(f"{label}解析失败: {reason}")
+            self._record(page_failures=end - start)
+            for number in range(start, end):
+                parsed[number] = None
+
+        try:
+            while pending or suspects or in_flight:
+                isolating = bool(suspects)
+                if isolating:
+                    # 存在可疑页面时逐页单独解析，崩溃可以定位到具体页面
+                    if not in_flight:
+                        page = suspects.popleft()
+                        in_flight[self._submit(parse_pdf_pages, file_path, page, page + 1)] = (page, page + 1)
+                else:
+                    while pending and len(in_flight) < self.workers:
+                        start, end = pending.popleft()
+                        in_flight[self._submit(parse_pdf_pages, file_path, start, end)] = (start, end)
+
+                done, _ = wait(in_flight, timeout=self.timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    self.close(terminate=True)
+                    self._record(timeouts=1)
+                    raise DocumentParseError(f"PDF 解析超时（单个页段超过 {self.timeout} 秒）")
+
+                broken = False
+                for future in done:
+                    start, end = in_flight.pop(future)
+                    try:
+                        rows = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        if isolating and end - start == 1:
+                            fail(start, end, '解析进程异常退出（可能超出内存限制）')
+                        else:
+                            suspects.extend(range(start, end))
+                        continue
+                    except Exception as e:
+                        fail(start, end, f"{type(e).__name__}: {e}")
+                        continue
+
+                    for number, page, error in rows:
+                        parsed[number] = page
+                        if error:
+                            fail(number, number + 1, error)
+
+                if broken:
+                    # 进程池已损坏：其余在解析的页段同样失败，全部转为逐页重试
+                    for start, end in in_flight.values():
+                        suspects.extend(range(start, end))
+                    in_flight.clear()
+                    self.close(terminate=True)
+
+                while next_page in parsed:
+                    page = parsed.pop(next_page)
+                    next_page += 1
+                    if page is not None:
+                        yielded += 1
+                        self._record(pages=1)
+                        yield page
+        finally:
+            for future in in_flight:
+                future.cancel()
+            # 提前停止消费（生成器被关闭）时还在解析的页段没有必要等待
+            self.close(terminate=bool(in_flight))
+
+        if total and not yielded:
+            raise DocumentParseError(f"PDF 所有页面解析失败: {'; '.join(errors[:3])}")
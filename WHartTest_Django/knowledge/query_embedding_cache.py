@@ -0,0 +1,169 @@
+"""
+查询向量缓存
+Agent 多步执行和 RAG 对话中同一查询会被反复检索，按 (模型, 归一化查询文本) 缓存
+稠密查询向量和 BM25 稀疏查询向量，命中时跳过嵌入服务调用
+
+- 进程内 LRU（容量上限 + TTL）
+- 可选 Redis 共享层（多个 worker 进程共用缓存）
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """归一化查询文本：去除首尾空白、合并连续空白、英文转小写"""
+    return ' '.join(text.split()).lower()
+
+
+class SparseQueryVector:
+    """稀疏查询向量（与 FastEmbed SparseEmbedding 的 indices/values 接口一致）"""
+
+    __slots__ = ('indices', 'values')
+
+    def __init__(self, indices, values):
+        self.indices = np.asarray(indices)
+        self.values = np.asarray(values)
+
+    def to_dict(self) -> Dict[str, list]:
+        return {'indices': self.indices.tolist(), 'values': self.values.tolist()}
+
+
+class QueryEmbeddingCache:
+    """查询向量缓存（带命中统计）"""
+
+    KEY_PREFIX = 'knowledge:query_vector'
+
+    _default = None
+    _default_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'errors': 0}
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 3600, redis_url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis_url = redis_url
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+    @classmethod
+    def get_default(cls) -> Optional['QueryEmbeddingCache']:
+        """按 settings 创建进程级缓存实例，容量为 0 时返回 None"""
+        max_entries = getattr(settings, 'KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES', 1024)
+        if max_entries <= 0:
+            return None
+
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    ttl = getattr(settings, 'KNOWLEDGE_QUERY_CACHE_TTL', 3600)
+                    redis_url = getattr(settings, 'KNOWLEDGE_QUERY_CACHE_REDIS_URL', '') or None
+                    cls._default = cls(max_entries=max_entries, ttl=ttl, redis_url=redis_url)
+                    logger.info(
+                        f"📦 查询向量缓存已启用: 容量={max_entries}, TTL={ttl}s, "
+                        f"Redis={'启用' if redis_url else '未启用'}"
+                    )
+        return cls._default
+
+    @classmethod
+    def _record(cls, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """获取当前进程的命中统计"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        hits = stats['local_hits'] + stats['redis_hits']
+        total = hits + stats['misses']
+        stats['hit_rate'] = round(hits / total, 4) if total else 0.0
+        if cls._default is not None:
+            stats['size'] = len(cls._default._entries)
+        return stats
+
+    @property
+    def redis(self):
+        """延迟创建 Redis 客户端"""
+        if self._redis is None and self.redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def _cache_key(self, model_key: str, kind: str, text: str) -> str:
+        digest = hashlib.sha256(f"{model_key}\n{normalize_query(text)}".encode()).hexdigest()
+        return f"{self.KEY_PREFIX}:{kind}:{digest}"
+
+    def _get_local(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, model_key: str, kind: str, text: str, compute_fn: Callable[[str], Any],
+                       dumps: Callable[[Any], Any] = None, loads: Callable[[Any], Any] = None):
+        """
+        读取缓存，未命中时调用 compute_fn(text) 并写回
+        dumps/loads 用于 Redis 存储的序列化（默认直接 JSON 序列化）
+        """
+        key = self._cache_key(model_key, kind, text)
+        value = self._get_local(key)
+        if value is not None:
+            self._record(local_hits=1)
+            return value
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(key)
+                if raw is not None:
+                    data = json.loads(raw)
+                    value = loads(data) if loads else data
+                    self._set_local(key, value)
+                    self._record(redis_hits=1)
+                    return value
+            except Exception as e:
+                logger.warning(f"⚠️ 读取 Redis 查询向量缓存失败: {e}")
+                self._record(errors=1)
+
+        self._record(misses=1)
+        value = compute_fn(text)
+        if value is None:
+            return None
+
+        self._set_local(key, value)
+        if self.redis is not None:
+            try:
+                self.redis.setex(key, self.ttl, json.dumps(dumps(value) if dumps else value))
+            except Exception as e:
+                logger.warning(f"⚠️ 写入 Redis 查询向量缓存失败: {e}")
+                self._record(errors=1)
+        return value
+
+    def clear(self):
+        """清空进程内缓存"""
+        with self._lock:
+            self._entries.clear()
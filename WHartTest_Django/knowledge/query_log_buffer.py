@@ -0,0 +1,234 @@
+"""
+查询日志缓冲写入
+知识库检索（包括 Agent 工具检索）不再在请求路径上同步插入 QueryLog，
+日志条目先进入进程内缓冲区，由后台线程批量写入：
+
+- 缓冲条目达到 KNOWLEDGE_QUERY_LOG_BUFFER_SIZE 或距上次写入超过 KNOWLEDGE_QUERY_LOG_FLUSH_INTERVAL 秒时，
+  用一次 bulk_create 写入，并按知识库累加 KnowledgeBase.query_count（statistics 接口直接读取该计数）
+- 进程正常退出（atexit）和 Celery 子进程退出时写入剩余条目
+- 整批写入失败时改为逐条写入：无法写入的条目（例如数据不合法）直接丢弃，不会阻塞之后的写入；
+  数据库不可用时未写入的条目放回缓冲区等待下次重试
+- 缓冲区超过 KNOWLEDGE_QUERY_LOG_MAX_PENDING 时丢弃最早的条目（数据库长时间不可用时限制内存占用）
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLogBuffer:
+    """进程级查询日志缓冲区（带统计）"""
+
+    _default = None
+    _default_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _stats = {'enqueued': 0, 'written': 0, 'flushes': 0, 'dropped': 0, 'errors': 0}
+
+    def __init__(self, batch_size: int = 100, interval: float = 5.0, max_pending: int = 10000):
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self._pending: deque = deque(maxlen=max(max_pending, self.batch_size))
+        self._lock = threading.Lock()
+        # 写入过程串行执行，避免后台线程与退出时的写入同时进行
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+
+    @classmethod
+    def get_default(cls) -> Optional['QueryLogBuffer']:
+        """按 settings 创建进程级缓冲区，批大小为 0 时返回 None（同步写入）"""
+        batch_size = getattr(settings, 'KNOWLEDGE_QUERY_LOG_BUFFER_SIZE', 100)
+        if batch_size <= 0:
+            return None
+
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    interval = getattr(settings, 'KNOWLEDGE_QUERY_LOG_FLUSH_INTERVAL', 5.0)
+                    max_pending = getattr(settings, 'KNOWLEDGE_QUERY_LOG_MAX_PENDING', 10000)
+                    cls._default = cls(batch_size=batch_size, interval=interval, max_pending=max_pending)
+                    atexit.register(cls._default.flush)
+                    logger.info(f"📝 查询日志缓冲写入已启用: 批大小={batch_size}, 间隔={interval}s")
+        return cls._default
+
+    @classmethod
+    def _record(cls, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        """获取当前进程的写入统计"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        stats['pending'] = len(cls._default._pending) if cls._default is not None else 0
+        return stats
+
+    def _ensure_thread(self):
+        """启动后台写入线程（fork 出的子进程中重新启动）"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='query-log-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+    def add(self, entry: Dict[str, Any]):
+        """加入一条日志（QueryLog 的字段字典），达到批大小时唤醒后台线程写入"""
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self._record(dropped=1)
+            self._pending.append(entry)
+            pending = len(self._pending)
+        self._record(enqueued=1)
+        self._ensure_thread()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """写入缓冲区中的全部条目，返回写入的条数；数据库不可用时未写入的条目放回缓冲区等待下次重试"""
+        from .models import QueryLog
+
+        with self._flush_lock:
+            with self._lock:
+                entries: List[Dict[str, Any]] = list(self._pending)
+                self._pending.clear()
+            if not entries:
+                return 0
+
+            try:
+                entries = _resolve_references(entries)
+                with transaction.atomic():
+                    QueryLog.objects.bulk_create(
+                        [QueryLog(**entry) for entry in entries], batch_size=self.batch_size
+                    )
+                    _increment_query_counts(Counter(str(entry['knowledge_base_id']) for entry in entries))
+                written = len(entries)
+            except Exception as e:
+                logger.warning(f"批量写入查询日志失败，改为逐条写入: {e}")
+                written, remaining = self._write_each(entries)
+                if remaining:
+                    self._record(errors=1)
+                    self._requeue(remaining)
+                if not written:
+                    return 0
+
+            self._record(written=written, flushes=1)
+            return written
+
+    def _write_each(self, entries: List[Dict[str, Any]]):
+        """
+        逐条写入，返回 (写入条数, 未写入的条目)
+        数据不合法的条目丢弃；其他错误（例如数据库不可用）时停止写入，剩余条目交给调用方放回缓冲区
+        """
+        from .models import QueryLog
+
+        written = 0
+        for index, entry in enumerate(entries):
+            try:
+                with transaction.atomic():
+                    QueryLog.objects.create(**entry)
+                    _increment_query_counts({str(entry['knowledge_base_id']): 1})
+            except (IntegrityError, DataError, TypeError, ValueError) as e:
+                logger.error(f"丢弃无法写入的查询日志: {e}")
+                self._record(dropped=1)
+                continue
+            except Exception as e:
+                logger.error(f"写入查询日志失败，剩余 {len(entries) - index} 条等待下次重试: {e}")
+                return written, entries[index:]
+            written += 1
+        return written, []
+
+    def _requeue(self, entries: List[Dict[str, Any]]):
+        """未写入的条目放回缓冲区头部（它们早于缓冲期间新加入的条目），超出容量时丢弃最早的条目"""
+        with self._lock:
+            merged = [*entries, *self._pending]
+            overflow = max(0, len(merged) - self._pending.maxlen)
+            self._pending.clear()
+            self._pending.extend(merged[overflow:])
+        if overflow:
+            self._record(dropped=overflow)
+
+
+def _resolve_references(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    处理缓冲期间被删除的外键，避免外键错误导致整批写入失败：
+    知识库已删除的日志直接丢弃，用户已删除的日志保留并清空用户
+    """
+    from .models import KnowledgeBase
+
+    existing = {str(pk) for pk in KnowledgeBase.objects.filter(
+        pk__in={entry['knowledge_base_id'] for entry in entries}
+    ).values_list('pk', flat=True)}
+    entries = [entry for entry in entries if str(entry['knowledge_base_id']) in existing]
+
+    user_ids = {entry['user_id'] for entry in entries if entry.get('user_id') is not None}
+    if user_ids:
+        existing_users = set(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        entries = [
+            {**entry, 'user_id': None} if entry.get('user_id') is not None and entry['user_id'] not in existing_users
+            else entry
+            for entry in entries
+        ]
+    return entries
+
+
+def _increment_query_counts(counts: Dict[str, int]):
+    """累加知识库的查询次数计数"""
+    from .models import KnowledgeBase
+
+    for knowledge_base_id, count in counts.items():
+        KnowledgeBase.objects.filter(pk=knowledge_base_id).update(query_count=F('query_count') + count)
+
+
+def record_query_log(**fields):
+    """
+    记录一条查询日志（fields 为 QueryLog 的字段，知识库和用户使用 knowledge_base_id / user_id）
+    启用缓冲时只加入缓冲区，否则同步写入
+    """
+    from .models import QueryLog
+
+    fields.setdefault('created_at', timezone.now())
+    buffer = QueryLogBuffer.get_default()
+    if buffer is not None:
+        buffer.add(fields)
+        return
+
+    with transaction.atomic():
+        QueryLog.objects.create(**fields)
+        _increment_query_counts({str(fields['knowledge_base_id']): 1})
+
+
+def _flush_on_worker_exit(**kwargs):
+    if QueryLogBuffer._default is not None:
+        QueryLogBuffer._default.flush()
+
+
+try:
+    # Celery prefork 子进程通过 os._exit 退出，不会执行 atexit
+    from celery.signals import worker_process_shutdown
+
+    worker_process_shutdown.connect(_flush_on_worker_exit, weak=False)
+except ImportError:  # pragma: no cover
+    pass
@@ -0,0 +1,125 @@
+"""
+知识库检索结果缓存
+多个测试人员对同一知识库反复执行相同查询时，直接返回缓存的检索结果，不再嵌入查询和访问 Qdrant
+
+- 缓存键包含 (知识库, 查询文本, top_k, 相似度阈值, 过滤条件, 嵌入模型, 融合方式) 和知识库版本号
+- 文档入库、重新处理、删除后知识库版本号递增，旧版本的缓存结果不会再被命中，过期后自动清理
+- 存储在 Django 缓存框架中（KNOWLEDGE_QUERY_RESULT_CACHE_ALIAS），版本号需要在 Web 进程和入库 worker 之间共享
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .query_embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class QueryResultCache:
+    """检索结果缓存（带命中统计）"""
+
+    KEY_PREFIX = 'knowledge:query_result'
+    VERSION_KEY_PREFIX = 'knowledge:kb_version'
+
+    _stats_lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'errors': 0}
+
+    def __init__(self, alias: str = 'default', ttl: int = 300):
+        self.alias = alias
+        self.ttl = ttl
+
+    @classmethod
+    def get_default(cls) -> Optional['QueryResultCache']:
+        """按 settings 创建缓存实例，TTL 为 0 时返回 None"""
+        ttl = getattr(settings, 'KNOWLEDGE_QUERY_RESULT_CACHE_TTL', 300)
+        if ttl <= 0:
+            return None
+        return cls(alias=getattr(settings, 'KNOWLEDGE_QUERY_RESULT_CACHE_ALIAS', 'default'), ttl=ttl)
+
+    @classmethod
+    def _record(cls, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """获取当前进程的命中统计"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+        return stats
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, knowledge_base_id) -> str:
+        return f"{self.VERSION_KEY_PREFIX}:{knowledge_base_id}"
+
+    def get_version(self, knowledge_base_id) -> int:
+        """
+        获取知识库当前版本号
+        版本号不存在（首次访问或被缓存淘汰）时以当前毫秒时间戳初始化，
+        保证新版本号不会与被淘汰前的任何版本号重复
+        """
+        key = self._version_key(knowledge_base_id)
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, int(time.time() * 1000), timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def bump_version(self, knowledge_base_id):
+        """知识库内容变化后递增版本号，使该知识库的所有缓存结果失效"""
+        key = self._version_key(knowledge_base_id)
+        try:
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # 版本号不存在时无需递增：下次读取会以新的时间戳初始化
+                self.get_version(knowledge_base_id)
+            self._record(invalidations=1)
+        except Exception as e:
+            logger.warning(f"⚠️ 更新知识库 {knowledge_base_id} 检索缓存版本失败: {e}")
+            self._record(errors=1)
+
+    def _cache_key(self, knowledge_base_id, version: int, params: Dict[str, Any]) -> str:
+        raw = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        digest = hashlib.sha256(raw.encode()).hexdigest()
+        return f"{self.KEY_PREFIX}:{knowledge_base_id}:{version}:{digest}"
+
+    def get_or_search(self, knowledge_base_id, query: str, params: Dict[str, Any],
+                      search_fn: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        读取缓存的检索结果，未命中时调用 search_fn() 检索并写回
+        params 为除查询文本外影响检索结果的参数（top_k、阈值、过滤条件等）
+        """
+        try:
+            version = self.get_version(knowledge_base_id)
+            key = self._cache_key(knowledge_base_id, version, {'query': normalize_query(query), **params})
+            results = self.cache.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ 读取检索结果缓存失败: {e}")
+            self._record(errors=1)
+            return search_fn()
+
+        if results is not None:
+            self._record(hits=1)
+            return results
+
+        self._record(misses=1)
+        results = search_fn()
+        try:
+            self.cache.set(key, results, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ 写入检索结果缓存失败: {e}")
+            self._record(errors=1)
+        return results
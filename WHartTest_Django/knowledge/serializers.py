@@ -15,9 +15,10 @@ class KnowledgeGlobalConfigSerializer(serializers.ModelSerializer):
             'embedding_service', 'embedding_service_display',
             'api_base_url', 'api_key', 'model_name',
             'chunk_size', 'chunk_overlap',
+            'embedding_batch_size', 'embedding_concurrency', 'embedding_dimension',
             'updated_at', 'updated_by', 'updated_by_name'
         ]
-        read_only_fields = ['updated_at', 'updated_by']
+        read_only_fields = ['embedding_dimension', 'updated_at', 'updated_by']
         extra_kwargs = {
             'api_key': {'write_only': False}  # API Key可读可写，但前端应做脱敏处理
         }
@@ -35,10 +36,14 @@ class KnowledgeBaseSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'description', 'project', 'project_name',
             'creator', 'creator_name', 'is_active',
-            'chunk_size', 'chunk_overlap',
+            'chunk_size', 'chunk_overlap', 'vector_dimension', 'fusion_mode',
+            'quantization', 'vectors_on_disk', 'payload_on_disk', 'hnsw_m', 'hnsw_ef_construct',
+            'vector_layout',
             'document_count', 'chunk_count', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'creator', 'created_at', 'updated_at', 'project_name']
+        read_only_fields = [
+            'id', 'creator', 'vector_dimension', 'vector_layout', 'created_at', 'updated_at', 'project_name'
+        ]
         extra_kwargs = {
             'project': {'required': False}  # 在更新时project字段不是必填的
         }
@@ -129,6 +134,7 @@ class DocumentSerializer(serializers.ModelSerializer):
     knowledge_base_name = serializers.CharField(source='knowledge_base.name', read_only=True)
     file_extension = serializers.CharField(read_only=True)
     chunk_count = serializers.SerializerMethodField()
+    progress = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Document
@@ -136,12 +142,13 @@ class DocumentSerializer(serializers.ModelSerializer):
             'id', 'knowledge_base', 'knowledge_base_name', 'title',
             'document_type', 'file', 'url', 'content', 'status',
             'error_message', 'file_size', 'page_count', 'word_count',
-            'file_extension', 'chunk_count', 'uploader', 'uploader_name',
-            'uploaded_at', 'processed_at'
+            'file_extension', 'chunk_count', 'progress', 'total_chunks', 'processed_chunks',
+            'uploader', 'uploader_name', 'uploaded_at', 'processed_at'
         ]
         read_only_fields = [
             'id', 'uploader', 'file_size', 'page_count', 'word_count',
-            'file_extension', 'uploaded_at', 'processed_at'
+            'file_extension', 'total_chunks', 'processed_chunks',
+            'uploaded_at', 'processed_at'
         ]
 
     def get_chunk_count(self, obj):
@@ -187,6 +194,26 @@ class KnowledgeQuerySerializer(serializers.Serializer):
         default=0.1, min_value=0.0, max_value=1.0, help_text="相似度阈值"
     )
     include_metadata = serializers.BooleanField(default=True, help_text="是否包含元数据")
+    document_ids = serializers.ListField(
+        child=serializers.UUIDField(), required=False, help_text="只检索这些文档"
+    )
+    document_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=Document.DOCUMENT_TYPES), required=False,
+        help_text="只检索这些类型的文档"
+    )
+    metadata_filters = serializers.DictField(
+        required=False, help_text="分块元数据匹配条件，值为列表时匹配任一值，例如 {\"tags\": [\"登录\"]}"
+    )
+
+    def get_filters(self):
+        """转换为 VectorStoreManager.similarity_search 的 filters 参数"""
+        data = self.validated_data
+        filters = {
+            'document_ids': data.get('document_ids'),
+            'document_types': data.get('document_types'),
+            'metadata': data.get('metadata_filters'),
+        }
+        return {key: value for key, value in filters.items() if value} or None
 
     def validate_knowledge_base_id(self, value):
         """验证知识库是否存在且有权限访问"""
@@ -4,8 +4,14 @@
 """
 import os
 import time
+import functools
 import hashlib
-from typing import List, Dict, Any
+import threading
+from contextlib import contextmanager
+from collections import defaultdict, deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
 import nltk
 from django.conf import settings
 
@@ -31,6 +37,7 @@ os.environ['HF_HUB_DISABLE_SYMLINKS_WARNING'] = '1'
 os.environ['HF_HUB_TIMEOUT'] = '1'
 os.environ['REQUESTS_TIMEOUT'] = '1'
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from langchain_community.document_loaders import (
     PyPDFLoader, Docx2txtLoader, UnstructuredPowerPointLoader,
@@ -52,7 +59,13 @@ from qdrant_client.models import (
     models,
 )
 from langchain_core.documents import Document as LangChainDocument
-from .models import KnowledgeBase, Document, DocumentChunk, QueryLog, KnowledgeGlobalConfig
+from .models import KnowledgeBase, Document, DocumentChunk, KnowledgeGlobalConfig
+from .embedding_cache import EmbeddingCache, content_hash as compute_content_hash
+from .query_embedding_cache import QueryEmbeddingCache, SparseQueryVector
+from .parsing import DocumentParsePool
+from .parsed_content_cache import ParsedContentCache, file_digest as parsed_file_digest
+from .query_result_cache import QueryResultCache
+from .query_log_buffer import record_query_log
 import logging
 import requests
 import uuid
@@ -90,6 +103,27 @@ def _init_fastembed():
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def _allow_model_download():
+    """临时关闭 HuggingFace 离线模式，允许下载本地缓存中不存在的模型"""
+    offline_vars = ['HF_HUB_OFFLINE', 'TRANSFORMERS_OFFLINE', 'HF_DATASETS_OFFLINE']
+    old_values = {var: os.environ.pop(var, None) for var in offline_vars}
+
+    try:
+        import huggingface_hub.constants
+        if hasattr(huggingface_hub.constants, 'HF_HUB_OFFLINE'):
+            huggingface_hub.constants.HF_HUB_OFFLINE = False
+    except Exception:
+        pass
+
+    try:
+        yield
+    finally:
+        for var, val in old_values.items():
+            if val is not None:
+                os.environ[var] = val
+
+
 class SparseBM25Encoder:
     """基于 FastEmbed 的 BM25 稀疏编码器"""
 
@@ -115,23 +149,9 @@ class SparseBM25Encoder:
             logger.info(f"✅ 初始化 BM25 稀疏编码器: {self.model_name}")
         else:
             # 无本地缓存时，临时禁用离线模式以下载模型
-            offline_vars = ['HF_HUB_OFFLINE', 'TRANSFORMERS_OFFLINE', 'HF_DATASETS_OFFLINE']
-            old_values = {var: os.environ.pop(var, None) for var in offline_vars}
-            
-            try:
-                import huggingface_hub.constants
-                if hasattr(huggingface_hub.constants, 'HF_HUB_OFFLINE'):
-                    huggingface_hub.constants.HF_HUB_OFFLINE = False
-            except Exception:
-                pass
-            
-            try:
+            with _allow_model_download():
                 self._encoder = SparseTextEmbedding(model_name=self.model_name)
-                logger.info(f"✅ 初始化 BM25 稀疏编码器: {self.model_name}")
-            finally:
-                for var, val in old_values.items():
-                    if val is not None:
-                        os.environ[var] = val
+            logger.info(f"✅ 初始化 BM25 稀疏编码器: {self.model_name}")
 
     def encode_documents(self, texts: List[str]) -> List:
         """编码文档列表"""
@@ -144,50 +164,231 @@ class SparseBM25Encoder:
 
 
 class CustomAPIEmbeddings(Embeddings):
-    """自定义HTTP API嵌入服务"""
-    
-    def __init__(self, api_base_url: str, api_key: str = None, custom_headers: dict = None, model_name: str = 'text-embedding'):
+    """
+    自定义HTTP API嵌入服务
+
+    - 按 batch_size 将文本打包为 OpenAI 风格的 input 列表批量请求
+    - 复用 HTTP 连接池（keep-alive），避免每个分块重新建立连接
+    - 最多 max_concurrency 个批次并发请求，每个批次独立重试（指数退避）
+    """
+
+    # 可重试的 HTTP 状态码（限流与服务端错误）
+    RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_base_url: str, api_key: str = None, custom_headers: dict = None,
+                 model_name: str = 'text-embedding', batch_size: int = 32, max_concurrency: int = 4,
+                 max_retries: int = 3, retry_backoff: float = 1.0, timeout: float = 30):
         self.api_base_url = api_base_url.rstrip('/')
         self.api_key = api_key
         self.custom_headers = custom_headers or {}
         self.model_name = model_name
-        
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """嵌入多个文档"""
-        return [self.embed_query(text) for text in texts]
-    
-    def embed_query(self, text: str) -> List[float]:
-        """嵌入单个查询"""
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """获取带连接池的 HTTP 会话（连接池大小与并发数一致）"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=self.max_concurrency,
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _build_headers(self) -> Dict[str, str]:
         headers = {
             'Content-Type': 'application/json',
             **self.custom_headers
         }
-        
         if self.api_key:
             headers['Authorization'] = f'Bearer {self.api_key}'
-        
+        return headers
+
+    def _iter_batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _parse_embeddings(self, result: Dict[str, Any], expected: int) -> List[List[float]]:
+        """解析 OpenAI 风格响应，按 index 还原输入顺序"""
+        items = result.get('data') if isinstance(result, dict) else None
+        if not items or len(items) != expected:
+            raise ValueError(f"API响应格式错误: 期望 {expected} 个向量, 响应: {str(result)[:200]}")
+        if all('index' in item for item in items):
+            items = sorted(items, key=lambda item: item['index'])
+        return [item['embedding'] for item in items]
+
+    def _should_retry(self, error: Exception) -> bool:
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code in self.RETRYABLE_STATUS_CODES
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    def _post(self, payload_input, expected: int) -> List[List[float]]:
+        """发送单个批次请求（带重试）"""
         data = {
-            'input': text,
+            'input': payload_input,
             'model': self.model_name  # 使用配置的模型名
         }
-        
-        try:
-            response = requests.post(
-                self.api_base_url,  # 直接使用完整的API URL
-                json=data,
-                headers=headers,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            if 'data' in result and len(result['data']) > 0:
-                return result['data'][0]['embedding']
-            else:
-                raise ValueError(f"API响应格式错误: {result}")
-                
-        except Exception as e:
-            raise RuntimeError(f"自定义API嵌入失败: {str(e)}")
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    self.api_base_url,  # 直接使用完整的API URL
+                    json=data,
+                    headers=self._build_headers(),
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                return self._parse_embeddings(response.json(), expected)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._should_retry(e):
+                    raise RuntimeError(f"自定义API嵌入失败: {str(e)}")
+                delay = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                logger.warning(f"嵌入批次请求失败，{delay:.1f}s 后第 {attempt} 次重试: {e}")
+                time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入多个文档（分批并发请求，结果顺序与输入一致）"""
+        if not texts:
+            return []
+
+        batches = self._iter_batches(texts)
+        if len(batches) == 1:
+            return self._post(batches[0], len(batches[0]))
+
+        workers = min(self.max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='embedding') as executor:
+            batch_results = list(executor.map(lambda batch: self._post(batch, len(batch)), batches))
+
+        return [vector for batch in batch_results for vector in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入单个查询"""
+        return self._post(text, 1)[0]
+
+    async def _apost(self, client, semaphore, payload_input, expected: int) -> List[List[float]]:
+        """异步发送单个批次请求（带重试）"""
+        import asyncio
+        import httpx
+
+        data = {
+            'input': payload_input,
+            'model': self.model_name
+        }
+        attempt = 0
+        async with semaphore:
+            while True:
+                try:
+                    response = await client.post(self.api_base_url, json=data, headers=self._build_headers())
+                    response.raise_for_status()
+                    return self._parse_embeddings(response.json(), expected)
+                except Exception as e:
+                    retryable = (
+                        isinstance(e, httpx.HTTPStatusError)
+                        and e.response.status_code in self.RETRYABLE_STATUS_CODES
+                    ) or isinstance(e, httpx.TransportError)
+                    if attempt >= self.max_retries or not retryable:
+                        raise RuntimeError(f"自定义API嵌入失败: {str(e)}")
+                    delay = self.retry_backoff * (2 ** attempt)
+                    attempt += 1
+                    logger.warning(f"嵌入批次请求失败，{delay:.1f}s 后第 {attempt} 次重试: {e}")
+                    await asyncio.sleep(delay)
+
+    def _async_client(self):
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency,
+        )
+        return httpx.AsyncClient(timeout=self.timeout, limits=limits)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """异步嵌入多个文档"""
+        import asyncio
+
+        if not texts:
+            return []
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._async_client() as client:
+            batch_results = await asyncio.gather(*[
+                self._apost(client, semaphore, batch, len(batch))
+                for batch in self._iter_batches(texts)
+            ])
+
+        return [vector for batch in batch_results for vector in batch]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """异步嵌入单个查询"""
+        import asyncio
+
+        async with self._async_client() as client:
+            result = await self._apost(client, asyncio.Semaphore(1), text, 1)
+        return result[0]
+
+
+class FastEmbedEmbeddings(Embeddings):
+    """
+    基于 FastEmbed (ONNX Runtime) 的本地稠密嵌入模型
+    在当前进程内用 CPU 批量推理，无需嵌入服务；模型按 (模型名称, 线程数) 每个进程只加载一次
+    """
+
+    DEFAULT_MODEL = "BAAI/bge-small-zh-v1.5"
+
+    _models = {}
+    _models_lock = threading.Lock()
+
+    def __init__(self, model_name: Optional[str] = None, batch_size: int = 32, threads: Optional[int] = None):
+        self.model_name = model_name or self.DEFAULT_MODEL
+        self.batch_size = batch_size
+        self.threads = threads
+        self._model = self._load_model(self.model_name, threads)
+
+    @classmethod
+    def _load_model(cls, model_name: str, threads: Optional[int]):
+        """加载（或复用已加载的）FastEmbed 模型"""
+        cache_key = (model_name, threads)
+        if cache_key not in cls._models:
+            with cls._models_lock:
+                if cache_key not in cls._models:
+                    try:
+                        from fastembed import TextEmbedding
+                    except ImportError:
+                        raise ImportError("本地嵌入模型需要安装 fastembed: pip install fastembed")
+
+                    start_time = time.time()
+                    with _allow_model_download():
+                        cls._models[cache_key] = TextEmbedding(
+                            model_name=model_name,
+                            cache_dir=os.environ.get('FASTEMBED_CACHE_PATH'),
+                            threads=threads,
+                        )
+                    logger.info(
+                        f"✅ 本地嵌入模型加载完成: {model_name}, 线程数: {threads or '自动'}, "
+                        f"耗时: {time.time() - start_time:.2f}s"
+                    )
+        return cls._models[cache_key]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量嵌入文档"""
+        if not texts:
+            return []
+        return [vector.tolist() for vector in self._model.embed(texts, batch_size=self.batch_size)]
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入单个查询"""
+        return next(iter(self._model.query_embed(text))).tolist()
 
 
 
@@ -205,8 +406,16 @@ class DocumentProcessor:
             'html': UnstructuredHTMLLoader,
         }
 
-    def load_document(self, document: Document) -> List[LangChainDocument]:
+    def load_document(self, document: Document, errors: Optional[List[str]] = None) -> List[LangChainDocument]:
         """加载文档内容"""
+        return list(self.iter_document(document, errors))
+
+    def iter_document(self, document: Document, errors: Optional[List[str]] = None) -> Iterator[LangChainDocument]:
+        """
+        逐页加载文档内容
+        文件在解析进程池中解析，多页 PDF 边解析边产出；
+        跳过的页面错误追加到 errors（调用方写入文档的 error_message）
+        """
         try:
             logger.info(f"开始加载文档: {document.title} (ID: {document.id})")
             logger.info(f"文档类型: {document.document_type}")
@@ -214,11 +423,11 @@ class DocumentProcessor:
             # 优先级：URL > 文本内容 > 文件
             if document.document_type == 'url' and document.url:
                 logger.info(f"从URL加载: {document.url}")
-                return self._load_from_url(document.url)
+                yield from self._load_from_url(document.url)
             elif document.content:
                 # 如果有文本内容，直接使用
                 logger.info("从文本内容加载")
-                return self._load_from_content(document.content, document.title)
+                yield from self._load_from_content(document.content, document.title)
             elif document.file and hasattr(document.file, 'path'):
                 file_path = document.file.path
                 logger.info(f"从文件加载: {file_path}")
@@ -232,7 +441,7 @@ class DocumentProcessor:
                 # 检查文件是否存在
                 if os.path.exists(file_path):
                     logger.info(f"文件存在，开始加载: {file_path}")
-                    return self._load_from_file(document)
+                    yield from self._load_from_file(document, errors if errors is not None else [])
                 else:
                     raise FileNotFoundError(f"文件不存在: {file_path}")
             else:
@@ -253,8 +462,8 @@ class DocumentProcessor:
             metadata={"source": title, "title": title}
         )]
 
-    def _load_from_file(self, document: Document) -> List[LangChainDocument]:
-        """从文件加载文档"""
+    def _load_from_file(self, document: Document, errors: List[str]) -> Iterator[LangChainDocument]:
+        """从文件加载文档（优先使用按文件摘要缓存的解析结果）"""
         file_path = document.file.path
 
         # Windows路径兼容性处理
@@ -275,6 +484,60 @@ class DocumentProcessor:
         if not loader_class:
             raise ValueError(f"不支持的文档类型: {document.document_type}")
 
+        metadata = {
+            "source": document.title,
+            "document_id": str(document.id),
+            "document_type": document.document_type,
+            "title": document.title,
+            "file_path": file_path
+        }
+
+        cache = ParsedContentCache.get_default()
+        parser_key = ParsedContentCache.parser_key('knowledge', document.document_type)
+        digest = self._file_digest(document, file_path) if cache is not None else None
+        cached_pages = cache.get(parser_key, digest) if cache is not None else None
+
+        if cached_pages is not None:
+            logger.info(f"📦 使用缓存的解析结果，页数: {len(cached_pages)}")
+            pages = iter(cached_pages)
+        else:
+            pages = self._parse_file(document, file_path, loader_class, errors)
+
+        parsed: List[Tuple[str, dict]] = []
+        errors_before = len(errors)
+        for page_content, page_metadata in pages:
+            parsed.append((page_content, dict(page_metadata)))
+            page_metadata.update(metadata)
+            yield LangChainDocument(page_content=page_content, metadata=page_metadata)
+
+        if not parsed:
+            raise ValueError(f"文档加载失败，没有内容: {file_path}")
+        logger.info(f"成功加载文档，页数: {len(parsed)}" + (f"，跳过 {len(errors)} 处解析错误" if errors else ""))
+
+        # 只缓存完整的解析结果，有页面解析失败时下次重新解析
+        if cache is not None and cached_pages is None and len(errors) == errors_before:
+            cache.set(parser_key, digest, parsed)
+
+    @staticmethod
+    def _file_digest(document: Document, file_path: str) -> str:
+        """获取文件的 SHA-256，首次计算后保存在文档上"""
+        if not document.file_digest:
+            document.file_digest = parsed_file_digest(file_path)
+            Document.objects.filter(pk=document.pk).update(file_digest=document.file_digest)
+        return document.file_digest
+
+    def _parse_file(self, document: Document, file_path: str, loader_class,
+                    errors: List[str]) -> Iterator[Tuple[str, dict]]:
+        """解析文件，逐页产出 (page_content, metadata)"""
+        # 文本文件解析开销很小，直接在当前线程读取；其余格式交给解析进程池
+        parse_pool = DocumentParsePool.from_settings() if document.document_type != 'txt' else None
+        if parse_pool is not None:
+            if document.document_type == 'pdf':
+                yield from parse_pool.iter_pdf_pages(file_path, errors)
+            else:
+                yield from parse_pool.load(loader_class, file_path)
+            return
+
         try:
             # 对于文本文件，使用UTF-8编码
             if document.document_type == 'txt':
@@ -288,19 +551,7 @@ class DocumentProcessor:
             if not docs:
                 raise ValueError(f"文档加载失败，没有内容: {file_path}")
 
-            logger.info(f"成功加载文档，页数: {len(docs)}")
-
-            # 添加元数据
-            for doc in docs:
-                doc.metadata.update({
-                    "source": document.title,
-                    "document_id": str(document.id),
-                    "document_type": document.document_type,
-                    "title": document.title,
-                    "file_path": file_path
-                })
-
-            return docs
+            pages = [(doc.page_content, doc.metadata) for doc in docs]
 
         except Exception as e:
             logger.error(f"文档加载器失败: {e}")
@@ -314,22 +565,25 @@ class DocumentProcessor:
                     if not content.strip():
                         raise ValueError("文件内容为空")
 
-                    return [LangChainDocument(
-                        page_content=content,
-                        metadata={
-                            "source": document.title,
-                            "document_id": str(document.id),
-                            "document_type": document.document_type,
-                            "title": document.title,
-                            "file_path": file_path
-                        }
-                    )]
+                    pages = [(content, {})]
                 except Exception as read_error:
                     logger.error(f"直接读取文件也失败: {read_error}")
                     raise
             else:
                 raise
 
+        yield from pages
+
+
+def _iter_batches(iterable: Iterable, size: int) -> Iterator[List]:
+    """将可迭代对象按固定大小分批"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 class VectorStoreManager:
     """向量存储管理器 - 支持稠密+稀疏混合检索"""
@@ -337,22 +591,84 @@ class VectorStoreManager:
     # 向量名称常量
     DENSE_VECTOR_NAME = "dense"
     SPARSE_VECTOR_NAME = "bm25"
-    # RRF 融合参数
+    # 跨知识库合并结果时的 RRF 参数
     RRF_K = 60
+    # 混合检索的 RRF 参数，与 Qdrant 服务端融合相同：各路 1 / (HYBRID_RRF_K + 排名) 之和（排名从 0 开始）。
+    # 客户端、服务端融合使用同一公式，并统一除以所有检索路都排第一时的分数归一化到 0-1，
+    # 同一个 score_threshold 在两种融合模式下过滤效果一致
+    HYBRID_RRF_K = 2
+    # 建立 keyword 索引的 payload 字段
+    PAYLOAD_INDEX_FIELDS = ('document_id', 'knowledge_base_id', 'document_type')
+    # 小知识库共享集合的名称前缀（按向量维度区分：kb_shared_<维度>）
+    SHARED_COLLECTION_PREFIX = 'kb_shared'
 
     # 类级别的缓存
     _vector_store_cache = {}
     _embeddings_cache = {}
     _sparse_encoder_cache = {}
+    _sparse_encoder_lock = threading.Lock()
     _global_config_cache = None
     _global_config_cache_time = 0
+    _qdrant_client_cache = {}
+    # 进程级管理器注册表：知识库ID -> VectorStoreManager
+    _manager_registry = {}
+    _registry_lock = threading.Lock()
+    _metrics_lock = threading.Lock()
+    _metrics = {
+        'managers_created': 0,
+        'registry_hits': 0,
+        'embedding_probes': 0,
+        'construction_seconds': 0.0,
+    }
 
     def __init__(self, knowledge_base: KnowledgeBase):
+        start_time = time.perf_counter()
         self.knowledge_base = knowledge_base
         self.global_config = self._get_global_config()
+        self.embeddings_key = self._embeddings_cache_key(self.global_config)
         self.embeddings = self._get_embeddings_instance()
         self.sparse_encoder = self._get_sparse_encoder()
         self._log_embedding_info()
+        self._record_metrics(managers_created=1, construction_seconds=time.perf_counter() - start_time)
+
+    @classmethod
+    def get_manager(cls, knowledge_base: KnowledgeBase) -> 'VectorStoreManager':
+        """
+        从进程级注册表获取知识库的管理器
+        嵌入配置变化后自动重建；复用时只替换知识库对象以获取最新的分块设置
+        """
+        cache_key = str(knowledge_base.id)
+        embeddings_key = cls._embeddings_cache_key(cls._get_global_config())
+
+        with cls._registry_lock:
+            manager = cls._manager_registry.get(cache_key)
+        if manager is not None and manager.embeddings_key == embeddings_key:
+            manager.knowledge_base = knowledge_base
+            cls._record_metrics(registry_hits=1)
+            return manager
+
+        manager = cls(knowledge_base)
+        with cls._registry_lock:
+            cls._manager_registry[cache_key] = manager
+        return manager
+
+    @classmethod
+    def _record_metrics(cls, **counts):
+        with cls._metrics_lock:
+            for key, value in counts.items():
+                cls._metrics[key] += value
+
+    @classmethod
+    def metrics(cls) -> Dict[str, Any]:
+        """获取当前进程的管理器构建统计"""
+        with cls._metrics_lock:
+            metrics = dict(cls._metrics)
+        with cls._registry_lock:
+            metrics['registry_size'] = len(cls._manager_registry)
+        created = metrics['managers_created']
+        metrics['construction_seconds'] = round(metrics['construction_seconds'], 4)
+        metrics['avg_construction_seconds'] = round(metrics['construction_seconds'] / created, 4) if created else 0.0
+        return metrics
 
     @classmethod
     def _get_global_config(cls):
@@ -370,14 +686,24 @@ class VectorStoreManager:
 
     @classmethod
     def clear_global_config_cache(cls):
-        """清理全局配置缓存"""
+        """清理全局配置缓存（注册表中的管理器持有旧配置，一并清理）"""
         cls._global_config_cache = None
         cls._global_config_cache_time = 0
+        with cls._registry_lock:
+            cls._manager_registry.clear()
+
+    @staticmethod
+    def _embeddings_cache_key(config) -> str:
+        """嵌入模型实例的缓存键"""
+        return (
+            f"{config.embedding_service}_{config.api_base_url}_{config.model_name}"
+            f"_{config.embedding_batch_size}_{config.embedding_concurrency}"
+        )
 
     def _get_embeddings_instance(self):
         """获取嵌入模型实例，使用全局配置"""
         config = self.global_config
-        cache_key = f"{config.embedding_service}_{config.api_base_url}_{config.model_name}"
+        cache_key = self._embeddings_cache_key(config)
         
         if cache_key not in self._embeddings_cache:
             embedding_service = config.embedding_service
@@ -391,12 +717,17 @@ class VectorStoreManager:
                     self._embeddings_cache[cache_key] = self._create_ollama_embeddings(config)
                 elif embedding_service == 'custom':
                     self._embeddings_cache[cache_key] = self._create_custom_api_embeddings(config)
+                elif embedding_service == 'local':
+                    self._embeddings_cache[cache_key] = self._create_local_embeddings(config)
                 else:
                     raise ValueError(f"不支持的嵌入服务: {embedding_service}")
-                    
-                # 测试嵌入功能
-                test_embedding = self._embeddings_cache[cache_key].embed_query("模型功能测试")
-                logger.info(f"✅ 嵌入模型测试成功: {embedding_service}, 维度: {len(test_embedding)}")
+
+                # 测试嵌入功能（同一配置只校验一次，维度记录到全局配置）
+                if config.is_embedding_validated:
+                    logger.info(f"✅ 嵌入配置已校验: {embedding_service}, 维度: {config.embedding_dimension}")
+                else:
+                    dimension = self._probe_embedding_dimension(self._embeddings_cache[cache_key])
+                    logger.info(f"✅ 嵌入模型测试成功: {embedding_service}, 维度: {dimension}")
                 
             except Exception as e:
                 logger.error(f"❌ 嵌入服务 {embedding_service} 初始化失败: {str(e)}")
@@ -404,21 +735,53 @@ class VectorStoreManager:
                 
         return self._embeddings_cache[cache_key]
 
+    def _probe_embedding_dimension(self, embeddings) -> int:
+        """调用一次嵌入服务获取向量维度，并记录到全局配置"""
+        config = self.global_config
+        dimension = len(embeddings.embed_query("模型功能测试"))
+        self._record_metrics(embedding_probes=1)
+
+        signature = config.embedding_signature()
+        KnowledgeGlobalConfig.objects.filter(pk=config.pk).update(
+            embedding_dimension=dimension, validated_signature=signature
+        )
+        config.embedding_dimension = dimension
+        config.validated_signature = signature
+        return dimension
+
+    def _get_embedding_dimension(self) -> int:
+        """获取当前嵌入模型的向量维度（优先使用已记录的值）"""
+        config = self.global_config
+        if config.is_embedding_validated:
+            return config.embedding_dimension
+        return self._probe_embedding_dimension(self.embeddings)
+
     def _get_sparse_encoder(self) -> Optional[SparseBM25Encoder]:
         """获取 BM25 稀疏编码器（带缓存）"""
-        cache_key = self.SPARSE_VECTOR_NAME
-        
-        if cache_key not in self._sparse_encoder_cache:
-            try:
-                self._sparse_encoder_cache[cache_key] = SparseBM25Encoder()
-            except ImportError as e:
-                logger.warning(f"⚠️ FastEmbed 未安装，将使用纯稠密向量检索: {e}")
-                self._sparse_encoder_cache[cache_key] = None
-            except Exception as e:
-                logger.warning(f"⚠️ BM25 编码器初始化失败: {e}，降级为纯稠密检索")
-                self._sparse_encoder_cache[cache_key] = None
-        
-        return self._sparse_encoder_cache[cache_key]
+        return self.load_sparse_encoder()
+
+    @classmethod
+    def load_sparse_encoder(cls) -> Optional[SparseBM25Encoder]:
+        """
+        加载（或复用已加载的）进程级 BM25 稀疏编码器
+        启动预热与请求并发加载时，后到的调用等待同一次加载完成，不会重复加载
+        """
+        cache_key = cls.SPARSE_VECTOR_NAME
+        if cache_key in cls._sparse_encoder_cache:
+            return cls._sparse_encoder_cache[cache_key]
+
+        with cls._sparse_encoder_lock:
+            if cache_key not in cls._sparse_encoder_cache:
+                try:
+                    cls._sparse_encoder_cache[cache_key] = SparseBM25Encoder()
+                except ImportError as e:
+                    logger.warning(f"⚠️ FastEmbed 未安装，将使用纯稠密向量检索: {e}")
+                    cls._sparse_encoder_cache[cache_key] = None
+                except Exception as e:
+                    logger.warning(f"⚠️ BM25 编码器初始化失败: {e}，降级为纯稠密检索")
+                    cls._sparse_encoder_cache[cache_key] = None
+
+        return cls._sparse_encoder_cache[cache_key]
     
     def _create_openai_embeddings(self, config):
         """创建OpenAI Embeddings实例"""
@@ -490,9 +853,23 @@ class VectorStoreManager:
             api_base_url=config.api_base_url,
             api_key=config.api_key,
             custom_headers={},
-            model_name=config.model_name
+            model_name=config.model_name,
+            batch_size=config.embedding_batch_size,
+            max_concurrency=config.embedding_concurrency
         )
     
+    def _create_local_embeddings(self, config):
+        """创建本地 FastEmbed Embeddings实例"""
+        model_name = config.model_name or FastEmbedEmbeddings.DEFAULT_MODEL
+        threads = getattr(settings, 'KNOWLEDGE_LOCAL_EMBEDDING_THREADS', None) or None
+
+        logger.info(f"🚀 初始化本地嵌入模型: {model_name}")
+        return FastEmbedEmbeddings(
+            model_name=model_name,
+            batch_size=config.embedding_batch_size,
+            threads=threads
+        )
+
     def _log_embedding_info(self):
         """记录嵌入模型信息"""
         embedding_type = type(self.embeddings).__name__
@@ -509,6 +886,8 @@ class VectorStoreManager:
             logger.info(f"   🎉 说明: 使用Ollama本地API嵌入服务")
         elif embedding_type == "CustomAPIEmbeddings":
             logger.info(f"   🎉 说明: 使用自定义HTTP API嵌入服务")
+        elif embedding_type == "FastEmbedEmbeddings":
+            logger.info(f"   🎉 说明: 使用进程内 FastEmbed 本地嵌入模型")
 
         self._vector_store = None
         self._qdrant_client = None
@@ -518,34 +897,75 @@ class VectorStoreManager:
         logger.info(f"   ✅ 实际使用的嵌入模型: {embedding_type}")
         logger.info(f"   💾 向量存储类型: Qdrant")
 
-    def _get_qdrant_url(self) -> str:
+    @staticmethod
+    def _get_qdrant_url() -> str:
         """获取 Qdrant 服务地址"""
         return os.environ.get('QDRANT_URL', 'http://localhost:8918')
 
     def _get_collection_name(self) -> str:
-        """获取集合名称"""
+        """获取集合名称（共享布局的知识库使用对应维度的共享集合）"""
+        if self.knowledge_base.vector_layout == 'shared':
+            dimension = self.knowledge_base.vector_dimension or self._get_embedding_dimension()
+            return f"{self.SHARED_COLLECTION_PREFIX}_{dimension}"
         return f"kb_{self.knowledge_base.id}"
 
+    @classmethod
+    def _shared_collection_names(cls, client: QdrantClient) -> List[str]:
+        """列出所有共享集合"""
+        prefix = f"{cls.SHARED_COLLECTION_PREFIX}_"
+        return [
+            collection.name for collection in client.get_collections().collections
+            if collection.name.startswith(prefix)
+        ]
+
+    @staticmethod
+    def _knowledge_base_condition(knowledge_base_id) -> models.FieldCondition:
+        return models.FieldCondition(key='knowledge_base_id', match=models.MatchValue(value=str(knowledge_base_id)))
+
+    def _scope_filter(self, search_filter: Optional[models.Filter]) -> Optional[models.Filter]:
+        """共享集合中的检索限定在本知识库的分区内"""
+        if self.knowledge_base.vector_layout != 'shared':
+            return search_filter
+        must = [self._knowledge_base_condition(self.knowledge_base.id)]
+        if search_filter is not None:
+            must.append(search_filter)
+        return models.Filter(must=must)
+
+    @classmethod
+    def _get_shared_qdrant_client(cls, qdrant_url: str) -> QdrantClient:
+        """获取进程内共享的 Qdrant 客户端（复用连接池）"""
+        client = cls._qdrant_client_cache.get(qdrant_url)
+        if client is None:
+            client = QdrantClient(url=qdrant_url)
+            cls._qdrant_client_cache[qdrant_url] = client
+            logger.info(f"🔗 已连接 Qdrant: {qdrant_url}")
+        return client
+
     @property
     def qdrant_client(self) -> QdrantClient:
         """获取 Qdrant 客户端"""
         if self._qdrant_client is None:
-            qdrant_url = self._get_qdrant_url()
-            self._qdrant_client = QdrantClient(url=qdrant_url)
-            logger.info(f"🔗 已连接 Qdrant: {qdrant_url}")
+            self._qdrant_client = self._get_shared_qdrant_client(self._get_qdrant_url())
         return self._qdrant_client
 
     @property
     def vector_store(self):
         """获取向量存储实例（带缓存和健康检查）"""
-        if self._vector_store is None:
-            cache_key = str(self.knowledge_base.id)
+        collection_name = self._get_collection_name()
+        cache_key = str(self.knowledge_base.id)
+        cached_store = self._vector_store_cache.get(cache_key)
+        if cached_store is not None and cached_store.collection_name != collection_name:
+            # 知识库已迁移集合布局，缓存的向量存储指向旧集合
+            del self._vector_store_cache[cache_key]
+        if self._vector_store is not None and self._vector_store.collection_name != collection_name:
+            self._vector_store = None
 
+        if self._vector_store is None:
             if cache_key in self._vector_store_cache:
                 cached_store = self._vector_store_cache[cache_key]
                 try:
                     # 验证 Qdrant 集合是否存在
-                    self.qdrant_client.get_collection(self._get_collection_name())
+                    self.qdrant_client.get_collection(collection_name)
                     logger.info(f"使用缓存的向量存储实例: {cache_key}")
                     self._vector_store = cached_store
                 except Exception as e:
@@ -569,15 +989,25 @@ class VectorStoreManager:
             if cache_key in cls._vector_store_cache:
                 del cls._vector_store_cache[cache_key]
                 logger.info(f"已清理知识库 {cache_key} 的向量存储缓存")
+            with cls._registry_lock:
+                cls._manager_registry.pop(cache_key, None)
 
-            # 清理 Qdrant 集合
+            # 清理 Qdrant 集合（以及共享集合中该知识库的分区）
             try:
                 qdrant_url = os.environ.get('QDRANT_URL', 'http://localhost:8918')
-                client = QdrantClient(url=qdrant_url)
+                client = cls._get_shared_qdrant_client(qdrant_url)
                 collection_name = f"kb_{knowledge_base_id}"
                 if client.collection_exists(collection_name):
                     client.delete_collection(collection_name)
                     logger.info(f"已删除 Qdrant 集合: {collection_name}")
+                for shared_name in cls._shared_collection_names(client):
+                    client.delete(
+                        collection_name=shared_name,
+                        points_selector=models.FilterSelector(
+                            filter=models.Filter(must=[cls._knowledge_base_condition(knowledge_base_id)])
+                        ),
+                        wait=True,
+                    )
             except Exception as e:
                 logger.warning(f"清理 Qdrant 集合失败: {e}")
         else:
@@ -585,21 +1015,66 @@ class VectorStoreManager:
             cls._vector_store_cache.clear()
             cls._embeddings_cache.clear()
             cls._sparse_encoder_cache.clear()
+            with cls._registry_lock:
+                cls._manager_registry.clear()
             logger.info("已清理所有向量存储缓存")
 
     def _create_vector_store(self):
         """创建 Qdrant 向量存储（支持稠密+稀疏混合）"""
+        self._choose_initial_layout()
         collection_name = self._get_collection_name()
+        self._ensure_collection(collection_name)
+
+        # 使用 LangChain 的 QdrantVectorStore（用于兼容性，实际混合查询直接用 client）
+        # 集合已由上面创建，跳过其构造时用 dummy_text 探测维度的校验
+        qdrant_store = QdrantVectorStore(
+            client=self.qdrant_client,
+            collection_name=collection_name,
+            embedding=self.embeddings,
+            vector_name=self.DENSE_VECTOR_NAME,
+            validate_collection_config=False
+        )
         
-        # 获取嵌入向量维度
-        test_embedding = self.embeddings.embed_query("测试")
-        vector_size = len(test_embedding)
+        return qdrant_store
+
+    def _uses_default_storage(self) -> bool:
+        """知识库是否使用默认存储配置（自定义量化 / 磁盘存储 / HNSW 参数需要独立集合）"""
+        kb = self.knowledge_base
+        return (
+            kb.quantization == 'none' and not kb.vectors_on_disk and not kb.payload_on_disk
+            and not kb.hnsw_m and not kb.hnsw_ef_construct
+        )
+
+    def _choose_initial_layout(self):
+        """启用共享集合时，尚未写入过向量的小知识库直接放入共享集合"""
+        kb = self.knowledge_base
+        if (
+            kb.vector_layout != 'dedicated'
+            or not getattr(settings, 'KNOWLEDGE_SHARED_COLLECTION_ENABLED', False)
+            or not self._uses_default_storage()
+            or self.qdrant_client.collection_exists(self._get_collection_name())
+        ):
+            return
+        KnowledgeBase.objects.filter(pk=kb.pk).update(vector_layout='shared')
+        kb.vector_layout = 'shared'
+        logger.info(f"📦 知识库 {kb.id} 使用共享集合")
+
+    def _ensure_collection(self, collection_name: str):
+        """确保集合存在；共享集合关闭全局 HNSW 图，按 knowledge_base_id 为每个租户单独建图"""
+        shared = self.knowledge_base.vector_layout == 'shared'
+
+        # 获取嵌入向量维度（已记录时不再调用嵌入服务）
+        vector_size = self._get_embedding_dimension()
         
-        # 配置命名向量（用于混合检索）
+        # 配置命名向量（用于混合检索），量化、磁盘存储和 HNSW 参数按知识库配置
+        storage = self.storage_options(self.knowledge_base)
+        if shared:
+            storage['hnsw_config'] = models.HnswConfigDiff(m=0, payload_m=16)
         vectors_config = {
             self.DENSE_VECTOR_NAME: VectorParams(
                 size=vector_size,
-                distance=Distance.COSINE
+                distance=Distance.COSINE,
+                on_disk=storage['vectors_on_disk'],
             )
         }
         
@@ -608,7 +1083,7 @@ class VectorStoreManager:
         if self.sparse_encoder:
             sparse_vectors_config = {
                 self.SPARSE_VECTOR_NAME: SparseVectorParams(
-                    index=SparseIndexParams(on_disk=False)
+                    index=SparseIndexParams(on_disk=storage['vectors_on_disk'])
                 )
             }
         
@@ -618,11 +1093,29 @@ class VectorStoreManager:
                 self.qdrant_client.create_collection(
                     collection_name=collection_name,
                     vectors_config=vectors_config,
-                    sparse_vectors_config=sparse_vectors_config
+                    sparse_vectors_config=sparse_vectors_config,
+                    on_disk_payload=storage['payload_on_disk'],
+                    hnsw_config=storage['hnsw_config'],
+                    quantization_config=storage['quantization_config'],
                 )
+                self._ensure_payload_indexes(collection_name, existing_schema={}, tenant=shared)
                 mode = "稀疏+稠密混合" if sparse_vectors_config else "纯稠密"
                 logger.info(f"✅ 创建 Qdrant 集合: {collection_name}, 维度: {vector_size}, 模式: {mode}")
+                KnowledgeBase.objects.filter(pk=self.knowledge_base.pk).update(vector_dimension=vector_size)
+                self.knowledge_base.vector_dimension = vector_size
             else:
+                if shared and not self.knowledge_base.vector_dimension:
+                    # 共享集合已由其他知识库创建
+                    KnowledgeBase.objects.filter(pk=self.knowledge_base.pk).update(vector_dimension=vector_size)
+                    self.knowledge_base.vector_dimension = vector_size
+                if self.knowledge_base.vector_dimension and self.knowledge_base.vector_dimension != vector_size:
+                    logger.warning(
+                        f"⚠️ 知识库向量维度 {self.knowledge_base.vector_dimension} 与当前嵌入模型维度 "
+                        f"{vector_size} 不一致，请重新处理文档"
+                    )
+                # 旧集合补建 payload 索引
+                self._ensure_payload_indexes(collection_name, tenant=shared)
+
                 # 检查是否需要更新稀疏配置
                 if sparse_vectors_config:
                     try:
@@ -634,113 +1127,425 @@ class VectorStoreManager:
                         logger.debug(f"跳过稀疏配置更新: {e}")
         except Exception as e:
             logger.warning(f"检查/创建集合时出错: {e}")
-        
-        # 使用 LangChain 的 QdrantVectorStore（用于兼容性，实际混合查询直接用 client）
-        qdrant_store = QdrantVectorStore(
-            client=self.qdrant_client,
-            collection_name=collection_name,
-            embedding=self.embeddings,
-            vector_name=self.DENSE_VECTOR_NAME
+
+    @staticmethod
+    def storage_options(knowledge_base) -> Dict[str, Any]:
+        """
+        知识库的向量存储参数（量化、磁盘存储、HNSW）
+        knowledge_base 只需要具有 KnowledgeBase 的同名存储字段（基准测试命令传入临时配置）
+        """
+        quantization_config = None
+        if knowledge_base.quantization == 'scalar':
+            quantization_config = models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True,
+            ))
+        elif knowledge_base.quantization == 'binary':
+            quantization_config = models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+
+        hnsw_config = None
+        if knowledge_base.hnsw_m or knowledge_base.hnsw_ef_construct:
+            hnsw_config = models.HnswConfigDiff(
+                m=knowledge_base.hnsw_m or None, ef_construct=knowledge_base.hnsw_ef_construct or None
+            )
+
+        return {
+            'quantization_config': quantization_config,
+            'hnsw_config': hnsw_config,
+            'vectors_on_disk': bool(knowledge_base.vectors_on_disk),
+            'payload_on_disk': bool(knowledge_base.payload_on_disk),
+        }
+
+    @staticmethod
+    def search_params(knowledge_base) -> Optional[models.SearchParams]:
+        """量化集合的稠密检索参数：先用量化向量多取候选，再用原始向量重排序"""
+        if knowledge_base.quantization == 'none':
+            return None
+        oversampling = getattr(settings, 'KNOWLEDGE_QUANTIZATION_OVERSAMPLING', 2.0)
+        return models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
         )
-        
-        return qdrant_store
 
-    def add_documents(self, documents: List[LangChainDocument], document_obj: Document) -> List[str]:
-        """添加文档到向量存储（稠密+稀疏混合）"""
+    def apply_storage_settings(self) -> Optional[Dict[str, Any]]:
+        """
+        将知识库的存储配置迁移到已有集合，只提交与当前集合配置不同的部分
+        Qdrant 在后台按新配置重建段，迁移期间检索不受影响；返回实际变更的配置项
+        需要迁移集合布局但有文档正在入库时不迁移，返回 None，由调用方稍后重试
+        """
+        if self.knowledge_base.vector_layout == 'shared':
+            # 共享集合使用统一配置，自定义存储配置的知识库迁移到独立集合（按新配置创建）
+            if self._uses_default_storage():
+                return {}
+            if self._has_pending_ingest():
+                logger.info(f"知识库 {self.knowledge_base.id} 有文档正在入库，暂缓迁移到独立集合")
+                return None
+            self.migrate_layout('dedicated')
+            return {'vector_layout': 'dedicated'}
+
+        collection_name = self._get_collection_name()
+        if not self.qdrant_client.collection_exists(collection_name):
+            return {}
+
+        storage = self.storage_options(self.knowledge_base)
+        config = self.qdrant_client.get_collection(collection_name).config
+        dense_params = config.params.vectors[self.DENSE_VECTOR_NAME]
+        changes: Dict[str, Any] = {}
+
+        if bool(dense_params.on_disk) != storage['vectors_on_disk']:
+            changes['vectors_config'] = {
+                self.DENSE_VECTOR_NAME: models.VectorParamsDiff(on_disk=storage['vectors_on_disk'])
+            }
+        sparse_params = (config.params.sparse_vectors or {}).get(self.SPARSE_VECTOR_NAME)
+        if sparse_params and bool(sparse_params.index and sparse_params.index.on_disk) != storage['vectors_on_disk']:
+            changes['sparse_vectors_config'] = {
+                self.SPARSE_VECTOR_NAME: SparseVectorParams(index=SparseIndexParams(on_disk=storage['vectors_on_disk']))
+            }
+        if bool(config.params.on_disk_payload) != storage['payload_on_disk']:
+            changes['collection_params'] = models.CollectionParamsDiff(on_disk_payload=storage['payload_on_disk'])
+
+        current_quantization = 'none'
+        if isinstance(config.quantization_config, models.ScalarQuantization):
+            current_quantization = 'scalar'
+        elif isinstance(config.quantization_config, models.BinaryQuantization):
+            current_quantization = 'binary'
+        if current_quantization != self.knowledge_base.quantization:
+            changes['quantization_config'] = storage['quantization_config'] or models.Disabled.DISABLED
+
+        hnsw = storage['hnsw_config']
+        if hnsw and (
+            (hnsw.m and hnsw.m != config.hnsw_config.m)
+            or (hnsw.ef_construct and hnsw.ef_construct != config.hnsw_config.ef_construct)
+        ):
+            changes['hnsw_config'] = hnsw
+
+        if changes:
+            self.qdrant_client.update_collection(collection_name=collection_name, **changes)
+            logger.info(f"✅ 已迁移集合 {collection_name} 的存储配置: {', '.join(changes)}")
+        return changes
+
+    def _ensure_payload_indexes(self, collection_name: str, existing_schema: Optional[Dict[str, Any]] = None,
+                                tenant: bool = False):
+        """
+        为按文档删除、按文档/类型过滤检索使用的 payload 字段创建 keyword 索引
+        tenant=True 时 knowledge_base_id 建为租户索引，Qdrant 按知识库聚集存储同一租户的向量
+        """
+        try:
+            if existing_schema is None:
+                existing_schema = self.qdrant_client.get_collection(collection_name).payload_schema or {}
+            for field_name in self.PAYLOAD_INDEX_FIELDS:
+                if field_name not in existing_schema:
+                    field_schema = models.PayloadSchemaType.KEYWORD
+                    if tenant and field_name == 'knowledge_base_id':
+                        field_schema = models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+                    self.qdrant_client.create_payload_index(
+                        collection_name=collection_name,
+                        field_name=field_name,
+                        field_schema=field_schema,
+                    )
+                    logger.info(f"✅ 创建 payload 索引: {collection_name}.{field_name}")
+        except Exception as e:
+            logger.warning(f"创建 payload 索引失败: {e}")
+
+    @staticmethod
+    def build_search_filter(filters: Optional[Dict[str, Any]]) -> Optional[models.Filter]:
+        """
+        将检索过滤条件转换为 Qdrant Filter，在 Qdrant 内完成过滤
+        支持的键：
+        - document_ids:   只检索这些文档
+        - document_types: 只检索这些类型的文档（pdf/docx/txt/...）
+        - metadata:       其他 payload 字段的匹配条件，值为列表时匹配任一值，
+                          例如 {"tags": ["登录", "支付"]}
+        """
+        if not filters:
+            return None
+
+        conditions = []
+        if filters.get('document_ids'):
+            conditions.append(models.FieldCondition(
+                key='document_id', match=models.MatchAny(any=[str(value) for value in filters['document_ids']])
+            ))
+        if filters.get('document_types'):
+            conditions.append(models.FieldCondition(
+                key='document_type', match=models.MatchAny(any=list(filters['document_types']))
+            ))
+        for key, value in (filters.get('metadata') or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                match = models.MatchAny(any=list(value))
+            else:
+                match = models.MatchValue(value=value)
+            conditions.append(models.FieldCondition(key=key, match=match))
+
+        return models.Filter(must=conditions) if conditions else None
+
+    def _build_payload(self, chunk: LangChainDocument, chunk_index: int, vector_id: str,
+                       document_obj: Document) -> Dict[str, Any]:
+        """构建分块在 Qdrant 中的 payload"""
+        payload = dict(chunk.metadata or {})
+        payload.update({
+            "page_content": chunk.page_content,
+            "document_id": str(document_obj.id),
+            "document_type": document_obj.document_type,
+            "chunk_index": chunk_index,
+            "vector_id": vector_id,
+            "knowledge_base_id": str(self.knowledge_base.id),
+        })
+        return payload
+
+    def _build_point(self, chunk: LangChainDocument, chunk_index: int, vector_id: str,
+                     dense_vector: List[float], sparse_vec, document_obj: Document) -> PointStruct:
+        """构建包含稠密向量（及可选稀疏向量）的 PointStruct"""
+        vectors = {self.DENSE_VECTOR_NAME: dense_vector}
+        if sparse_vec is not None:
+            vectors[self.SPARSE_VECTOR_NAME] = SparseVector(
+                indices=sparse_vec.indices.tolist(),
+                values=sparse_vec.values.tolist(),
+            )
+        return PointStruct(
+            id=vector_id,
+            vector=vectors,
+            payload=self._build_payload(chunk, chunk_index, vector_id, document_obj),
+        )
+
+    def _encode_chunks(self, chunk_texts: List[str]):
+        """计算分块的稠密向量和稀疏向量"""
+        # 计算稠密向量（未变化的分块直接复用嵌入缓存）
+        dense_embeddings = self._embed_documents(chunk_texts)
+
+        # 计算稀疏向量（如果可用）
+        sparse_embeddings = None
+        if self.sparse_encoder:
+            sparse_embeddings = self.sparse_encoder.encode_documents(chunk_texts)
+
+        return dense_embeddings, sparse_embeddings
+
+    def _iter_chunks(self, documents: Iterable[LangChainDocument]) -> Iterator[Tuple[int, LangChainDocument]]:
+        """逐页分块，按全局顺序产出 (chunk_index, 分块)，不一次性持有全部分块"""
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.knowledge_base.chunk_size,
+            chunk_overlap=self.knowledge_base.chunk_overlap
+        )
+        chunk_index = 0
+        for document in documents:
+            for chunk in text_splitter.split_documents([document]):
+                yield chunk_index, chunk
+                chunk_index += 1
+
+    def count_chunks(self, documents: Iterable[LangChainDocument]) -> int:
+        """统计文档的分块数量（用于计算处理进度）"""
+        return sum(1 for _ in self._iter_chunks(documents))
+
+    def ingest_fingerprint(self, documents: Iterable[LangChainDocument]) -> str:
+        """文档内容与分块配置的指纹，相同指纹的中断任务可从检查点继续"""
+        digest = hashlib.sha256(
+            f"{self.knowledge_base.chunk_size}:{self.knowledge_base.chunk_overlap}".encode()
+        )
+        for document in documents:
+            digest.update(document.page_content.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def matches_committed_chunks(self, documents: Iterable[LangChainDocument], document_obj: Document) -> bool:
+        """
+        已提交的分块是否与重新分块结果的前缀一致（按内容哈希逐一对比）
+        首次流式入库在解析完成前中断时没有完整的内容指纹，用于判断能否从检查点继续
+        """
+        committed = list(
+            document_obj.chunks.order_by('chunk_index').values_list('chunk_index', 'embedding_hash')
+        )
+        expected = (
+            (chunk_index, compute_content_hash(chunk.page_content))
+            for chunk_index, chunk in self._iter_chunks(documents)
+        )
+        return committed == list(islice(expected, len(committed)))
+
+    @staticmethod
+    def _chunk_vector_id(document_obj: Document, chunk_index: int) -> str:
+        """按文档和分块位置生成确定性的向量ID，重试同一批次时写入是幂等的"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"wharttest-knowledge/{document_obj.id}/{chunk_index}"))
+
+    def add_documents(self, documents: Iterable[LangChainDocument], document_obj: Document,
+                      resume_from: int = 0) -> int:
+        """
+        流式添加文档到向量存储（稠密+稀疏混合）
+        分块 → 批量嵌入 → 稀疏编码 → 写入 Qdrant → 保存分块记录，逐批执行，
+        内存占用只与批大小相关。每批提交后更新 Document.processed_chunks 检查点，
+        resume_from 指定从第几个分块继续。返回文档的分块总数
+        """
         try:
             # 确保集合存在（触发 vector_store 属性会创建集合）
             _ = self.vector_store
-            
-            # 文档分块
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.knowledge_base.chunk_size,
-                chunk_overlap=self.knowledge_base.chunk_overlap
-            )
-            chunks = text_splitter.split_documents(documents)
-            
-            # 生成唯一的 vector_ids
-            vector_ids = [str(uuid.uuid4()) for _ in chunks]
-            chunk_texts = [chunk.page_content for chunk in chunks]
-            
-            # 计算稠密向量
-            dense_embeddings = self.embeddings.embed_documents(chunk_texts)
-            
-            # 计算稀疏向量（如果可用）
-            sparse_embeddings = None
-            if self.sparse_encoder:
-                sparse_embeddings = self.sparse_encoder.encode_documents(chunk_texts)
-            
-            # 构建 PointStruct 列表
-            points: List[PointStruct] = []
-            for i, (chunk, vector_id, dense_vector) in enumerate(zip(chunks, vector_ids, dense_embeddings)):
-                payload = dict(chunk.metadata or {})
-                payload.update({
-                    "page_content": chunk.page_content,
-                    "document_id": str(document_obj.id),
-                    "chunk_index": i,
-                    "vector_id": vector_id,
-                    "knowledge_base_id": str(self.knowledge_base.id),
-                })
-                
-                # 构建向量配置
-                vectors = {self.DENSE_VECTOR_NAME: dense_vector}
-                
-                # 添加稀疏向量（如果可用）
-                sparse_vectors = None
-                if sparse_embeddings and sparse_embeddings[i]:
-                    sparse_vec = sparse_embeddings[i]
-                    sparse_vectors = {
-                        self.SPARSE_VECTOR_NAME: SparseVector(
-                            indices=sparse_vec.indices.tolist(),
-                            values=sparse_vec.values.tolist(),
-                        )
-                    }
-                
-                point = PointStruct(
-                    id=vector_id,
-                    vector=vectors,
-                    payload=payload,
-                )
-                
-                # Qdrant SDK 需要单独设置 sparse_vectors
-                if sparse_vectors:
-                    point = PointStruct(
-                        id=vector_id,
-                        vector={
-                            self.DENSE_VECTOR_NAME: dense_vector,
-                            self.SPARSE_VECTOR_NAME: SparseVector(
-                                indices=sparse_embeddings[i].indices.tolist(),
-                                values=sparse_embeddings[i].values.tolist(),
-                            )
-                        },
-                        payload=payload,
+
+            batch_size = max(1, getattr(settings, 'KNOWLEDGE_INGEST_BATCH_SIZE', 64))
+            collection_name = self._get_collection_name()
+            processed = resume_from
+            mode = "稀疏+稠密" if self.sparse_encoder else "纯稠密"
+
+            chunk_stream = (item for item in self._iter_chunks(documents) if item[0] >= resume_from)
+            for batch in _iter_batches(chunk_stream, batch_size):
+                indices = [chunk_index for chunk_index, _ in batch]
+                chunks = [chunk for _, chunk in batch]
+                vector_ids = [self._chunk_vector_id(document_obj, chunk_index) for chunk_index in indices]
+
+                dense_embeddings, sparse_embeddings = self._encode_chunks([chunk.page_content for chunk in chunks])
+
+                points: List[PointStruct] = [
+                    self._build_point(
+                        chunk, chunk_index, vector_id, dense_embeddings[j],
+                        sparse_embeddings[j] if sparse_embeddings else None,
+                        document_obj
                     )
-                
-                points.append(point)
-            
-            # 批量写入 Qdrant
-            self.qdrant_client.upsert(
-                collection_name=self._get_collection_name(),
-                points=points,
-            )
-            
-            mode = "稀疏+稠密" if sparse_embeddings else "纯稠密"
-            logger.info(f"✅ 已写入 {len(points)} 个分块到 Qdrant（{mode}）")
+                    for j, (chunk_index, chunk, vector_id) in enumerate(zip(indices, chunks, vector_ids))
+                ]
+                self.qdrant_client.upsert(collection_name=collection_name, points=points, wait=True)
+
+                # 分块记录与检查点在同一事务中提交
+                with transaction.atomic():
+                    self._save_chunks_to_db(chunks, vector_ids, document_obj, indices=indices)
+                    processed = indices[-1] + 1
+                    Document.objects.filter(pk=document_obj.pk).update(processed_chunks=processed)
+                document_obj.processed_chunks = processed
 
-            # 保存分块信息到数据库
-            self._save_chunks_to_db(chunks, vector_ids, document_obj)
+                progress = f"/{document_obj.total_chunks}" if document_obj.total_chunks else ""
+                logger.info(f"✅ 已写入 {processed}{progress} 个分块到 Qdrant（{mode}）")
 
-            return vector_ids
+            return processed
         except Exception as e:
             logger.error(f"添加文档到向量存储失败: {e}")
             raise
 
-    def _save_chunks_to_db(self, chunks: List[LangChainDocument], vector_ids: List[str], document_obj: Document):
+    def reindex_document(self, documents: List[LangChainDocument], document_obj: Document) -> Dict[str, int]:
+        """
+        增量重建文档索引
+        重新分块后按内容哈希与已有 DocumentChunk 对比：
+        - 新增/修改的分块：嵌入并写入新向量
+        - 删除的分块：删除对应向量
+        - 位置变化的分块：原地更新 chunk_index，不重新嵌入
+        Qdrant 的写入、更新、删除在一次 batch_update_points 请求中按序执行，
+        数据库变更在同一事务内完成，Qdrant 失败时回滚
+        """
+        try:
+            _ = self.vector_store
+
+            chunks = [chunk for _, chunk in self._iter_chunks(documents)]
+            existing = list(document_obj.chunks.order_by('chunk_index'))
+
+            # 相同内容的旧分块按位置排队，依次分配给新分块
+            reusable: Dict[str, deque] = defaultdict(deque)
+            removed: List[DocumentChunk] = []
+            for row in existing:
+                if row.vector_id and row.embedding_hash:
+                    reusable[row.embedding_hash].append(row)
+                else:
+                    removed.append(row)
+
+            added = []   # (新位置, 分块)
+            moved = []   # (新位置, 分块, 旧记录)
+            unchanged = 0
+            for i, chunk in enumerate(chunks):
+                candidates = reusable.get(compute_content_hash(chunk.page_content))
+                if not candidates:
+                    added.append((i, chunk))
+                    continue
+                row = candidates.popleft()
+                if row.chunk_index == i:
+                    unchanged += 1
+                else:
+                    moved.append((i, chunk, row))
+            removed.extend(row for rows in reusable.values() for row in rows)
+
+            # 只对新增分块计算向量
+            new_vector_ids = [str(uuid.uuid4()) for _ in added]
+            operations = []
+            if added:
+                dense_embeddings, sparse_embeddings = self._encode_chunks(
+                    [chunk.page_content for _, chunk in added]
+                )
+                points = [
+                    self._build_point(
+                        chunk, i, vector_id, dense_embeddings[j],
+                        sparse_embeddings[j] if sparse_embeddings else None,
+                        document_obj
+                    )
+                    for j, ((i, chunk), vector_id) in enumerate(zip(added, new_vector_ids))
+                ]
+                operations.append(models.UpsertOperation(upsert=models.PointsList(points=points)))
+            for i, chunk, row in moved:
+                operations.append(models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload=self._build_payload(chunk, i, row.vector_id, document_obj),
+                    points=[row.vector_id],
+                )))
+            removed_vector_ids = [row.vector_id for row in removed if row.vector_id]
+            if removed_vector_ids:
+                operations.append(models.DeleteOperation(
+                    delete=models.PointIdsList(points=removed_vector_ids)
+                ))
+
+            with transaction.atomic():
+                DocumentChunk.objects.filter(pk__in=[row.pk for row in removed]).delete()
+
+                if moved:
+                    # 先移到临时区间再写入最终位置，避免 (document, chunk_index) 唯一约束冲突
+                    offset = max([len(chunks)] + [row.chunk_index + 1 for row in existing])
+                    for i, _, row in moved:
+                        row.chunk_index = offset + i
+                    DocumentChunk.objects.bulk_update([row for _, _, row in moved], ['chunk_index'])
+                    for i, chunk, row in moved:
+                        row.chunk_index = i
+                        row.start_index = chunk.metadata.get('start_index')
+                        row.end_index = chunk.metadata.get('end_index')
+                        row.page_number = chunk.metadata.get('page')
+                    DocumentChunk.objects.bulk_update(
+                        [row for _, _, row in moved],
+                        ['chunk_index', 'start_index', 'end_index', 'page_number']
+                    )
+
+                if added:
+                    self._save_chunks_to_db(
+                        [chunk for _, chunk in added], new_vector_ids, document_obj,
+                        indices=[i for i, _ in added]
+                    )
+
+                if operations:
+                    self.qdrant_client.batch_update_points(
+                        collection_name=self._get_collection_name(),
+                        update_operations=operations,
+                        wait=True,
+                    )
+
+            stats = {
+                'total': len(chunks),
+                'added': len(added),
+                'removed': len(removed),
+                'moved': len(moved),
+                'unchanged': unchanged,
+            }
+            logger.info(
+                f"✅ 增量索引完成: 新增 {stats['added']}, 删除 {stats['removed']}, "
+                f"移动 {stats['moved']}, 未变化 {stats['unchanged']}"
+            )
+            return stats
+        except Exception as e:
+            logger.error(f"增量更新文档向量失败: {e}")
+            raise
+
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """计算文档稠密向量，优先读取嵌入缓存"""
+        cache = EmbeddingCache.get_default()
+        if cache is None:
+            return self.embeddings.embed_documents(texts)
+        return cache.embed_documents(
+            EmbeddingCache.model_key(self.global_config), texts, self.embeddings.embed_documents
+        )
+
+    def _save_chunks_to_db(self, chunks: List[LangChainDocument], vector_ids: List[str], document_obj: Document,
+                           indices: Optional[List[int]] = None):
         """保存分块信息到数据库"""
+        if indices is None:
+            indices = list(range(len(chunks)))
+
         chunk_objects = []
-        for i, (chunk, vector_id) in enumerate(zip(chunks, vector_ids)):
+        for i, chunk, vector_id in zip(indices, chunks, vector_ids):
             # 计算内容哈希
-            content_hash = hashlib.md5(chunk.page_content.encode()).hexdigest()
+            content_hash = compute_content_hash(chunk.page_content)
 
             chunk_obj = DocumentChunk(
                 document=document_obj,
@@ -756,26 +1561,99 @@ class VectorStoreManager:
 
         DocumentChunk.objects.bulk_create(chunk_objects)
 
-    def similarity_search(self, query: str, k: int = 5, score_threshold: float = 0.1) -> List[Dict[str, Any]]:
-        """相似度搜索（支持稠密+稀疏混合检索）"""
+    def encode_query(self, query: str) -> Tuple[List[float], Any]:
+        """
+        计算查询的稠密向量和稀疏向量（未启用 BM25 时稀疏向量为 None）
+        启用查询向量缓存时，重复查询直接复用缓存结果
+        """
+        cache = QueryEmbeddingCache.get_default()
+
+        if cache is None:
+            dense_vector = self.embeddings.embed_query(query)
+        else:
+            dense_vector = cache.get_or_compute(
+                EmbeddingCache.model_key(self.global_config), 'dense', query, self.embeddings.embed_query
+            )
+
+        sparse_query = None
+        if self.sparse_encoder:
+            try:
+                if cache is None:
+                    sparse_query = self.sparse_encoder.encode_query(query)
+                else:
+                    sparse_query = cache.get_or_compute(
+                        self.SPARSE_VECTOR_NAME, 'sparse', query, self._encode_sparse_query,
+                        dumps=SparseQueryVector.to_dict, loads=lambda data: SparseQueryVector(**data)
+                    )
+            except Exception as e:
+                logger.warning(f"⚠️ BM25 查询编码失败，仅使用稠密向量: {e}")
+        return dense_vector, sparse_query
+
+    def _encode_sparse_query(self, query: str) -> Optional[SparseQueryVector]:
+        """BM25 编码查询，转换为可缓存的稀疏向量"""
+        encoded = self.sparse_encoder.encode_query(query)
+        if encoded is None:
+            return None
+        return SparseQueryVector(encoded.indices, encoded.values)
+
+    def cached_similarity_search(self, query: str, k: int = 5, score_threshold: float = 0.1,
+                                 query_vectors=None,
+                                 filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        经过检索结果缓存（QueryResultCache）的相似度搜索，相同参数的查询在知识库内容未变化时直接返回缓存结果
+        query_vectors 可以是 encode_query 的结果，或返回该结果的函数（只在缓存未命中时调用）
+        """
+        def search_fn():
+            vectors = query_vectors() if callable(query_vectors) else query_vectors
+            return self.similarity_search(query, k=k, score_threshold=score_threshold,
+                                          query_vectors=vectors, filters=filters)
+
+        cache = QueryResultCache.get_default()
+        if cache is None:
+            return search_fn()
+        params = {
+            'top_k': k,
+            'similarity_threshold': score_threshold,
+            'filters': filters,
+            'embeddings': self.embeddings_key,
+            'fusion_mode': self.knowledge_base.fusion_mode,
+        }
+        return cache.get_or_search(self.knowledge_base.id, query, params, search_fn)
+
+    def similarity_search(self, query: str, k: int = 5, score_threshold: float = 0.1,
+                          query_vectors: Optional[Tuple[List[float], Any]] = None,
+                          filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        相似度搜索（支持稠密+稀疏混合检索）
+        query_vectors 为 encode_query 的结果，跨知识库检索时传入以避免重复嵌入；
+        filters 见 build_search_filter，过滤在 Qdrant 内执行
+        """
         embedding_type = type(self.embeddings).__name__
         logger.info(f"🔍 开始相似度搜索 (Qdrant):")
         logger.info(f"   📝 查询: '{query}'")
         logger.info(f"   🤖 使用嵌入模型: {embedding_type}")
         logger.info(f"   🎯 返回数量: {k}, 相似度阈值: {score_threshold}")
+        if filters:
+            logger.info(f"   🏷️ 过滤条件: {filters}")
+
+        dense_vector, sparse_query = query_vectors or self.encode_query(query)
+        search_filter = self._scope_filter(self.build_search_filter(filters))
 
         # 根据是否有稀疏编码器选择检索方式
-        if self.sparse_encoder:
+        if self.sparse_encoder and self.knowledge_base.fusion_mode == 'server':
+            logger.info("   🔀 使用混合检索（BM25 + 稠密向量，服务端融合）")
+            return self._server_hybrid_similarity_search(dense_vector, sparse_query, k, score_threshold, search_filter)
+        elif self.sparse_encoder:
             logger.info("   🔀 使用混合检索（BM25 + 稠密向量）")
-            return self._hybrid_similarity_search(query, k, score_threshold)
+            return self._hybrid_similarity_search(dense_vector, sparse_query, k, score_threshold, search_filter)
         else:
             logger.info("   📊 使用纯稠密向量检索")
-            return self._dense_similarity_search(query, k, score_threshold)
+            return self._dense_similarity_search(dense_vector, k, score_threshold, search_filter)
 
-    def _dense_similarity_search(self, query: str, k: int, score_threshold: float) -> List[Dict[str, Any]]:
+    def _dense_similarity_search(self, dense_vector: List[float], k: int, score_threshold: float,
+                                 search_filter: Optional[models.Filter] = None) -> List[Dict[str, Any]]:
         """纯稠密向量检索"""
         try:
-            dense_vector = self.embeddings.embed_query(query)
             collection_name = self._get_collection_name()
             
             results = self.qdrant_client.search(
@@ -784,6 +1662,8 @@ class VectorStoreManager:
                     name=self.DENSE_VECTOR_NAME,
                     vector=dense_vector,
                 ),
+                query_filter=search_filter,
+                search_params=self.search_params(self.knowledge_base),
                 limit=k,
                 with_payload=True,
             )
@@ -795,18 +1675,13 @@ class VectorStoreManager:
             logger.error(f"稠密向量搜索失败: {e}")
             raise
 
-    def _hybrid_similarity_search(self, query: str, k: int, score_threshold: float) -> List[Dict[str, Any]]:
+    def _hybrid_similarity_search(self, dense_vector: List[float], sparse_query, k: int, score_threshold: float,
+                                  search_filter: Optional[models.Filter] = None) -> List[Dict[str, Any]]:
         """混合检索（RRF 融合稠密+稀疏）"""
         try:
             collection_name = self._get_collection_name()
             per_source_limit = max(k * 3, 10)  # 每种检索方式多取一些候选
             
-            # 计算稠密向量
-            dense_vector = self.embeddings.embed_query(query)
-            
-            # 计算稀疏向量
-            sparse_query = self.sparse_encoder.encode_query(query)
-            
             # 稠密向量检索
             dense_results = self.qdrant_client.search(
                 collection_name=collection_name,
@@ -814,6 +1689,8 @@ class VectorStoreManager:
                     name=self.DENSE_VECTOR_NAME,
                     vector=dense_vector,
                 ),
+                query_filter=search_filter,
+                search_params=self.search_params(self.knowledge_base),
                 limit=per_source_limit,
                 with_payload=True,
             )
@@ -830,6 +1707,7 @@ class VectorStoreManager:
                             values=sparse_query.values.tolist(),
                         ),
                     ),
+                    query_filter=search_filter,
                     limit=per_source_limit,
                     with_payload=True,
                 )
@@ -837,7 +1715,7 @@ class VectorStoreManager:
             logger.info(f"🔍 稠密候选: {len(dense_results)}, 稀疏候选: {len(sparse_results)}")
             
             # RRF 融合
-            fused_results = self._rrf_fusion(dense_results, sparse_results, k)
+            fused_results = self._rrf_fusion(dense_results, sparse_results, k, sources=2 if sparse_query else 1)
             
             return self._format_fused_results(fused_results, score_threshold)
             
@@ -845,15 +1723,130 @@ class VectorStoreManager:
             logger.error(f"混合搜索失败: {e}")
             # 降级为纯稠密检索
             logger.warning("⚠️ 降级为纯稠密检索")
-            return self._dense_similarity_search(query, k, score_threshold)
+            return self._dense_similarity_search(dense_vector, k, score_threshold, search_filter)
+
+    def _server_hybrid_similarity_search(self, dense_vector: List[float], sparse_query, k: int,
+                                         score_threshold: float,
+                                         search_filter: Optional[models.Filter] = None) -> List[Dict[str, Any]]:
+        """
+        混合检索（Qdrant Query API 服务端 RRF 融合）
+        一次查询完成：prefetch 稠密+稀疏候选后服务端融合，只返回前 k 条 payload，
+        相似度与客户端融合使用同一归一化方式（见 HYBRID_RRF_K）；
+        默认不返回各路来源（fusion_detail 的 sources 为空、dense_score/sparse_score 为 None），
+        KNOWLEDGE_SERVER_FUSION_DETAIL 开启时同批次再执行稠密、稀疏两个无 payload 查询，
+        按各路排名返回完整的 fusion_detail（服务端检索量翻倍）
+        """
+        if not sparse_query:
+            return self._dense_similarity_search(dense_vector, k, score_threshold, search_filter)
 
-    def _rrf_fusion(self, dense_results, sparse_results, limit: int) -> List[Dict[str, Any]]:
-        """RRF (Reciprocal Rank Fusion) 融合两种检索结果"""
+        try:
+            collection_name = self._get_collection_name()
+            per_source_limit = max(k * 3, 10)
+            sparse_vector = SparseVector(
+                indices=sparse_query.indices.tolist(),
+                values=sparse_query.values.tolist(),
+            )
+            dense_params = self.search_params(self.knowledge_base)
+            fused_request = models.QueryRequest(
+                prefetch=[
+                    models.Prefetch(
+                        query=dense_vector, using=self.DENSE_VECTOR_NAME,
+                        filter=search_filter, params=dense_params, limit=per_source_limit,
+                    ),
+                    models.Prefetch(
+                        query=sparse_vector, using=self.SPARSE_VECTOR_NAME,
+                        filter=search_filter, limit=per_source_limit,
+                    ),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                filter=search_filter,
+                limit=k,
+                offset=0,
+                with_payload=True,
+            )
+
+            if not getattr(settings, 'KNOWLEDGE_SERVER_FUSION_DETAIL', False):
+                fused_response = self.qdrant_client.query_batch_points(
+                    collection_name=collection_name, requests=[fused_request]
+                )[0]
+                logger.info(f"🔍 服务端融合: 返回 {len(fused_response.points)}")
+                fused_results = [
+                    {
+                        "id": str(point.id),
+                        "payload": point.payload or {},
+                        "score": self._normalize_rrf(point.score, sources=2),
+                        "labels": {},
+                        "original_scores": {},
+                    }
+                    for point in fused_response.points
+                ]
+                return self._format_fused_results(fused_results, score_threshold)
+
+            query_requests = [
+                fused_request,
+                models.QueryRequest(
+                    query=dense_vector, using=self.DENSE_VECTOR_NAME, filter=search_filter,
+                    params=dense_params, limit=per_source_limit, offset=0, with_payload=False,
+                ),
+                models.QueryRequest(
+                    query=sparse_vector, using=self.SPARSE_VECTOR_NAME, filter=search_filter,
+                    limit=per_source_limit, offset=0, with_payload=False,
+                ),
+            ]
+            fused_response, dense_response, sparse_response = self.qdrant_client.query_batch_points(
+                collection_name=collection_name, requests=query_requests
+            )
+
+            logger.info(
+                f"🔍 服务端融合: 稠密候选 {len(dense_response.points)}, 稀疏候选 {len(sparse_response.points)}, "
+                f"返回 {len(fused_response.points)}"
+            )
+            fused_results = self._rank_fused_points(
+                fused_response.points,
+                {'dense': dense_response.points, 'sparse': sparse_response.points},
+            )
+            return self._format_fused_results(fused_results, score_threshold)
+
+        except Exception as e:
+            logger.error(f"服务端融合检索失败: {e}")
+            logger.warning("⚠️ 降级为客户端融合检索")
+            return self._hybrid_similarity_search(dense_vector, sparse_query, k, score_threshold, search_filter)
+
+    def _normalize_rrf(self, score: float, sources: int) -> float:
+        """RRF 分数除以 sources 路检索都排第一时的分数，归一化到 0-1"""
+        return min(score * self.HYBRID_RRF_K / max(sources, 1), 1.0)
+
+    def _rank_fused_points(self, fused_points, candidates: Dict[str, List]) -> List[Dict[str, Any]]:
+        """按候选列表中的排名为服务端融合结果计算与 _rrf_fusion 一致的归一化分数"""
+        ranks = {
+            label: {str(point.id): (rank, point.score) for rank, point in enumerate(points)}
+            for label, points in candidates.items()
+        }
+
+        fused_list = []
+        for point in fused_points:
+            point_id = str(point.id)
+            entry = {"id": point_id, "payload": point.payload or {}, "score": 0.0, "labels": {}, "original_scores": {}}
+            for label, ranked in ranks.items():
+                if point_id in ranked:
+                    rank, original_score = ranked[point_id]
+                    incremental = 1.0 / (self.HYBRID_RRF_K + rank)
+                    entry["score"] += incremental
+                    entry["labels"][label] = incremental
+                    entry["original_scores"][label] = original_score
+            entry["score"] = self._normalize_rrf(entry["score"], sources=len(candidates))
+            fused_list.append(entry)
+        return fused_list
+
+    def _rrf_fusion(self, dense_results, sparse_results, limit: int, sources: int = 2) -> List[Dict[str, Any]]:
+        """
+        RRF (Reciprocal Rank Fusion) 融合两种检索结果
+        sources 为查询的检索路数（没有命中的检索路也计入），归一化方式与服务端融合一致
+        """
         if not dense_results and not sparse_results:
             return []
         
         fused: Dict[str, Dict[str, Any]] = {}
-        contributors = 0
         
         def accumulate(results, label: str):
             for rank, point in enumerate(results):
@@ -865,26 +1858,18 @@ class VectorStoreManager:
                         "labels": {},
                         "original_scores": {},
                     }
-                incremental = 1.0 / (self.RRF_K + rank + 1)
+                incremental = 1.0 / (self.HYBRID_RRF_K + rank)
                 fused[point_id]["score"] += incremental
                 fused[point_id]["labels"][label] = incremental
                 fused[point_id]["original_scores"][label] = point.score
         
-        if dense_results:
-            contributors += 1
-            accumulate(dense_results, "dense")
-        if sparse_results:
-            contributors += 1
-            accumulate(sparse_results, "sparse")
-        
-        # 归一化分数到 0-1 范围
-        max_possible = contributors * (1.0 / (self.RRF_K + 1))
-        max_possible = max(max_possible, 1e-9)
+        accumulate(dense_results, "dense")
+        accumulate(sparse_results, "sparse")
         
         fused_list = []
         for point_id, data in fused.items():
             data["id"] = point_id
-            data["score"] = min(data["score"] / max_possible, 1.0)
+            data["score"] = self._normalize_rrf(data["score"], sources)
             fused_list.append(data)
         
         # 按融合分数降序排序
@@ -972,25 +1957,252 @@ class VectorStoreManager:
         return formatted_results
 
     def delete_document(self, document: Document):
-        """从 Qdrant 向量存储中删除文档"""
+        """从 Qdrant 向量存储中删除文档（按 document_id 过滤条件一次删除，不读取分块记录）"""
         try:
-            chunks = document.chunks.all()
-            vector_ids = [chunk.vector_id for chunk in chunks if chunk.vector_id]
-
-            if vector_ids:
-                # Qdrant 删除
-                collection_name = self._get_collection_name()
-                self.qdrant_client.delete(
-                    collection_name=collection_name,
-                    points_selector=vector_ids
-                )
-                logger.info(f"✅ 已从 Qdrant 删除 {len(vector_ids)} 个向量")
-
-            chunks.delete()
+            self.delete_document_vectors(self.knowledge_base.id, document.id, client=self.qdrant_client)
         except Exception as e:
             logger.error(f"删除文档向量失败: {e}")
             raise
 
+    @classmethod
+    def delete_document_vectors(cls, knowledge_base_id, document_id, client: Optional[QdrantClient] = None):
+        """
+        按 document_id payload 索引删除文档在知识库集合中的全部向量
+        文档可能在独立集合或共享集合中（删除知识库时记录可能已不可读），两处都按过滤条件删除
+        """
+        if client is None:
+            client = cls._get_shared_qdrant_client(os.environ.get('QDRANT_URL', 'http://localhost:8918'))
+        collection_name = f"kb_{knowledge_base_id}"
+        collection_names = cls._shared_collection_names(client)
+        if client.collection_exists(collection_name):
+            collection_names.insert(0, collection_name)
+
+        selector = models.FilterSelector(filter=models.Filter(must=[
+            cls._knowledge_base_condition(knowledge_base_id),
+            models.FieldCondition(key='document_id', match=models.MatchValue(value=str(document_id))),
+        ]))
+        for name in collection_names:
+            client.delete(collection_name=name, points_selector=selector, wait=True)
+        if collection_names:
+            logger.info(f"✅ 已从 Qdrant 删除文档 {document_id} 的向量")
+
+    def target_layout(self) -> str:
+        """
+        按知识库规模计算应使用的集合布局
+        - 分块数超过 KNOWLEDGE_SHARED_COLLECTION_PROMOTE_CHUNKS 或使用自定义存储配置：独立集合
+        - 分块数低于 KNOWLEDGE_SHARED_COLLECTION_DEMOTE_CHUNKS：共享集合
+        - 介于两者之间时保持不变，避免在阈值附近反复迁移
+        """
+        layout = self.knowledge_base.vector_layout
+        if not getattr(settings, 'KNOWLEDGE_SHARED_COLLECTION_ENABLED', False) or not self._uses_default_storage():
+            return 'dedicated'
+
+        chunk_count = DocumentChunk.objects.filter(document__knowledge_base=self.knowledge_base).count()
+        if layout == 'shared' and chunk_count > getattr(settings, 'KNOWLEDGE_SHARED_COLLECTION_PROMOTE_CHUNKS', 20000):
+            return 'dedicated'
+        if layout == 'dedicated' and chunk_count < getattr(settings, 'KNOWLEDGE_SHARED_COLLECTION_DEMOTE_CHUNKS', 5000):
+            return 'shared'
+        return layout
+
+    def rebalance_layout(self) -> Optional[str]:
+        """
+        知识库规模跨过阈值时在共享集合与独立集合之间迁移
+        有文档正在入库时跳过（下一次入库完成后再检查），返回迁移后的布局，未迁移时返回 None
+        """
+        target = self.target_layout()
+        if target == self.knowledge_base.vector_layout:
+            return None
+        if self._has_pending_ingest():
+            logger.info(f"知识库 {self.knowledge_base.id} 有文档正在入库，暂不迁移集合布局")
+            return None
+        self.migrate_layout(target)
+        return target
+
+    def _has_pending_ingest(self) -> bool:
+        """是否有文档正在入库（迁移集合布局期间写入的向量会丢失）"""
+        return self.knowledge_base.documents.filter(status__in=('pending', 'processing')).exists()
+
+    def migrate_layout(self, target: str):
+        """
+        将知识库的向量复制到目标布局的集合，切换布局后删除源集合中的向量
+        复制时保留点 ID、向量和 payload，不重新嵌入；复制失败时清理已复制的向量并保持原布局
+        """
+        kb = self.knowledge_base
+        source_layout = kb.vector_layout
+        if target == source_layout:
+            return
+        source_name = self._get_collection_name()
+        source_filter = self._scope_filter(None)
+
+        kb.vector_layout = target
+        target_name = self._get_collection_name()
+        copied = 0
+        try:
+            self._ensure_collection(target_name)
+            if self.qdrant_client.collection_exists(source_name):
+                offset = None
+                while True:
+                    points, offset = self.qdrant_client.scroll(
+                        collection_name=source_name,
+                        scroll_filter=source_filter,
+                        limit=256,
+                        offset=offset,
+                        with_payload=True,
+                        with_vectors=True,
+                    )
+                    if points:
+                        self.qdrant_client.upsert(
+                            collection_name=target_name,
+                            points=[
+                                PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                                for point in points
+                            ],
+                            wait=True,
+                        )
+                        copied += len(points)
+                    if offset is None:
+                        break
+            KnowledgeBase.objects.filter(pk=kb.pk).update(vector_layout=target)
+        except Exception:
+            kb.vector_layout = source_layout
+            try:
+                if target == 'shared':
+                    self.qdrant_client.delete(
+                        collection_name=target_name,
+                        points_selector=models.FilterSelector(
+                            filter=models.Filter(must=[self._knowledge_base_condition(kb.id)])
+                        ),
+                        wait=True,
+                    )
+                elif self.qdrant_client.collection_exists(target_name):
+                    self.qdrant_client.delete_collection(target_name)
+            except Exception as cleanup_error:
+                logger.warning(f"清理未完成的集合迁移失败: {cleanup_error}")
+            raise
+
+        self._vector_store = None
+        self._vector_store_cache.pop(str(kb.id), None)
+        if source_layout == 'shared':
+            self.qdrant_client.delete(
+                collection_name=source_name,
+                points_selector=models.FilterSelector(filter=source_filter),
+                wait=True,
+            )
+        elif self.qdrant_client.collection_exists(source_name):
+            self.qdrant_client.delete_collection(source_name)
+        logger.info(f"✅ 知识库 {kb.id} 已迁移到{'共享' if target == 'shared' else '独立'}集合 {target_name}，共 {copied} 个向量")
+
+
+class ProjectKnowledgeSearch:
+    """
+    项目级知识检索
+    查询只嵌入一次，并发检索项目下所有启用的知识库，按各库内排名做全局 RRF 融合；
+    超出总耗时预算仍未返回的知识库直接丢弃
+    """
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, project_id: int):
+        self.project_id = project_id
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        """获取进程级共享线程池"""
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=settings.KNOWLEDGE_SEARCH_MAX_WORKERS,
+                        thread_name_prefix='knowledge-search'
+                    )
+        return cls._executor
+
+    def search(self, query: str, k: int = 5, score_threshold: float = 0.1, per_kb_k: Optional[int] = None,
+               timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        跨知识库检索
+
+        Returns:
+            {'results': 融合后的前 k 条结果（附带 knowledge_base 信息）,
+             'searched': 返回结果的知识库数, 'timed_out': 超时丢弃的知识库名,
+             'failed': 检索失败的知识库名, 'elapsed': 总耗时}
+        """
+        start_time = time.time()
+        timeout = settings.KNOWLEDGE_SEARCH_TIMEOUT if timeout is None else timeout
+        per_kb_k = per_kb_k or k
+        report = {'results': [], 'searched': 0, 'timed_out': [], 'failed': [], 'elapsed': 0.0}
+
+        knowledge_bases = list(KnowledgeBase.objects.filter(project_id=self.project_id, is_active=True))
+        if not knowledge_bases:
+            return report
+
+        managers = []
+        for kb in knowledge_bases:
+            try:
+                managers.append(VectorStoreManager.get_manager(kb))
+            except Exception as e:
+                logger.error(f"知识库 {kb.name} 初始化失败: {e}")
+                report['failed'].append(kb.name)
+
+        # 同一嵌入配置下的知识库共用一次查询嵌入；只在检索结果缓存未命中时嵌入
+        query_vectors = {}
+        vectors_lock = threading.Lock()
+
+        def encode_query(manager):
+            with vectors_lock:
+                if manager.embeddings_key not in query_vectors:
+                    query_vectors[manager.embeddings_key] = manager.encode_query(query)
+                return query_vectors[manager.embeddings_key]
+
+        executor = self._get_executor()
+        futures = {
+            executor.submit(
+                manager.cached_similarity_search, query, per_kb_k, score_threshold,
+                functools.partial(encode_query, manager)
+            ): manager.knowledge_base
+            for manager in managers
+        }
+        remaining = max(timeout - (time.time() - start_time), 0)
+        done, not_done = wait(futures, timeout=remaining)
+
+        ranked_lists = []
+        for future in done:
+            kb = futures[future]
+            try:
+                ranked_lists.append((kb, future.result()))
+            except Exception as e:
+                logger.error(f"知识库 {kb.name} 检索失败: {e}")
+                report['failed'].append(kb.name)
+        for future in not_done:
+            future.cancel()
+            report['timed_out'].append(futures[future].name)
+        if report['timed_out']:
+            logger.warning(f"⏱️ 超出检索预算 {timeout}s，已丢弃: {', '.join(report['timed_out'])}")
+
+        report['searched'] = len(ranked_lists)
+        report['results'] = self._global_rrf(ranked_lists, k)
+        report['elapsed'] = time.time() - start_time
+        logger.info(
+            f"🔍 项目 {self.project_id} 跨库检索完成: {report['searched']}/{len(knowledge_bases)} 个知识库, "
+            f"{len(report['results'])} 条结果, 耗时 {report['elapsed']:.3f}s"
+        )
+        return report
+
+    @staticmethod
+    def _global_rrf(ranked_lists, limit: int) -> List[Dict[str, Any]]:
+        """按各知识库内排名做 RRF 融合，分数相同时按原相似度排序"""
+        merged = []
+        for kb, results in ranked_lists:
+            for rank, result in enumerate(results):
+                merged.append({
+                    **result,
+                    'knowledge_base': {'id': str(kb.id), 'name': kb.name},
+                    'rrf_score': 1.0 / (VectorStoreManager.RRF_K + rank + 1),
+                })
+        merged.sort(key=lambda item: (item['rrf_score'], item['similarity_score']), reverse=True)
+        return merged[:limit]
+
 
 class KnowledgeBaseService:
     """知识库服务"""
@@ -998,42 +2210,111 @@ class KnowledgeBaseService:
     def __init__(self, knowledge_base: KnowledgeBase):
         self.knowledge_base = knowledge_base
         self.document_processor = DocumentProcessor()
-        self.vector_manager = VectorStoreManager(knowledge_base)
-
-    def process_document(self, document: Document) -> bool:
-        """处理文档"""
+        self.vector_manager = VectorStoreManager.get_manager(knowledge_base)
+
+    def process_document(self, document: Document, incremental: bool = True) -> bool:
+        """
+        处理文档
+        incremental=True 且文档已有分块时，按分块差异增量更新索引（检索期间旧内容始终可用）；
+        否则删除旧分块后全量重建
+        """
         try:
             # 更新状态为处理中
             document.status = 'processing'
             document.save()
 
-            # 清理已存在的分块和向量（如果有的话）
-            try:
-                self.vector_manager.delete_document(document)
-            except Exception as e:
-                logger.warning(f"删除旧向量时出错（可能是首次处理）: {e}")
-            
-            # 再从数据库删除分块记录
-            document.chunks.all().delete()
+            parse_errors: List[str] = []
+            pages = self.document_processor.iter_document(document, parse_errors)
+            existing_chunks = document.chunks.count()
+
+            if not existing_chunks:
+                # 首次入库：解析出的页面直接流入分块器，解析与嵌入并行进行
+                collected: List[LangChainDocument] = []
+
+                def stream_pages():
+                    for page in pages:
+                        collected.append(page)
+                        yield page
+                    # 解析完成即可确定分块总数和内容指纹，剩余批次入库期间进度可见
+                    document.total_chunks = self.vector_manager.count_chunks(collected)
+                    document.ingest_fingerprint = self.vector_manager.ingest_fingerprint(collected)
+                    Document.objects.filter(pk=document.pk).update(
+                        total_chunks=document.total_chunks, ingest_fingerprint=document.ingest_fingerprint
+                    )
+
+                # 清理上次失败残留的向量（如果有的话）
+                try:
+                    self.vector_manager.delete_document(document)
+                except Exception as e:
+                    logger.warning(f"删除旧向量时出错（可能是首次处理）: {e}")
+
+                document.total_chunks = None
+                document.ingest_fingerprint = None
+                document.processed_chunks = 0
+                document.save()
+                chunk_total = self.vector_manager.add_documents(stream_pages(), document)
+
+                langchain_docs = collected
+                document.total_chunks = chunk_total
+            else:
+                langchain_docs = list(pages)
+                fingerprint = self.vector_manager.ingest_fingerprint(langchain_docs)
+                # 首次流式入库在解析完成前中断时 total_chunks 为空，已提交的批次同样可以续传
+                interrupted = existing_chunks == document.processed_chunks and (
+                    document.processed_chunks < document.total_chunks
+                    if document.total_chunks is not None
+                    else document.processed_chunks > 0
+                )
+                if document.ingest_fingerprint:
+                    resumable = document.ingest_fingerprint == fingerprint
+                else:
+                    resumable = self.vector_manager.matches_committed_chunks(langchain_docs, document)
+
+                if interrupted and resumable:
+                    # 上次入库中断且内容未变：从最后提交的批次继续
+                    logger.info(f"从检查点继续入库: {document.processed_chunks}/{document.total_chunks}")
+                    document.ingest_fingerprint = fingerprint
+                    document.total_chunks = self.vector_manager.count_chunks(langchain_docs)
+                    document.save()
+                    chunk_total = self.vector_manager.add_documents(
+                        langchain_docs, document, resume_from=document.processed_chunks
+                    )
+                elif incremental and not interrupted:
+                    # 增量更新：只写入变化的分块
+                    stats = self.vector_manager.reindex_document(langchain_docs, document)
+                    chunk_total = stats['total']
+                    document.ingest_fingerprint = fingerprint
+                    document.total_chunks = document.processed_chunks = chunk_total
+                else:
+                    # 清理已存在的分块和向量
+                    try:
+                        self.vector_manager.delete_document(document)
+                    except Exception as e:
+                        logger.warning(f"删除旧向量时出错: {e}")
+
+                    # 再从数据库删除分块记录
+                    document.chunks.all().delete()
+
+                    document.ingest_fingerprint = fingerprint
+                    document.total_chunks = self.vector_manager.count_chunks(langchain_docs)
+                    document.processed_chunks = 0
+                    document.save()
 
-            # 加载文档
-            langchain_docs = self.document_processor.load_document(document)
+                    # 向量化并存储（逐批提交检查点）
+                    chunk_total = self.vector_manager.add_documents(langchain_docs, document)
 
             # 计算文档统计信息
-            total_content = '\n'.join([doc.page_content for doc in langchain_docs])
-            document.word_count = len(total_content.split())
+            document.word_count = sum(len(doc.page_content.split()) for doc in langchain_docs)
             document.page_count = len(langchain_docs)
 
-            # 向量化并存储
-            vector_ids = self.vector_manager.add_documents(langchain_docs, document)
-
             # 更新状态为完成
             document.status = 'completed'
             document.processed_at = timezone.now()
-            document.error_message = None
+            # 部分页面解析失败时文档仍可检索，失败页面记录在 error_message 中
+            document.error_message = '\n'.join(parse_errors) or None
             document.save()
 
-            logger.info(f"文档处理成功: {document.id}, 生成 {len(vector_ids)} 个分块")
+            logger.info(f"文档处理成功: {document.id}, 共 {chunk_total} 个分块")
             return True
 
         except Exception as e:
@@ -1044,10 +2325,26 @@ class KnowledgeBaseService:
 
             logger.error(f"文档处理失败: {document.id}, 错误: {e}")
             return False
+        finally:
+            # 无论成功与否向量都可能已变化，使该知识库的检索结果缓存失效
+            self.invalidate_query_cache()
+
+    def invalidate_query_cache(self):
+        """递增知识库版本号，使检索结果缓存失效"""
+        cache = QueryResultCache.get_default()
+        if cache is not None:
+            cache.bump_version(self.knowledge_base.id)
+
+    def search(self, query_text: str, top_k: int = 5, similarity_threshold: float = 0.5,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """检索知识库（相同参数的查询在知识库内容未变化时直接返回缓存结果）"""
+        return self.vector_manager.cached_similarity_search(
+            query_text, k=top_k, score_threshold=similarity_threshold, filters=filters
+        )
 
     def query(self, query_text: str, top_k: int = 5, similarity_threshold: float = 0.5,
-              user=None) -> Dict[str, Any]:
-        """查询知识库"""
+              user=None, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """查询知识库（filters 见 VectorStoreManager.build_search_filter）"""
         start_time = time.time()
 
         try:
@@ -1061,9 +2358,7 @@ class KnowledgeBaseService:
 
             # 执行检索
             retrieval_start = time.time()
-            search_results = self.vector_manager.similarity_search(
-                query_text, k=top_k, score_threshold=similarity_threshold
-            )
+            search_results = self.search(query_text, top_k, similarity_threshold, filters)
             retrieval_time = time.time() - retrieval_start
 
             # 生成回答（这里可以集成LLM）
@@ -1110,11 +2405,11 @@ class KnowledgeBaseService:
 
     def _log_query(self, query: str, answer: str, sources: List[Dict[str, Any]],
                    retrieval_time: float, generation_time: float, total_time: float, user):
-        """记录查询日志"""
+        """记录查询日志（缓冲后批量写入，不阻塞查询请求）"""
         try:
-            QueryLog.objects.create(
-                knowledge_base=self.knowledge_base,
-                user=user,
+            record_query_log(
+                knowledge_base_id=self.knowledge_base.id,
+                user_id=user.id if user else None,
                 query=query,
                 response=answer,
                 retrieved_chunks=[{
@@ -1131,22 +2426,16 @@ class KnowledgeBaseService:
             logger.error(f"记录查询日志失败: {e}")
 
     def delete_document(self, document: Document):
-        """删除文档"""
+        """删除文档（向量由 post_delete 信号按 document_id 清理，覆盖所有删除入口）"""
         try:
-            # 从向量存储中删除
-            self.vector_manager.delete_document(document)
-
             # 删除文件
             if document.file:
                 if os.path.exists(document.file.path):
                     os.remove(document.file.path)
 
-            # 删除数据库记录
+            # 删除数据库记录（分块记录级联删除）
             document.delete()
 
-            # 清理向量存储缓存（因为内容已变化）
-            VectorStoreManager.clear_cache(self.knowledge_base.id)
-
             logger.info(f"文档删除成功: {document.id}")
 
         except Exception as e:
@@ -5,7 +5,7 @@
 import os
 import shutil
 import logging
-from django.db.models.signals import post_delete, pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
 
@@ -49,16 +49,37 @@ def cleanup_knowledge_base(sender, instance, **kwargs):
 @receiver(post_delete, sender='knowledge.Document')
 def cleanup_document_cache(sender, instance, **kwargs):
     """
-    文档删除后清理相关缓存
-    DocumentChunk 会通过 CASCADE 自动删除,但缓存需要手动清理
+    文档删除后清理其在 Qdrant 中的向量
+    DocumentChunk 会通过 CASCADE 自动删除，向量按 document_id 过滤条件一次删除，
+    知识库集合中其他文档的向量不受影响，并使知识库的检索结果缓存失效
     """
+    from .query_result_cache import QueryResultCache
+
     try:
         from .services import VectorStoreManager
-        
-        # 清理知识库的向量存储缓存
-        # 因为 Collection 中的文档数量已经变化
-        VectorStoreManager.clear_cache(instance.knowledge_base.id)
-        logger.info(f"✅ 已清理文档 '{instance.title}' 相关的向量缓存")
-        
+
+        VectorStoreManager.delete_document_vectors(instance.knowledge_base_id, instance.id)
+        logger.info(f"✅ 已清理文档 '{instance.title}' 的向量")
+
+    except Exception as e:
+        logger.error(f"❌ 清理文档向量失败: {e}", exc_info=True)
+
+    cache = QueryResultCache.get_default()
+    if cache is not None:
+        cache.bump_version(instance.knowledge_base_id)
+
+@receiver(post_save, sender='knowledge.KnowledgeGlobalConfig')
+def invalidate_embedding_cache(sender, instance, **kwargs):
+    """
+    全局嵌入配置保存后清理其他模型的嵌入缓存
+    切换嵌入模型后旧向量不可复用
+    """
+    try:
+        from .embedding_cache import EmbeddingCache
+
+        cache = EmbeddingCache.get_default()
+        if cache is not None:
+            cache.invalidate(keep_model_key=EmbeddingCache.model_key(instance))
+
     except Exception as e:
-        logger.error(f"❌ 清理文档缓存失败: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"❌ 清理嵌入缓存失败: {e}", exc_info=True)
@@ -0,0 +1,228 @@
+"""
+知识库文档入库异步任务
+Web 进程只负责入队，解析、嵌入和写入向量库都在独立的入库队列中执行：
+- 每个知识库同时处理的文档数量受限（基于 Redis 的并发槽位）
+- 小文档优先（按文件大小映射为队列优先级）
+- 失败后指数退避重试，借助入库检查点从上次提交的批次继续
+"""
+import logging
+import time
+
+from celery import shared_task
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 原子地清理过期槽位并尝试占用：成员为文档ID，分值为过期时间戳
+_ACQUIRE_SLOT_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local member = ARGV[4]
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+if redis.call('ZSCORE', key, member) or redis.call('ZCARD', key) < limit then
+    redis.call('ZADD', key, now + ttl, member)
+    redis.call('EXPIRE', key, ttl)
+    return 1
+end
+return 0
+"""
+
+# 文件大小（字节）上限 -> 队列优先级（Redis broker 中数值越小越优先）
+# 取值限定在 kombu Redis transport 默认的优先级档位 [0, 3, 6, 9] 内
+_PRIORITY_THRESHOLDS = [
+    (1 * 1024 * 1024, 0),
+    (10 * 1024 * 1024, 3),
+    (50 * 1024 * 1024, 6),
+]
+_LOWEST_PRIORITY = 9
+
+_redis_client = None
+
+
+def _get_redis_client():
+    """获取用于并发槽位的 Redis 客户端；broker 不是 Redis 时返回 None（不限流）"""
+    global _redis_client
+    broker_url = getattr(settings, 'CELERY_BROKER_URL', '') or ''
+    if not broker_url.startswith(('redis://', 'rediss://')):
+        return None
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(broker_url)
+    return _redis_client
+
+
+def _slot_key(knowledge_base_id) -> str:
+    return f"knowledge:ingest:slots:{knowledge_base_id}"
+
+
+def acquire_ingest_slot(knowledge_base_id, document_id) -> bool:
+    """占用知识库的入库并发槽位，槽位已满时返回 False"""
+    limit = getattr(settings, 'KNOWLEDGE_INGEST_MAX_CONCURRENCY_PER_KB', 2)
+    client = _get_redis_client()
+    if client is None or limit <= 0:
+        return True
+
+    # 槽位有效期与任务硬超时一致，worker 异常退出时自动释放
+    ttl = int(getattr(settings, 'CELERY_TASK_TIME_LIMIT', 30 * 60))
+    try:
+        acquired = client.eval(
+            _ACQUIRE_SLOT_SCRIPT, 1, _slot_key(knowledge_base_id),
+            time.time(), ttl, limit, str(document_id)
+        )
+        return bool(acquired)
+    except Exception as e:
+        logger.warning(f"⚠️ 获取入库并发槽位失败，不做限流: {e}")
+        return True
+
+
+def release_ingest_slot(knowledge_base_id, document_id):
+    """释放知识库的入库并发槽位"""
+    client = _get_redis_client()
+    if client is None:
+        return
+    try:
+        client.zrem(_slot_key(knowledge_base_id), str(document_id))
+    except Exception as e:
+        logger.warning(f"⚠️ 释放入库并发槽位失败: {e}")
+
+
+def ingest_priority(document) -> int:
+    """根据文档大小计算队列优先级，小文档优先处理"""
+    size = document.file_size
+    if size is None:
+        size = len((document.content or '').encode())
+    for max_size, priority in _PRIORITY_THRESHOLDS:
+        if size < max_size:
+            return priority
+    return _LOWEST_PRIORITY
+
+
+def enqueue_document_processing(document, incremental: bool = True, countdown=None):
+    """将文档投递到入库队列"""
+    return process_knowledge_document.apply_async(
+        args=[str(document.id)],
+        kwargs={'incremental': incremental},
+        queue=settings.KNOWLEDGE_INGEST_QUEUE,
+        priority=ingest_priority(document),
+        countdown=countdown,
+    )
+
+
+def rebalance_vector_layout(knowledge_base):
+    """入库完成后检查知识库规模，跨过阈值时迁移集合布局（失败只记录警告，不影响入库结果）"""
+    from .services import VectorStoreManager
+
+    if not settings.KNOWLEDGE_SHARED_COLLECTION_ENABLED and knowledge_base.vector_layout != 'shared':
+        return
+    try:
+        VectorStoreManager.get_manager(knowledge_base).rebalance_layout()
+    except Exception as e:
+        logger.warning(f"⚠️ 知识库 {knowledge_base.id} 集合布局迁移失败: {e}")
+
+
+def enqueue_storage_settings(knowledge_base, countdown=None):
+    """将知识库存储配置迁移投递到入库队列（集合迁移耗时较长，不在请求中执行）"""
+    return apply_knowledge_storage_settings.apply_async(
+        args=[str(knowledge_base.id)],
+        queue=settings.KNOWLEDGE_INGEST_QUEUE,
+        countdown=countdown,
+    )
+
+
+@shared_task(name='knowledge.apply_storage_settings', acks_late=True)
+def apply_knowledge_storage_settings(knowledge_base_id):
+    """
+    异步把知识库的存储配置迁移到已有的向量集合
+    失败只记录警告，可稍后执行 apply_vector_storage 命令重试
+    """
+    from .models import KnowledgeBase
+    from .services import KnowledgeBaseService, VectorStoreManager
+
+    try:
+        knowledge_base = KnowledgeBase.objects.get(id=knowledge_base_id)
+    except KnowledgeBase.DoesNotExist:
+        logger.warning(f"知识库 {knowledge_base_id} 不存在，跳过存储配置迁移")
+        return {'status': 'skipped', 'knowledge_base_id': knowledge_base_id}
+
+    try:
+        changes = VectorStoreManager.get_manager(knowledge_base).apply_storage_settings()
+    except Exception as e:
+        logger.warning(f"知识库 {knowledge_base_id} 存储配置迁移失败，可稍后执行 apply_vector_storage 命令重试: {e}")
+        return {'status': 'failed', 'knowledge_base_id': knowledge_base_id}
+
+    if changes is None:
+        # 有文档正在入库，不能迁移集合布局：延后重新入队
+        wait = getattr(settings, 'KNOWLEDGE_INGEST_SLOT_WAIT', 15)
+        logger.info(f"知识库 {knowledge_base_id} 有文档正在入库，存储配置迁移将在 {wait} 秒后重试")
+        enqueue_storage_settings(knowledge_base, countdown=wait)
+        return {'status': 'deferred', 'knowledge_base_id': knowledge_base_id}
+
+    if changes:
+        logger.info(f"知识库 {knowledge_base_id} 存储配置已迁移: {', '.join(changes)}")
+    # 量化配置和集合布局影响检索排序，已缓存的检索结果失效
+    KnowledgeBaseService(knowledge_base).invalidate_query_cache()
+    return {'status': 'completed', 'knowledge_base_id': knowledge_base_id, 'changes': list(changes)}
+
+
+@shared_task(
+    bind=True,
+    name='knowledge.process_document',
+    max_retries=3,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def process_knowledge_document(self, document_id, incremental=True):
+    """
+    异步处理知识库文档
+
+    Args:
+        document_id: 文档ID
+        incremental: 是否按分块差异增量更新（重新处理时使用）
+    """
+    from .models import Document
+    from .services import KnowledgeBaseService
+
+    try:
+        document = Document.objects.select_related('knowledge_base').get(id=document_id)
+    except Document.DoesNotExist:
+        logger.warning(f"文档 {document_id} 不存在，跳过入库")
+        return {'status': 'skipped', 'document_id': document_id}
+
+    knowledge_base_id = document.knowledge_base_id
+    if not acquire_ingest_slot(knowledge_base_id, document_id):
+        # 知识库并发已满：延后重新入队，不计入重试次数
+        wait = getattr(settings, 'KNOWLEDGE_INGEST_SLOT_WAIT', 15)
+        logger.info(f"知识库 {knowledge_base_id} 入库并发已满，文档 {document_id} 将在 {wait} 秒后重试")
+        enqueue_document_processing(document, incremental=incremental, countdown=wait)
+        return {'status': 'deferred', 'document_id': document_id}
+
+    error = None
+    try:
+        service = KnowledgeBaseService(document.knowledge_base)
+        success = service.process_document(document, incremental=incremental)
+    except Exception as e:
+        logger.error(f"文档 {document_id} 处理失败: {e}", exc_info=True)
+        success = False
+        error = str(e)
+    finally:
+        release_ingest_slot(knowledge_base_id, document_id)
+
+    if success:
+        logger.info(f"文档 {document_id} 处理完成")
+        rebalance_vector_layout(document.knowledge_base)
+        return {'status': 'completed', 'document_id': document_id}
+
+    if self.request.retries < self.max_retries:
+        countdown = getattr(settings, 'KNOWLEDGE_INGEST_RETRY_BACKOFF', 30) * (2 ** self.request.retries)
+        logger.warning(
+            f"文档 {document_id} 处理失败，{countdown} 秒后第 {self.request.retries + 1} 次重试"
+        )
+        # 等待重试期间保持 pending，错误信息保留供前端展示
+        Document.objects.filter(pk=document_id).update(status='pending')
+        raise self.retry(countdown=countdown)
+
+    if error:
+        Document.objects.filter(pk=document_id).update(status='failed', error_message=error)
+    return {'status': 'failed', 'document_id': document_id}
@@ -0,0 +1,1552 @@
+import hashlib
+import json
+import operator
+import os
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
+
+import requests
+from celery.exceptions import Retry
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from langchain.embeddings.base import Embeddings
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document as LangChainDocument
+from qdrant_client import QdrantClient, models as qmodels
+from rest_framework.test import APIClient
+
+from knowledge.benchmarking import compare_reports, generate_corpus, run_benchmark
+from knowledge.embedding_cache import (
+    DatabaseEmbeddingCacheBackend, DiskEmbeddingCacheBackend, EmbeddingCache
+)
+from knowledge.model_warmup import ModelWarmup, _preload_before_fork, models_ready
+from knowledge.parsed_content_cache import (
+    DatabaseParsedContentBackend, DiskParsedContentBackend, ParsedContentCache
+)
+from knowledge.parsing import DocumentParseError, DocumentParsePool, parse_pdf_pages
+from knowledge.query_embedding_cache import QueryEmbeddingCache, SparseQueryVector
+from knowledge.query_log_buffer import QueryLogBuffer, record_query_log
+from knowledge.query_result_cache import QueryResultCache
+from knowledge.serializers import DocumentSerializer
+from knowledge.models import (
+    Document, DocumentChunk, EmbeddingCacheEntry, KnowledgeBase, KnowledgeGlobalConfig, ParsedContentEntry,
+    QueryLog
+)
+from knowledge.services import (
+    CustomAPIEmbeddings, DocumentProcessor, FastEmbedEmbeddings, KnowledgeBaseService, ProjectKnowledgeSearch,
+    VectorStoreManager
+)
+from knowledge.tasks import apply_knowledge_storage_settings, ingest_priority, process_knowledge_document
+from projects.models import Project
+
+
+def _fake_response(payload, status_code=200):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.json.return_value = payload
+    if status_code >= 400:
+        error = requests.HTTPError(f"HTTP {status_code}")
+        error.response = response
+        response.raise_for_status.side_effect = error
+    else:
+        response.raise_for_status.return_value = None
+    return response
+
+
+class FakeEmbeddings(Embeddings):
+    """确定性的假嵌入模型：按文本哈希生成 8 维向量"""
+
+    def __init__(self):
+        self.embedded_texts = []
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode()).digest()
+        return [byte / 255.0 + 0.01 for byte in digest[:8]]
+
+    def embed_documents(self, texts):
+        self.embedded_texts.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+
+class FakeSparseEncoder:
+    """按词哈希生成稀疏向量的假 BM25 编码器"""
+
+    def encode_query(self, text):
+        import numpy as np
+
+        indices = sorted({int(hashlib.md5(word.encode()).hexdigest()[:6], 16) for word in text.split()})
+        return mock.Mock(indices=np.array(indices), values=np.ones(len(indices)))
+
+    def encode_documents(self, texts):
+        return [self.encode_query(text) for text in texts]
+
+
+def create_test_vector_manager(knowledge_base, embeddings=None, sparse_encoder=None):
+    """构建使用假嵌入模型和内存 Qdrant 的向量存储管理器"""
+    embeddings = embeddings or FakeEmbeddings()
+    with mock.patch.object(VectorStoreManager, '_get_embeddings_instance', return_value=embeddings), \
+            mock.patch.object(VectorStoreManager, '_get_sparse_encoder', return_value=sparse_encoder):
+        manager = VectorStoreManager(knowledge_base)
+    manager._qdrant_client = QdrantClient(':memory:')
+    return manager
+
+
+class CustomAPIEmbeddingsTests(SimpleTestCase):
+    """测试自定义API嵌入客户端的批量请求"""
+
+    def setUp(self):
+        self.embeddings = CustomAPIEmbeddings(
+            api_base_url='http://embedding.local/v1/embeddings',
+            model_name='bge-m3',
+            batch_size=2,
+            max_concurrency=3,
+            retry_backoff=0,
+        )
+
+    def _echo_post(self, url, json=None, **kwargs):
+        """按文本长度返回向量，并打乱 index 顺序以验证排序"""
+        items = [
+            {'index': i, 'embedding': [float(len(text))]}
+            for i, text in enumerate(json['input'])
+        ]
+        return _fake_response({'data': list(reversed(items))})
+
+    def test_embed_documents_batches_and_keeps_order(self):
+        texts = ['a', 'bb', 'ccc', 'dddd', 'eeeee']
+        with mock.patch.object(self.embeddings.session, 'post', side_effect=self._echo_post) as post:
+            vectors = self.embeddings.embed_documents(texts)
+
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(vectors, [[1.0], [2.0], [3.0], [4.0], [5.0]])
+        batch_sizes = sorted(len(call.kwargs['json']['input']) for call in post.call_args_list)
+        self.assertEqual(batch_sizes, [1, 2, 2])
+
+    def test_embed_query_retries_retryable_status(self):
+        responses = [
+            _fake_response({}, status_code=503),
+            _fake_response({'data': [{'index': 0, 'embedding': [0.5, 0.5]}]}),
+        ]
+        with mock.patch.object(self.embeddings.session, 'post', side_effect=responses) as post:
+            vector = self.embeddings.embed_query('测试')
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(vector, [0.5, 0.5])
+
+    def test_client_error_is_not_retried(self):
+        with mock.patch.object(
+            self.embeddings.session, 'post', return_value=_fake_response({}, status_code=400)
+        ) as post:
+            with self.assertRaises(RuntimeError):
+                self.embeddings.embed_query('测试')
+
+        self.assertEqual(post.call_count, 1)
+
+
+class EmbeddingCacheTests(TestCase):
+    """测试嵌入向量缓存"""
+
+    def setUp(self):
+        self.cache = EmbeddingCache(DatabaseEmbeddingCacheBackend(), max_entries=3)
+        self.embed_fn = mock.Mock(side_effect=lambda texts: [[float(len(t)), 0.5] for t in texts])
+
+    def test_unchanged_chunks_are_not_reembedded(self):
+        first = self.cache.embed_documents('custom:bge-m3', ['aa', 'bbb'], self.embed_fn)
+        second = self.cache.embed_documents('custom:bge-m3', ['aa', 'bbb', 'c'], self.embed_fn)
+
+        self.assertEqual(first, [[2.0, 0.5], [3.0, 0.5]])
+        self.assertEqual(second, [[2.0, 0.5], [3.0, 0.5], [1.0, 0.5]])
+        self.assertEqual(self.embed_fn.call_args_list[1].args[0], ['c'])
+
+    def test_eviction_and_model_invalidation(self):
+        self.cache.embed_documents('custom:old', ['a', 'b'], self.embed_fn)
+        self.cache.embed_documents('custom:new', ['c', 'd'], self.embed_fn)
+        # 超出容量后淘汰到低水位（3 * 0.9 = 2 条）
+        self.assertEqual(EmbeddingCacheEntry.objects.count(), 2)
+
+        self.cache.invalidate(keep_model_key='custom:new')
+        self.assertEqual(
+            set(EmbeddingCacheEntry.objects.values_list('model_key', flat=True)), {'custom:new'}
+        )
+
+    def test_eviction_counts_only_when_over_capacity(self):
+        cache = EmbeddingCache(DatabaseEmbeddingCacheBackend(), max_entries=10)
+        with mock.patch.object(cache.backend, 'count', wraps=cache.backend.count) as count:
+            for text in ['a', 'b', 'c', 'd']:
+                cache.embed_documents('custom:bge-m3', [text], self.embed_fn)
+        self.assertEqual(count.call_count, 1)
+
+    def test_model_key_includes_api_endpoint(self):
+        first = KnowledgeGlobalConfig(embedding_service='custom', model_name='bge-m3',
+                                      api_base_url='http://gpu-a.local/v1/embeddings')
+        second = KnowledgeGlobalConfig(embedding_service='custom', model_name='bge-m3',
+                                       api_base_url='http://gpu-b.local/v1/embeddings')
+        self.assertNotEqual(EmbeddingCache.model_key(first), EmbeddingCache.model_key(second))
+        self.assertLessEqual(len(EmbeddingCache.model_key(first)), 200)
+
+    def test_disk_backend_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backend = DiskEmbeddingCacheBackend(os.path.join(tmp_dir, 'cache.sqlite3'))
+            backend.set_many('custom:bge-m3', {'h1': [0.25, -1.0]})
+
+            self.assertEqual(backend.get_many('custom:bge-m3', ['h1', 'h2']), {'h1': [0.25, -1.0]})
+            self.assertEqual(backend.evict(max_entries=0), 1)
+            self.assertEqual(backend.count(), 0)
+
+
+@override_settings(KNOWLEDGE_EMBEDDING_CACHE_BACKEND='none')
+class IncrementalReindexTests(TestCase):
+    """测试文档增量重建索引"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='kb_user', password='password')
+        project = Project.objects.create(name='KB Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=project, creator=user, chunk_size=20, chunk_overlap=0
+        )
+        self.document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='wiki', document_type='txt', uploader=user
+        )
+        self.embeddings = FakeEmbeddings()
+        self.manager = create_test_vector_manager(self.knowledge_base, self.embeddings)
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+
+    def tearDown(self):
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+
+    def _docs(self, *paragraphs):
+        return [LangChainDocument(page_content='\n\n'.join(paragraphs), metadata={})]
+
+    def test_only_changed_chunks_are_written(self):
+        self.manager.add_documents(self._docs('alpha paragraph', 'beta paragraph', 'gamma paragraph'), self.document)
+        beta_vector_id = self.document.chunks.get(content='beta paragraph').vector_id
+        self.embeddings.embedded_texts.clear()
+
+        stats = self.manager.reindex_document(
+            self._docs('new intro', 'beta paragraph', 'gamma paragraph', 'delta paragraph'), self.document
+        )
+
+        self.assertEqual(
+            stats, {'total': 4, 'added': 2, 'removed': 1, 'moved': 0, 'unchanged': 2}
+        )
+        self.assertEqual(self.embeddings.embedded_texts, ['new intro', 'delta paragraph'])
+        chunks = list(self.document.chunks.order_by('chunk_index').values_list('chunk_index', 'content', 'vector_id'))
+        self.assertEqual([content for _, content, _ in chunks],
+                         ['new intro', 'beta paragraph', 'gamma paragraph', 'delta paragraph'])
+        self.assertEqual(chunks[1][2], beta_vector_id)
+
+        collection = self.manager._get_collection_name()
+        self.assertEqual(self.manager.qdrant_client.count(collection).count, 4)
+
+    def test_moved_chunks_keep_vectors(self):
+        self.manager.add_documents(self._docs('alpha paragraph', 'beta paragraph'), self.document)
+        self.embeddings.embedded_texts.clear()
+
+        stats = self.manager.reindex_document(self._docs('beta paragraph', 'alpha paragraph'), self.document)
+
+        self.assertEqual(stats['moved'], 2)
+        self.assertEqual(self.embeddings.embedded_texts, [])
+        alpha = self.document.chunks.get(content='alpha paragraph')
+        self.assertEqual(alpha.chunk_index, 1)
+        point = self.manager.qdrant_client.retrieve(self.manager._get_collection_name(), [alpha.vector_id])[0]
+        self.assertEqual(point.payload['chunk_index'], 1)
+
+
+@override_settings(KNOWLEDGE_EMBEDDING_CACHE_BACKEND='none', KNOWLEDGE_INGEST_BATCH_SIZE=2)
+class StreamingIngestionTests(TestCase):
+    """测试分批流式入库与断点续传"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ingest_user', password='password')
+        project = Project.objects.create(name='Ingest Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=project, creator=user, chunk_size=20, chunk_overlap=0
+        )
+        self.document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='manual', document_type='txt', uploader=user
+        )
+        self.pages = [
+            LangChainDocument(page_content=f'page {i} first part\n\npage {i} second part', metadata={'page': i})
+            for i in range(3)
+        ]
+        self.embeddings = FakeEmbeddings()
+        self.manager = create_test_vector_manager(self.knowledge_base, self.embeddings)
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+
+    def tearDown(self):
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+
+    def test_failed_ingestion_resumes_from_checkpoint(self):
+        self.document.total_chunks = self.manager.count_chunks(self.pages)
+        self.document.save()
+        _ = self.manager.vector_store
+        original_embed = self.embeddings.embed_documents
+        calls = []
+
+        def flaky_embed(texts):
+            calls.append(texts)
+            if len(calls) == 2:
+                raise RuntimeError('embedding service down')
+            return original_embed(texts)
+
+        with mock.patch.object(self.embeddings, 'embed_documents', side_effect=flaky_embed):
+            with self.assertRaises(RuntimeError):
+                self.manager.add_documents(self.pages, self.document)
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.processed_chunks, 2)
+        self.assertEqual(self.document.chunks.count(), 2)
+
+        self.embeddings.embedded_texts.clear()
+        total = self.manager.add_documents(self.pages, self.document, resume_from=2)
+
+        self.assertEqual(total, 6)
+        self.assertEqual(len(self.embeddings.embedded_texts), 4)
+        self.assertEqual(
+            list(self.document.chunks.values_list('chunk_index', flat=True)), list(range(6))
+        )
+        self.assertEqual(self.document.progress, 100)
+        collection = self.manager._get_collection_name()
+        self.assertEqual(self.manager.qdrant_client.count(collection).count, 6)
+
+    def test_interrupted_first_ingest_resumes_on_reprocess(self):
+        self.document.content = '\n\n'.join(f'section {i} of manual' for i in range(6))
+        self.document.save()
+        with mock.patch.object(VectorStoreManager, 'get_manager', return_value=self.manager):
+            service = KnowledgeBaseService(self.knowledge_base)
+        original_embed = self.embeddings.embed_documents
+        calls = []
+
+        def flaky_embed(texts):
+            calls.append(texts)
+            if len(calls) == 2:
+                raise RuntimeError('embedding service down')
+            return original_embed(texts)
+
+        with mock.patch.object(self.embeddings, 'embed_documents', side_effect=flaky_embed):
+            self.assertFalse(service.process_document(self.document))
+
+        # 解析流尚未结束时中断，分块总数未知
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'failed')
+        self.assertIsNone(self.document.total_chunks)
+        self.assertEqual(self.document.processed_chunks, 2)
+
+        self.embeddings.embedded_texts.clear()
+        with mock.patch.object(self.manager, 'reindex_document') as reindex_document:
+            self.assertTrue(service.process_document(self.document))
+
+        reindex_document.assert_not_called()
+        self.document.refresh_from_db()
+        self.assertEqual(self.embeddings.embedded_texts, [f'section {i} of manual' for i in range(2, 6)])
+        self.assertEqual(self.document.total_chunks, 6)
+        self.assertEqual(self.document.processed_chunks, 6)
+        self.assertIsNotNone(self.document.ingest_fingerprint)
+        self.assertEqual(
+            list(self.document.chunks.order_by('chunk_index').values_list('chunk_index', flat=True)), list(range(6))
+        )
+
+    def test_changed_content_after_interrupted_first_ingest_rebuilds(self):
+        self.document.content = '\n\n'.join(f'section {i} of manual' for i in range(6))
+        self.document.save()
+        with mock.patch.object(VectorStoreManager, 'get_manager', return_value=self.manager):
+            service = KnowledgeBaseService(self.knowledge_base)
+        original_embed = self.embeddings.embed_documents
+        calls = []
+
+        def flaky_embed(texts):
+            calls.append(texts)
+            if len(calls) == 2:
+                raise RuntimeError('embedding service down')
+            return original_embed(texts)
+
+        with mock.patch.object(self.embeddings, 'embed_documents', side_effect=flaky_embed):
+            self.assertFalse(service.process_document(self.document))
+
+        self.document.content = '\n\n'.join(f'chapter {i} of manual' for i in range(6))
+        self.document.save()
+        self.embeddings.embedded_texts.clear()
+        self.assertTrue(service.process_document(self.document))
+
+        self.assertEqual(len(self.embeddings.embedded_texts), 6)
+        self.assertEqual(
+            list(self.document.chunks.order_by('chunk_index').values_list('content', flat=True)),
+            [f'chapter {i} of manual' for i in range(6)],
+        )
+
+
+class DocumentIngestTaskTests(TestCase):
+    """测试文档入库队列任务"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='task_user', password='password')
+        project = Project.objects.create(name='Task Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=project, creator=user)
+        self.document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='notes', document_type='txt',
+            content='hello', file_size=2 * 1024 * 1024, uploader=user
+        )
+
+    def test_small_documents_get_higher_priority(self):
+        small = Document(content='tiny')
+        large = Document(file_size=200 * 1024 * 1024)
+        self.assertLess(ingest_priority(small), ingest_priority(self.document))
+        self.assertLess(ingest_priority(self.document), ingest_priority(large))
+
+    def test_priorities_use_default_broker_priority_steps(self):
+        from kombu.transport.redis import Channel
+
+        # 不修改全局 transport options，默认队列的优先级档位和轮询策略保持不变
+        transport_options = getattr(settings, 'CELERY_BROKER_TRANSPORT_OPTIONS', {})
+        for option in ('priority_steps', 'sep', 'queue_order_strategy'):
+            self.assertNotIn(option, transport_options)
+        for size in [0, 2 * 1024 * 1024, 20 * 1024 * 1024, 200 * 1024 * 1024]:
+            self.assertIn(ingest_priority(Document(file_size=size)), Channel.priority_steps)
+
+    def test_full_knowledge_base_defers_without_processing(self):
+        with mock.patch('knowledge.tasks.acquire_ingest_slot', return_value=False), \
+                mock.patch.object(process_knowledge_document, 'apply_async') as apply_async, \
+                mock.patch.object(KnowledgeBaseService, '__init__') as service_init:
+            result = process_knowledge_document(str(self.document.id))
+
+        self.assertEqual(result['status'], 'deferred')
+        service_init.assert_not_called()
+        self.assertEqual(apply_async.call_args.kwargs['queue'], 'knowledge_ingest')
+        self.assertEqual(apply_async.call_args.kwargs['priority'], ingest_priority(self.document))
+        self.assertGreater(apply_async.call_args.kwargs['countdown'], 0)
+
+    def test_failed_processing_is_retried_and_slot_released(self):
+        with mock.patch('knowledge.tasks.acquire_ingest_slot', return_value=True), \
+                mock.patch('knowledge.tasks.release_ingest_slot') as release, \
+                mock.patch.object(KnowledgeBaseService, '__init__', return_value=None), \
+                mock.patch.object(KnowledgeBaseService, 'process_document', return_value=False), \
+                mock.patch.object(process_knowledge_document, 'retry', side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                process_knowledge_document(str(self.document.id), incremental=False)
+
+        release.assert_called_once_with(self.knowledge_base.id, str(self.document.id))
+        self.assertGreater(retry.call_args.kwargs['countdown'], 0)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'pending')
+
+
+@override_settings(KNOWLEDGE_EMBEDDING_CACHE_BACKEND='none', KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES=0)
+class VectorStoreManagerRegistryTests(TestCase):
+    """测试管理器注册表与嵌入维度记录"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='registry_user', password='password')
+        project = Project.objects.create(name='Registry Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=project, creator=user, chunk_size=20, chunk_overlap=0
+        )
+        config = KnowledgeGlobalConfig.get_config()
+        config.embedding_service = 'custom'
+        config.api_base_url = 'http://embedding.local/v1/embeddings'
+        config.save()
+        VectorStoreManager.clear_global_config_cache()
+        self.embeddings = FakeEmbeddings()
+        for name, value in (('_create_custom_api_embeddings', self.embeddings), ('_get_sparse_encoder', None)):
+            patcher = mock.patch.object(VectorStoreManager, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(VectorStoreManager.clear_cache)
+
+    def test_embedding_dimension_is_probed_once(self):
+        VectorStoreManager.clear_cache()
+        with mock.patch.object(self.embeddings, 'embed_query', wraps=self.embeddings.embed_query) as embed_query:
+            VectorStoreManager(self.knowledge_base)
+            VectorStoreManager.clear_cache()
+            VectorStoreManager(self.knowledge_base)
+
+        self.assertEqual(embed_query.call_count, 1)
+        config = KnowledgeGlobalConfig.get_config()
+        self.assertEqual(config.embedding_dimension, 8)
+        self.assertTrue(config.is_embedding_validated)
+
+    def test_search_costs_one_query_embedding(self):
+        manager = VectorStoreManager.get_manager(self.knowledge_base)
+        manager._qdrant_client = QdrantClient(':memory:')
+        document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='faq', document_type='txt',
+            uploader=self.knowledge_base.creator
+        )
+        manager.add_documents([LangChainDocument(page_content='login steps\n\nlogout steps')], document)
+        self.knowledge_base.refresh_from_db()
+        self.assertEqual(self.knowledge_base.vector_dimension, 8)
+
+        hits = VectorStoreManager.metrics()['registry_hits']
+        with mock.patch.object(self.embeddings, 'embed_query', wraps=self.embeddings.embed_query) as embed_query, \
+                mock.patch.object(self.embeddings, 'embed_documents') as embed_documents:
+            for _ in range(2):
+                same_manager = VectorStoreManager.get_manager(self.knowledge_base)
+                results = same_manager.similarity_search('login steps', k=1, score_threshold=0)
+
+        self.assertIs(same_manager, manager)
+        self.assertEqual(results[0]['content'], 'login steps')
+        self.assertEqual(embed_query.call_count, 2)
+        embed_documents.assert_not_called()
+        self.assertEqual(VectorStoreManager.metrics()['registry_hits'], hits + 2)
+
+
+@override_settings(KNOWLEDGE_EMBEDDING_CACHE_BACKEND='none', KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES=0)
+class ProjectKnowledgeSearchTests(TestCase):
+    """测试项目级跨知识库并发检索"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='search_user', password='password')
+        self.project = Project.objects.create(name='Search Project', creator=user)
+        self.embeddings = FakeEmbeddings()
+        client = QdrantClient(':memory:')
+        self.managers = {}
+        for name, paragraphs in (('需求库', ['login flow', 'payment flow']), ('设计库', ['login page layout'])):
+            kb = KnowledgeBase.objects.create(
+                name=name, project=self.project, creator=user, chunk_size=20, chunk_overlap=0
+            )
+            document = Document.objects.create(knowledge_base=kb, title=name, document_type='txt', uploader=user)
+            manager = create_test_vector_manager(kb, self.embeddings)
+            manager._qdrant_client = client
+            manager.add_documents([LangChainDocument(page_content='\n\n'.join(paragraphs))], document)
+            VectorStoreManager._manager_registry[str(kb.id)] = manager
+            self.managers[name] = manager
+        self.addCleanup(VectorStoreManager.clear_cache)
+
+    def test_query_is_embedded_once_and_results_merged(self):
+        with mock.patch.object(self.embeddings, 'embed_query', wraps=self.embeddings.embed_query) as embed_query:
+            report = ProjectKnowledgeSearch(self.project.id).search('login', k=3, score_threshold=0, per_kb_k=2)
+
+        self.assertEqual(embed_query.call_count, 1)
+        self.assertEqual(report['searched'], 2)
+        self.assertEqual(len(report['results']), 3)
+        top_two = {result['knowledge_base']['name'] for result in report['results'][:2]}
+        self.assertEqual(top_two, {'需求库', '设计库'})
+
+    def test_slow_knowledge_base_is_dropped(self):
+        slow_manager = self.managers['设计库']
+        original_search = slow_manager.similarity_search
+
+        def slow_search(*args, **kwargs):
+            time.sleep(0.5)
+            return original_search(*args, **kwargs)
+
+        with mock.patch.object(slow_manager, 'similarity_search', side_effect=slow_search):
+            report = ProjectKnowledgeSearch(self.project.id).search('login', k=3, score_threshold=0, timeout=0.2)
+
+        self.assertEqual(report['timed_out'], ['设计库'])
+        self.assertEqual({result['knowledge_base']['name'] for result in report['results']}, {'需求库'})
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'knowledge': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'project-search-tests'},
+    })
+    def test_repeated_search_uses_result_cache(self):
+        searcher = ProjectKnowledgeSearch(self.project.id)
+        first = searcher.search('login', k=3, score_threshold=0, per_kb_k=2)
+        with mock.patch.object(self.embeddings, 'embed_query', wraps=self.embeddings.embed_query) as embed_query, \
+                mock.patch.object(VectorStoreManager, 'similarity_search') as similarity_search:
+            second = searcher.search('login', k=3, score_threshold=0, per_kb_k=2)
+
+        self.assertEqual(second['results'], first['results'])
+        embed_query.assert_not_called()
+        similarity_search.assert_not_called()
+
+
+@override_settings(KNOWLEDGE_EMBEDDING_CACHE_BACKEND='none', KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES=0)
+class ServerSideFusionTests(TestCase):
+    """测试 Qdrant Query API 服务端融合检索"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='fusion_user', password='password')
+        project = Project.objects.create(name='Fusion Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=project, creator=user, chunk_size=30, chunk_overlap=0
+        )
+        document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='guide', document_type='txt', uploader=user
+        )
+        self.manager = create_test_vector_manager(self.knowledge_base, sparse_encoder=FakeSparseEncoder())
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+        paragraphs = ['user login with password', 'reset password by email', 'export report as pdf', 'admin audit log']
+        self.manager.add_documents([LangChainDocument(page_content='\n\n'.join(paragraphs))], document)
+
+    def tearDown(self):
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+
+    @override_settings(KNOWLEDGE_SERVER_FUSION_DETAIL=True)
+    def test_server_fusion_matches_client_fusion(self):
+        client_results = self.manager.similarity_search('password login', k=3, score_threshold=0)
+
+        self.knowledge_base.fusion_mode = 'server'
+        with mock.patch.object(self.manager.qdrant_client, 'search') as search, \
+                mock.patch.object(
+                    self.manager.qdrant_client, 'query_batch_points',
+                    wraps=self.manager.qdrant_client.query_batch_points
+                ) as query_batch_points:
+            server_results = self.manager.similarity_search('password login', k=3, score_threshold=0)
+
+        search.assert_not_called()
+        self.assertEqual(query_batch_points.call_count, 1)
+        self.assertEqual(
+            [result['content'] for result in server_results][:1],
+            [result['content'] for result in client_results][:1]
+        )
+        self.assertEqual(set(server_results[0]['fusion_detail']), {'sources', 'dense_score', 'sparse_score'})
+        self.assertEqual(set(server_results[0]['fusion_detail']['sources']), {'dense', 'sparse'})
+        self.assertAlmostEqual(server_results[0]['similarity_score'], client_results[0]['similarity_score'])
+
+    def test_server_fusion_sends_single_query_by_default(self):
+        client_results = self.manager.similarity_search('password login', k=3, score_threshold=0)
+
+        self.knowledge_base.fusion_mode = 'server'
+        with mock.patch.object(
+            self.manager.qdrant_client, 'query_batch_points', wraps=self.manager.qdrant_client.query_batch_points
+        ) as query_batch_points:
+            server_results = self.manager.similarity_search('password login', k=3, score_threshold=0)
+
+        self.assertEqual(len(query_batch_points.call_args.kwargs['requests']), 1)
+        self.assertEqual(server_results[0]['content'], client_results[0]['content'])
+        self.assertLessEqual(server_results[0]['similarity_score'], 1.0)
+        scores = [result['similarity_score'] for result in server_results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_score_threshold_filters_alike_in_both_modes(self):
+        for threshold in (0.3, 0.55, 0.8):
+            self.knowledge_base.fusion_mode = 'client'
+            client_results = self.manager.similarity_search('password login', k=4, score_threshold=threshold)
+            self.knowledge_base.fusion_mode = 'server'
+            server_results = self.manager.similarity_search('password login', k=4, score_threshold=threshold)
+
+            self.assertEqual(
+                [result['content'] for result in server_results],
+                [result['content'] for result in client_results]
+            )
+            for server_result, client_result in zip(server_results, client_results):
+                self.assertAlmostEqual(server_result['similarity_score'], client_result['similarity_score'])
+        self.assertEqual(server_results[0]['fusion_detail'], {'sources': [], 'dense_score': None, 'sparse_score': None})
+
+
+@override_settings(KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES=0)
+class PayloadFilterTests(TestCase):
+    """测试按 payload 索引过滤检索和按文档删除向量"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='filter_user', password='password')
+        project = Project.objects.create(name='Filter Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=project, creator=user, chunk_size=30, chunk_overlap=0
+        )
+        self.manager = create_test_vector_manager(self.knowledge_base, sparse_encoder=FakeSparseEncoder())
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+        self.addCleanup(VectorStoreManager._vector_store_cache.pop, str(self.knowledge_base.id), None)
+
+        self.documents = {}
+        for title, document_type, text in [
+            ('guide', 'txt', 'user login with password\n\nreset password by email'),
+            ('spec', 'pdf', 'login api returns token\n\npassword must be hashed'),
+        ]:
+            document = Document.objects.create(
+                knowledge_base=self.knowledge_base, title=title, document_type=document_type, uploader=user
+            )
+            self.manager.add_documents([LangChainDocument(page_content=text)], document)
+            self.documents[title] = document
+
+    def _count(self):
+        return self.manager.qdrant_client.count(self.manager._get_collection_name()).count
+
+    def test_payload_indexes_created_with_collection(self):
+        knowledge_base = KnowledgeBase.objects.create(
+            name='KB2', project=self.knowledge_base.project, creator=self.knowledge_base.creator
+        )
+        manager = create_test_vector_manager(knowledge_base)
+        self.addCleanup(VectorStoreManager._vector_store_cache.pop, str(knowledge_base.id), None)
+
+        with mock.patch.object(manager.qdrant_client, 'create_payload_index') as create_index:
+            _ = manager.vector_store
+
+        self.assertEqual(
+            [call.kwargs['field_name'] for call in create_index.call_args_list],
+            list(VectorStoreManager.PAYLOAD_INDEX_FIELDS)
+        )
+
+    def test_filtered_search_in_every_fusion_mode(self):
+        spec_id = str(self.documents['spec'].id)
+        for fusion_mode, sparse_encoder in (('client', None), ('client', FakeSparseEncoder()), ('server', FakeSparseEncoder())):
+            self.knowledge_base.fusion_mode = fusion_mode
+            self.manager.sparse_encoder = sparse_encoder
+            by_document = self.manager.similarity_search(
+                'password login', k=4, score_threshold=0, filters={'document_ids': [spec_id]}
+            )
+            by_type = self.manager.similarity_search(
+                'password login', k=4, score_threshold=0, filters={'document_types': ['txt']}
+            )
+
+            self.assertEqual({result['metadata']['document_id'] for result in by_document}, {spec_id})
+            self.assertEqual(len(by_document), 2)
+            self.assertEqual({result['metadata']['document_type'] for result in by_type}, {'txt'})
+
+    def test_delete_document_uses_filter_without_reading_chunks(self):
+        with self.assertNumQueries(0):
+            self.manager.delete_document(self.documents['guide'])
+
+        self.assertEqual(self._count(), 2)
+        self.assertEqual(self.documents['guide'].chunks.count(), 2)
+
+    def test_deleting_document_keeps_other_documents_vectors(self):
+        with mock.patch.object(
+                VectorStoreManager, '_get_shared_qdrant_client', return_value=self.manager.qdrant_client):
+            self.documents['guide'].delete()
+
+        self.assertEqual(self._count(), 2)
+        remaining = self.manager.similarity_search('password login', k=4, score_threshold=0)
+        self.assertEqual(
+            {result['metadata']['document_id'] for result in remaining}, {str(self.documents['spec'].id)}
+        )
+
+
+class VectorStorageOptionsTests(TestCase):
+    """测试知识库的量化 / 磁盘存储 / HNSW 配置"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='storage_user', password='password')
+        project = Project.objects.create(name='Storage Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=project, creator=user, quantization='scalar', vectors_on_disk=True, hnsw_m=32
+        )
+        self.manager = create_test_vector_manager(self.knowledge_base, sparse_encoder=FakeSparseEncoder())
+        self.addCleanup(VectorStoreManager._vector_store_cache.pop, str(self.knowledge_base.id), None)
+
+    def test_collection_created_with_storage_options(self):
+        client = self.manager.qdrant_client
+        with mock.patch.object(client, 'create_collection', wraps=client.create_collection) as create:
+            _ = self.manager.vector_store
+
+        kwargs = create.call_args.kwargs
+        self.assertIsInstance(kwargs['quantization_config'], qmodels.ScalarQuantization)
+        self.assertTrue(kwargs['vectors_config'][VectorStoreManager.DENSE_VECTOR_NAME].on_disk)
+        self.assertEqual(kwargs['hnsw_config'].m, 32)
+        self.assertEqual(
+            VectorStoreManager.search_params(self.knowledge_base).quantization.oversampling,
+            settings.KNOWLEDGE_QUANTIZATION_OVERSAMPLING
+        )
+
+    def test_apply_storage_settings_updates_only_changed_options(self):
+        _ = self.manager.vector_store
+        self.knowledge_base.vectors_on_disk = False
+        self.knowledge_base.quantization = 'none'
+        collection = self.manager.qdrant_client.get_collection(self.manager._get_collection_name())
+        collection.config.quantization_config = qmodels.ScalarQuantization(
+            scalar=qmodels.ScalarQuantizationConfig(type=qmodels.ScalarType.INT8)
+        )
+        collection.config.hnsw_config.m = 32
+
+        with mock.patch.object(self.manager.qdrant_client, 'get_collection', return_value=collection), \
+                mock.patch.object(self.manager.qdrant_client, 'update_collection') as update:
+            changes = self.manager.apply_storage_settings()
+
+        self.assertEqual(set(changes), {'vectors_config', 'sparse_vectors_config', 'quantization_config'})
+        self.assertEqual(update.call_args.kwargs['quantization_config'], qmodels.Disabled.DISABLED)
+        self.assertFalse(update.call_args.kwargs['vectors_config'][VectorStoreManager.DENSE_VECTOR_NAME].on_disk)
+
+    def test_storage_change_is_migrated_in_task_queue(self):
+        admin = User.objects.create_superuser(username='storage_admin', password='password')
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        with mock.patch('knowledge.views.enqueue_storage_settings') as enqueue, \
+                mock.patch.object(VectorStoreManager, 'apply_storage_settings') as apply_storage:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.patch(
+                    f'/api/knowledge/knowledge-bases/{self.knowledge_base.id}/', {'quantization': 'none'}, format='json'
+                )
+
+        self.assertEqual(response.status_code, 200)
+        apply_storage.assert_not_called()
+        enqueue.assert_called_once()
+        self.assertEqual(enqueue.call_args.args[0].quantization, 'none')
+
+    def test_storage_settings_task_uses_registered_manager(self):
+        with mock.patch.object(VectorStoreManager, 'get_manager', return_value=self.manager), \
+                mock.patch.object(
+                    self.manager, 'apply_storage_settings', return_value={'quantization_config': None}
+                ) as apply_storage, \
+                mock.patch.object(KnowledgeBaseService, 'invalidate_query_cache') as invalidate:
+            result = apply_knowledge_storage_settings(str(self.knowledge_base.id))
+
+        apply_storage.assert_called_once()
+        invalidate.assert_called_once()
+        self.assertEqual(result['changes'], ['quantization_config'])
+
+
+@override_settings(KNOWLEDGE_SHARED_COLLECTION_ENABLED=True)
+class SharedCollectionLayoutTests(TestCase):
+    """测试小知识库共享集合及按规模迁移集合布局"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='shared_user', password='password')
+        project = Project.objects.create(name='Shared Project', creator=user)
+        client = QdrantClient(':memory:')
+        self.managers = {}
+        for name, text in [('alpha', 'alpha login flow\n\nalpha password reset'), ('beta', 'beta login api')]:
+            knowledge_base = KnowledgeBase.objects.create(
+                name=name, project=project, creator=user, chunk_size=30, chunk_overlap=0
+            )
+            manager = create_test_vector_manager(knowledge_base, sparse_encoder=FakeSparseEncoder())
+            manager._qdrant_client = client
+            self.addCleanup(VectorStoreManager._vector_store_cache.pop, str(knowledge_base.id), None)
+            document = Document.objects.create(
+                knowledge_base=knowledge_base, title=name, document_type='txt', uploader=user, status='completed'
+            )
+            manager.add_documents([LangChainDocument(page_content=text)], document)
+            self.managers[name] = manager
+        self.client = client
+
+    def _search_kb_ids(self, manager):
+        results = manager.similarity_search('login password', k=10, score_threshold=0)
+        return {result['metadata']['knowledge_base_id'] for result in results}
+
+    def test_small_knowledge_bases_share_one_collection(self):
+        alpha, beta = self.managers['alpha'], self.managers['beta']
+
+        self.assertEqual(alpha.knowledge_base.vector_layout, 'shared')
+        self.assertEqual(alpha._get_collection_name(), beta._get_collection_name())
+        self.assertEqual([c.name for c in self.client.get_collections().collections], ['kb_shared_8'])
+        self.assertEqual(self._search_kb_ids(alpha), {str(alpha.knowledge_base.id)})
+        self.assertEqual(self._search_kb_ids(beta), {str(beta.knowledge_base.id)})
+
+    def test_promote_and_demote_move_vectors(self):
+        alpha, beta = self.managers['alpha'], self.managers['beta']
+
+        with override_settings(KNOWLEDGE_SHARED_COLLECTION_PROMOTE_CHUNKS=1):
+            self.assertEqual(alpha.rebalance_layout(), 'dedicated')
+        alpha.knowledge_base.refresh_from_db()
+        self.assertEqual(alpha.knowledge_base.vector_layout, 'dedicated')
+        self.assertEqual(self.client.count(f"kb_{alpha.knowledge_base.id}").count, 2)
+        self.assertEqual(self.client.count('kb_shared_8').count, 1)
+        self.assertEqual(self._search_kb_ids(alpha), {str(alpha.knowledge_base.id)})
+
+        self.assertEqual(alpha.rebalance_layout(), 'shared')
+        self.assertFalse(self.client.collection_exists(f"kb_{alpha.knowledge_base.id}"))
+        self.assertEqual(self.client.count('kb_shared_8').count, 3)
+        self.assertEqual(self._search_kb_ids(beta), {str(beta.knowledge_base.id)})
+
+    def test_storage_migration_waits_for_ingest_in_progress(self):
+        alpha = self.managers['alpha']
+        knowledge_base = alpha.knowledge_base
+        knowledge_base.quantization = 'scalar'
+        knowledge_base.save(update_fields=['quantization'])
+        pending = Document.objects.create(
+            knowledge_base=knowledge_base, title='pending', document_type='txt',
+            uploader=knowledge_base.creator, status='processing'
+        )
+
+        with mock.patch.object(VectorStoreManager, 'get_manager', return_value=alpha), \
+                mock.patch('knowledge.tasks.enqueue_storage_settings') as enqueue:
+            result = apply_knowledge_storage_settings(str(knowledge_base.id))
+
+        self.assertEqual(result['status'], 'deferred')
+        self.assertIsNotNone(enqueue.call_args.kwargs['countdown'])
+        self.assertEqual(knowledge_base.vector_layout, 'shared')
+        self.assertFalse(self.client.collection_exists(f"kb_{knowledge_base.id}"))
+
+        pending.status = 'completed'
+        pending.save(update_fields=['status'])
+        self.assertEqual(alpha.apply_storage_settings(), {'vector_layout': 'dedicated'})
+        self.assertEqual(self.client.count(f"kb_{knowledge_base.id}").count, 2)
+
+    def test_service_delete_document_removes_vectors_once(self):
+        alpha = self.managers['alpha']
+        document = alpha.knowledge_base.documents.get()
+        document_id = document.id
+        with mock.patch.object(VectorStoreManager, 'get_manager', return_value=alpha):
+            service = KnowledgeBaseService(alpha.knowledge_base)
+
+        with mock.patch.object(VectorStoreManager, 'delete_document_vectors') as delete_vectors:
+            service.delete_document(document)
+
+        delete_vectors.assert_called_once_with(alpha.knowledge_base.id, document_id)
+        self.assertFalse(Document.objects.filter(pk=document_id).exists())
+
+    def test_delete_document_in_shared_collection_keeps_other_tenants(self):
+        alpha = self.managers['alpha']
+        alpha.delete_document(alpha.knowledge_base.documents.get())
+
+        self.assertEqual(self.client.count('kb_shared_8').count, 1)
+        self.assertEqual(self._search_kb_ids(alpha), set())
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'knowledge': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'query-result-tests'},
+}, KNOWLEDGE_QUERY_LOG_BUFFER_SIZE=0)
+class QueryResultCacheTests(TestCase):
+    """测试检索结果缓存及按知识库版本号失效"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='result_cache_user', password='password')
+        project = Project.objects.create(name='Result Cache Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=project, creator=user, chunk_size=30, chunk_overlap=0
+        )
+        self.manager = create_test_vector_manager(self.knowledge_base)
+        self.addCleanup(VectorStoreManager._vector_store_cache.pop, str(self.knowledge_base.id), None)
+        with mock.patch.object(VectorStoreManager, 'get_manager', return_value=self.manager):
+            self.service = KnowledgeBaseService(self.knowledge_base)
+
+        self.documents = []
+        for title in ('guide', 'spec'):
+            document = Document.objects.create(
+                knowledge_base=self.knowledge_base, title=title, document_type='txt', uploader=user
+            )
+            self.manager.add_documents([LangChainDocument(page_content=f'{title} login steps')], document)
+            self.documents.append(document)
+
+    def _query(self, **kwargs):
+        return self.service.query('login steps', similarity_threshold=0, **kwargs)['sources']
+
+    def test_repeated_query_is_served_from_cache(self):
+        with mock.patch.object(self.manager, 'similarity_search', wraps=self.manager.similarity_search) as search:
+            first = self._query()
+            second = self._query()
+            self._query(top_k=1)
+
+        self.assertEqual(first, second)
+        self.assertEqual(search.call_count, 2)
+
+    def test_document_delete_invalidates_cached_results(self):
+        stats_before = QueryResultCache.stats()
+        self.assertEqual(len(self._query()), 2)
+
+        with mock.patch.object(
+            VectorStoreManager, '_get_shared_qdrant_client', return_value=self.manager.qdrant_client
+        ):
+            self.documents[0].delete()
+
+        self.assertEqual(len(self._query()), 1)
+        stats = QueryResultCache.stats()
+        self.assertEqual(stats['misses'] - stats_before['misses'], 2)
+        self.assertEqual(stats['invalidations'] - stats_before['invalidations'], 1)
+
+
+class QueryLogBufferTests(TestCase):
+    """测试查询日志缓冲批量写入和查询次数计数"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='log_user', password='password')
+        project = Project.objects.create(name='Log Project', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=project, creator=self.user)
+        self.buffer = QueryLogBuffer(batch_size=2, interval=3600)
+        patcher = mock.patch.object(self.buffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _entry(self, query, **extra):
+        return {'knowledge_base_id': self.knowledge_base.id, 'user_id': self.user.id, 'query': query, **extra}
+
+    def test_flush_bulk_inserts_and_updates_counter(self):
+        queried_at = timezone.now() - timezone.timedelta(minutes=5)
+        self.buffer.add(self._entry('first', created_at=queried_at))
+        self.buffer.add(self._entry('second'))
+        self.buffer.add({**self._entry('orphan'), 'knowledge_base_id': uuid.uuid4()})
+
+        with self.assertNumQueries(6):
+            self.assertEqual(self.buffer.flush(), 2)
+
+        self.knowledge_base.refresh_from_db()
+        self.assertEqual(self.knowledge_base.query_count, 2)
+        self.assertEqual(QueryLog.objects.get(query='first').created_at, queried_at)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_entries_for_retry(self):
+        self.buffer.add(self._entry('first'))
+        with mock.patch.object(QueryLog.objects, 'bulk_create', side_effect=OperationalError('db down')), \
+                mock.patch.object(QueryLog.objects, 'create', side_effect=OperationalError('db down')):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(len(self.buffer._pending), 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(QueryLog.objects.filter(knowledge_base=self.knowledge_base).count(), 1)
+
+    def test_deleted_user_does_not_block_later_flushes(self):
+        other = User.objects.create_user(username='gone_user', password='password')
+        self.buffer.add({**self._entry('from deleted user'), 'user_id': other.id})
+        self.buffer.add(self._entry('second'))
+        other.delete()
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertIsNone(QueryLog.objects.get(query='from deleted user').user_id)
+
+        self.buffer.add(self._entry('later'))
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.stats()['pending'], 0)
+
+    def test_invalid_entry_is_dropped_and_rest_written(self):
+        self.buffer.add(self._entry('first'))
+        self.buffer.add({**self._entry('broken'), 'no_such_field': 1})
+        self.buffer.add(self._entry('third'))
+
+        self.assertEqual(self.buffer.flush(), 2)
+
+        self.assertEqual(len(self.buffer._pending), 0)
+        self.assertEqual(set(QueryLog.objects.values_list('query', flat=True)), {'first', 'third'})
+        self.knowledge_base.refresh_from_db()
+        self.assertEqual(self.knowledge_base.query_count, 2)
+
+    def test_requeue_overflow_drops_oldest_entries(self):
+        buffer = QueryLogBuffer(batch_size=2, interval=3600, max_pending=3)
+        buffer._pending.extend(self._entry(query) for query in ('new-1', 'new-2'))
+
+        buffer._requeue([self._entry('old-1'), self._entry('old-2')])
+
+        self.assertEqual([entry['query'] for entry in buffer._pending], ['old-2', 'new-1', 'new-2'])
+
+    @override_settings(KNOWLEDGE_QUERY_LOG_BUFFER_SIZE=0)
+    def test_synchronous_mode_writes_immediately(self):
+        record_query_log(knowledge_base_id=self.knowledge_base.id, user_id=None, query='direct')
+
+        self.knowledge_base.refresh_from_db()
+        self.assertEqual(self.knowledge_base.query_count, 1)
+        self.assertTrue(QueryLog.objects.filter(query='direct').exists())
+
+
+class KnowledgeBenchmarkTests(TestCase):
+    """测试入库与检索基准测试"""
+
+    def test_corpus_is_deterministic_and_follows_language_mix(self):
+        self.assertEqual(generate_corpus(3, 4, seed=1), generate_corpus(3, 4, seed=1))
+
+        english = generate_corpus(3, 4, zh_ratio=0, queries=5)
+        chinese = generate_corpus(3, 4, zh_ratio=1, queries=5)
+        english_text = ''.join(p for _, paragraphs in english.documents for p in paragraphs)
+        chinese_text = ''.join(p for _, paragraphs in chinese.documents for p in paragraphs)
+        self.assertFalse(any('\u4e00' <= char <= '\u9fff' for char in english_text))
+        self.assertTrue(all(not char.isascii() for char in chinese_text))
+        self.assertEqual(len(chinese.queries), 5)
+
+    def test_benchmark_reports_every_mode_and_rolls_back(self):
+        report = run_benchmark(documents=2, paragraphs=3, queries=4, dimension=16, chunk_size=200)
+
+        self.assertEqual([run['mode'] for run in report['runs']], ['dense', 'hybrid', 'hybrid_server'])
+        for run in report['runs']:
+            self.assertGreater(run['ingest']['chunks'], 0)
+            self.assertGreater(run['ingest']['dense_embed_seconds'], 0)
+            self.assertGreater(run['ingest']['upsert_seconds'], 0)
+            self.assertEqual(run['query']['queries'], 4)
+            self.assertLessEqual(run['query']['p50_ms'], run['query']['p99_ms'])
+        self.assertEqual(report['runs'][0]['ingest']['sparse_encode_seconds'], 0)
+        self.assertFalse(KnowledgeBase.objects.exists())
+        self.assertFalse(DocumentChunk.objects.exists())
+
+        slower = json.loads(json.dumps(report))
+        slower['runs'][0]['query']['p95_ms'] = report['runs'][0]['query']['p95_ms'] * 2
+        self.assertLess(compare_reports(report, slower)[0]['p95_ms'], 0)
+
+
+class ModelWarmupTests(TestCase):
+    """测试启动时的模型预热"""
+
+    def setUp(self):
+        state = {'status': 'pending', 'pid': None, 'started_at': None, 'finished_at': None, 'error': None,
+                 'models': {}}
+        for patcher in (mock.patch.object(ModelWarmup, '_state', state),
+                        mock.patch.object(ModelWarmup, '_ready', threading.Event())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_preload_loads_models_and_signals_readiness(self):
+        KnowledgeGlobalConfig.objects.create(embedding_service='local', model_name='BAAI/bge-small-zh-v1.5')
+        dense_model = mock.Mock()
+        dense_model.query_embed.return_value = iter([[0.1, 0.2]])
+        received = []
+
+        def on_ready(sender, models, **kwargs):
+            received.append(models)
+
+        models_ready.connect(on_ready)
+        self.addCleanup(models_ready.disconnect, on_ready)
+        with mock.patch.object(VectorStoreManager, 'load_sparse_encoder', return_value=FakeSparseEncoder()), \
+                mock.patch.object(FastEmbedEmbeddings, '_load_model', return_value=dense_model) as load_model:
+            status = ModelWarmup.preload()
+
+        load_model.assert_called_once_with('BAAI/bge-small-zh-v1.5', None)
+        self.assertTrue(status['ready'])
+        self.assertTrue(ModelWarmup.wait(0))
+        self.assertEqual(set(status['models']), {'bm25', 'local_embedding'})
+        self.assertTrue(all(model['loaded'] for model in status['models'].values()))
+        self.assertEqual(received, [status['models']])
+
+    def test_prefork_parent_only_loads_fork_safe_models(self):
+        with mock.patch.object(ModelWarmup, 'preload') as preload:
+            _preload_before_fork(sender=mock.Mock(pool_cls='prefork'))
+            preload.assert_called_once_with(sparse=True, dense=False)
+            preload.reset_mock()
+            _preload_before_fork(sender=mock.Mock(pool_cls='threads'))
+            preload.assert_called_once_with(sparse=True, dense=True)
+
+        with override_settings(KNOWLEDGE_PRELOAD_MODELS=False), \
+                mock.patch.object(VectorStoreManager, 'load_sparse_encoder') as load_sparse:
+            self.assertEqual(ModelWarmup.preload()['status'], 'disabled')
+        load_sparse.assert_not_called()
+
+    def test_concurrent_sparse_encoder_loads_share_one_instance(self):
+        VectorStoreManager._sparse_encoder_cache.pop(VectorStoreManager.SPARSE_VECTOR_NAME, None)
+        self.addCleanup(VectorStoreManager._sparse_encoder_cache.pop, VectorStoreManager.SPARSE_VECTOR_NAME, None)
+
+        def slow_encoder():
+            time.sleep(0.05)
+            return FakeSparseEncoder()
+
+        with mock.patch('knowledge.services.SparseBM25Encoder', side_effect=slow_encoder) as encoder_class:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                encoders = list(executor.map(lambda _: VectorStoreManager.load_sparse_encoder(), range(4)))
+
+        encoder_class.assert_called_once()
+        self.assertEqual(len({id(encoder) for encoder in encoders}), 1)
+
+
+class KnowledgeBaseContentListingTests(TestCase):
+    """测试知识库内容列表的键集分页和查询次数"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='content_admin', password='password')
+        project = Project.objects.create(name='Content Project', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=project, creator=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/knowledge/knowledge-bases/{self.knowledge_base.id}/content/'
+
+    def _create_documents(self, count, uploader=None, **fields):
+        documents = []
+        for i in range(count):
+            document = Document.objects.create(
+                knowledge_base=self.knowledge_base, title=f'doc {i}', document_type='txt', status='completed',
+                content=f'login flow {i} ' * 100, uploader=uploader or self.user, **fields
+            )
+            DocumentChunk.objects.bulk_create([
+                DocumentChunk(document=document, chunk_index=index, content='chunk') for index in range(i % 3 + 1)
+            ])
+            documents.append(document)
+        return documents
+
+    def _count_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_documents(self):
+        self._create_documents(2)
+        baseline = self._count_queries()
+        other_user = User.objects.create_user(username='other_uploader', password='password')
+        self._create_documents(8, uploader=other_user)
+
+        self.assertEqual(self._count_queries(), baseline)
+        self.assertEqual(self._count_queries(search='LOGIN'), baseline)
+
+    def test_cursor_pages_through_documents_in_order(self):
+        documents = self._create_documents(5)
+        # 相同上传时间的文档按 ID 排序，不会重复或遗漏
+        Document.objects.filter(pk__in=[documents[1].pk, documents[2].pk]).update(
+            uploaded_at=documents[1].uploaded_at
+        )
+        expected = list(
+            Document.objects.filter(knowledge_base=self.knowledge_base)
+            .order_by('-uploaded_at', '-id').values_list('id', flat=True)
+        )
+
+        seen, cursor = [], None
+        while True:
+            params = {'page_size': 2, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(self.url, params).json()['data']
+            self.assertEqual(data['total_count'], 5)
+            seen.extend(item['id'] for item in data['documents'])
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                break
+
+        self.assertEqual(seen, [str(pk) for pk in expected])
+        self.assertEqual(
+            set(data), {'total_count', 'page_size', 'has_more', 'next_cursor', 'documents', 'knowledge_base'}
+        )
+        first = self.client.get(self.url, {'page_size': 100}).json()['data']['documents']
+        chunk_counts = {str(doc.id): doc.chunks.count() for doc in documents}
+        self.assertEqual({item['id']: item['chunk_count'] for item in first}, chunk_counts)
+        self.assertTrue(all(len(item['content_preview']) == 500 for item in first))
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 400)
+
+
+class FakeRedis:
+    """只实现 get/setex 的内存版 Redis"""
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+
+class QueryEmbeddingCacheTests(TestCase):
+    """测试查询向量缓存"""
+
+    def test_lru_eviction_and_ttl(self):
+        cache = QueryEmbeddingCache(max_entries=2, ttl=60)
+        compute = mock.Mock(side_effect=lambda text: [float(len(text))])
+
+        cache.get_or_compute('m', 'dense', 'alpha', compute)
+        cache.get_or_compute('m', 'dense', '  ALPHA ', compute)
+        cache.get_or_compute('m', 'dense', 'beta', compute)
+        cache.get_or_compute('m', 'dense', 'gamma', compute)
+        cache.get_or_compute('m', 'dense', 'alpha', compute)
+        self.assertEqual(compute.call_count, 4)
+
+        with mock.patch('knowledge.query_embedding_cache.time.monotonic', return_value=time.monotonic() + 120):
+            cache.get_or_compute('m', 'dense', 'alpha', compute)
+        self.assertEqual(compute.call_count, 5)
+
+    def test_redis_layer_shares_sparse_vectors(self):
+        redis = FakeRedis()
+        writer = QueryEmbeddingCache(max_entries=10, ttl=60)
+        reader = QueryEmbeddingCache(max_entries=10, ttl=60)
+        writer._redis = reader._redis = redis
+        sparse = SparseQueryVector([3, 7], [0.5, 1.0])
+        codec = {'dumps': SparseQueryVector.to_dict, 'loads': lambda data: SparseQueryVector(**data)}
+
+        writer.get_or_compute('bm25', 'sparse', 'login page', lambda text: sparse, **codec)
+        compute = mock.Mock()
+        cached = reader.get_or_compute('bm25', 'sparse', 'login page', compute, **codec)
+
+        compute.assert_not_called()
+        self.assertEqual(cached.to_dict(), {'indices': [3, 7], 'values': [0.5, 1.0]})
+        self.assertGreaterEqual(QueryEmbeddingCache.stats()['redis_hits'], 1)
+
+    @override_settings(KNOWLEDGE_EMBEDDING_CACHE_BACKEND='none')
+    def test_repeated_query_skips_embedding_service(self):
+        user = User.objects.create_user(username='qcache_user', password='password')
+        project = Project.objects.create(name='QCache Project', creator=user)
+        knowledge_base = KnowledgeBase.objects.create(name='KB', project=project, creator=user)
+        embeddings = FakeEmbeddings()
+        encoder = FakeSparseEncoder()
+        manager = create_test_vector_manager(knowledge_base, embeddings, sparse_encoder=encoder)
+
+        with mock.patch.object(QueryEmbeddingCache, 'get_default', return_value=QueryEmbeddingCache()), \
+                mock.patch.object(embeddings, 'embed_query', wraps=embeddings.embed_query) as embed_query, \
+                mock.patch.object(encoder, 'encode_query', wraps=encoder.encode_query) as encode_query:
+            first = manager.encode_query('How to login?')
+            second = manager.encode_query('how to  login?')
+
+        self.assertEqual(embed_query.call_count, 1)
+        self.assertEqual(encode_query.call_count, 1)
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(second[1].indices.tolist(), first[1].indices.tolist())
+
+
+class FastEmbedEmbeddingsTests(SimpleTestCase):
+    """测试本地 FastEmbed 嵌入模型封装"""
+
+    def setUp(self):
+        import numpy as np
+
+        self.text_embedding = mock.Mock()
+        self.text_embedding.return_value.embed.side_effect = (
+            lambda texts, batch_size: (np.array([float(len(text)), 1.0]) for text in texts)
+        )
+        self.text_embedding.return_value.query_embed.side_effect = lambda text: iter([np.array([0.5, 0.5])])
+        patcher = mock.patch('fastembed.TextEmbedding', self.text_embedding)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(FastEmbedEmbeddings._models.clear)
+
+    def test_model_loaded_once_per_process(self):
+        first = FastEmbedEmbeddings(model_name='BAAI/bge-small-zh-v1.5', batch_size=16, threads=2)
+        FastEmbedEmbeddings(model_name='BAAI/bge-small-zh-v1.5', batch_size=64, threads=2)
+
+        self.assertEqual(self.text_embedding.call_count, 1)
+        self.assertEqual(self.text_embedding.call_args.kwargs['threads'], 2)
+        self.assertEqual(first.embed_documents(['ab', 'abc']), [[2.0, 1.0], [3.0, 1.0]])
+        self.assertEqual(self.text_embedding.return_value.embed.call_args.kwargs['batch_size'], 16)
+        self.assertEqual(first.embed_query('测试'), [0.5, 0.5])
+
+
+def make_pdf(page_texts):
+    """生成每页包含一行文本的最小 PDF"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return output
+
+
+def crashing_submit(crash_page):
+    """模拟解析 crash_page 所在页段时解析进程崩溃，其余任务在当前进程内执行"""
+    def submit(pool, fn, *args):
+        future = Future()
+        if fn is parse_pdf_pages and args[1] <= crash_page < args[2]:
+            future.set_exception(BrokenProcessPool('worker died'))
+        else:
+            future.set_result(fn(*args))
+        return future
+    return submit
+
+
+class DocumentParsePoolTests(SimpleTestCase):
+    """测试文档解析进程池"""
+
+    def setUp(self):
+        handle, self.pdf_path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(handle, 'wb') as pdf_file:
+            pdf_file.write(make_pdf([f'Page {i} content' for i in range(5)]))
+        self.addCleanup(os.remove, self.pdf_path)
+
+    def test_pdf_pages_parsed_in_worker_processes_in_page_order(self):
+        pool = DocumentParsePool(workers=2, timeout=60, pages_per_task=2)
+        errors = []
+
+        pages = list(pool.iter_pdf_pages(self.pdf_path, errors))
+
+        self.assertEqual(errors, [])
+        self.assertEqual([text for text, _ in pages], [f'Page {i} content' for i in range(5)])
+        self.assertEqual([metadata['page'] for _, metadata in pages], list(range(5)))
+        self.assertEqual(pages[0][1]['total_pages'], 5)
+
+    def test_timeout_terminates_only_its_own_parse(self):
+        slow_pool = DocumentParsePool(workers=1, timeout=2)
+        other_pool = DocumentParsePool(workers=1, timeout=60)
+        results = {}
+
+        def parse_other():
+            try:
+                results['other'] = other_pool._call(time.sleep, 4)
+            except DocumentParseError as e:
+                results['other'] = e
+            finally:
+                other_pool.close()
+
+        # 另一个文档正在解析时，本次解析超时
+        worker = threading.Thread(target=parse_other)
+        worker.start()
+        with self.assertRaises(DocumentParseError):
+            slow_pool._call(time.sleep, 30)
+        worker.join(timeout=60)
+
+        self.assertIsNone(results['other'])
+        self.assertIsNone(slow_pool._executor)
+        self.assertEqual(len(list(other_pool.iter_pdf_pages(self.pdf_path, []))), 5)
+
+    def test_pool_is_reused_across_documents(self):
+        first = DocumentParsePool(workers=3, timeout=60)
+        executor = first._get_executor()
+        self.assertEqual(len(list(first.iter_pdf_pages(self.pdf_path, []))), 5)
+
+        second = DocumentParsePool(workers=3, timeout=60)
+        self.assertIs(second._get_executor(), executor)
+        self.assertEqual(len(second.load(PyPDFLoader, self.pdf_path)), 5)
+
+    def test_real_pdf_parsed_under_default_memory_limit(self):
+        with open(self.pdf_path, 'wb') as pdf_file:
+            pdf_file.write(make_pdf([f'Section {i} describes the login and password policy' for i in range(60)]))
+        pool = DocumentParsePool.from_settings()
+        self.assertEqual(pool.memory_limit_mb, settings.KNOWLEDGE_PARSE_MEMORY_LIMIT_MB)
+
+        pages = pool.load(PyPDFLoader, self.pdf_path)
+        errors = []
+        streamed = list(pool.iter_pdf_pages(self.pdf_path, errors))
+
+        self.assertEqual(len(pages), 60)
+        self.assertEqual(errors, [])
+        self.assertEqual([text for text, _ in streamed], [text for text, _ in pages])
+
+    def test_memory_limit_ends_only_the_oversized_parse(self):
+        pool = DocumentParsePool(workers=1, timeout=60, memory_limit_mb=200)
+
+        with self.assertRaises(DocumentParseError):
+            pool._call(operator.mul, 'x', 600 * 1024 * 1024)
+
+        self.assertIsNone(pool._executor)
+        self.assertEqual(len(list(pool.iter_pdf_pages(self.pdf_path, []))), 5)
+
+    def test_crashing_page_is_isolated_and_reported(self):
+        pool = DocumentParsePool(workers=2, timeout=60, pages_per_task=2)
+        errors = []
+
+        with mock.patch.object(DocumentParsePool, '_submit', crashing_submit(crash_page=2)):
+            pages = list(pool.iter_pdf_pages(self.pdf_path, errors))
+
+        self.assertEqual([metadata['page'] for _, metadata in pages], [0, 1, 3, 4])
+        self.assertEqual(len(errors), 1)
+        self.assertIn('第 3 页', errors[0])
+
+
+@override_settings(KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES=0)
+class DocumentParsingIngestTests(TestCase):
+    """测试文件解析结果流式入库"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = User.objects.create_user(username='parse_user', password='password')
+        project = Project.objects.create(name='Parse Project', creator=user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=project, creator=user)
+        self.document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='spec', document_type='pdf', uploader=user,
+            file=SimpleUploadedFile('spec.pdf', make_pdf([f'Page {i} content' for i in range(4)])),
+        )
+        VectorStoreManager._vector_store_cache.pop(str(self.knowledge_base.id), None)
+        self.addCleanup(VectorStoreManager._vector_store_cache.pop, str(self.knowledge_base.id), None)
+
+    def test_partial_parse_failure_completes_and_records_error(self):
+        manager = create_test_vector_manager(self.knowledge_base)
+        with mock.patch.object(VectorStoreManager, 'get_manager', return_value=manager):
+            service = KnowledgeBaseService(self.knowledge_base)
+
+        with mock.patch.object(DocumentParsePool, '_submit', crashing_submit(crash_page=1)):
+            self.assertTrue(service.process_document(self.document))
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'completed')
+        self.assertEqual(self.document.page_count, 3)
+        self.assertEqual(self.document.total_chunks, 3)
+        self.assertEqual(self.document.processed_chunks, 3)
+        self.assertIn('第 2 页', self.document.error_message)
+        self.assertEqual(
+            sorted(self.document.chunks.values_list('content', flat=True)),
+            ['Page 0 content', 'Page 2 content', 'Page 3 content'],
+        )
+
+
+class ParsedContentCacheTests(TestCase):
+    """测试按文件摘要缓存的文档解析结果"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = User.objects.create_user(username='cache_user', password='password')
+        project = Project.objects.create(name='Cache Project', creator=user)
+        knowledge_base = KnowledgeBase.objects.create(name='KB', project=project, creator=user)
+        pdf = make_pdf([f'Page {i} content' for i in range(3)])
+        self.documents = [
+            Document.objects.create(
+                knowledge_base=knowledge_base, title=f'spec {i}', document_type='pdf', uploader=user,
+                file=SimpleUploadedFile(f'spec{i}.pdf', pdf),
+            )
+            for i in range(2)
+        ]
+        self.cache = ParsedContentCache(DatabaseParsedContentBackend())
+        patcher = mock.patch.object(ParsedContentCache, '_default', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_file_is_parsed_once(self):
+        processor = DocumentProcessor()
+        original = DocumentParsePool.iter_pdf_pages
+
+        with mock.patch.object(DocumentParsePool, 'iter_pdf_pages', autospec=True, side_effect=original) as parse, \
+                mock.patch.object(DocumentParsePool, '_submit', crashing_submit(crash_page=-1)):
+            first = processor.load_document(self.documents[0])
+            reloaded = processor.load_document(self.documents[0])
+            duplicate = processor.load_document(self.documents[1])
+
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(ParsedContentEntry.objects.count(), 1)
+        self.assertEqual([doc.page_content for doc in reloaded], [doc.page_content for doc in first])
+        self.assertEqual(duplicate[0].metadata['document_id'], str(self.documents[1].id))
+        self.assertEqual(duplicate[0].metadata['page'], 0)
+        self.documents[1].refresh_from_db()
+        self.assertEqual(self.documents[1].file_digest, hashlib.sha256(make_pdf(
+            [f'Page {i} content' for i in range(3)]
+        )).hexdigest())
+
+    def test_replaced_file_is_parsed_again(self):
+        processor = DocumentProcessor()
+        with mock.patch.object(DocumentParsePool, '_submit', crashing_submit(crash_page=-1)):
+            processor.load_document(self.documents[0])
+        document = Document.objects.get(pk=self.documents[0].pk)
+        new_pdf = make_pdf(['Replaced content'])
+
+        serializer = DocumentSerializer(
+            document, data={'file': SimpleUploadedFile('replaced.pdf', new_pdf)}, partial=True
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        document = Document.objects.get(pk=document.pk)
+        self.assertIsNone(document.file_digest)
+
+        with mock.patch.object(DocumentParsePool, '_submit', crashing_submit(crash_page=-1)):
+            reparsed = processor.load_document(document)
+
+        self.assertEqual([doc.page_content for doc in reparsed], ['Replaced content'])
+        document.refresh_from_db()
+        self.assertEqual(document.file_digest, hashlib.sha256(new_pdf).hexdigest())
+
+    def test_partial_parse_is_not_cached(self):
+        with mock.patch.object(DocumentParsePool, '_submit', crashing_submit(crash_page=1)):
+            DocumentProcessor().load_document(self.documents[0], errors=[])
+
+        self.assertFalse(ParsedContentEntry.objects.exists())
+
+    def test_disk_backend_evicts_least_recently_used(self):
+        cache = ParsedContentCache(DiskParsedContentBackend(tempfile.mkdtemp()), max_entries=4)
+        digests = ['aa' * 32, 'bb' * 32, 'cc' * 32, 'dd' * 32]
+        for index, digest in enumerate(digests):
+            cache.set('knowledge:pdf:v1', digest, [(f'text {index}', {'page': 0})])
+            entry_path = cache.backend._entry_path('knowledge:pdf:v1', digest)
+            os.utime(entry_path, (time.time() - 100 + index, time.time() - 100 + index))
+
+        self.assertEqual(cache.get('knowledge:pdf:v1', 'aa' * 32), [('text 0', {'page': 0})])
+        cache.set('knowledge:pdf:v1', 'ee' * 32, [('text 4', {})])
+
+        # 淘汰到低水位（容量的 90%）：删除最久未使用的两条
+        self.assertIsNone(cache.get('knowledge:pdf:v1', 'bb' * 32))
+        self.assertIsNone(cache.get('knowledge:pdf:v1', 'cc' * 32))
+        self.assertIsNotNone(cache.get('knowledge:pdf:v1', 'aa' * 32))
+        self.assertIsNotNone(cache.get('knowledge:pdf:v1', 'dd' * 32))
+
+    def test_eviction_counts_entries_once(self):
+        backend = DiskParsedContentBackend(tempfile.mkdtemp())
+        cache = ParsedContentCache(backend, max_entries=100)
+
+        with mock.patch.object(backend, 'count', wraps=backend.count) as count, \
+                mock.patch.object(backend, 'evict', wraps=backend.evict) as evict:
+            for index in range(5):
+                cache.set('knowledge:pdf:v1', f'{index:02d}' * 32, [(f'text {index}', {})])
+
+        self.assertEqual(count.call_count, 1)
+        evict.assert_not_called()
@@ -1,6 +1,11 @@
+import base64
+import binascii
+import json
 import os
-import threading
 import logging
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
@@ -10,7 +15,9 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from django.db import transaction
 from django.db import models
+from django.db.models.functions import Substr
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from wharttest_django.viewsets import BaseModelViewSet
 from .models import KnowledgeBase, Document, DocumentChunk, QueryLog, KnowledgeGlobalConfig
 from .serializers import (
@@ -19,6 +26,14 @@ from .serializers import (
     KnowledgeQueryResponseSerializer, KnowledgeGlobalConfigSerializer
 )
 from .services import KnowledgeBaseService, VectorStoreManager
+from .embedding_cache import EmbeddingCache
+from .query_embedding_cache import QueryEmbeddingCache
+from .parsing import DocumentParsePool
+from .parsed_content_cache import ParsedContentCache
+from .query_result_cache import QueryResultCache
+from .query_log_buffer import QueryLogBuffer
+from .model_warmup import ModelWarmup
+from .tasks import enqueue_document_processing, enqueue_storage_settings
 import logging
 import time
 from pathlib import Path
@@ -64,6 +79,27 @@ class KnowledgeGlobalConfigView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def encode_content_cursor(document: Document) -> str:
+    """知识库内容分页游标：当前页最后一个文档的 (上传时间, ID)"""
+    raw = json.dumps([document.uploaded_at.isoformat(), str(document.id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_content_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, uuid.UUID]]:
+    """解析分页游标，格式错误时抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        uploaded_at, document_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        parsed = parse_datetime(uploaded_at)
+        document_id = uuid.UUID(document_id)
+    except (TypeError, ValueError, AttributeError, binascii.Error):
+        raise ValueError('cursor 格式错误')
+    if parsed is None:
+        raise ValueError('cursor 格式错误')
+    return parsed, document_id
+
+
 class KnowledgeBaseViewSet(BaseModelViewSet):
     """知识库视图集"""
     queryset = KnowledgeBase.objects.all()
@@ -94,6 +130,24 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
         """创建知识库时自动设置创建人"""
         serializer.save(creator=self.request.user)
 
+    STORAGE_FIELDS = ('quantization', 'vectors_on_disk', 'payload_on_disk', 'hnsw_m', 'hnsw_ef_construct')
+
+    def perform_update(self, serializer):
+        """更新知识库；存储配置变化时在入库队列中异步迁移已有的向量集合"""
+        previous = {field: getattr(serializer.instance, field) for field in self.STORAGE_FIELDS}
+        knowledge_base = serializer.save()
+        if all(getattr(knowledge_base, field) == value for field, value in previous.items()):
+            return
+        # 事务提交后再入队，避免 worker 读到旧配置
+        transaction.on_commit(lambda: self._enqueue_storage_settings(knowledge_base))
+
+    def _enqueue_storage_settings(self, knowledge_base):
+        """投递存储配置迁移任务，投递失败时只记录警告"""
+        try:
+            enqueue_storage_settings(knowledge_base)
+        except Exception as e:
+            logger.warning(f"知识库 {knowledge_base.id} 存储配置迁移入队失败，可稍后执行 apply_vector_storage 命令重试: {e}")
+
     @action(detail=True, methods=['post'])
     def query(self, request, pk=None):
         """查询知识库"""
@@ -113,7 +167,8 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
                 query_text=query_serializer.validated_data['query'],
                 top_k=query_serializer.validated_data.get('top_k', 5),
                 similarity_threshold=query_serializer.validated_data.get('similarity_threshold', 0.1),
-                user=request.user
+                user=request.user,
+                filters=query_serializer.get_filters()
             )
 
             # 序列化响应
@@ -137,7 +192,8 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
             'chunk_count': DocumentChunk.objects.filter(
                 document__knowledge_base=knowledge_base
             ).count(),
-            'query_count': knowledge_base.query_logs.count(),
+            # 查询次数为日志批量写入时累加的计数，尚在缓冲区中的查询不计入
+            'query_count': knowledge_base.query_count,
             'document_status_distribution': {},
             'recent_queries': knowledge_base.query_logs.order_by('-created_at')[:5].values(
                 'query', 'total_time', 'created_at'
@@ -153,22 +209,37 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
 
         return Response(stats)
 
-    @action(detail=True, methods=['get'])
+    CONTENT_MAX_PAGE_SIZE = 100
+    CONTENT_PREVIEW_LENGTH = 500
+
+    # search 参数用于检索文档，不能作用于知识库本身的 SearchFilter
+    @action(detail=True, methods=['get'], filter_backends=[])
     def content(self, request, pk=None):
-        """查看知识库内容"""
+        """
+        查看知识库内容（键集分页）
+        按上传时间倒序返回文档，下一页通过上一页返回的 next_cursor 获取（响应不再包含 page / total_pages）；
+        分块数量、上传人和内容预览在同一条查询中取出，每页的查询次数与文档数量无关
+
+        search 只支持标题和正文的子串匹配（不区分大小写），不提供全文检索（tsvector）：
+        中文没有可用的分词配置，PostgreSQL 上由 pg_trgm 索引加速（见迁移 0020），其他数据库为 LIKE 全表扫描
+        """
         knowledge_base = self.get_object()
 
         # 获取查询参数
         search = request.query_params.get('search', '')
         document_type = request.query_params.get('document_type', '')
-        status = request.query_params.get('status', 'completed')
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 20))
+        document_status = request.query_params.get('status', 'completed')
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), self.CONTENT_MAX_PAGE_SIZE)
+            cursor = decode_content_cursor(request.query_params.get('cursor'))
+        except ValueError as e:
+            return Response({'error': f'分页参数无效: {e}'}, status=status.HTTP_400_BAD_REQUEST)
 
         # 构建查询
-        documents = knowledge_base.documents.filter(status=status)
+        documents = knowledge_base.documents.filter(status=document_status)
 
         if search:
+            # PostgreSQL 上由 UPPER(title) / UPPER(content) 的 pg_trgm GIN 索引支持（见迁移 0020）
             documents = documents.filter(
                 models.Q(title__icontains=search) |
                 models.Q(content__icontains=search)
@@ -177,27 +248,40 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
         if document_type:
             documents = documents.filter(document_type=document_type)
 
-        # 排序
-        documents = documents.order_by('-uploaded_at')
-
-        # 分页
         total_count = documents.count()
-        start = (page - 1) * page_size
-        end = start + page_size
-        documents = documents[start:end]
+
+        if cursor is not None:
+            uploaded_at, document_id = cursor
+            documents = documents.filter(
+                models.Q(uploaded_at__lt=uploaded_at) |
+                models.Q(uploaded_at=uploaded_at, id__lt=document_id)
+            )
+
+        # 多取一条判断是否还有下一页；正文只取预览部分
+        page = list(
+            documents.select_related('uploader')
+            .defer('content')
+            .annotate(
+                chunk_count=models.Count('chunks'),
+                content_preview=Substr('content', 1, self.CONTENT_PREVIEW_LENGTH),
+            )
+            .order_by('-uploaded_at', '-id')[:page_size + 1]
+        )
+        has_more = len(page) > page_size
+        page = page[:page_size]
 
         # 序列化文档数据
         content_data = []
-        for doc in documents:
+        for doc in page:
             doc_data = {
                 'id': doc.id,
                 'title': doc.title,
                 'document_type': doc.document_type,
                 'status': doc.status,
-                'uploader_name': doc.uploader.username,
+                'uploader_name': doc.uploader.username if doc.uploader else None,
                 'uploaded_at': doc.uploaded_at,
-                'chunk_count': doc.chunks.count(),
-                'content_preview': doc.content[:500] if doc.content else None,  # 内容预览
+                'chunk_count': doc.chunk_count,
+                'content_preview': doc.content_preview or None,  # 内容预览
                 'file_size': doc.file_size,
                 'page_count': doc.page_count,
                 'word_count': doc.word_count,
@@ -217,9 +301,9 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
         # 返回分页数据
         return Response({
             'total_count': total_count,
-            'page': page,
             'page_size': page_size,
-            'total_pages': (total_count + page_size - 1) // page_size,
+            'has_more': has_more,
+            'next_cursor': encode_content_cursor(page[-1]) if has_more else None,
             'documents': content_data,
             'knowledge_base': {
                 'id': knowledge_base.id,
@@ -339,6 +423,16 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
             cache_count = len(VectorStoreManager._vector_store_cache)
             status_info['vector_stores']['cache_status'] = f'{cache_count} cached instances'
 
+            # 嵌入向量缓存、查询向量缓存命中统计，向量存储管理器构建统计，文档解析统计（当前进程）
+            status_info['embedding_cache'] = EmbeddingCache.stats()
+            status_info['query_embedding_cache'] = QueryEmbeddingCache.stats()
+            status_info['vector_store_managers'] = VectorStoreManager.metrics()
+            status_info['document_parse_pool'] = DocumentParsePool.stats()
+            status_info['parsed_content_cache'] = ParsedContentCache.stats()
+            status_info['query_result_cache'] = QueryResultCache.stats()
+            status_info['query_log_buffer'] = QueryLogBuffer.stats()
+            status_info['model_warmup'] = ModelWarmup.status()
+
             # 确定整体状态
             all_deps = all(status_info['dependencies'].values())
             model_working = status_info['embedding_model']['status'] == 'working'
@@ -397,28 +491,27 @@ class DocumentViewSet(BaseModelViewSet):
         ).distinct()
 
     def perform_create(self, serializer):
-        """创建文档时自动设置上传人"""
-        document = serializer.save(uploader=self.request.user)
+        """创建文档时自动设置上传人，并投递到入库队列"""
+        file = serializer.validated_data.get('file')
+        content = serializer.validated_data.get('content')
+        if file:
+            file_size = file.size
+        else:
+            file_size = len(content.encode()) if content else None
+        document = serializer.save(uploader=self.request.user, file_size=file_size)
 
-        # 启动后台任务处理文档（避免超时）
-        import threading
+        # 事务提交后再入队，避免 worker 读不到新文档
+        transaction.on_commit(lambda: self._enqueue_processing(document))
 
-        def process_document_async():
-            try:
-                service = KnowledgeBaseService(document.knowledge_base)
-                service.process_document(document)
-                logger.info(f"文档 {document.id} 处理完成")
-            except Exception as e:
-                logger.error(f"文档 {document.id} 处理失败: {e}")
-                # 更新文档状态为失败
-                document.status = 'failed'
-                document.error_message = str(e)
-                document.save()
-
-        # 在后台线程中处理文档
-        thread = threading.Thread(target=process_document_async)
-        thread.daemon = True
-        thread.start()
+    def _enqueue_processing(self, document, incremental=True):
+        """投递文档处理任务，投递失败时标记文档为失败"""
+        try:
+            enqueue_document_processing(document, incremental=incremental)
+        except Exception as e:
+            logger.error(f"文档 {document.id} 入队失败: {e}")
+            document.status = 'failed'
+            document.error_message = f"任务入队失败: {e}"
+            document.save(update_fields=['status', 'error_message'])
 
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
@@ -427,7 +520,9 @@ class DocumentViewSet(BaseModelViewSet):
         return Response({
             'id': document.id,
             'status': document.status,
-            'progress': getattr(document, 'progress', 0),
+            'progress': document.progress,
+            'total_chunks': document.total_chunks,
+            'processed_chunks': document.processed_chunks,
             'error_message': document.error_message,
             'chunk_count': document.chunks.count(),
             'processed_at': document.processed_at
@@ -435,31 +530,19 @@ class DocumentViewSet(BaseModelViewSet):
 
     @action(detail=True, methods=['post'])
     def reprocess(self, request, pk=None):
-        """重新处理文档"""
+        """
+        重新处理文档
+        mode=incremental（默认）只更新变化的分块，mode=full 删除后全量重建
+        """
         document = self.get_object()
+        incremental = request.data.get('mode', 'incremental') != 'full'
 
         # 重置状态
         document.status = 'pending'
         document.error_message = ''
         document.save()
 
-        # 启动后台处理
-        import threading
-
-        def reprocess_document_async():
-            try:
-                service = KnowledgeBaseService(document.knowledge_base)
-                service.process_document(document)
-                logger.info(f"文档 {document.id} 重新处理完成")
-            except Exception as e:
-                logger.error(f"文档 {document.id} 重新处理失败: {e}")
-                document.status = 'failed'
-                document.error_message = str(e)
-                document.save()
-
-        thread = threading.Thread(target=reprocess_document_async)
-        thread.daemon = True
-        thread.start()
+        transaction.on_commit(lambda: self._enqueue_processing(document, incremental=incremental))
 
         return Response({'message': '文档重新处理已启动，请稍后查看状态'})
 
@@ -491,7 +574,7 @@ class DocumentViewSet(BaseModelViewSet):
                             with open(file_path, 'r', encoding='gbk') as f:
                                 return f.read()
                     else:
-                        # 对于其他文件类型，使用DocumentProcessor加载
+                        # 对于其他文件类型，使用DocumentProcessor加载（处理时已写入解析缓存，这里只读取缓存）
                         from .services import DocumentProcessor
                         processor = DocumentProcessor()
                         docs = processor.load_document(document)
@@ -676,6 +759,30 @@ def embedding_services(request):
     })
 
 
+def _test_local_embedding(model_name):
+    """在当前进程内加载本地 FastEmbed 模型并执行一次嵌入"""
+    from django.conf import settings
+    from .services import FastEmbedEmbeddings
+
+    try:
+        start_time = time.time()
+        embeddings = FastEmbedEmbeddings(
+            model_name=model_name or None,
+            threads=getattr(settings, 'KNOWLEDGE_LOCAL_EMBEDDING_THREADS', None) or None
+        )
+        vector = embeddings.embed_query('This is a test embedding request.')
+        return Response({
+            'success': True,
+            'message': f'本地嵌入模型加载成功！维度: {len(vector)}，耗时: {time.time() - start_time:.2f}s'
+        })
+    except Exception as e:
+        logger.error(f"本地嵌入模型测试失败: {e}", exc_info=True)
+        return Response({
+            'success': False,
+            'message': f'本地嵌入模型加载失败: {str(e)}'
+        })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def test_embedding_connection(request):
@@ -694,6 +801,8 @@ def test_embedding_connection(request):
     
     if not embedding_service:
         return Response({'error': '请选择嵌入服务'}, status=status.HTTP_400_BAD_REQUEST)
+    if embedding_service == 'local':
+        return _test_local_embedding(model_name)
     if not api_base_url:
         return Response({'error': '请输入API基础URL'}, status=status.HTTP_400_BAD_REQUEST)
     if not model_name:
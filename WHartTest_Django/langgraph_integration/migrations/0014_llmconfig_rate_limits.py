@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('langgraph_integration', '0013_alter_llmconfig_provider'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='llmconfig',
+            name='requests_per_minute',
+            field=models.IntegerField(default=0, help_text='该配置每分钟最多发出的请求数，0 表示不限制', verbose_name='每分钟请求数'),
+        ),
+        migrations.AddField(
+            model_name='llmconfig',
+            name='tokens_per_minute',
+            field=models.IntegerField(default=0, help_text='该配置每分钟最多消耗的Token数（输入+输出），0 表示不限制', verbose_name='每分钟Token数'),
+        ),
+    ]
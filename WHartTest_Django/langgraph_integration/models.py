@@ -41,6 +41,12 @@ class LLMConfig(models.Model):
     context_limit = models.IntegerField(default=128000, verbose_name="上下文限制",
                                        help_text="模型最大上下文Token数（GPT-4o: 128000, Claude: 200000, Gemini: 1000000）")
     
+    # 限流配置（所有进程共享，0 表示不限制）
+    requests_per_minute = models.IntegerField(default=0, verbose_name="每分钟请求数",
+                                              help_text="该配置每分钟最多发出的请求数，0 表示不限制")
+    tokens_per_minute = models.IntegerField(default=0, verbose_name="每分钟Token数",
+                                            help_text="该配置每分钟最多消耗的Token数（输入+输出），0 表示不限制")
+    
     # 状态字段（保持不变）
     is_active = models.BooleanField(default=False, verbose_name="是否激活",
                                    help_text="是否为当前激活的LLM配置")
@@ -0,0 +1,551 @@
+"""
+LLM 全局限流调度
+评审任务、Agent 循环、测试用例执行和对话都调用同一个 LLM 服务，分布在多个 Celery worker 和 ASGI 进程中。
+这里按 LLMConfig 维护每分钟请求数（RPM）和每分钟 Token 数（TPM）两个令牌桶，所有进程共享：
+
+- 令牌桶和排队队列存放在 Redis 中（Lua 脚本保证原子性），未配置 Redis 或 Redis 不可用时退回进程内实现；
+  Lua 脚本统一使用 Redis 服务器的 TIME，各进程所在主机的时钟偏差不影响共享的令牌桶和排队顺序
+- 排队按 (到达时间 + 优先级延后秒数) 排序，队首拿到令牌后下一个才能获取：同一优先级先到先得，
+  交互式对话排在后台评审之前，但后台请求等待超过延后秒数后不会再被新的对话请求插队
+- 请求前按消息长度估算 Token 数扣减 TPM，完成后按实际用量修正；服务商返回 429 时暂停该配置的调度
+- 排队数、等待时间等统计通过 LLMRateLimiter.stats() 查看（LLM 配置的 rate_limit_status 接口）
+
+RateLimitedChatOpenAI 在 invoke / ainvoke / stream / astream 的实际请求前获取令牌，
+create_llm_instance 创建的模型都会经过限流；LLMConfig 的 RPM / TPM 为 0 时不限流
+"""
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+# 优先级：排队时相当于晚到的秒数
+PRIORITY_CLASSES = {
+    'interactive': 0,
+    'default': 10,
+    'background': 30,
+}
+
+# 排队者的心跳有效期（秒），进程异常退出后其排队位置在此时间后自动清除
+HEARTBEAT_TTL = 10
+# 非队首时的轮询间隔（秒）
+QUEUE_POLL_INTERVAL = 0.1
+# 令牌桶键的过期时间（秒），长时间无请求时桶会自动补满，无需保留
+BUCKET_TTL = 3600
+# Redis 出错后改用进程内限流的时长（秒）
+REDIS_RETRY_INTERVAL = 30
+
+
+class LLMRateLimitTimeout(Exception):
+    """排队等待超过 LLM_RATE_LIMIT_MAX_WAIT"""
+
+
+# Redis 服务器时间（秒，含微秒）
+_REDIS_NOW = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+"""
+
+# KEYS: 令牌桶, 排队队列, 心跳
+# ARGV: 排队编号, 优先级延后秒数, RPM, TPM, 预估Token数, 心跳有效期, 桶过期时间
+# 返回: {是否获取, 建议等待秒数, 排队数}
+_ACQUIRE_SCRIPT = _REDIS_NOW + """
+local ticket = ARGV[1]
+local rpm = tonumber(ARGV[3])
+local tpm = tonumber(ARGV[4])
+local cost = tonumber(ARGV[5])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+for _, expired in ipairs(stale) do
+    redis.call('ZREM', KEYS[2], expired)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+-- 排队顺序 = 首次到达时间 + 优先级延后秒数，之后轮询不再改变
+redis.call('ZADD', KEYS[2], 'NX', now + tonumber(ARGV[2]), ticket)
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[6]), ticket)
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+redis.call('EXPIRE', KEYS[3], ARGV[7])
+local depth = redis.call('ZCARD', KEYS[2])
+if redis.call('ZRANGE', KEYS[2], 0, 0)[1] ~= ticket then
+    return {0, '-1', depth}
+end
+
+local bucket = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated_at', 'blocked_until')
+local elapsed = math.max(0, now - (tonumber(bucket[3]) or now))
+local requests = math.min(rpm, (tonumber(bucket[1]) or rpm) + elapsed * rpm / 60)
+local tokens = math.min(tpm, (tonumber(bucket[2]) or tpm) + elapsed * tpm / 60)
+local wait = math.max(0, (tonumber(bucket[4]) or 0) - now)
+if rpm > 0 and requests < 1 then
+    wait = math.max(wait, (1 - requests) * 60 / rpm)
+end
+if tpm > 0 and tokens < math.min(cost, tpm) then
+    wait = math.max(wait, (math.min(cost, tpm) - tokens) * 60 / tpm)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+    redis.call('ZREM', KEYS[2], ticket)
+    redis.call('ZREM', KEYS[3], ticket)
+    depth = depth - 1
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+if wait == 0 then
+    return {1, '0', depth}
+end
+return {0, tostring(wait), depth}
+"""
+
+# 按实际用量修正 TPM（桶已过期时无需修正）
+_SETTLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], 'tokens', ARGV[1])
+end
+return 1
+"""
+
+# 服务商限流时暂停调度 ARGV[1] 秒
+_PAUSE_SCRIPT = _REDIS_NOW + """
+local until_time = now + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+if until_time > current then
+    redis.call('HSET', KEYS[1], 'blocked_until', until_time)
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# 心跳未过期的排队数
+_DEPTH_SCRIPT = _REDIS_NOW + """
+return redis.call('ZCOUNT', KEYS[1], now, '+inf')
+"""
+
+
+class _LocalBackend:
+    """进程内令牌桶和排队队列，与 Redis 脚本的逻辑一致（now 为空时取当前时间）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._queues: Dict[str, Dict[str, Tuple[float, float]]] = {}
+
+    def try_acquire(self, key, ticket, delay, rpm, tpm, cost, now=None) -> Tuple[bool, float, int]:
+        now = time.time() if now is None else now
+        with self._lock:
+            queue = self._queues.setdefault(key, {})
+            for expired in [t for t, (_, expire_at) in queue.items() if expire_at <= now]:
+                del queue[expired]
+            queue[ticket] = (queue[ticket][0] if ticket in queue else now + delay, now + HEARTBEAT_TTL)
+            depth = len(queue)
+            if min(queue, key=lambda t: (queue[t][0], t)) != ticket:
+                return False, -1, depth
+
+            bucket = self._buckets.setdefault(
+                key, {'requests': rpm, 'tokens': tpm, 'updated_at': now, 'blocked_until': 0}
+            )
+            elapsed = max(0, now - bucket['updated_at'])
+            requests = min(rpm, bucket['requests'] + elapsed * rpm / 60)
+            tokens = min(tpm, bucket['tokens'] + elapsed * tpm / 60)
+            wait = max(0, bucket['blocked_until'] - now)
+            if rpm > 0 and requests < 1:
+                wait = max(wait, (1 - requests) * 60 / rpm)
+            if tpm > 0 and tokens < min(cost, tpm):
+                wait = max(wait, (min(cost, tpm) - tokens) * 60 / tpm)
+            if wait == 0:
+                requests -= 1
+                tokens -= cost
+                del queue[ticket]
+                depth -= 1
+            bucket.update(requests=requests, tokens=tokens, updated_at=now)
+            return wait == 0, wait, depth
+
+    def release(self, key, ticket):
+        with self._lock:
+            self._queues.get(key, {}).pop(ticket, None)
+
+    def settle(self, key, delta):
+        with self._lock:
+            if key in self._buckets:
+                self._buckets[key]['tokens'] += delta
+
+    def pause(self, key, seconds, now=None):
+        until = (time.time() if now is None else now) + seconds
+        with self._lock:
+            if key in self._buckets:
+                self._buckets[key]['blocked_until'] = max(self._buckets[key]['blocked_until'], until)
+
+    def depth(self, key, now=None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            return sum(1 for _, expire_at in self._queues.get(key, {}).values() if expire_at > now)
+
+
+class _RedisBackend:
+    """Redis 令牌桶和排队队列，所有进程共享"""
+
+    KEY_PREFIX = 'llm:rate_limit'
+
+    def __init__(self, redis_url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self._acquire = self.client.register_script(_ACQUIRE_SCRIPT)
+        self._settle = self.client.register_script(_SETTLE_SCRIPT)
+        self._pause = self.client.register_script(_PAUSE_SCRIPT)
+        self._depth = self.client.register_script(_DEPTH_SCRIPT)
+
+    def _keys(self, key):
+        return [f"{self.KEY_PREFIX}:{key}:{name}" for name in ('bucket', 'queue', 'heartbeat')]
+
+    def try_acquire(self, key, ticket, delay, rpm, tpm, cost) -> Tuple[bool, float, int]:
+        granted, wait, depth = self._acquire(
+            keys=self._keys(key), args=[ticket, delay, rpm, tpm, cost, HEARTBEAT_TTL, BUCKET_TTL]
+        )
+        return bool(granted), float(wait), int(depth)
+
+    def release(self, key, ticket):
+        _, queue_key, heartbeat_key = self._keys(key)
+        pipe = self.client.pipeline()
+        pipe.zrem(queue_key, ticket)
+        pipe.zrem(heartbeat_key, ticket)
+        pipe.execute()
+
+    def settle(self, key, delta):
+        self._settle(keys=self._keys(key)[:1], args=[delta])
+
+    def pause(self, key, seconds):
+        self._pause(keys=self._keys(key)[:1], args=[seconds, BUCKET_TTL])
+
+    def depth(self, key) -> int:
+        return int(self._depth(keys=self._keys(key)[2:]))
+
+
+class LLMRateLimiter:
+    """按 LLMConfig 的 RPM / TPM 调度 LLM 请求（带排队统计）"""
+
+    _default = None
+    _default_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _stats = {
+        'requests': 0,
+        'granted': 0,
+        'timeouts': 0,
+        'waiting': 0,
+        'provider_rate_limited': 0,
+        'backend_errors': 0,
+        'wait_seconds_total': 0.0,
+        'wait_seconds_max': 0.0,
+        'estimated_tokens': 0,
+        'actual_tokens': 0,
+    }
+    _priority_stats: Dict[str, Dict[str, float]] = {}
+
+    def __init__(self, redis_url: Optional[str] = None, max_wait: float = 120.0):
+        self.redis_url = redis_url
+        self.max_wait = max_wait
+        self.local = _LocalBackend()
+        self._redis = None
+        self._redis_retry_at = 0.0
+        self._sequence = itertools.count()
+
+    @classmethod
+    def get_default(cls) -> Optional['LLMRateLimiter']:
+        """按 settings 创建进程级调度器，禁用时返回 None"""
+        if not getattr(settings, 'LLM_RATE_LIMIT_ENABLED', True):
+            return None
+
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    redis_url = getattr(settings, 'LLM_RATE_LIMIT_REDIS_URL', '') or None
+                    max_wait = getattr(settings, 'LLM_RATE_LIMIT_MAX_WAIT', 120)
+                    cls._default = cls(redis_url=redis_url, max_wait=max_wait)
+                    logger.info(
+                        f"🚦 LLM 限流调度已启用: 最长排队 {max_wait}s, "
+                        f"Redis={'启用' if redis_url else '未启用'}"
+                    )
+        return cls._default
+
+    @classmethod
+    def _record(cls, priority: Optional[str] = None, wait_seconds: Optional[float] = None, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+            if wait_seconds is not None:
+                cls._stats['wait_seconds_total'] += wait_seconds
+                cls._stats['wait_seconds_max'] = max(cls._stats['wait_seconds_max'], wait_seconds)
+                priority_stats = cls._priority_stats.setdefault(
+                    priority, {'granted': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+                )
+                priority_stats['granted'] += 1
+                priority_stats['wait_seconds_total'] += wait_seconds
+                priority_stats['wait_seconds_max'] = max(priority_stats['wait_seconds_max'], wait_seconds)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """获取当前进程的调度统计"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+            by_priority = {name: dict(values) for name, values in cls._priority_stats.items()}
+        stats['wait_seconds_avg'] = round(stats['wait_seconds_total'] / stats['granted'], 4) if stats['granted'] else 0.0
+        for values in by_priority.values():
+            values['wait_seconds_avg'] = round(values['wait_seconds_total'] / values['granted'], 4)
+        stats['by_priority'] = by_priority
+        return stats
+
+    @property
+    def redis(self) -> Optional[_RedisBackend]:
+        """延迟创建 Redis 后端"""
+        if self._redis is None and self.redis_url:
+            self._redis = _RedisBackend(self.redis_url)
+        return self._redis
+
+    def _call(self, method: str, *args):
+        """优先使用 Redis，失败后 REDIS_RETRY_INTERVAL 秒内退回进程内实现"""
+        if self.redis is not None and time.time() >= self._redis_retry_at:
+            try:
+                return getattr(self.redis, method)(*args)
+            except Exception as e:
+                self._redis_retry_at = time.time() + REDIS_RETRY_INTERVAL
+                self._record(backend_errors=1)
+                logger.warning(f"⚠️ LLM 限流 Redis 不可用，{REDIS_RETRY_INTERVAL}s 内使用进程内限流: {e}")
+        return getattr(self.local, method)(*args)
+
+    def _new_ticket(self, priority: str) -> Tuple[str, float]:
+        """生成排队编号，返回 (编号, 优先级延后秒数)；排队顺序由后端按首次到达时间计算"""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级: {priority}")
+        ticket = f"{os.getpid()}:{next(self._sequence)}:{uuid.uuid4().hex[:8]}"
+        return ticket, PRIORITY_CLASSES[priority]
+
+    def _poll(self, key, ticket, delay, rpm, tpm, cost, started) -> Optional[float]:
+        """尝试获取一次令牌，获取成功返回 None，否则返回需要等待的秒数"""
+        granted, wait, _ = self._call('try_acquire', key, ticket, delay, rpm, tpm, cost)
+        if granted:
+            return None
+        if time.time() - started >= self.max_wait:
+            self._call('release', key, ticket)
+            self._record(timeouts=1)
+            raise LLMRateLimitTimeout(f"LLM 请求排队超过 {self.max_wait} 秒（{key}）")
+        return QUEUE_POLL_INTERVAL if wait < 0 else min(wait, 1.0)
+
+    async def _run_async(self, func, *args):
+        """使用 Redis 时在线程池中执行（同步的网络请求），进程内实现直接执行"""
+        if self.redis_url:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        return func(*args)
+
+    def acquire(self, key: str, rpm: int, tpm: int, tokens: int, priority: str = 'default') -> float:
+        """阻塞直到获取令牌，返回排队秒数；超过最长排队时间时抛出 LLMRateLimitTimeout"""
+        ticket, priority_delay = self._new_ticket(priority)
+        started = time.time()
+        self._record(requests=1, estimated_tokens=tokens, waiting=1)
+        try:
+            while True:
+                delay = self._poll(key, ticket, priority_delay, rpm, tpm, tokens, started)
+                if delay is None:
+                    break
+                time.sleep(delay)
+        finally:
+            self._record(waiting=-1)
+        waited = time.time() - started
+        self._record(priority=priority, wait_seconds=waited, granted=1)
+        return waited
+
+    async def aacquire(self, key: str, rpm: int, tpm: int, tokens: int, priority: str = 'default') -> float:
+        """
+        acquire 的异步版本，排队时不阻塞事件循环
+        使用 Redis 时每次轮询（同步的网络请求）在线程池中执行，asettle/apause 同理
+        """
+        ticket, priority_delay = self._new_ticket(priority)
+        started = time.time()
+        self._record(requests=1, estimated_tokens=tokens, waiting=1)
+        try:
+            while True:
+                delay = await self._run_async(self._poll, key, ticket, priority_delay, rpm, tpm, tokens, started)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            await self._run_async(self._call, 'release', key, ticket)
+            raise
+        finally:
+            self._record(waiting=-1)
+        waited = time.time() - started
+        self._record(priority=priority, wait_seconds=waited, granted=1)
+        return waited
+
+    def settle(self, key: str, estimated_tokens: int, actual_tokens: Optional[int]):
+        """按实际 Token 用量修正 TPM 令牌桶"""
+        if not actual_tokens:
+            return
+        self._record(actual_tokens=actual_tokens)
+        if actual_tokens != estimated_tokens:
+            self._call('settle', key, estimated_tokens - actual_tokens)
+
+    def pause(self, key: str, seconds: float):
+        """服务商返回限流错误时，暂停该配置的调度"""
+        self._record(provider_rate_limited=1)
+        self._call('pause', key, seconds)
+        logger.warning(f"🚦 LLM 服务商限流，{key} 暂停调度 {seconds}s")
+
+    async def asettle(self, key: str, estimated_tokens: int, actual_tokens: Optional[int]):
+        """settle 的异步版本"""
+        await self._run_async(self.settle, key, estimated_tokens, actual_tokens)
+
+    async def apause(self, key: str, seconds: float):
+        """pause 的异步版本"""
+        await self._run_async(self.pause, key, seconds)
+
+    def queue_depth(self, key: str) -> int:
+        """当前排队的请求数（使用 Redis 时为所有进程合计）"""
+        return self._call('depth', key)
+
+
+def config_key(config) -> str:
+    """限流键：同一个 LLMConfig 的所有调用共享令牌桶"""
+    return f"config:{config.pk}"
+
+
+def estimate_tokens(messages, max_output_tokens: Optional[int] = None) -> int:
+    """粗略估算请求 Token 数：中文约1.5字符/token，英文约4字符/token，取2.5字符/token，加上预期输出"""
+    chars = 0
+    for message in messages:
+        content = getattr(message, 'content', message)
+        if isinstance(content, list):
+            content = ' '.join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+        chars += len(str(content))
+    output_tokens = max_output_tokens or getattr(settings, 'LLM_RATE_LIMIT_OUTPUT_TOKENS', 1024)
+    return int(chars / 2.5) + output_tokens
+
+
+def _usage_tokens(message) -> Optional[int]:
+    usage = getattr(message, 'usage_metadata', None)
+    return usage.get('total_tokens') if usage else None
+
+
+def _is_provider_rate_limit(error: Exception) -> bool:
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError'
+
+
+def _retry_after(error: Exception) -> float:
+    """读取 429 响应的 Retry-After 头，没有时使用 LLM_RATE_LIMIT_PAUSE_SECONDS"""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return getattr(settings, 'LLM_RATE_LIMIT_PAUSE_SECONDS', 10)
+
+
+class RateLimitedChatOpenAI(ChatOpenAI):
+    """在实际请求前向 LLMRateLimiter 获取令牌的 ChatOpenAI"""
+
+    rate_limit_key: Optional[str] = None
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    rate_limit_priority: str = 'default'
+
+    def _limiter(self) -> Optional[LLMRateLimiter]:
+        if not self.rate_limit_key or (self.requests_per_minute <= 0 and self.tokens_per_minute <= 0):
+            return None
+        return LLMRateLimiter.get_default()
+
+    def _estimate(self, messages) -> int:
+        return estimate_tokens(messages, self.max_tokens)
+
+    def _acquire(self, messages) -> Tuple[Optional[LLMRateLimiter], int]:
+        limiter = self._limiter()
+        tokens = self._estimate(messages) if limiter else 0
+        if limiter:
+            limiter.acquire(
+                self.rate_limit_key, self.requests_per_minute, self.tokens_per_minute, tokens, self.rate_limit_priority
+            )
+        return limiter, tokens
+
+    async def _aacquire(self, messages) -> Tuple[Optional[LLMRateLimiter], int]:
+        limiter = self._limiter()
+        tokens = self._estimate(messages) if limiter else 0
+        if limiter:
+            await limiter.aacquire(
+                self.rate_limit_key, self.requests_per_minute, self.tokens_per_minute, tokens, self.rate_limit_priority
+            )
+        return limiter, tokens
+
+    def _on_error(self, limiter: Optional[LLMRateLimiter], error: Exception):
+        if limiter and _is_provider_rate_limit(error):
+            limiter.pause(self.rate_limit_key, _retry_after(error))
+
+    async def _aon_error(self, limiter: Optional[LLMRateLimiter], error: Exception):
+        if limiter and _is_provider_rate_limit(error):
+            await limiter.apause(self.rate_limit_key, _retry_after(error))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            # 流式模式下由 _stream 获取令牌
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        limiter, tokens = self._acquire(messages)
+        try:
+            result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception as e:
+            self._on_error(limiter, e)
+            raise
+        if limiter:
+            limiter.settle(self.rate_limit_key, tokens, _usage_tokens(result.generations[0].message))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        limiter, tokens = await self._aacquire(messages)
+        try:
+            result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception as e:
+            await self._aon_error(limiter, e)
+            raise
+        if limiter:
+            await limiter.asettle(self.rate_limit_key, tokens, _usage_tokens(result.generations[0].message))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter, tokens = self._acquire(messages)
+        actual_tokens = None
+        try:
+            for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                actual_tokens = _usage_tokens(chunk.message) or actual_tokens
+                yield chunk
+        except Exception as e:
+            self._on_error(limiter, e)
+            raise
+        if limiter:
+            limiter.settle(self.rate_limit_key, tokens, actual_tokens)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter, tokens = await self._aacquire(messages)
+        actual_tokens = None
+        try:
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                actual_tokens = _usage_tokens(chunk.message) or actual_tokens
+                yield chunk
+        except Exception as e:
+            await self._aon_error(limiter, e)
+            raise
+        if limiter:
+            await limiter.asettle(self.rate_limit_key, tokens, actual_tokens)
+
+
+def rate_limit_kwargs(config, priority: str) -> Dict[str, Any]:
+    """创建 RateLimitedChatOpenAI 时的限流参数"""
+    return {
+        'rate_limit_key': config_key(config) if config.pk else None,
+        'requests_per_minute': config.requests_per_minute or 0,
+        'tokens_per_minute': config.tokens_per_minute or 0,
+        'rate_limit_priority': priority,
+    }
@@ -12,11 +12,14 @@ class LLMConfigSerializer(serializers.ModelSerializer):
         model = LLMConfig
         fields = [
             'id', 'config_name', 'provider', 'name', 'api_url', 'api_key', 'system_prompt', 
-            'supports_vision', 'context_limit', 'is_active', 'created_at', 'updated_at'
+            'supports_vision', 'context_limit', 'requests_per_minute', 'tokens_per_minute',
+            'is_active', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
         extra_kwargs = {
-            'api_key': {'write_only': True}  # API密钥只允许写入，不允许读取
+            'api_key': {'write_only': True},  # API密钥只允许写入，不允许读取
+            'requests_per_minute': {'min_value': 0},
+            'tokens_per_minute': {'min_value': 0},
         }
 
     def to_representation(self, instance):
@@ -1,3 +1,121 @@
-from django.test import TestCase
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from langgraph_integration.rate_limiter import (
+    HEARTBEAT_TTL, LLMRateLimiter, LLMRateLimitTimeout, RateLimitedChatOpenAI, _LocalBackend,
+)
+
+
+class LocalBackendTests(SimpleTestCase):
+    """测试进程内令牌桶和排队队列"""
+
+    def setUp(self):
+        self.backend = _LocalBackend()
+
+    def test_rpm_bucket_refills_over_time(self):
+        self.assertTrue(self.backend.try_acquire('k', 'a', 0, 2, 0, 0, now=0)[0])
+        self.assertTrue(self.backend.try_acquire('k', 'b', 0, 2, 0, 0, now=0)[0])
+
+        granted, wait, depth = self.backend.try_acquire('k', 'c', 0, 2, 0, 0, now=0)
+        self.assertFalse(granted)
+        self.assertEqual(wait, 30)
+        self.assertEqual(depth, 1)
+
+        self.assertTrue(self.backend.try_acquire('k', 'c', 0, 2, 0, 0, now=30)[0])
+
+    def test_tpm_bucket_refills_over_time(self):
+        self.assertTrue(self.backend.try_acquire('k', 'a', 0, 0, 600, 400, now=0)[0])
+
+        granted, wait, _ = self.backend.try_acquire('k', 'b', 0, 0, 600, 400, now=0)
+        self.assertFalse(granted)
+        self.assertEqual(wait, 20)
+
+        self.assertTrue(self.backend.try_acquire('k', 'b', 0, 0, 600, 400, now=20)[0])
+
+    def test_higher_priority_is_served_first(self):
+        self.backend.try_acquire('k', 'first', 0, 12, 0, 0, now=0)
+        self.backend.pause('k', 3, now=0)
+        self.backend.try_acquire('k', 'background', 30, 12, 0, 0, now=1)
+        self.backend.try_acquire('k', 'interactive', 0, 12, 0, 0, now=2)
+
+        self.assertEqual(self.backend.try_acquire('k', 'background', 30, 12, 0, 0, now=5)[:2], (False, -1))
+        self.assertTrue(self.backend.try_acquire('k', 'interactive', 0, 12, 0, 0, now=5)[0])
+
+    def test_same_priority_is_first_in_first_out(self):
+        self.backend.try_acquire('k', 'first', 0, 12, 0, 0, now=0)
+        self.backend.pause('k', 3, now=0)
+        self.backend.try_acquire('k', 'z-early', 10, 12, 0, 0, now=1)
+        self.backend.try_acquire('k', 'a-late', 10, 12, 0, 0, now=2)
+
+        self.assertEqual(self.backend.try_acquire('k', 'a-late', 10, 12, 0, 0, now=5)[:2], (False, -1))
+        self.assertTrue(self.backend.try_acquire('k', 'z-early', 10, 12, 0, 0, now=5)[0])
+
+    def test_expired_heartbeat_leaves_queue(self):
+        self.backend.try_acquire('k', 'first', 0, 1, 0, 0, now=0)
+        self.backend.try_acquire('k', 'abandoned', 0, 1, 0, 0, now=1)
+        self.assertEqual(self.backend.try_acquire('k', 'waiting', 0, 1, 0, 0, now=2)[:2], (False, -1))
+
+        granted, wait, depth = self.backend.try_acquire('k', 'waiting', 0, 1, 0, 0, now=1 + HEARTBEAT_TTL)
+        self.assertFalse(granted)
+        self.assertGreater(wait, 0)
+        self.assertEqual(depth, 1)
+
+    def test_pause_blocks_until_elapsed(self):
+        self.backend.try_acquire('k', 'a', 0, 60, 0, 0, now=0)
+        self.backend.pause('k', 7, now=0)
+
+        self.assertEqual(self.backend.try_acquire('k', 'b', 0, 60, 0, 0, now=1)[:2], (False, 6))
+        self.assertTrue(self.backend.try_acquire('k', 'b', 0, 60, 0, 0, now=7)[0])
+
+
+class LLMRateLimiterTests(SimpleTestCase):
+    """测试限流调度器的排队超时、用量修正和服务商限流"""
+
+    def setUp(self):
+        self.limiter = LLMRateLimiter(max_wait=0)
+
+    def test_timeout_releases_queue_position(self):
+        self.limiter.acquire('k', 1, 0, 0)
+
+        with self.assertRaises(LLMRateLimitTimeout):
+            self.limiter.acquire('k', 1, 0, 0)
+
+        self.assertEqual(self.limiter.queue_depth('k'), 0)
+
+    def test_settle_returns_unused_tokens(self):
+        self.limiter.acquire('k', 0, 1000, 1000)
+
+        self.limiter.settle('k', 1000, 400)
+
+        self.assertAlmostEqual(self.limiter.local._buckets['k']['tokens'], 600, delta=1)
+
+    def test_provider_429_pauses_scheduling(self):
+        self.limiter.acquire('k', 60, 0, 0)
+        llm = RateLimitedChatOpenAI(
+            model='gpt-4o', api_key='test', rate_limit_key='k', requests_per_minute=60
+        )
+        error = Exception('rate limited')
+        error.status_code = 429
+        error.response = SimpleNamespace(headers={'retry-after': '5'})
+
+        llm._on_error(self.limiter, error)
+
+        granted, wait, _ = self.limiter.local.try_acquire('k', 'next', 0, 60, 0, 0)
+        self.assertFalse(granted)
+        self.assertGreater(wait, 4)
+
+    def test_async_acquire_polls_redis_off_the_event_loop(self):
+        poll_threads = []
+        backend = mock.Mock()
+        backend.try_acquire.side_effect = lambda *args: poll_threads.append(threading.get_ident()) or (True, 0, 0)
+        limiter = LLMRateLimiter(redis_url='redis://redis.invalid:6379/0')
+
+        with mock.patch.object(LLMRateLimiter, 'redis', new_callable=mock.PropertyMock, return_value=backend):
+            asyncio.run(limiter.aacquire('k', 60, 0, 0))
+
+        self.assertEqual(len(poll_threads), 1)
+        self.assertNotEqual(poll_threads[0], threading.get_ident())
@@ -29,7 +29,7 @@ from orchestrator_integration.context_compression import ConversationCompressor,
 # --- New Imports ---
 from typing import TypedDict, Annotated, List
 from langchain_core.messages import AnyMessage, HumanMessage, AIMessage, ToolMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from .rate_limiter import LLMRateLimiter, RateLimitedChatOpenAI, config_key, rate_limit_kwargs
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages # Correct import for add_messages
 from langgraph.prebuilt import create_react_agent # For agent with tools
@@ -58,10 +58,11 @@ from mcp_tools.persistent_client import mcp_session_manager # 持久化MCP会话
 logger = logging.getLogger(__name__) # Initialize logger
 
 # --- Helper Functions ---
-def create_llm_instance(active_config, temperature=0.7):
+def create_llm_instance(active_config, temperature=0.7, priority='interactive'):
     """
     根据配置创建LLM实例
     统一使用OpenAI兼容格式，支持所有兼容的服务商
+    请求经过 LLMRateLimiter 按配置的 RPM / TPM 排队，priority 见 rate_limiter.PRIORITY_CLASSES
     """
     model_identifier = active_config.name or "gpt-3.5-turbo"
     
@@ -69,9 +70,10 @@ def create_llm_instance(active_config, temperature=0.7):
         "model": model_identifier,
         "temperature": temperature,
         "api_key": active_config.api_key,
-        "base_url": active_config.api_url
+        "base_url": active_config.api_url,
+        **rate_limit_kwargs(active_config, priority),
     }
-    llm = ChatOpenAI(**llm_kwargs)
+    llm = RateLimitedChatOpenAI(**llm_kwargs)
     logger.info(f"Initialized OpenAI-compatible LLM with model: {model_identifier}, base_url: {active_config.api_url}")
     
     return llm
@@ -114,6 +116,27 @@ class LLMConfigViewSet(BaseModelViewSet):
             LLMConfig.objects.filter(is_active=True).exclude(pk=serializer.instance.pk).update(is_active=False)
         serializer.save()
 
+    @action(detail=False, methods=['get'])
+    def rate_limit_status(self, request):
+        """LLM 限流调度状态：各配置的限额和排队数，以及当前进程的等待时间统计"""
+        limiter = LLMRateLimiter.get_default()
+        configs = [
+            {
+                'id': config.id,
+                'config_name': config.config_name,
+                'requests_per_minute': config.requests_per_minute,
+                'tokens_per_minute': config.tokens_per_minute,
+                'queue_depth': limiter.queue_depth(config_key(config)) if limiter else 0,
+            }
+            for config in self.get_queryset()
+        ]
+        return Response({
+            'enabled': limiter is not None,
+            'backend': 'redis' if limiter and limiter.redis_url else 'local',
+            'configs': configs,
+            'stats': LLMRateLimiter.stats(),
+        })
+
 
 def get_effective_system_prompt(user, prompt_id=None):
     """
@@ -12,7 +12,6 @@ from langchain.tools import Tool
 
 from .prompts import get_agent_prompt
 from .context_compression import CompressionSettings, CompressionResult, ConversationCompressor
-from knowledge.models import KnowledgeBase
 
 logger = logging.getLogger(__name__)
 
@@ -38,82 +37,70 @@ class OrchestratorState(TypedDict):
 
 def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
     """
-    创建知识库搜索工具，自动重试最多3次
-    
+    创建知识库搜索工具，检索出错时自动重试最多3次
+
     Args:
         project_id: 项目ID
-        max_retries: 最大重试次数
-    
+        max_retries: 检索出错时的最大重试次数（结果为空不重试）
+
     Returns:
         LangChain Tool对象
     """
     def search_knowledge_base(query: str) -> str:
         """
-        在项目的所有知识库中搜索相关文档，自动重试最多3次
-        
+        在项目的所有知识库中并发搜索相关文档
+
         Args:
             query: 搜索查询字符串
-        
+
         Returns:
             搜索结果摘要，如果没找到返回失败信息
         """
+        from knowledge.services import ProjectKnowledgeSearch
+
         logger.info(f"🔍 知识库工具被调用: query='{query}', max_retries={max_retries}")
-        
+        searcher = ProjectKnowledgeSearch(project_id)
+
         for attempt in range(max_retries):
             try:
-                # 获取项目下所有激活的知识库
-                project_kbs = KnowledgeBase.objects.filter(
-                    project_id=project_id,
-                    is_active=True
-                )
-                
-                if not project_kbs.exists():
-                    msg = f"项目 {project_id} 下没有可用的知识库"
-                    logger.warning(msg)
-                    return msg
-                
-                logger.info(f"  📚 第{attempt+1}次尝试: 在 {project_kbs.count()} 个知识库中搜索...")
-                
-                all_docs = []
-                for kb in project_kbs:
-                    try:
-                        # 使用VectorStoreManager进行搜索
-                        from knowledge.services import KnowledgeBaseService
-                        kb_service = KnowledgeBaseService(kb)
-                        results = kb_service.vector_manager.similarity_search(query, k=3, score_threshold=0.1)
-                        if results:
-                            all_docs.extend(results)
-                            logger.info(f"    └─ {kb.name}: 找到 {len(results)} 个文档")
-                    except Exception as e:
-                        logger.error(f"    └─ {kb.name}: 搜索失败 {e}")
-                
-                if all_docs:
-                    # 找到文档，返回摘要
-                    docs_summary = "\n\n".join([
-                        f"【文档{i+1}】来源: {doc.get('metadata', {}).get('source', '未知')}\n内容: {doc.get('content', '')[:300]}..."
-                        for i, doc in enumerate(all_docs[:5])
-                    ])
-                    logger.info(f"  ✅ 第{attempt+1}次尝试成功: 找到 {len(all_docs)} 个文档")
-                    return f"找到 {len(all_docs)} 个相关文档:\n\n{docs_summary}"
-                else:
-                    logger.info(f"  ⚠️ 第{attempt+1}次尝试: 未找到文档")
-                    if attempt < max_retries - 1:
-                        continue  # 继续重试
-                    else:
-                        return f"在 {project_kbs.count()} 个知识库中搜索了 {max_retries} 次，未找到与'{query}'相关的文档"
-            
+                report = searcher.search(query, k=5, score_threshold=0.1, per_kb_k=3)
             except Exception as e:
                 logger.error(f"  ❌ 第{attempt+1}次尝试失败: {e}", exc_info=True)
                 if attempt < max_retries - 1:
                     continue
-                else:
-                    return f"知识库搜索失败（重试{max_retries}次）: {str(e)}"
-        
+                return f"知识库搜索失败（重试{max_retries}次）: {str(e)}"
+
+            all_docs = report['results']
+            searched_total = report['searched'] + len(report['failed']) + len(report['timed_out'])
+            if searched_total == 0:
+                msg = f"项目 {project_id} 下没有可用的知识库"
+                logger.warning(msg)
+                return msg
+
+            if report['failed'] and not report['searched']:
+                # 所有知识库都检索失败时才重试，结果为空不重试
+                logger.warning(f"  ❌ 第{attempt+1}次尝试: 所有知识库检索失败")
+                if attempt < max_retries - 1:
+                    continue
+                return f"知识库搜索失败（重试{max_retries}次）: {', '.join(report['failed'])}"
+
+            if not all_docs:
+                logger.info(f"  ⚠️ 未找到文档")
+                return f"在 {searched_total} 个知识库中未找到与'{query}'相关的文档"
+
+            docs_summary = "\n\n".join([
+                f"【文档{i+1}】来源: {doc['knowledge_base']['name']} / {doc.get('metadata', {}).get('source', '未知')}"
+                f"\n内容: {doc.get('content', '')[:300]}..."
+                for i, doc in enumerate(all_docs)
+            ])
+            logger.info(f"  ✅ 找到 {len(all_docs)} 个文档, 耗时 {report['elapsed']:.3f}s")
+            return f"找到 {len(all_docs)} 个相关文档:\n\n{docs_summary}"
+
         return f"知识库搜索失败: 达到最大重试次数{max_retries}"
-    
+
     return Tool(
         name="search_knowledge_base",
-        description=f"在项目ID={project_id}的所有知识库中搜索相关文档。输入搜索查询，返回相关文档内容。自动重试最多{max_retries}次。适用于查找项目文档、需求、设计等信息。",
+        description=f"在项目ID={project_id}的所有知识库中搜索相关文档。输入搜索查询，返回相关文档内容。适用于查找项目文档、需求、设计等信息。",
         func=search_knowledge_base
     )
 
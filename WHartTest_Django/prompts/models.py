@@ -13,6 +13,9 @@ class PromptType(models.TextChoices):
     TESTABILITY_ANALYSIS = 'testability_analysis', _('可测性分析')
     FEASIBILITY_ANALYSIS = 'feasibility_analysis', _('可行性分析')
     CLARITY_ANALYSIS = 'clarity_analysis', _('清晰度分析')
+    # 已拆分模块的文档：先分析全局结构，再结合全局上下文逐个分析模块
+    GLOBAL_ANALYSIS = 'global_analysis', _('全局结构分析')
+    MODULE_ANALYSIS = 'module_analysis', _('模块分析')
     # 其他类型
     TEST_CASE_EXECUTION = 'test_case_execution', _('测试用例执行')
     BRAIN_ORCHESTRATOR = 'brain_orchestrator', _('智能规划')
@@ -30,6 +33,8 @@ class UserPrompt(models.Model):
         PromptType.TESTABILITY_ANALYSIS,
         PromptType.FEASIBILITY_ANALYSIS,
         PromptType.CLARITY_ANALYSIS,
+        PromptType.GLOBAL_ANALYSIS,
+        PromptType.MODULE_ANALYSIS,
         PromptType.TEST_CASE_EXECUTION,
         PromptType.DIAGRAM_GENERATION,
     ]
@@ -104,6 +109,8 @@ class UserPrompt(models.Model):
                     PromptType.TESTABILITY_ANALYSIS.value,
                     PromptType.FEASIBILITY_ANALYSIS.value,
                     PromptType.CLARITY_ANALYSIS.value,
+                    PromptType.GLOBAL_ANALYSIS.value,
+                    PromptType.MODULE_ANALYSIS.value,
                     PromptType.TEST_CASE_EXECUTION.value,
                 ]),
                 name='unique_user_program_prompt_type'
@@ -252,6 +252,91 @@ def get_default_prompts() -> List[Dict]:
             'prompt_type': PromptType.CLARITY_ANALYSIS,
             'is_default': False
         },
+        {
+            'name': '全局结构分析',
+            'content': '''你是一位资深的需求分析师。请分析需求文档的全局结构，提取后续逐模块评审所需的全局上下文。
+
+【文档标题】
+{title}
+
+【文档描述】
+{description}
+
+【文档内容】
+{content}
+
+【分析要求】
+1. 🗺️ **业务流程**：识别文档中的核心业务流程
+2. 📦 **数据实体**：识别关键数据实体及其含义
+3. 📏 **全局规则**：提取跨模块生效的业务规则和约束
+4. ⚠️ **缺失与风险**：指出文档整体缺失的内容和风险点
+
+【输出JSON格式】
+{{
+  "structure_score": 80,
+  "completeness_score": 75,
+  "consistency_score": 80,
+  "clarity_score": 78,
+  "overall_score": 78,
+  "business_flows": ["用户注册流程", "下单支付流程"],
+  "data_entities": ["用户", "订单"],
+  "global_rules": ["所有金额保留两位小数"],
+  "missing_aspects": ["缺少异常流程说明"],
+  "risk_points": ["支付回调超时处理不明确"],
+  "strengths": ["模块划分清晰"],
+  "weaknesses": ["非功能需求描述不足"]
+}}''',
+            'description': '分析已拆分模块文档的全局结构，为模块分析提供业务流程、数据实体和全局规则',
+            'prompt_type': PromptType.GLOBAL_ANALYSIS,
+            'is_default': False
+        },
+        {
+            'name': '模块分析',
+            'content': '''你是一位资深的需求分析师。请结合文档的全局上下文评审下面的需求模块。
+
+【模块】
+ID: {module_id}
+标题: {module_title}
+
+【全局上下文】
+- 业务流程: {business_flows}
+- 数据实体: {data_entities}
+- 全局规则: {global_rules}
+
+【模块内容】
+{module_content}
+
+【分析要求】
+从规范性、清晰度、完整性、与全局上下文的一致性、可行性五个维度评审该模块，列出发现的问题。
+
+【输出JSON格式】
+{{
+  "module_id": "{module_id}",
+  "module_name": "{module_title}",
+  "specification_score": 80,
+  "clarity_score": 75,
+  "completeness_score": 70,
+  "consistency_score": 85,
+  "feasibility_score": 80,
+  "overall_score": 78,
+  "issues": [
+    {{
+      "priority": "high",
+      "type": "completeness",
+      "title": "缺少登录失败处理",
+      "description": "未说明密码连续错误后的处理方式",
+      "location": "登录流程第3步",
+      "suggestion": "补充连续失败5次后锁定账户30分钟的规则"
+    }}
+  ],
+  "strengths": ["主流程描述清晰"],
+  "weaknesses": ["异常场景不足"],
+  "recommendations": ["补充异常流程"]
+}}''',
+            'description': '结合全局上下文逐个评审需求模块，输出模块评分和问题',
+            'prompt_type': PromptType.MODULE_ANALYSIS,
+            'is_default': False
+        },
         {
             'name': '一致性分析',
             'content': '''你是一位资深的需求一致性分析专家。请深入分析完整的需求文档。
@@ -615,6 +700,8 @@ def initialize_user_prompts(user, force_update: bool = False) -> dict:
             PromptType.TESTABILITY_ANALYSIS,
             PromptType.FEASIBILITY_ANALYSIS,
             PromptType.CLARITY_ANALYSIS,
+            PromptType.GLOBAL_ANALYSIS,
+            PromptType.MODULE_ANALYSIS,
             PromptType.TEST_CASE_EXECUTION,
             PromptType.BRAIN_ORCHESTRATOR,
             PromptType.DIAGRAM_GENERATION,
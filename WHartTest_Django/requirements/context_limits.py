@@ -2,8 +2,10 @@
 模型上下文限制配置和检测
 """
 
+import math
 import tiktoken
 import logging
+from typing import List
 
 logger = logging.getLogger(__name__)
 
@@ -59,20 +61,35 @@ class ContextLimitChecker:
                     self.encoders[model_name] = tiktoken.get_encoding("cl100k_base")
             except Exception as e:
                 logger.warning(f"无法获取模型 {model_name} 的编码器，使用默认编码器: {e}")
-                self.encoders[model_name] = tiktoken.get_encoding("cl100k_base")
+                try:
+                    self.encoders[model_name] = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    # 离线环境下无法下载编码文件，记录失败避免每次计数都重新下载
+                    logger.warning(f"无法加载默认编码器，按字符数估算token数量: {e}")
+                    self.encoders[model_name] = None
         
         return self.encoders[model_name]
     
     def count_tokens(self, text: str, model_name: str = 'gpt-3.5-turbo') -> int:
-        """计算文本的token数量"""
+        """
+        计算文本的token数量
+        无法使用编码器时按字符数估算并向上取整：各片段的估算值之和不小于整段文本的估算值，
+        split_by_tokens 按片段累加切分窗口时不会超出预算
+        """
         try:
             encoder = self.get_encoder(model_name)
+            if encoder is None:
+                return self._estimate_tokens(text)
             return len(encoder.encode(text))
         except Exception as e:
             logger.error(f"计算token数量失败: {e}")
-            # 粗略估算：中文约1.5字符/token，英文约4字符/token
-            # 取平均值2.5字符/token
-            return len(text) // 2.5
+            return self._estimate_tokens(text)
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # 粗略估算：中文约1.5字符/token，英文约4字符/token
+        # 取平均值2.5字符/token
+        return math.ceil(len(text) / 2.5)
     
     def get_context_limit(self, model_name: str) -> int:
         """获取模型的上下文限制"""
@@ -149,6 +166,47 @@ class ContextLimitChecker:
             'message': f'建议拆分为{chunks_needed}个分块，每个分块约{optimal_chunk_tokens}tokens'
         }
 
+    def split_by_tokens(self, text: str, max_tokens: int, overlap_tokens: int = 0,
+                        model_name: str = 'gpt-3.5-turbo') -> List[str]:
+        """
+        按token预算把文本切分为窗口
+        优先在行边界切分，单行超过预算时按字符切分；相邻窗口重叠末尾若干行（不超过overlap_tokens），
+        避免跨窗口的需求描述被截断后无法识别
+        """
+        if not text or self.count_tokens(text, model_name) <= max_tokens:
+            return [text]
+
+        # 切分为不超过预算的片段
+        pieces = []
+        for line in text.splitlines(keepends=True):
+            tokens = self.count_tokens(line, model_name)
+            if tokens <= max_tokens:
+                pieces.append((line, tokens))
+                continue
+            step = max(1, int(len(line) * max_tokens / tokens * 0.9))
+            for start in range(0, len(line), step):
+                part = line[start:start + step]
+                pieces.append((part, self.count_tokens(part, model_name)))
+
+        windows = []
+        current, current_tokens = [], 0
+        for piece, tokens in pieces:
+            if current and current_tokens + tokens > max_tokens:
+                windows.append(''.join(part for part, _ in current))
+                # 上一窗口末尾的行作为下一窗口的开头
+                overlap_budget = min(overlap_tokens, max_tokens - tokens)
+                overlap, overlap_count = [], 0
+                for part, part_tokens in reversed(current):
+                    if overlap_count + part_tokens > overlap_budget:
+                        break
+                    overlap.insert(0, (part, part_tokens))
+                    overlap_count += part_tokens
+                current, current_tokens = overlap, overlap_count
+            current.append((piece, tokens))
+            current_tokens += tokens
+        windows.append(''.join(part for part, _ in current))
+        return windows
+
 # 全局实例
 context_checker = ContextLimitChecker()
 
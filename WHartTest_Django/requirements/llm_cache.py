@@ -0,0 +1,187 @@
+"""
+需求评审 LLM 响应缓存
+完整性、一致性、可测性、可行性、清晰度等专项分析在低温度下运行，文档内容不变时（重新评审、
+只修改了无关模块后再次评审）相同的请求会得到基本相同的结果。启用后按 (模型参数, 完整消息) 的哈希
+缓存响应，命中时不再调用 LLM：
+
+- 作为 LangChain 的 BaseCache 挂在 create_llm_instance 创建的模型上，缓存键包含模型名称、温度等全部调用参数
+- 存储在数据库中（LLMResponseCacheEntry），超过 TTL 的条目失效，超过容量时淘汰最久未使用的条目；
+  淘汰在写入时进行，每个进程每 REQUIREMENT_LLM_CACHE_EVICT_INTERVAL 秒最多一次
+- 空响应不缓存；safe_llm_invoke(use_cache=False) 或评审选项 use_llm_cache=False 时跳过查找但写入新结果
+- 每次评审的命中数记录在评审报告中（llm_cache_hits / llm_cache_misses）
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import warnings
+from datetime import timedelta
+from typing import Any, Dict, Optional, Sequence
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+logger = logging.getLogger(__name__)
+
+
+def _loads(raw: str) -> Any:
+    """反序列化缓存的响应（langchain_core.load.loads 每次调用都会发出 beta 警告，只在这里忽略）"""
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='The function `loads` is in beta')
+        return loads(raw)
+
+
+class LLMResponseCache(BaseCache):
+    """LLM 响应缓存（带命中统计）"""
+
+    _stats_lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+    # 上次淘汰的时间（进程内）
+    _last_evicted_at = 0.0
+
+    def __init__(self, model_name: str = '', ttl: int = 7 * 24 * 3600, max_entries: int = 2000,
+                 read: bool = True, counters: Optional[Dict[str, int]] = None):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.read = read
+        # 单次评审的命中计数，跳过查找的副本与原缓存共享
+        self.counters = counters if counters is not None else {'hits': 0, 'misses': 0, 'bypassed': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_model(cls, model_name: str, temperature: float) -> Optional['LLMResponseCache']:
+        """按 settings 创建缓存，未启用或温度高于 REQUIREMENT_LLM_CACHE_MAX_TEMPERATURE 时返回 None"""
+        if not getattr(settings, 'REQUIREMENT_LLM_CACHE_ENABLED', False):
+            return None
+        if temperature > getattr(settings, 'REQUIREMENT_LLM_CACHE_MAX_TEMPERATURE', 0.3):
+            return None
+        return cls(
+            model_name=model_name,
+            ttl=getattr(settings, 'REQUIREMENT_LLM_CACHE_TTL', 7 * 24 * 3600),
+            max_entries=getattr(settings, 'REQUIREMENT_LLM_CACHE_MAX_ENTRIES', 2000),
+        )
+
+    @classmethod
+    def _record(cls, **counts):
+        with cls._stats_lock:
+            for key, value in counts.items():
+                cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """获取当前进程的命中统计"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+        return stats
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+        self._record(**{name: 1})
+
+    def without_lookup(self) -> 'LLMResponseCache':
+        """跳过查找、只写入新结果的副本（计数共享）"""
+        return type(self)(self.model_name, self.ttl, self.max_entries, read=False, counters=self.counters)
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        """缓存键：模型调用参数（模型名称、温度等）和完整消息的哈希"""
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        from .models import LLMResponseCacheEntry
+
+        if not self.read:
+            self._count('bypassed')
+            return None
+
+        key = self.make_key(prompt, llm_string)
+        try:
+            entries = LLMResponseCacheEntry.objects.filter(
+                cache_key=key, created_at__gte=timezone.now() - timedelta(seconds=self.ttl)
+            )
+            entry = entries.first()
+            if entry is None:
+                self._count('misses')
+                return None
+            entries.update(last_accessed_at=timezone.now(), hit_count=F('hit_count') + 1)
+            generations = [_loads(raw) for raw in json.loads(entry.response)]
+        except Exception as e:
+            self._record(errors=1)
+            logger.warning(f"⚠️ 读取LLM响应缓存失败: {e}")
+            self._count('misses')
+            return None
+
+        for generation in generations:
+            message = getattr(generation, 'message', None)
+            if message is not None:
+                message.response_metadata['cache_hit'] = True
+        self._count('hits')
+        logger.info(f"LLM响应缓存命中: {key[:12]}")
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        from .models import LLMResponseCacheEntry
+
+        # 空响应由 safe_llm_invoke 重试，不能缓存
+        if not return_val or not all(generation.text for generation in return_val):
+            return
+
+        key = self.make_key(prompt, llm_string)
+        try:
+            LLMResponseCacheEntry.objects.update_or_create(
+                cache_key=key,
+                defaults={
+                    'model_name': self.model_name[:255],
+                    'response': json.dumps([dumps(generation) for generation in return_val]),
+                    'created_at': timezone.now(),
+                    'last_accessed_at': timezone.now(),
+                    'hit_count': 0,
+                },
+            )
+            self._record(writes=1)
+            if self._evict_due():
+                self._evict()
+        except Exception as e:
+            self._record(errors=1)
+            logger.warning(f"⚠️ 写入LLM响应缓存失败: {e}")
+
+    @classmethod
+    def _evict_due(cls) -> bool:
+        """距上次淘汰超过 REQUIREMENT_LLM_CACHE_EVICT_INTERVAL 秒时返回 True 并记录本次时间"""
+        interval = getattr(settings, 'REQUIREMENT_LLM_CACHE_EVICT_INTERVAL', 300)
+        now = time.monotonic()
+        with cls._stats_lock:
+            if cls._last_evicted_at and now - cls._last_evicted_at < interval:
+                return False
+            cls._last_evicted_at = now
+            return True
+
+    def _evict(self):
+        """删除过期条目，超过容量时淘汰最久未使用的条目"""
+        from .models import LLMResponseCacheEntry
+
+        expired, _ = LLMResponseCacheEntry.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=self.ttl)
+        ).delete()
+        overflow = list(
+            LLMResponseCacheEntry.objects.order_by('-last_accessed_at')
+            .values_list('id', flat=True)[self.max_entries:]
+        )
+        if overflow:
+            LLMResponseCacheEntry.objects.filter(id__in=overflow).delete()
+        if expired or overflow:
+            self._record(evictions=expired + len(overflow))
+
+    def clear(self, **kwargs: Any) -> None:
+        from .models import LLMResponseCacheEntry
+
+        LLMResponseCacheEntry.objects.all().delete()
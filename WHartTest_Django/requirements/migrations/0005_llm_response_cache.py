@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-17 06:58
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requirements', '0004_reviewreport_feasibility_testability_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMResponseCacheEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('cache_key', models.CharField(help_text='模型调用参数和完整消息的SHA-256', max_length=64, unique=True, verbose_name='缓存键')),
+                ('model_name', models.CharField(blank=True, max_length=255, verbose_name='模型名称')),
+                ('response', models.TextField(help_text='序列化的LangChain生成结果', verbose_name='响应内容')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='命中次数')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('last_accessed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='最近访问时间')),
+            ],
+            options={
+                'verbose_name': 'LLM响应缓存',
+                'verbose_name_plural': 'LLM响应缓存',
+                'ordering': ['-last_accessed_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='reviewreport',
+            name='llm_cache_hits',
+            field=models.IntegerField(default=0, verbose_name='LLM缓存命中数'),
+        ),
+        migrations.AddField(
+            model_name='reviewreport',
+            name='llm_cache_misses',
+            field=models.IntegerField(default=0, verbose_name='LLM缓存未命中数'),
+        ),
+    ]
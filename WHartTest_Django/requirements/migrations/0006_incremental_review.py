@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 07:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requirements', '0005_llm_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewissue',
+            name='analysis_source',
+            field=models.CharField(blank=True, help_text='产生该问题的专项分析：completeness / consistency / testability / feasibility / clarity', max_length=20, verbose_name='来源分析'),
+        ),
+        migrations.AddField(
+            model_name='reviewreport',
+            name='base_report',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incremental_reports', to='requirements.reviewreport', verbose_name='增量评审基准报告'),
+        ),
+        migrations.AddField(
+            model_name='reviewreport',
+            name='review_fingerprints',
+            field=models.JSONField(blank=True, default=dict, help_text='{"global": 全局上下文指纹, "modules": {模块ID: 模块内容指纹}}，用于判断下次评审哪些模块需要重新分析', verbose_name='评审内容指纹'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from projects.models import Project
 import uuid
@@ -247,6 +248,26 @@ class ReviewReport(models.Model):
         help_text='存储完整性、一致性、可测性、可行性、清晰度5个专项分析的详细结果'
     )
 
+    # LLM 响应缓存命中情况（未启用缓存时均为0）
+    llm_cache_hits = models.IntegerField(_('LLM缓存命中数'), default=0)
+    llm_cache_misses = models.IntegerField(_('LLM缓存未命中数'), default=0)
+
+    # 增量评审：复用上一次评审中未变更模块的结果
+    base_report = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='incremental_reports',
+        verbose_name=_('增量评审基准报告')
+    )
+    review_fingerprints = models.JSONField(
+        _('评审内容指纹'),
+        default=dict,
+        blank=True,
+        help_text='{"global": 全局上下文指纹, "modules": {模块ID: 模块内容指纹}}，用于判断下次评审哪些模块需要重新分析'
+    )
+
     # 元数据
     created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
     updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
@@ -313,6 +334,10 @@ class ReviewIssue(models.Model):
     location = models.CharField(_('问题位置'), max_length=200, blank=True)
     page_number = models.IntegerField(_('页码'), null=True, blank=True)
     section = models.CharField(_('章节'), max_length=100, blank=True)
+    analysis_source = models.CharField(
+        _('来源分析'), max_length=20, blank=True,
+        help_text='产生该问题的专项分析：completeness / consistency / testability / feasibility / clarity'
+    )
 
     # 状态管理
     is_resolved = models.BooleanField(_('已解决'), default=False)
@@ -382,3 +407,26 @@ class ModuleReviewResult(models.Model):
 
     def __str__(self):
         return f"{self.module.title} - {self.module_rating or '未评级'}"
+
+
+class LLMResponseCacheEntry(models.Model):
+    """
+    LLM响应缓存条目（见 requirements.llm_cache）
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    cache_key = models.CharField(_('缓存键'), max_length=64, unique=True, help_text='模型调用参数和完整消息的SHA-256')
+    model_name = models.CharField(_('模型名称'), max_length=255, blank=True)
+    response = models.TextField(_('响应内容'), help_text='序列化的LangChain生成结果')
+    hit_count = models.IntegerField(_('命中次数'), default=0)
+
+    # 元数据
+    created_at = models.DateTimeField(_('创建时间'), default=timezone.now)
+    last_accessed_at = models.DateTimeField(_('最近访问时间'), default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = _('LLM响应缓存')
+        verbose_name_plural = _('LLM响应缓存')
+        ordering = ['-last_accessed_at']
+
+    def __str__(self):
+        return f"{self.model_name} - {self.cache_key[:12]}"
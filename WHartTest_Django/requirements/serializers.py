@@ -76,10 +76,10 @@ class ReviewIssueSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'issue_type', 'issue_type_display', 'priority', 'priority_display',
             'title', 'description', 'suggestion', 'location', 'page_number', 'section',
-            'module', 'module_name', 'is_resolved', 'resolution_note',
+            'module', 'module_name', 'is_resolved', 'resolution_note', 'analysis_source',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'analysis_source', 'created_at', 'updated_at']
 
 
 class ModuleReviewResultSerializer(serializers.ModelSerializer):
@@ -119,9 +119,10 @@ class ReviewReportSerializer(serializers.ModelSerializer):
             'medium_priority_issues', 'low_priority_issues',
             'summary', 'recommendations', 'issues', 'module_results',
             'specialized_analyses', 'scores',  # 新增字段
+            'llm_cache_hits', 'llm_cache_misses', 'base_report',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'review_date', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'review_date', 'base_report', 'created_at', 'updated_at']
     
     def get_scores(self, obj):
         """获取5个专项分数"""
@@ -343,6 +344,21 @@ class ReviewAnalysisRequestSerializer(serializers.Serializer):
         required=False,
         help_text="并发执行的最大worker数量，默认3。数值越大速度越快但可能触发API限流"
     )
+    module_analysis = serializers.BooleanField(
+        default=True,
+        required=False,
+        help_text="是否逐模块分析（需配置模块分析提示词），模块分析与专项分析共用并发数"
+    )
+    use_llm_cache = serializers.BooleanField(
+        default=True,
+        required=False,
+        help_text="是否读取LLM响应缓存（需启用 REQUIREMENT_LLM_CACHE_ENABLED），为 False 时重新调用LLM"
+    )
+    incremental = serializers.BooleanField(
+        default=False,
+        required=False,
+        help_text="是否增量评审：只重新分析上次全面评审后内容变更的模块，全局上下文变化时自动改为完整评审"
+    )
 
 
 class ReviewProgressSerializer(serializers.Serializer):
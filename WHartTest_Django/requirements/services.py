@@ -1,25 +1,34 @@
+import hashlib
 import logging
 import json
 import re
+import threading
+from difflib import SequenceMatcher
 from string import Template
 from typing import List, Dict, Any, Optional
 from django.conf import settings
-from langchain_openai import ChatOpenAI
+from django.db import connection
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langgraph_integration.models import LLMConfig
+from langgraph_integration.rate_limiter import LLMRateLimitTimeout, RateLimitedChatOpenAI, rate_limit_kwargs
+from .context_limits import RESERVED_TOKENS, context_checker
+from .llm_cache import LLMResponseCache
 from .models import RequirementDocument, RequirementModule
 from prompts.models import UserPrompt
 
 logger = logging.getLogger(__name__)
 
 
-def create_llm_instance(active_config, temperature=0.1):
+def create_llm_instance(active_config, temperature=0.1, priority='background', use_cache=True):
     """
     根据配置创建LLM实例
     统一使用OpenAI兼容格式，支持所有兼容的服务商
+    评审属于后台任务，默认以 background 优先级排队，交互式对话优先；
+    启用 REQUIREMENT_LLM_CACHE_ENABLED 且温度足够低时挂载 LLMResponseCache
     """
     model_identifier = active_config.name or "gpt-3.5-turbo"
+    response_cache = LLMResponseCache.for_model(model_identifier, temperature) if use_cache else None
     
     llm_kwargs = {
         "model": model_identifier,
@@ -28,8 +37,10 @@ def create_llm_instance(active_config, temperature=0.1):
         "base_url": active_config.api_url,
         "max_retries": 3,
         "timeout": 120,
+        "cache": response_cache or False,
+        **rate_limit_kwargs(active_config, priority),
     }
-    llm = ChatOpenAI(**llm_kwargs)
+    llm = RateLimitedChatOpenAI(**llm_kwargs)
     logger.info(f"Initialized OpenAI-compatible LLM with model: {model_identifier}, base_url: {active_config.api_url}")
     
     return llm
@@ -37,18 +48,20 @@ def create_llm_instance(active_config, temperature=0.1):
     return llm
 
 
-def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
+def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2, use_cache=True):
     """
     安全地调用 LLM，处理空响应和临时性错误。
     
     某些 API（如非官方 OpenAI 兼容服务）可能返回 HTTP 200 但 choices 为空，
     这个函数会检测并重试这种情况。
+    限流排队超时（LLMRateLimitTimeout）不重试，避免再次排队。
     
     Args:
         llm: LangChain LLM 实例
         messages: 消息列表
         max_retries: 最大重试次数
         retry_delay: 重试间隔（秒）
+        use_cache: 为 False 时不读取 LLM 响应缓存（仍写入新结果）
     
     Returns:
         LLM 响应对象
@@ -58,6 +71,9 @@ def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
     """
     import time
     
+    if not use_cache:
+        llm = without_cache_lookup(llm)
+    
     last_error = None
     for attempt in range(max_retries):
         try:
@@ -82,6 +98,8 @@ def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
                     time.sleep(retry_delay * (attempt + 1))
                 continue
             raise
+        except LLMRateLimitTimeout:
+            raise
         except Exception as e:
             last_error = e
             logger.warning(f"LLM 调用失败: {e}，尝试重试 ({attempt + 1}/{max_retries})")
@@ -93,6 +111,13 @@ def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
     raise last_error or Exception("LLM 调用失败，所有重试都未成功")
 
 
+def without_cache_lookup(llm):
+    """返回跳过响应缓存查找的 LLM 副本，未挂载缓存时原样返回"""
+    if isinstance(getattr(llm, 'cache', None), LLMResponseCache):
+        return llm.model_copy(update={'cache': llm.cache.without_lookup()})
+    return llm
+
+
 def extract_json_from_response(content: str) -> Optional[dict]:
     """
     从 LLM 响应中提取 JSON 对象，支持多种格式。
@@ -211,15 +236,37 @@ class DocumentProcessor:
                 return document.content
             
             if document.file:
-                # TODO: 根据文件类型提取内容
-                # 这里先返回模拟内容
-                return self._extract_from_file(document.file)
+                return self._extract_from_file_cached(document.file)
             
             return ""
         except Exception as e:
             logger.error(f"提取文档内容失败: {e}")
             return ""
     
+    def _extract_from_file_cached(self, file) -> str:
+        """从文件提取内容，相同文件（按 SHA-256）直接复用已缓存的提取结果"""
+        from knowledge.parsed_content_cache import ParsedContentCache, file_digest
+
+        cache = ParsedContentCache.get_default()
+        if cache is None:
+            return self._extract_from_file(file)
+
+        try:
+            digest = file_digest(file)
+        except Exception as e:
+            logger.warning(f"计算文件摘要失败，跳过解析缓存: {e}")
+            return self._extract_from_file(file)
+
+        file_extension = file.name.lower().split('.')[-1] if '.' in file.name else ''
+        parser_key = ParsedContentCache.parser_key('requirements', file_extension)
+
+        def extract():
+            content = self._extract_from_file(file)
+            return [(content, {})] if content else []
+
+        pages = cache.get_or_parse(parser_key, digest, extract)
+        return pages[0][0] if pages else ""
+
     def _extract_from_file(self, file) -> str:
         """从文件提取内容"""
         try:
@@ -1667,16 +1714,49 @@ class ModuleOperationService:
 class RequirementReviewEngine:
     """需求评审AI分析引擎 - 专业的需求文档评审分析"""
 
+    # 单个分析窗口至少容纳的文档token数
+    MIN_WINDOW_TOKENS = 1000
+    # 标题相似度不低于该值的问题视为同一问题（窗口重叠部分会被重复分析）
+    ISSUE_SIMILARITY_THRESHOLD = 0.9
+    PRIORITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+    # 一致性分析拆分窗口时，要求各窗口额外返回关键陈述，用于跨窗口检查
+    CONSISTENCY_STATEMENTS_INSTRUCTION = (
+        "\n\n另外，请在返回的JSON中增加 key_statements 字段：列出本部分中的关键定义、业务规则、约束条件和数值"
+        "（每条一句话，不超过30条），用于与文档其他部分做一致性比对。"
+    )
+    CONSISTENCY_DIGEST_HEADER = "以下是同一需求文档各部分的关键陈述摘要，请重点检查不同部分之间相互矛盾或不一致的地方：\n\n"
+
     def __init__(self, user=None):
         self.user = user
+        self.llm_config = None
+        # 同时进行的LLM调用数，评审时使用评审选项中的并发数
+        self.max_workers = 3
         self.llm = self._get_llm_instance()
 
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @max_workers.setter
+    def max_workers(self, value: int):
+        self._max_workers = max(1, value)
+        self._llm_slots = threading.BoundedSemaphore(self._max_workers)
+
+    def _invoke_llm(self, messages):
+        """
+        调用LLM，同时进行的调用数不超过 max_workers
+        专项分析、模块分析和它们拆分出的窗口分析分布在多层线程池中，共用这一个限制
+        """
+        with self._llm_slots:
+            return safe_llm_invoke(self.llm, messages)
+
     def _get_llm_instance(self):
         """获取LLM实例"""
         try:
             active_config = LLMConfig.objects.filter(is_active=True).first()
             if not active_config:
                 raise Exception("没有可用的LLM配置")
+            self.llm_config = active_config
 
             # 使用新的LLM工厂函数，支持多供应商
             return create_llm_instance(active_config, temperature=0.1)
@@ -1694,22 +1774,161 @@ class RequirementReviewEngine:
         # 没有找到用户提示词，返回None
         return None
 
+    def _apply_cache_option(self, analysis_options: dict):
+        """评审选项 use_llm_cache=False 时本次评审不读取响应缓存"""
+        if not analysis_options.get('use_llm_cache', True):
+            self.llm = without_cache_lookup(self.llm)
 
+    def llm_cache_counters(self) -> dict:
+        """本次评审的 LLM 响应缓存命中计数"""
+        cache = getattr(self.llm, 'cache', None)
+        if isinstance(cache, LLMResponseCache):
+            return dict(cache.counters)
+        return {'hits': 0, 'misses': 0, 'bypassed': 0}
 
-    def analyze_document_directly(self, content: str, analysis_options: dict = None) -> dict:
-        """直接分析整个文档（不拆分模块）"""
+    def _run_in_worker(self, func, *args):
+        """线程池任务：结束后关闭工作线程的数据库连接（提示词、响应缓存的查询）"""
         try:
-            direct_prompt = self._get_user_prompt('direct_analysis')
+            return func(*args)
+        finally:
+            connection.close()
+
+    def _get_model_name(self) -> str:
+        return getattr(self.llm_config, 'name', None) or 'gpt-4o'
+
+    def _get_window_budget(self, prompt: str) -> int:
+        """
+        单个分析窗口可容纳的文档token数：模型上下文限制减去预留、输出和提示词本身占用的token
+        """
+        model_name = self._get_model_name()
+        context_limit = getattr(self.llm_config, 'context_limit', None) or context_checker.get_context_limit(model_name)
+        budget = (
+            context_limit - RESERVED_TOKENS
+            - getattr(settings, 'REQUIREMENT_REVIEW_OUTPUT_TOKENS', 4096)
+            - context_checker.count_tokens(prompt, model_name)
+        )
+        return max(int(budget), self.MIN_WINDOW_TOKENS)
+
+    def _split_content(self, prompt_template: str, content: str, content_key: str = 'document', **kwargs) -> List[str]:
+        """按提示词模板填入其他变量后剩余的token预算，把内容拆分为相互重叠的分析窗口"""
+        prompt = format_prompt_template(prompt_template, **{content_key: ''}, **kwargs)
+        return context_checker.split_by_tokens(
+            content or '',
+            self._get_window_budget(prompt),
+            getattr(settings, 'REQUIREMENT_REVIEW_WINDOW_OVERLAP_TOKENS', 400),
+            self._get_model_name()
+        )
+
+    def _map_windows(self, display_name: str, windows: List[str], analyze_window) -> List[dict]:
+        """并发分析各窗口，LLM调用数与外层分析共用 max_workers 的限制（见 _invoke_llm）"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        logger.info(f"{display_name}内容超出单次分析窗口，拆分为 {len(windows)} 个窗口并发分析")
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(windows)))) as executor:
+            return list(executor.map(lambda window: self._run_in_worker(analyze_window, window), windows))
+
+    def _map_reduce(self, display_name: str, windows: List[str], analyze_window) -> dict:
+        """并发分析各窗口，合并为一个分析结果"""
+        merged = self._reduce_window_results(windows, self._map_windows(display_name, windows, analyze_window))
+        logger.info(
+            f"{display_name}窗口结果合并完成，问题数: {merged['map_reduce']['issues_before_dedup']} -> "
+            f"{len(merged.get('issues', []))}"
+        )
+        return merged
+
+    def _reduce_window_results(self, windows: List[str], results: List[dict]) -> dict:
+        """
+        合并各窗口的分析结果：数值字段（评分）按窗口长度加权平均，问题列表去重（保留优先级最高的一条），
+        其他列表字段去重合并，其余字段取第一个窗口的结果
+        """
+        numeric, lists, merged = {}, {}, {}
+        for window, result in zip(windows, results):
+            if not isinstance(result, dict):
+                continue
+            for key, value in result.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    numeric.setdefault(key, []).append((value, len(window)))
+                elif isinstance(value, list):
+                    lists.setdefault(key, []).extend(value)
+                else:
+                    merged.setdefault(key, value)
+
+        for key, values in numeric.items():
+            total_weight = sum(weight for _, weight in values) or 1
+            average = sum(value * weight for value, weight in values) / total_weight
+            merged[key] = int(round(average)) if all(isinstance(value, int) for value, _ in values) else round(average, 2)
+        for key, values in lists.items():
+            merged[key] = self._dedupe_issues(values) if key == 'issues' else self._dedupe_list(values)
+
+        merged['map_reduce'] = {
+            'windows': len(windows),
+            'window_lengths': [len(window) for window in windows],
+            'issues_before_dedup': len(lists.get('issues', [])),
+        }
+        return merged
+
+    def _dedupe_issues(self, issues: list) -> list:
+        """
+        同一模块下标题相同或高度相似的问题只保留一条（优先级最高的）
+        标题中的编号（需求编号、章节号等）不同的问题不视为重复
+        """
+        kept, keys = [], []
+        for issue in issues:
+            if not isinstance(issue, dict):
+                continue
+            raw_title = str(issue.get('title') or issue.get('description') or '')
+            title = re.sub(r'[\W_]+', '', raw_title).lower()
+            key = (issue.get('module_name') or '', tuple(re.findall(r'\d+', raw_title)), title)
+            for index, (module_name, numbers, kept_title) in enumerate(keys):
+                if title and (module_name, numbers) == key[:2] and (
+                    title == kept_title
+                    or SequenceMatcher(None, title, kept_title).ratio() >= self.ISSUE_SIMILARITY_THRESHOLD
+                ):
+                    if self._issue_rank(issue) < self._issue_rank(kept[index]):
+                        kept[index] = issue
+                    break
+            else:
+                kept.append(issue)
+                keys.append(key)
+        return kept
+
+    def _issue_rank(self, issue: dict) -> int:
+        return self.PRIORITY_RANK.get(issue.get('priority') or issue.get('severity'), len(self.PRIORITY_RANK))
+
+    @staticmethod
+    def _dedupe_list(values: list) -> list:
+        """去重并保持顺序"""
+        seen, deduped = set(), []
+        for value in values:
+            key = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+            if key not in seen:
+                seen.add(key)
+                deduped.append(value)
+        return deduped
+
+    def analyze_document_directly(self, content: str, analysis_options: dict = None, prompt: str = None) -> dict:
+        """直接分析整个文档（不拆分模块），超出单次分析窗口的文档拆分为多个窗口分析后合并"""
+        if analysis_options is not None:
+            self.max_workers = self._get_max_workers(analysis_options)
+        self._apply_cache_option(analysis_options or {})
+        try:
+            direct_prompt = prompt or self._get_user_prompt('direct_analysis')
             if not direct_prompt:
                 raise ValueError("用户未配置直接分析提示词，请先在提示词管理中配置")
 
-            formatted_prompt = format_prompt_template(direct_prompt, content=content[:8000])
+            windows = self._split_content(direct_prompt, content, 'content')
+            if len(windows) > 1:
+                return self._map_reduce(
+                    '直接分析', windows, lambda window: self.analyze_document_directly(window, prompt=direct_prompt)
+                )
+
+            formatted_prompt = format_prompt_template(direct_prompt, content=content)
             messages = [
                 SystemMessage(content="你是一位专业的需求分析师，擅长需求文档评审。"),
                 HumanMessage(content=formatted_prompt)
             ]
 
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
 
             analysis_result = extract_json_from_response(response.content)
             if analysis_result:
@@ -1756,14 +1975,18 @@ class RequirementReviewEngine:
             ]
         }
 
-    def analyze_completeness(self, content: str) -> dict:
+    def analyze_completeness(self, content: str, prompt: str = None) -> dict:
         """完整性专项分析 - 分析完整文档的完整性"""
         logger.info("开始执行完整性分析...")
-        completeness_prompt = self._get_user_prompt('completeness_analysis')
+        completeness_prompt = prompt or self._get_user_prompt('completeness_analysis')
         if not completeness_prompt:
             logger.warning("用户未配置完整性分析提示词，返回默认结果")
             return self._get_default_analysis_result('completeness_analysis')
         
+        windows = self._split_content(completeness_prompt, content)
+        if len(windows) > 1:
+            return self._map_reduce('完整性', windows, lambda window: self.analyze_completeness(window, completeness_prompt))
+        
         try:
             formatted_prompt = format_prompt_template(completeness_prompt, document=content)
             logger.debug(f"完整性分析提示词已格式化，文档长度: {len(content)}")
@@ -1774,7 +1997,7 @@ class RequirementReviewEngine:
             ]
             
             logger.info("调用LLM进行完整性分析...")
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
             logger.info(f"LLM响应完成，内容长度: {len(response.content)}")
             
             result = extract_json_from_response(response.content)
@@ -1792,16 +2015,29 @@ class RequirementReviewEngine:
             logger.error(f"详细错误: {traceback.format_exc()}")
             return self._get_default_analysis_result('completeness_analysis')
     
-    def analyze_consistency(self, content: str) -> dict:
-        """一致性专项分析 - 分析完整文档的一致性"""
+    def analyze_consistency(self, content: str, prompt: str = None, collect_statements: bool = False) -> dict:
+        """
+        一致性专项分析 - 分析完整文档的一致性
+        超出单次分析窗口时各窗口额外提取关键陈述（collect_statements），合并后再做一次跨窗口检查
+        """
         logger.info("开始执行一致性分析...")
-        consistency_prompt = self._get_user_prompt('consistency_analysis')
+        consistency_prompt = prompt or self._get_user_prompt('consistency_analysis')
         if not consistency_prompt:
             logger.warning("用户未配置一致性分析提示词，返回默认结果")
             return self._get_default_analysis_result('consistency_analysis')
         
+        windows = self._split_content(consistency_prompt, content)
+        if len(windows) > 1:
+            results = self._map_windows(
+                '一致性', windows,
+                lambda window: self.analyze_consistency(window, consistency_prompt, collect_statements=True)
+            )
+            return self._reduce_consistency(consistency_prompt, windows, results)
+        
         try:
             formatted_prompt = format_prompt_template(consistency_prompt, document=content)
+            if collect_statements:
+                formatted_prompt += self.CONSISTENCY_STATEMENTS_INSTRUCTION
             logger.debug(f"一致性分析提示词已格式化，文档长度: {len(content)}")
             
             messages = [
@@ -1810,7 +2046,7 @@ class RequirementReviewEngine:
             ]
             
             logger.info("调用LLM进行一致性分析...")
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
             logger.info(f"LLM响应完成，内容长度: {len(response.content)}")
             
             result = extract_json_from_response(response.content)
@@ -1828,14 +2064,54 @@ class RequirementReviewEngine:
             logger.error(f"详细错误: {traceback.format_exc()}")
             return self._get_default_analysis_result('consistency_analysis')
     
-    def analyze_testability(self, content: str) -> dict:
+    def _reduce_consistency(self, prompt: str, windows: List[str], results: List[dict]) -> dict:
+        """
+        合并一致性分析的窗口结果：各窗口只能发现窗口内部的矛盾，把各窗口的关键陈述汇总后用同一提示词
+        再分析一次，找出不同窗口之间的矛盾；跨窗口检查发现问题时评分取两者中较低的
+        关键陈述超出单次分析窗口时拆分为多个摘要窗口（每个窗口都带摘要说明）分别检查，结果按窗口合并
+        """
+        merged = self._reduce_window_results(windows, results)
+        merged.pop('key_statements', None)
+        sections = []
+        for index, result in enumerate(results, 1):
+            statements = result.get('key_statements') if isinstance(result, dict) else None
+            if isinstance(statements, list) and statements:
+                sections.append(f"## 第{index}部分\n" + '\n'.join(f"- {statement}" for statement in statements))
+        if len(sections) < 2:
+            return merged
+
+        digest_windows = [
+            self.CONSISTENCY_DIGEST_HEADER + window
+            for window in self._split_content(prompt + self.CONSISTENCY_DIGEST_HEADER, '\n\n'.join(sections))
+        ]
+        if len(digest_windows) > 1:
+            cross_window = self._reduce_window_results(digest_windows, self._map_windows(
+                '一致性关键陈述', digest_windows, lambda window: self.analyze_consistency(window, prompt)
+            ))
+        else:
+            cross_window = self.analyze_consistency(digest_windows[0], prompt)
+        cross_issues = [issue for issue in cross_window.get('issues', []) if isinstance(issue, dict)]
+        if cross_issues:
+            merged['issues'] = self._dedupe_issues(merged.get('issues', []) + cross_issues)
+            if isinstance(cross_window.get('overall_score'), (int, float)):
+                merged['overall_score'] = min(merged.get('overall_score', 70), cross_window['overall_score'])
+        merged['map_reduce']['cross_window_issues'] = len(cross_issues)
+        merged['map_reduce']['digest_windows'] = len(digest_windows)
+        logger.info(f"一致性跨窗口检查完成，发现问题: {len(cross_issues)}")
+        return merged
+
+    def analyze_testability(self, content: str, prompt: str = None) -> dict:
         """可测性专项分析 - 分析完整文档的可测试性"""
         logger.info("开始执行可测性分析...")
-        testability_prompt = self._get_user_prompt('testability_analysis')
+        testability_prompt = prompt or self._get_user_prompt('testability_analysis')
         if not testability_prompt:
             logger.warning("用户未配置可测性分析提示词，返回默认结果")
             return self._get_default_analysis_result('testability_analysis')
         
+        windows = self._split_content(testability_prompt, content)
+        if len(windows) > 1:
+            return self._map_reduce('可测性', windows, lambda window: self.analyze_testability(window, testability_prompt))
+        
         try:
             formatted_prompt = format_prompt_template(testability_prompt, document=content)
             logger.debug(f"可测性分析提示词已格式化，文档长度: {len(content)}")
@@ -1844,7 +2120,7 @@ class RequirementReviewEngine:
                 HumanMessage(content=formatted_prompt)
             ]
             
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
             result = extract_json_from_response(response.content)
             if result:
                 logger.info(f"可测性分析完成，评分: {result.get('overall_score', 'N/A')}")
@@ -1859,14 +2135,18 @@ class RequirementReviewEngine:
             logger.error(f"详细错误: {traceback.format_exc()}")
             return self._get_default_analysis_result('testability_analysis')
     
-    def analyze_feasibility(self, content: str) -> dict:
+    def analyze_feasibility(self, content: str, prompt: str = None) -> dict:
         """可行性专项分析 - 分析完整文档的可行性"""
         logger.info("开始执行可行性分析...")
-        feasibility_prompt = self._get_user_prompt('feasibility_analysis')
+        feasibility_prompt = prompt or self._get_user_prompt('feasibility_analysis')
         if not feasibility_prompt:
             logger.warning("用户未配置可行性分析提示词，返回默认结果")
             return self._get_default_analysis_result('feasibility_analysis')
         
+        windows = self._split_content(feasibility_prompt, content)
+        if len(windows) > 1:
+            return self._map_reduce('可行性', windows, lambda window: self.analyze_feasibility(window, feasibility_prompt))
+        
         try:
             formatted_prompt = format_prompt_template(feasibility_prompt, document=content)
             messages = [
@@ -1874,7 +2154,7 @@ class RequirementReviewEngine:
                 HumanMessage(content=formatted_prompt)
             ]
             
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
             result = extract_json_from_response(response.content)
             if result:
                 logger.info(f"可行性分析完成，评分: {result.get('overall_score', 'N/A')}")
@@ -1889,14 +2169,18 @@ class RequirementReviewEngine:
             logger.error(f"详细错误: {traceback.format_exc()}")
             return self._get_default_analysis_result('feasibility_analysis')
     
-    def analyze_clarity(self, content: str) -> dict:
+    def analyze_clarity(self, content: str, prompt: str = None) -> dict:
         """清晰度专项分析 - 分析完整文档的清晰度"""
         logger.info("开始执行清晰度分析...")
-        clarity_prompt = self._get_user_prompt('clarity_analysis')
+        clarity_prompt = prompt or self._get_user_prompt('clarity_analysis')
         if not clarity_prompt:
             logger.warning("用户未配置清晰度分析提示词，返回默认结果")
             return self._get_default_analysis_result('clarity_analysis')
         
+        windows = self._split_content(clarity_prompt, content)
+        if len(windows) > 1:
+            return self._map_reduce('清晰度', windows, lambda window: self.analyze_clarity(window, clarity_prompt))
+        
         try:
             formatted_prompt = format_prompt_template(clarity_prompt, document=content)
             messages = [
@@ -1904,7 +2188,7 @@ class RequirementReviewEngine:
                 HumanMessage(content=formatted_prompt)
             ]
             
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
             result = extract_json_from_response(response.content)
             if result:
                 logger.info(f"清晰度分析完成，评分: {result.get('overall_score', 'N/A')}")
@@ -1928,55 +2212,49 @@ class RequirementReviewEngine:
             "issues": []
         }
 
-    def analyze_document_comprehensive(self, document: RequirementDocument, analysis_options: dict = None) -> dict:
+    # 参与评审、变化后需要重新全面评审的提示词
+    REVIEW_PROMPT_TYPES = [
+        'completeness_analysis', 'consistency_analysis', 'testability_analysis',
+        'feasibility_analysis', 'clarity_analysis', 'global_analysis', 'module_analysis',
+    ]
+
+    def analyze_document_comprehensive(self, document: RequirementDocument, analysis_options: dict = None,
+                                       on_module_complete=None) -> dict:
         """
         全面分析需求文档 - 新架构：并发执行5个专项分析
-        现在5个分析可以并发执行，提高效率
+        现在5个分析可以并发执行，提高效率；文档已拆分模块时，模块分析提交到同一个线程池，
+        与专项分析共享并发上限
         
         Args:
             document: 要分析的文档
-            analysis_options: 分析选项，可包含max_workers控制并发数
+            analysis_options: 分析选项，可包含max_workers控制并发数、
+                parallel_processing=False时串行执行、module_analysis=False时跳过模块分析、
+                priority_modules指定优先分析的模块ID
+            on_module_complete: 每个模块分析完成时的回调 (module, module_analysis)，在调用线程中执行
         """
         analysis_options = analysis_options or {}
-        max_workers = analysis_options.get('max_workers', 3)  # 从选项中获取，默认3
+        max_workers = self.max_workers = self._get_max_workers(analysis_options)
+        self._apply_cache_option(analysis_options)
         
         try:
             logger.info(f"开始全面分析文档: {document.title}, 内容长度: {len(document.content)}, 并发数: {max_workers}")
-            
-            # 使用线程池并发执行5个专项分析（每个都处理完整文档，充分利用200k上下文）
-            from concurrent.futures import ThreadPoolExecutor, as_completed
-            
             logger.info("开始并发执行5个专项分析...")
             
-            # 定义5个分析任务
+            # 定义5个分析任务（每个都处理完整文档，充分利用200k上下文）
             analysis_tasks = {
-                'completeness': ('完整性', self.analyze_completeness),
-                'consistency': ('一致性', self.analyze_consistency),
-                'testability': ('可测性', self.analyze_testability),
-                'feasibility': ('可行性', self.analyze_feasibility),
-                'clarity': ('清晰度', self.analyze_clarity),
+                'completeness': ('完整性', self.analyze_completeness, document.content),
+                'consistency': ('一致性', self.analyze_consistency, document.content),
+                'testability': ('可测性', self.analyze_testability, document.content),
+                'feasibility': ('可行性', self.analyze_feasibility, document.content),
+                'clarity': ('清晰度', self.analyze_clarity, document.content),
             }
             
-            # 并发执行所有分析
-            results = {}
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 提交所有任务
-                future_to_analysis = {
-                    executor.submit(task_func, document.content): (name, display_name)
-                    for name, (display_name, task_func) in analysis_tasks.items()
-                }
-                
-                # 收集结果
-                for future in as_completed(future_to_analysis):
-                    analysis_name, display_name = future_to_analysis[future]
-                    try:
-                        result = future.result()
-                        results[analysis_name] = result
-                        logger.info(f"{display_name}分析完成，评分: {result.get('overall_score', 0)}")
-                    except Exception as e:
-                        logger.error(f"{display_name}分析失败: {e}")
-                        # 使用默认结果
-                        results[analysis_name] = self._get_default_analysis_result(f'{analysis_name}_analysis')
+            # 需要分析的模块和提示词在提交前一次取出，工作线程中只调用LLM
+            modules, module_prompt, global_prompt = self._prepare_module_analysis(document, analysis_options)
+            
+            results, module_results = self._run_analyses(
+                document, analysis_tasks, modules, module_prompt, global_prompt, max_workers, on_module_complete
+            )
             
             logger.info("所有专项分析并发执行完成")
             
@@ -1990,6 +2268,9 @@ class RequirementReviewEngine:
                 'clarity': results.get('clarity', {}),
                 'document': document
             })
+            # 模块分析结果按模块顺序排列
+            comprehensive_report['module_analyses'] = self._order_module_analyses(modules, module_results)
+            comprehensive_report['llm_cache'] = self.llm_cache_counters()
             
             logger.info(f"文档分析完成，总体评分: {comprehensive_report.get('overall_score', 0)}")
             return comprehensive_report
@@ -1999,7 +2280,278 @@ class RequirementReviewEngine:
             import traceback
             logger.error(f"详细错误: {traceback.format_exc()}")
             raise
-    
+
+    def analyze_document_incremental(self, document: RequirementDocument, previous_analyses: dict,
+                                     changed_modules: List[RequirementModule],
+                                     analysis_options: dict = None, on_module_complete=None) -> dict:
+        """
+        增量分析需求文档：只重新分析变更的模块，其余结果沿用上一次评审
+        
+        - 完整性、可测性、可行性、清晰度只分析变更模块的内容，评分按变更内容占比与上次评分加权合并，
+          问题列表只保留上次评审中属于未变更模块的问题（不属于任何模块的问题由本次分析重新产生），再合并新问题
+        - 一致性是跨模块的检查，有模块变更时对全部模块内容重新分析，结果整体替换
+        - 有模块被删除时上次的评分和问题都包含已删除的内容，评审服务改为完整评审，不会进入这里
+        - 配置了模块分析提示词时，只对变更模块重新执行模块分析
+        
+        Args:
+            document: 要分析的文档
+            previous_analyses: 上一次评审的专项分析详情（ReviewReport.specialized_analyses）
+            changed_modules: 内容变更或新增的模块
+            analysis_options: 分析选项，同 analyze_document_comprehensive
+            on_module_complete: 每个模块分析完成时的回调 (module, module_analysis)
+        """
+        analysis_options = analysis_options or {}
+        max_workers = self.max_workers = self._get_max_workers(analysis_options)
+        self._apply_cache_option(analysis_options)
+        
+        try:
+            all_modules = list(document.modules.order_by('order'))
+            changed_modules = sorted(changed_modules, key=lambda m: m.order)
+            changed_ids = {module.id for module in changed_modules}
+            full_content = self._assemble_module_content(all_modules)
+            changed_content = self._assemble_module_content(changed_modules)
+            logger.info(
+                f"开始增量分析文档: {document.title}, 变更模块: {len(changed_modules)}/{len(all_modules)}, "
+                f"并发数: {max_workers}"
+            )
+            
+            analysis_tasks = {}
+            if changed_modules:
+                analysis_tasks.update({
+                    'completeness': ('完整性', self.analyze_completeness, changed_content),
+                    'testability': ('可测性', self.analyze_testability, changed_content),
+                    'feasibility': ('可行性', self.analyze_feasibility, changed_content),
+                    'clarity': ('清晰度', self.analyze_clarity, changed_content),
+                    'consistency': ('一致性', self.analyze_consistency, full_content),
+                })
+            
+            modules, module_prompt, global_prompt = self._prepare_module_analysis(document, analysis_options)
+            modules = [module for module in modules if module.id in changed_ids]
+            
+            results, module_results = self._run_analyses(
+                document, analysis_tasks, modules, module_prompt, global_prompt, max_workers, on_module_complete
+            )
+            
+            # 变更内容占全部模块内容的比例，作为新评分的权重
+            weight = len(changed_content) / len(full_content) if full_content else 1.0
+            merged = {}
+            for name in ['completeness', 'consistency', 'testability', 'feasibility', 'clarity']:
+                previous = dict(previous_analyses.get(f'{name}_analysis') or {})
+                if name not in results:
+                    merged[name] = previous
+                elif name == 'consistency':
+                    merged[name] = results[name]
+                else:
+                    merged[name] = self._merge_incremental_analysis(
+                        previous, results[name], all_modules, changed_ids, weight
+                    )
+            
+            comprehensive_report = self._generate_comprehensive_report_v2({**merged, 'document': document})
+            comprehensive_report['module_analyses'] = self._order_module_analyses(modules, module_results)
+            # 本次新产生的问题（沿用的问题由评审服务从上一次评审报告中复制）
+            comprehensive_report['new_issues'] = [
+                issue for name in results for issue in results[name].get('issues', [])
+            ]
+            comprehensive_report['incremental'] = {
+                'changed_modules': [str(module.id) for module in changed_modules],
+                'reused_modules': len(all_modules) - len(changed_modules),
+                'changed_ratio': round(weight, 4),
+                'reanalyzed': sorted(results),
+            }
+            comprehensive_report['llm_cache'] = self.llm_cache_counters()
+            
+            logger.info(f"增量分析完成，总体评分: {comprehensive_report.get('overall_score', 0)}")
+            return comprehensive_report
+
+        except Exception as e:
+            logger.error(f"需求文档增量分析失败: {e}")
+            import traceback
+            logger.error(f"详细错误: {traceback.format_exc()}")
+            raise
+
+    def _merge_incremental_analysis(self, previous: dict, current: dict, all_modules: List[RequirementModule],
+                                    changed_ids: set, weight: float) -> dict:
+        """
+        合并单个专项分析的上次结果和变更模块的新结果
+        上次的问题只保留属于未变更模块的，与评审服务复制问题记录的规则一致（_copy_base_results）
+        """
+        kept_issues = []
+        for issue in previous.get('issues', []):
+            module = self.find_issue_module(issue, all_modules)
+            if module is not None and module.id not in changed_ids:
+                kept_issues.append(issue)
+        previous_score = previous.get('overall_score', 70)
+        current_score = current.get('overall_score', 70)
+        return {
+            **previous,
+            **current,
+            'overall_score': int(round(previous_score * (1 - weight) + current_score * weight)),
+            'issues': kept_issues + list(current.get('issues', [])),
+            'incremental': {
+                'previous_score': previous_score,
+                'changed_score': current_score,
+                'changed_ratio': round(weight, 4),
+            },
+        }
+
+    @staticmethod
+    def find_issue_module(issue: dict, modules: List[RequirementModule]) -> Optional[RequirementModule]:
+        """问题所属模块：按模块顺序第一个标题包含问题 module_name 的模块（保存问题和增量合并共用）"""
+        module_name = (issue.get('module_name') or '').lower() if isinstance(issue, dict) else ''
+        if not module_name:
+            return None
+        return next((module for module in modules if module_name in module.title.lower()), None)
+
+    @staticmethod
+    def _assemble_module_content(modules: List[RequirementModule]) -> str:
+        """按模块拼接文档内容"""
+        return '\n\n'.join(f"## {module.title}\n{module.content}" for module in modules)
+
+    @staticmethod
+    def _fingerprint(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def compute_review_fingerprints(self, document: RequirementDocument) -> dict:
+        """
+        计算评审内容指纹：每个模块的标题和内容，以及模块之外影响评审结果的全局上下文
+        （文档标题、描述和评审提示词）
+        """
+        modules = list(document.modules.order_by('order'))
+        global_context = json.dumps({
+            'title': document.title,
+            'description': document.description or '',
+            'prompts': [self._get_user_prompt(prompt_type) or '' for prompt_type in self.REVIEW_PROMPT_TYPES],
+        }, ensure_ascii=False, sort_keys=True)
+        return {
+            'global': self._fingerprint(global_context),
+            'modules': {
+                str(module.id): self._fingerprint(f"{module.title}\n{module.content}")
+                for module in modules
+            },
+        }
+
+    @staticmethod
+    def _get_max_workers(analysis_options: dict) -> int:
+        """从选项中获取并发数，默认3；parallel_processing=False时串行执行"""
+        if not analysis_options.get('parallel_processing', True):
+            return 1
+        return analysis_options.get('max_workers', 3)
+
+    def _run_analyses(self, document: RequirementDocument, analysis_tasks: dict, modules: List[RequirementModule],
+                      module_prompt: str, global_prompt: str, max_workers: int, on_module_complete=None):
+        """
+        在同一个线程池中并发执行专项分析和模块分析
+        
+        Args:
+            analysis_tasks: 分析名 -> (显示名, 分析函数, 分析内容)
+        
+        Returns:
+            (分析名 -> 分析结果, 模块ID -> 模块分析结果)，失败的分析使用默认结果
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        results = {}
+        module_results = {}
+        if not analysis_tasks and not modules:
+            return results, module_results
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 提交所有任务
+            pending = {
+                executor.submit(self._run_in_worker, task_func, content): ('analysis', name, display_name)
+                for name, (display_name, task_func, content) in analysis_tasks.items()
+            }
+            if modules:
+                if global_prompt:
+                    # 模块分析依赖全局上下文，全局分析完成后再提交
+                    pending[executor.submit(self._run_in_worker, self._analyze_global_structure, document, global_prompt)] = (
+                        'global', None, '全局结构'
+                    )
+                else:
+                    pending.update(self._submit_module_analyses(executor, modules, {}, module_prompt))
+            
+            # 收集结果
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, key, display_name = pending.pop(future)
+                    if kind == 'global':
+                        try:
+                            global_context = future.result()
+                        except Exception as e:
+                            logger.error(f"全局结构分析失败: {e}")
+                            global_context = self._get_default_global_analysis()
+                        pending.update(self._submit_module_analyses(executor, modules, global_context, module_prompt))
+                    elif kind == 'module':
+                        module_results[key.id] = self._collect_module_analysis(future, key, on_module_complete)
+                    else:
+                        try:
+                            result = future.result()
+                            results[key] = result
+                            logger.info(f"{display_name}分析完成，评分: {result.get('overall_score', 0)}")
+                        except Exception as e:
+                            logger.error(f"{display_name}分析失败: {e}")
+                            # 使用默认结果
+                            results[key] = self._get_default_analysis_result(f'{key}_analysis')
+        return results, module_results
+
+    @staticmethod
+    def _order_module_analyses(modules: List[RequirementModule], module_results: dict) -> list:
+        """模块分析结果按模块顺序排列"""
+        return [
+            module_results[module.id]
+            for module in sorted(modules, key=lambda m: m.order)
+            if module.id in module_results
+        ]
+
+    def _prepare_module_analysis(self, document: RequirementDocument, analysis_options: dict):
+        """
+        获取需要分析的模块（优先模块排在前面）及模块分析、全局分析提示词
+        未配置模块分析提示词或关闭模块分析时返回空模块列表
+        """
+        if not analysis_options.get('module_analysis', True):
+            return [], None, None
+
+        modules = list(document.modules.order_by('order'))
+        if not modules:
+            return [], None, None
+
+        module_prompt = self._get_user_prompt('module_analysis')
+        if not module_prompt:
+            logger.info("用户未配置模块分析提示词，跳过模块分析")
+            return [], None, None
+
+        priority_modules = {str(module_id) for module_id in analysis_options.get('priority_modules') or []}
+        modules.sort(key=lambda m: str(m.id) not in priority_modules)
+        return modules, module_prompt, self._get_user_prompt('global_analysis')
+
+    def _submit_module_analyses(self, executor, modules: List[RequirementModule], global_context: dict,
+                                module_prompt: str) -> dict:
+        """将模块分析提交到线程池，返回 future -> ('module', 模块, 模块名)"""
+        logger.info(f"提交 {len(modules)} 个模块分析任务...")
+        return {
+            executor.submit(self._run_in_worker, self._analyze_single_module, module, global_context, module_prompt): (
+                'module', module, module.title
+            )
+            for module in modules
+        }
+
+    def _collect_module_analysis(self, future, module: RequirementModule, on_module_complete=None) -> dict:
+        """取出单个模块的分析结果并通知回调，失败时使用默认结果"""
+        try:
+            analysis = future.result()
+        except Exception as e:
+            logger.error(f"模块 {module.title} 分析失败: {e}")
+            analysis = self._get_default_module_analysis(module)
+
+        logger.info(f"模块 {module.title} 分析完成，评分: {analysis.get('overall_score', 0)}")
+        if on_module_complete:
+            try:
+                on_module_complete(module, analysis)
+            except Exception as e:
+                logger.error(f"模块 {module.title} 分析结果处理失败: {e}")
+        return analysis
+
     def _generate_comprehensive_report_v2(self, analyses: dict) -> dict:
         """生成综合评审报告 - 新架构版本"""
         try:
@@ -2128,26 +2680,31 @@ class RequirementReviewEngine:
             logger.error(f"详细错误: {traceback.format_exc()}")
             raise
 
-    def _analyze_global_structure(self, document: RequirementDocument) -> dict:
-        """分析文档的全局结构和上下文"""
+    def _analyze_global_structure(self, document: RequirementDocument, global_prompt: str = None,
+                                  content: str = None) -> dict:
+        """分析文档的全局结构和上下文，超出单次分析窗口的文档拆分为多个窗口分析后合并"""
 
-        global_prompt = self._get_user_prompt('global_analysis')
+        global_prompt = global_prompt or self._get_user_prompt('global_analysis')
         if not global_prompt:
             raise ValueError("用户未配置全局分析提示词，请先在提示词管理中配置")
 
+        prompt_vars = {'title': document.title, 'description': document.description or "无描述"}
+        if content is None:
+            windows = self._split_content(global_prompt, document.content, 'content', **prompt_vars)
+            if len(windows) > 1:
+                return self._map_reduce(
+                    '全局结构', windows, lambda window: self._analyze_global_structure(document, global_prompt, window)
+                )
+            content = document.content
+
         try:
-            formatted_prompt = format_prompt_template(
-                global_prompt,
-                title=document.title,
-                description=document.description or "无描述",
-                content=document.content[:6000]
-            )
+            formatted_prompt = format_prompt_template(global_prompt, content=content, **prompt_vars)
             messages = [
                 SystemMessage(content="你是一位专业的需求分析师，擅长需求文档评审。"),
                 HumanMessage(content=formatted_prompt)
             ]
 
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
 
             global_analysis = extract_json_from_response(response.content)
             if not global_analysis:
@@ -2164,45 +2721,40 @@ class RequirementReviewEngine:
             logger.error(f"全局结构分析失败: {e}")
             return self._get_default_global_analysis()
 
-    def _analyze_modules_detailed(self, document: RequirementDocument, global_context: dict) -> List[dict]:
-        """详细分析各个模块"""
-        modules = document.modules.order_by('order')
-        module_analyses = []
-
-        for module in modules:
-            try:
-                analysis = self._analyze_single_module(module, global_context)
-                module_analyses.append(analysis)
-            except Exception as e:
-                logger.error(f"模块 {module.title} 分析失败: {e}")
-                # 添加默认分析结果
-                module_analyses.append(self._get_default_module_analysis(module))
-
-        return module_analyses
-
-    def _analyze_single_module(self, module: RequirementModule, global_context: dict) -> dict:
-        """分析单个模块"""
+    def _analyze_single_module(self, module: RequirementModule, global_context: dict,
+                               module_prompt: str = None, content: str = None) -> dict:
+        """分析单个模块，超出单次分析窗口的模块拆分为多个窗口分析后合并"""
 
-        module_prompt = self._get_user_prompt('module_analysis')
+        module_prompt = module_prompt or self._get_user_prompt('module_analysis')
         if not module_prompt:
             raise ValueError("用户未配置模块分析提示词，请先在提示词管理中配置")
 
+        prompt_vars = {
+            'module_id': str(module.id),
+            'module_title': module.title,
+            'business_flows': ", ".join(global_context.get('business_flows', [])),
+            'data_entities': ", ".join(global_context.get('data_entities', [])),
+            'global_rules': ", ".join(global_context.get('global_rules', [])),
+        }
+        if content is None:
+            windows = self._split_content(module_prompt, module.content, 'module_content', **prompt_vars)
+            if len(windows) > 1:
+                analysis = self._map_reduce(
+                    f'模块 {module.title} ', windows,
+                    lambda window: self._analyze_single_module(module, global_context, module_prompt, window)
+                )
+                analysis['module_id'] = str(module.id)
+                return analysis
+            content = module.content
+
         try:
-            formatted_prompt = format_prompt_template(
-                module_prompt,
-                module_id=str(module.id),
-                module_title=module.title,
-                module_content=module.content[:3000],
-                business_flows=", ".join(global_context.get('business_flows', [])),
-                data_entities=", ".join(global_context.get('data_entities', [])),
-                global_rules=", ".join(global_context.get('global_rules', []))
-            )
+            formatted_prompt = format_prompt_template(module_prompt, module_content=content, **prompt_vars)
             messages = [
                 SystemMessage(content="你是一位专业的需求分析师，正在进行需求评审。"),
                 HumanMessage(content=formatted_prompt)
             ]
 
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
 
             analysis = extract_json_from_response(response.content)
             if analysis:
@@ -2240,7 +2792,7 @@ class RequirementReviewEngine:
                 HumanMessage(content=formatted_prompt)
             ]
 
-            response = safe_llm_invoke(self.llm, messages)
+            response = self._invoke_llm(messages)
 
             consistency_analysis = extract_json_from_response(response.content)
             if not consistency_analysis:
@@ -2477,6 +3029,9 @@ class RequirementReviewService:
             review_report.completeness_score = review_result.get('completeness_score', 0)
             review_report.summary = review_result.get('summary', '')
             review_report.recommendations = review_result.get('recommendations', '')
+            llm_cache = self.review_engine.llm_cache_counters()
+            review_report.llm_cache_hits = llm_cache['hits']
+            review_report.llm_cache_misses = llm_cache['misses']
             review_report.status = 'completed'
             review_report.save()
 
@@ -2516,20 +3071,34 @@ class RequirementReviewService:
 
     def start_comprehensive_review(self, document: RequirementDocument,
                                  analysis_options: dict = None) -> 'ReviewReport':
-        """启动全面的需求评审（基于模块）"""
+        """
+        启动全面的需求评审（基于模块）
+        analysis_options.incremental=True 时基于上一次全面评审做增量评审：只重新分析内容变更的模块，
+        未变更模块的问题和模块评审结果从上一次评审中复制；没有可用的基准评审、全局上下文
+        （文档标题、描述、评审提示词）变化或有模块被删除时自动改为完整评审
+        """
         from .models import ReviewReport, ReviewIssue, ModuleReviewResult
 
+        analysis_options = analysis_options or {}
+
         try:
             # 检查文档状态（允许 ready_for_review 或 reviewing 状态）
             if document.status not in ['ready_for_review', 'reviewing']:
                 raise ValueError(f"文档状态 {document.status} 不允许开始评审")
 
+            fingerprints = self.review_engine.compute_review_fingerprints(document)
+            base_report = None
+            if analysis_options.get('incremental'):
+                base_report = self._get_incremental_base_report(document, fingerprints)
+
             # 创建评审报告
             review_report = ReviewReport.objects.create(
                 document=document,
                 status='in_progress',
                 reviewer='AI需求评审助手',
-                review_type='comprehensive'  # 标记为全面评审
+                review_type='comprehensive',  # 标记为全面评审
+                base_report=base_report,
+                review_fingerprints=fingerprints
             )
 
             # 确保文档状态为 reviewing
@@ -2537,19 +3106,32 @@ class RequirementReviewService:
                 document.status = 'reviewing'
                 document.save()
 
-            logger.info(f"开始评审文档: {document.title}")
+            # 模块评审结果在每个模块分析完成时保存
+            on_module_complete = lambda module, module_analysis: self._save_module_result(
+                review_report, module, module_analysis
+            )
 
-            # 执行AI分析
-            analysis_result = self.review_engine.analyze_document_comprehensive(document, analysis_options)
+            if base_report:
+                logger.info(f"开始增量评审文档: {document.title}, 基准评审: {base_report.id}")
+                self._run_incremental_review(review_report, base_report, analysis_options, on_module_complete)
+            else:
+                logger.info(f"开始评审文档: {document.title}")
 
-            # 更新评审报告
-            self._update_review_report(review_report, analysis_result)
+                # 执行AI分析
+                analysis_result = self.review_engine.analyze_document_comprehensive(
+                    document,
+                    analysis_options,
+                    on_module_complete=on_module_complete
+                )
 
-            # 创建问题记录
-            self._create_review_issues(review_report, analysis_result)
+                # 更新评审报告
+                self._update_review_report(review_report, analysis_result)
+
+                # 创建问题记录
+                self._create_review_issues(review_report, analysis_result)
 
-            # 创建模块评审结果
-            self._create_module_results(review_report, analysis_result)
+                # 创建模块评审结果
+                self._create_module_results(review_report, analysis_result)
 
             # 完成评审
             review_report.status = 'completed'
@@ -2576,6 +3158,123 @@ class RequirementReviewService:
 
             raise
 
+    def _get_incremental_base_report(self, document: RequirementDocument, fingerprints: dict) -> Optional['ReviewReport']:
+        """
+        获取增量评审的基准报告：最近一次完成的全面评审，全局上下文未变化且没有模块被删除
+        （基准评审的评分和问题包含已删除模块的内容，无法只去掉这部分）
+        """
+        from .models import ReviewReport
+
+        base_report = ReviewReport.objects.filter(
+            document=document, review_type='comprehensive', status='completed'
+        ).order_by('-review_date').first()
+
+        if not base_report or not base_report.review_fingerprints.get('modules'):
+            logger.info(f"文档 {document.title} 没有可用于增量评审的历史评审，执行完整评审")
+            return None
+        if base_report.review_fingerprints.get('global') != fingerprints['global']:
+            logger.info(f"文档 {document.title} 的标题、描述或评审提示词已变化，执行完整评审")
+            return None
+        if set(base_report.review_fingerprints['modules']) - set(fingerprints['modules']):
+            logger.info(f"文档 {document.title} 有模块在上次评审后被删除，执行完整评审")
+            return None
+        return base_report
+
+    def _run_incremental_review(self, review_report: 'ReviewReport', base_report: 'ReviewReport',
+                                analysis_options: dict, on_module_complete):
+        """增量评审：重新分析变更模块，复制未变更模块的问题和模块评审结果"""
+        document = review_report.document
+        previous_modules = base_report.review_fingerprints.get('modules', {})
+        current_modules = review_report.review_fingerprints['modules']
+        changed_modules = [
+            module for module in document.modules.order_by('order')
+            if previous_modules.get(str(module.id)) != current_modules.get(str(module.id))
+        ]
+
+        analysis_result = self.review_engine.analyze_document_incremental(
+            document,
+            base_report.specialized_analyses or {},
+            changed_modules,
+            analysis_options=analysis_options,
+            on_module_complete=on_module_complete
+        )
+
+        self._update_review_report(review_report, analysis_result)
+        self._copy_base_results(
+            review_report, base_report, {module.id for module in changed_modules},
+            reanalyzed=analysis_result.get('incremental', {}).get('reanalyzed', [])
+        )
+        self._create_review_issues(review_report, {'issues': analysis_result.get('new_issues', [])})
+        self._create_module_results(review_report, analysis_result)
+        self._recount_review_issues(review_report)
+
+    def _copy_base_results(self, review_report: 'ReviewReport', base_report: 'ReviewReport',
+                           changed_module_ids: set, reanalyzed: list):
+        """
+        从基准报告复制未变更模块的问题（保留处理状态）和模块评审结果
+        与 _merge_incremental_analysis 的规则一致：重新分析的专项中，不属于任何模块的问题由本次分析重新产生，不复制
+        """
+        from .models import ReviewIssue, ModuleReviewResult
+
+        issues = base_report.issues.exclude(module_id__in=changed_module_ids).exclude(
+            module__isnull=True, analysis_source__in=reanalyzed
+        )
+        if 'consistency' in reanalyzed:
+            # 一致性问题已对全部模块重新分析
+            issues = issues.exclude(analysis_source='consistency')
+        ReviewIssue.objects.bulk_create([
+            ReviewIssue(
+                report=review_report,
+                module_id=issue.module_id,
+                issue_type=issue.issue_type,
+                priority=issue.priority,
+                title=issue.title,
+                description=issue.description,
+                suggestion=issue.suggestion,
+                location=issue.location,
+                page_number=issue.page_number,
+                section=issue.section,
+                analysis_source=issue.analysis_source,
+                is_resolved=issue.is_resolved,
+                resolution_note=issue.resolution_note,
+            )
+            for issue in issues
+        ])
+
+        ModuleReviewResult.objects.bulk_create([
+            ModuleReviewResult(
+                report=review_report,
+                module_id=result.module_id,
+                module_rating=result.module_rating,
+                issues_count=result.issues_count,
+                severity_score=result.severity_score,
+                analysis_content=result.analysis_content,
+                strengths=result.strengths,
+                weaknesses=result.weaknesses,
+                recommendations=result.recommendations,
+            )
+            for result in base_report.module_results.exclude(module_id__in=changed_module_ids)
+        ])
+
+    def _recount_review_issues(self, review_report: 'ReviewReport'):
+        """按实际保存的问题记录更新问题统计"""
+        from django.db.models import Count, Q
+
+        counts = review_report.issues.aggregate(
+            total=Count('id'),
+            high=Count('id', filter=Q(priority='high')),
+            medium=Count('id', filter=Q(priority='medium')),
+            low=Count('id', filter=Q(priority='low')),
+        )
+        review_report.total_issues = counts['total']
+        review_report.high_priority_issues = counts['high']
+        review_report.medium_priority_issues = counts['medium']
+        review_report.low_priority_issues = counts['low']
+        review_report.summary = self.review_engine._generate_summary(
+            review_report.completion_score, counts['total'], counts['high']
+        )
+        review_report.save()
+
     def _update_review_report(self, review_report: 'ReviewReport', analysis_result: dict):
         """更新评审报告基本信息和专项分析详情"""
         review_report.overall_rating = analysis_result.get('overall_rating', 'average')
@@ -2598,6 +3297,11 @@ class RequirementReviewService:
         review_report.testability_score = specialized_analyses.get('testability_analysis', {}).get('overall_score', 0)
         review_report.feasibility_score = specialized_analyses.get('feasibility_analysis', {}).get('overall_score', 0)
         
+        # LLM 响应缓存命中情况
+        llm_cache = analysis_result.get('llm_cache', {})
+        review_report.llm_cache_hits = llm_cache.get('hits', 0)
+        review_report.llm_cache_misses = llm_cache.get('misses', 0)
+        
         review_report.save()
 
     def _create_review_issues(self, review_report: 'ReviewReport', analysis_result: dict):
@@ -2605,15 +3309,12 @@ class RequirementReviewService:
         from .models import ReviewIssue
 
         issues = analysis_result.get('issues', [])
+        modules = list(review_report.document.modules.order_by('order'))
 
         for issue_data in issues:
             try:
                 # 查找相关模块
-                module = None
-                if issue_data.get('module_name'):
-                    module = review_report.document.modules.filter(
-                        title__icontains=issue_data['module_name']
-                    ).first()
+                module = self.review_engine.find_issue_module(issue_data, modules)
 
                 # 映射问题类型
                 issue_type = self._map_issue_type(issue_data.get('type', 'clarity'))
@@ -2627,51 +3328,58 @@ class RequirementReviewService:
                     description=issue_data.get('description', ''),
                     suggestion=issue_data.get('suggestion', ''),
                     location=issue_data.get('location', ''),
-                    section=issue_data.get('module_name', '')
+                    section=issue_data.get('module_name', ''),
+                    analysis_source=issue_data.get('source', '')
                 )
 
             except Exception as e:
                 logger.error(f"创建问题记录失败: {e}")
 
     def _create_module_results(self, review_report: 'ReviewReport', analysis_result: dict):
-        """创建模块评审结果"""
-        from .models import ModuleReviewResult
-
+        """创建模块评审结果（跳过分析过程中已保存的模块）"""
         module_analyses = analysis_result.get('module_analyses', [])
+        saved_module_ids = {str(module_id) for module_id in review_report.module_results.values_list('module_id', flat=True)}
 
         for module_analysis in module_analyses:
             try:
                 # 查找模块
                 module_id = module_analysis.get('module_id')
-                if not module_id:
+                if not module_id or str(module_id) in saved_module_ids:
                     continue
 
                 module = review_report.document.modules.filter(id=module_id).first()
                 if not module:
                     continue
 
-                # 计算严重程度评分（分数越高问题越严重）
-                overall_score = module_analysis.get('overall_score', 70)
-                severity_score = max(0, 100 - overall_score)
-
-                # 映射评级
-                module_rating = self._map_module_rating(overall_score)
-
-                ModuleReviewResult.objects.create(
-                    report=review_report,
-                    module=module,
-                    module_rating=module_rating,
-                    issues_count=len(module_analysis.get('issues', [])),
-                    severity_score=severity_score,
-                    analysis_content=json.dumps(module_analysis, ensure_ascii=False, indent=2),
-                    strengths='\n'.join(module_analysis.get('strengths', [])),
-                    weaknesses='\n'.join(module_analysis.get('weaknesses', [])),
-                    recommendations='\n'.join(module_analysis.get('recommendations', []))
-                )
+                self._save_module_result(review_report, module, module_analysis)
 
             except Exception as e:
                 logger.error(f"创建模块结果失败: {e}")
 
+    def _save_module_result(self, review_report: 'ReviewReport', module: RequirementModule,
+                            module_analysis: dict) -> 'ModuleReviewResult':
+        """保存单个模块的评审结果"""
+        from .models import ModuleReviewResult
+
+        # 计算严重程度评分（分数越高问题越严重）
+        overall_score = module_analysis.get('overall_score', 70)
+        severity_score = max(0, 100 - overall_score)
+
+        # 映射评级
+        module_rating = self._map_module_rating(overall_score)
+
+        return ModuleReviewResult.objects.create(
+            report=review_report,
+            module=module,
+            module_rating=module_rating,
+            issues_count=len(module_analysis.get('issues', [])),
+            severity_score=severity_score,
+            analysis_content=json.dumps(module_analysis, ensure_ascii=False, indent=2),
+            strengths='\n'.join(module_analysis.get('strengths', [])),
+            weaknesses='\n'.join(module_analysis.get('weaknesses', [])),
+            recommendations='\n'.join(module_analysis.get('recommendations', []))
+        )
+
     def _map_issue_type(self, ai_type: str) -> str:
         """映射AI分析的问题类型到数据库字段"""
         type_mapping = {
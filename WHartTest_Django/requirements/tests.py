@@ -1,3 +1,472 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from projects.models import Project
+from prompts.models import PromptType, UserPrompt
+from prompts.services import initialize_user_prompts
+from requirements.context_limits import ContextLimitChecker
+from requirements.llm_cache import LLMResponseCache
+from requirements.models import LLMResponseCacheEntry, RequirementDocument, RequirementModule
+from requirements.services import RequirementReviewEngine, RequirementReviewService, safe_llm_invoke
+
+
+TEST_PROMPTS = {
+    'completeness_analysis': 'COMPLETENESS {document}',
+    'consistency_analysis': 'CONSISTENCY {document}',
+    'testability_analysis': 'TESTABILITY {document}',
+    'feasibility_analysis': 'FEASIBILITY {document}',
+    'clarity_analysis': 'CLARITY {document}',
+    'global_analysis': 'GLOBAL {title} {content}',
+    'module_analysis': 'MODULE {module_id}|{module_title}|{module_content}',
+}
+
+
+class FakeReviewLLM:
+    """按提示词类型返回固定JSON，记录调用顺序和最大并发数"""
+
+    def __init__(self, delay=0.0, responses=None):
+        self.delay = delay
+        self.responses = responses or {}
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        prompt = messages[-1].content
+        kind = prompt.split(' ', 1)[0]
+        with self._lock:
+            self.calls.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if kind == 'MODULE':
+                module_id, module_title, _ = prompt[len('MODULE '):].split('|', 2)
+                result = {'module_id': module_id, 'module_name': module_title, 'overall_score': 80, 'issues': []}
+            else:
+                result = {'overall_score': 80, 'issues': []}
+            response = self.responses.get(kind, {})
+            result.update(response(prompt) if callable(response) else response)
+            return SimpleNamespace(content=json.dumps(result, ensure_ascii=False))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def module_calls(self):
+        return [call.split('|')[1] for call in self.calls if call.startswith('MODULE ')]
+
+
+class ReviewTestMixin:
+    """评审测试的公共数据：用户、文档和模块，LLM 和提示词替换为测试替身"""
+
+    module_count = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='review_user', password='password')
+        project = Project.objects.create(name='Review Project', creator=self.user)
+        self.document = RequirementDocument.objects.create(
+            project=project, title='订单系统需求', document_type='md', status='ready_for_review',
+            content='订单系统', uploader=self.user,
+        )
+        self.modules = [
+            RequirementModule.objects.create(
+                document=self.document, title=f'模块{i}', content=f'模块{i}的需求内容', order=i
+            )
+            for i in range(self.module_count)
+        ]
+        self.llm = FakeReviewLLM()
+        patches = [
+            mock.patch.object(RequirementReviewEngine, '_get_llm_instance', lambda engine: self.llm),
+            mock.patch.object(
+                RequirementReviewEngine, '_get_user_prompt', lambda engine, prompt_type: self.prompts.get(prompt_type)
+            ),
+        ]
+        self.prompts = dict(TEST_PROMPTS)
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class ModuleAnalysisTests(ReviewTestMixin, TestCase):
+    """测试模块分析的并发、优先级和逐个保存"""
+
+    module_count = 6
+
+    def test_default_prompts_enable_module_analysis(self):
+        initialize_user_prompts(self.user)
+        self.prompts = {
+            prompt_type: UserPrompt.get_user_prompt_by_type(self.user, prompt_type).content
+            for prompt_type in (PromptType.GLOBAL_ANALYSIS, PromptType.MODULE_ANALYSIS)
+        }
+        engine = RequirementReviewEngine(user=self.user)
+
+        modules, module_prompt, global_prompt = engine._prepare_module_analysis(self.document, {})
+
+        self.assertEqual(len(modules), self.module_count)
+        self.assertIn('{module_content}', module_prompt)
+        self.assertIn('{content}', global_prompt)
+
+    def test_concurrency_is_bounded_by_max_workers(self):
+        self.llm.delay = 0.05
+        engine = RequirementReviewEngine(user=self.user)
+
+        report = engine.analyze_document_comprehensive(self.document, {'max_workers': 2})
+
+        self.assertEqual(self.llm.max_active, 2)
+        self.assertEqual(
+            [analysis['module_name'] for analysis in report['module_analyses']],
+            [module.title for module in self.modules],
+        )
+
+    def test_priority_modules_are_analyzed_first(self):
+        engine = RequirementReviewEngine(user=self.user)
+        priority = [self.modules[4], self.modules[2]]
+
+        engine.analyze_document_comprehensive(
+            self.document, {'max_workers': 1, 'priority_modules': [str(module.id) for module in priority]}
+        )
+
+        self.assertEqual(
+            self.llm.module_calls(),
+            ['模块2', '模块4', '模块0', '模块1', '模块3', '模块5'],
+        )
+
+    def test_module_results_are_saved_as_each_module_completes(self):
+        service = RequirementReviewService(user=self.user)
+        statuses = []
+        original = service._save_module_result
+
+        def save_module_result(review_report, module, module_analysis):
+            statuses.append(review_report.status)
+            return original(review_report, module, module_analysis)
+
+        with mock.patch.object(service, '_save_module_result', side_effect=save_module_result):
+            report = service.start_comprehensive_review(self.document, {'max_workers': 2})
+
+        self.assertEqual(statuses, ['in_progress'] * self.module_count)
+        self.assertEqual(report.module_results.count(), self.module_count)
+        self.assertEqual(report.status, 'completed')
+
+
+class LLMResponseCacheTests(TestCase):
+    """测试 LLM 响应缓存的缓存键、空响应和跳过查找"""
+
+    def setUp(self):
+        self.cache = LLMResponseCache(model_name='fake')
+        patcher = mock.patch.object(LLMResponseCache, '_last_evicted_at', 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _model(self, *responses):
+        return FakeListChatModel(responses=list(responses), cache=self.cache)
+
+    def test_cache_key_is_stable_and_includes_model_params(self):
+        key = LLMResponseCache.make_key('需求', 'model=fake,temperature=0.1')
+
+        self.assertEqual(key, LLMResponseCache.make_key('需求', 'model=fake,temperature=0.1'))
+        self.assertNotEqual(key, LLMResponseCache.make_key('需求', 'model=fake,temperature=0.2'))
+        self.assertNotEqual(key, LLMResponseCache.make_key('需求2', 'model=fake,temperature=0.1'))
+
+    def test_repeated_request_is_served_from_cache(self):
+        llm = self._model('第一次', '第二次')
+
+        llm.invoke([HumanMessage(content='需求')])
+        response = llm.invoke([HumanMessage(content='需求')])
+
+        self.assertEqual(response.content, '第一次')
+        self.assertTrue(response.response_metadata['cache_hit'])
+        self.assertEqual(self.cache.counters, {'hits': 1, 'misses': 1, 'bypassed': 0})
+
+    def test_empty_response_is_not_cached(self):
+        llm = self._model('', '有效结果')
+
+        self.assertEqual(llm.invoke([HumanMessage(content='需求')]).content, '')
+        self.assertFalse(LLMResponseCacheEntry.objects.exists())
+
+        self.assertEqual(llm.invoke([HumanMessage(content='需求')]).content, '有效结果')
+        self.assertEqual(LLMResponseCacheEntry.objects.count(), 1)
+
+    def test_use_llm_cache_false_skips_lookup_but_writes(self):
+        llm = self._model('旧结果', '新结果', '不应调用')
+        llm.invoke([HumanMessage(content='需求')])
+        with mock.patch.object(RequirementReviewEngine, '_get_llm_instance', lambda engine: llm):
+            engine = RequirementReviewEngine()
+
+        engine._apply_cache_option({'use_llm_cache': False})
+        response = safe_llm_invoke(engine.llm, [HumanMessage(content='需求')])
+
+        self.assertEqual(response.content, '新结果')
+        self.assertEqual(engine.llm_cache_counters()['bypassed'], 1)
+        self.assertEqual(llm.invoke([HumanMessage(content='需求')]).content, '新结果')
+
+    @override_settings(REQUIREMENT_LLM_CACHE_EVICT_INTERVAL=300)
+    def test_eviction_is_throttled(self):
+        self.cache.max_entries = 1
+        llm = self._model('结果1', '结果2', '结果3')
+
+        llm.invoke([HumanMessage(content='需求1')])
+        llm.invoke([HumanMessage(content='需求2')])
+        self.assertEqual(LLMResponseCacheEntry.objects.count(), 2)
+
+        LLMResponseCache._last_evicted_at -= 300
+        llm.invoke([HumanMessage(content='需求3')])
+        self.assertEqual(LLMResponseCacheEntry.objects.count(), 1)
+
+
+class IncrementalReviewTests(ReviewTestMixin, TestCase):
+    """测试增量评审的指纹、回退完整评审、评分合并和问题复制"""
+
+    def setUp(self):
+        super().setUp()
+        self.service = RequirementReviewService(user=self.user)
+
+    def _review(self, **options):
+        self.document.status = 'ready_for_review'
+        self.document.save()
+        return self.service.start_comprehensive_review(self.document, {'incremental': True, **options})
+
+    def _edit_module(self, module, content):
+        module.content = content
+        module.save()
+
+    def test_fingerprints_track_module_content_and_global_context(self):
+        engine = RequirementReviewEngine(user=self.user)
+        before = engine.compute_review_fingerprints(self.document)
+
+        self._edit_module(self.modules[1], '修改后的需求内容')
+        after = engine.compute_review_fingerprints(self.document)
+
+        self.assertEqual(before['global'], after['global'])
+        self.assertEqual(before['modules'][str(self.modules[0].id)], after['modules'][str(self.modules[0].id)])
+        self.assertNotEqual(before['modules'][str(self.modules[1].id)], after['modules'][str(self.modules[1].id)])
+
+        self.prompts['clarity_analysis'] = 'CLARITY 新提示词 {document}'
+        self.assertNotEqual(after['global'], engine.compute_review_fingerprints(self.document)['global'])
+
+    def test_falls_back_to_full_review(self):
+        first = self._review()
+        self.assertIsNone(first.base_report)
+
+        second = self._review()
+        self.assertEqual(second.base_report, first)
+
+        self.document.title = '订单系统需求 v2'
+        third = self._review()
+        self.assertIsNone(third.base_report)
+
+    def test_removed_module_falls_back_to_full_review(self):
+        self.llm.responses['COMPLETENESS'] = {'issues': [
+            {'title': '模块0缺少字段', 'module_name': '模块0'},
+            {'title': '模块2缺少字段', 'module_name': '模块2'},
+        ]}
+        base = self._review()
+        self.assertEqual(base.issues.count(), 2)
+
+        self.modules[2].delete()
+        self.llm.responses['COMPLETENESS'] = {'issues': [{'title': '模块0缺少字段', 'module_name': '模块0'}]}
+        report = self._review()
+
+        self.assertIsNone(report.base_report)
+        self.assertEqual(list(report.issues.values_list('title', flat=True)), ['模块0缺少字段'])
+        self.assertEqual(
+            [issue['title'] for issue in report.specialized_analyses['completeness_analysis']['issues']],
+            ['模块0缺少字段'],
+        )
+
+    def test_scores_are_weighted_by_changed_content(self):
+        engine = RequirementReviewEngine(user=self.user)
+        previous = {
+            'overall_score': 60,
+            'issues': [{'title': '模块0的问题', 'module_name': '模块0'}, {'title': '模块1的问题', 'module_name': '模块1'},
+                       {'title': '全局问题'}],
+        }
+
+        merged = engine._merge_incremental_analysis(
+            previous, {'overall_score': 90, 'issues': [{'title': '新问题'}]}, self.modules, {self.modules[1].id}, 0.5
+        )
+
+        self.assertEqual(merged['overall_score'], 75)
+        self.assertEqual([issue['title'] for issue in merged['issues']], ['模块0的问题', '新问题'])
+        self.assertEqual(merged['incremental']['previous_score'], 60)
+
+    def test_unchanged_issues_are_copied_once(self):
+        self.llm.responses['COMPLETENESS'] = {'issues': [
+            {'title': '模块0缺少字段', 'module_name': '模块0', 'priority': 'high'},
+            {'title': '模块1缺少字段', 'module_name': '模块1'},
+            {'title': '缺少非功能需求'},
+        ]}
+        base = self._review()
+        base.issues.filter(title='模块0缺少字段').update(is_resolved=True)
+
+        self._edit_module(self.modules[1], '修改后的需求内容')
+        self.llm.responses['COMPLETENESS'] = {'issues': [
+            {'title': '模块1缺少字段', 'module_name': '模块1'},
+            {'title': '缺少非功能需求'},
+        ]}
+        report = self._review()
+
+        self.assertEqual(report.base_report, base)
+        self.assertEqual(
+            sorted(report.issues.values_list('title', flat=True)), ['模块0缺少字段', '模块1缺少字段', '缺少非功能需求']
+        )
+        self.assertTrue(report.issues.get(title='模块0缺少字段').is_resolved)
+        self.assertEqual(report.total_issues, 3)
+        completeness_issues = report.specialized_analyses['completeness_analysis']['issues']
+        self.assertEqual(len(completeness_issues), 3)
+        self.assertEqual(report.module_results.count(), self.module_count)
+
+
+class SplitByTokensTests(SimpleTestCase):
+    """测试按token预算切分分析窗口（离线环境按字符数估算token）"""
+
+    def setUp(self):
+        self.checker = ContextLimitChecker()
+        self.checker.encoders['offline'] = None
+
+    def _split(self, text, max_tokens, overlap_tokens=0):
+        return self.checker.split_by_tokens(text, max_tokens, overlap_tokens, 'offline')
+
+    def test_text_within_budget_is_not_split(self):
+        self.assertEqual(self._split('订单需求', 500), ['订单需求'])
+
+    def test_windows_stay_within_budget_with_char_estimate(self):
+        text = ''.join(f'第{i}条需求：订单提交后生成支付单\n' for i in range(300))
+
+        windows = self._split(text, 500)
+
+        self.assertGreater(len(windows), 1)
+        self.assertEqual(''.join(windows), text)
+        for window in windows:
+            self.assertLessEqual(self.checker.count_tokens(window, 'offline'), 500)
+
+    def test_windows_overlap_within_budget(self):
+        text = ''.join(f'第{i}条需求：订单提交后生成支付单\n' for i in range(300))
+
+        windows = self._split(text, 500, overlap_tokens=50)
+
+        for previous, window in zip(windows, windows[1:]):
+            self.assertIn(window.splitlines(keepends=True)[0], previous.splitlines(keepends=True))
+        for window in windows:
+            self.assertLessEqual(self.checker.count_tokens(window, 'offline'), 500)
+
+    def test_long_line_is_split_by_characters(self):
+        windows = self._split('订' * 5000, 500)
+
+        self.assertEqual(''.join(windows), '订' * 5000)
+        for window in windows:
+            self.assertLessEqual(self.checker.count_tokens(window, 'offline'), 500)
+
+
+class WindowedAnalysisTests(ReviewTestMixin, TestCase):
+    """测试窗口拆分、问题去重、并发限制和一致性跨窗口检查"""
+
+    module_count = 1
+
+    def setUp(self):
+        super().setUp()
+        self.engine = RequirementReviewEngine(user=self.user)
+        self.content = ''.join(f'第{i}行：订单提交后需要在规定时间内完成支付，否则自动取消订单\n' for i in range(80))
+
+    def _small_windows(self):
+        patcher = mock.patch.object(RequirementReviewEngine, '_get_window_budget', return_value=1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_content_within_context_limit_is_not_split(self):
+        content = '订单需求描述' * 15000
+
+        self.assertEqual(self.engine._split_content('CONSISTENCY {document}', content), [content])
+
+    def test_dedupe_keeps_highest_priority_of_similar_issues(self):
+        issues = [
+            {'title': '订单状态缺少取消流程', 'module_name': '订单', 'priority': 'low'},
+            {'title': '订单状态缺少取消流程。', 'module_name': '订单', 'priority': 'high'},
+            {'title': '订单状态缺少取消流程', 'module_name': '支付', 'priority': 'medium'},
+            {'title': '需求3.1缺少验收标准', 'module_name': '订单'},
+            {'title': '需求3.2缺少验收标准', 'module_name': '订单'},
+        ]
+
+        deduped = self.engine._dedupe_issues(issues)
+
+        self.assertEqual(
+            [(issue['title'], issue['module_name']) for issue in deduped],
+            [('订单状态缺少取消流程。', '订单'), ('订单状态缺少取消流程', '支付'),
+             ('需求3.1缺少验收标准', '订单'), ('需求3.2缺少验收标准', '订单')],
+        )
+        self.assertEqual(deduped[0]['priority'], 'high')
+
+    def test_window_calls_share_the_concurrency_limit(self):
+        self._small_windows()
+        self.llm.delay = 0.02
+        self.engine.max_workers = 2
+        tasks = {
+            name: (name, getattr(self.engine, f'analyze_{name}'), self.content)
+            for name in ['completeness', 'testability', 'feasibility', 'clarity']
+        }
+
+        results, _ = self.engine._run_analyses(self.document, tasks, [], None, None, 2)
+
+        self.assertEqual(set(results), set(tasks))
+        self.assertGreater(len(self.llm.calls), len(tasks))
+        self.assertEqual(self.llm.max_active, 2)
+
+    def test_consistency_checks_statements_across_windows(self):
+        self._small_windows()
+
+        def consistency(prompt):
+            if RequirementReviewEngine.CONSISTENCY_DIGEST_HEADER in prompt:
+                return {'overall_score': 60, 'issues': [{'title': '订单超时时间前后不一致', 'priority': 'high'}]}
+            statement = '订单超时30分钟' if '第0行' in prompt else '订单超时15分钟'
+            return {'overall_score': 90, 'issues': [], 'key_statements': [statement]}
+
+        self.llm.responses['CONSISTENCY'] = consistency
+
+        result = self.engine.analyze_consistency(self.content)
+
+        digest_calls = [call for call in self.llm.calls if RequirementReviewEngine.CONSISTENCY_DIGEST_HEADER in call]
+        self.assertEqual(len(digest_calls), 1)
+        self.assertIn('订单超时30分钟', digest_calls[0])
+        self.assertIn('订单超时15分钟', digest_calls[0])
+        self.assertEqual([issue['title'] for issue in result['issues']], ['订单超时时间前后不一致'])
+        self.assertEqual(result['overall_score'], 60)
+        self.assertNotIn('key_statements', result)
+
+    def test_consistency_checks_every_digest_window(self):
+        # 窗口预算扣除提示词本身（与实际的 _get_window_budget 一致），摘要窗口加上摘要说明后不会再次拆分
+        checker = ContextLimitChecker()
+        patcher = mock.patch.object(
+            RequirementReviewEngine, '_get_window_budget',
+            side_effect=lambda prompt: 1000 - checker.count_tokens(prompt, 'gpt-4o')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        statements = {}
+
+        def consistency(prompt):
+            if RequirementReviewEngine.CONSISTENCY_DIGEST_HEADER in prompt:
+                found = [number for number in statements if f'陈述{number}' in prompt]
+                return {'overall_score': 60, 'issues': [{'title': f'关键陈述{found[-1]}与其他部分矛盾', 'priority': 'high'}]}
+            number = len(statements)
+            statements[number] = f'陈述{number}：' + '订单超时规则说明' * 300
+            return {'overall_score': 90, 'issues': [], 'key_statements': [statements[number]]}
+
+        self.llm.responses['CONSISTENCY'] = consistency
+
+        result = self.engine.analyze_consistency(self.content)
+
+        digest_calls = [call for call in self.llm.calls if RequirementReviewEngine.CONSISTENCY_DIGEST_HEADER in call]
+        self.assertGreater(len(digest_calls), 1)
+        self.assertEqual(result['map_reduce']['digest_windows'], len(digest_calls))
+        for number in statements:
+            self.assertTrue(any(f'陈述{number}' in call for call in digest_calls))
+        self.assertGreater(result['map_reduce']['cross_window_issues'], 1)
+        self.assertEqual(result['overall_score'], 60)
@@ -469,6 +469,9 @@ class RequirementDocumentViewSet(BaseModelViewSet):
                 'priority_modules': request.data.get('priority_modules', []),
                 'custom_requirements': request.data.get('custom_requirements', ''),
                 'max_workers': request.data.get('max_workers', 3),  # 新增：并发数
+                'module_analysis': request.data.get('module_analysis', True),  # 模块分析与专项分析共用并发数
+                'use_llm_cache': request.data.get('use_llm_cache', True),  # False 时不读取LLM响应缓存
+                'incremental': request.data.get('incremental', False),  # 只重新分析变更模块
                 'direct_review': direct_review
             }
 
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os # Added for environment variables
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -516,6 +517,36 @@ CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localho
 # Celery 6.0+ 启动时重试连接
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# LLM 全局限流配置
+# 按 LLM 配置的每分钟请求数 / Token 数（在 LLM 配置中设置，0 表示不限制）调度所有进程的 LLM 请求，
+# 令牌桶和排队队列默认放在 Celery broker 所在的 Redis 中，未配置 Redis 时只在进程内限流；
+# 排队超过 MAX_WAIT 秒放弃请求，服务商返回 429 且没有 Retry-After 时暂停 PAUSE_SECONDS 秒，
+# 请求前按消息长度加 OUTPUT_TOKENS 估算 Token 数，完成后按实际用量修正
+LLM_RATE_LIMIT_ENABLED = os.environ.get('LLM_RATE_LIMIT_ENABLED', 'True') == 'True'
+LLM_RATE_LIMIT_REDIS_URL = os.environ.get(
+    'LLM_RATE_LIMIT_REDIS_URL',
+    CELERY_BROKER_URL if CELERY_BROKER_URL.startswith(('redis://', 'rediss://')) else ''
+)
+LLM_RATE_LIMIT_MAX_WAIT = float(os.environ.get('LLM_RATE_LIMIT_MAX_WAIT', '120'))
+LLM_RATE_LIMIT_PAUSE_SECONDS = float(os.environ.get('LLM_RATE_LIMIT_PAUSE_SECONDS', '10'))
+LLM_RATE_LIMIT_OUTPUT_TOKENS = int(os.environ.get('LLM_RATE_LIMIT_OUTPUT_TOKENS', '1024'))
+
+# 需求评审 LLM 响应缓存配置（默认关闭）
+# 启用后温度不高于 MAX_TEMPERATURE 的评审请求按 (模型参数, 完整消息) 缓存响应，存储在数据库中；
+# 条目超过 TTL 秒失效，超过 MAX_ENTRIES 条时淘汰最久未使用的条目（写入时检查，每个进程每 EVICT_INTERVAL 秒最多一次）。
+# 评审时传 use_llm_cache=false 可强制重新调用
+REQUIREMENT_LLM_CACHE_ENABLED = os.environ.get('REQUIREMENT_LLM_CACHE_ENABLED', 'False') == 'True'
+REQUIREMENT_LLM_CACHE_TTL = int(os.environ.get('REQUIREMENT_LLM_CACHE_TTL', str(7 * 24 * 3600)))
+REQUIREMENT_LLM_CACHE_MAX_ENTRIES = int(os.environ.get('REQUIREMENT_LLM_CACHE_MAX_ENTRIES', '2000'))
+REQUIREMENT_LLM_CACHE_MAX_TEMPERATURE = float(os.environ.get('REQUIREMENT_LLM_CACHE_MAX_TEMPERATURE', '0.3'))
+REQUIREMENT_LLM_CACHE_EVICT_INTERVAL = int(os.environ.get('REQUIREMENT_LLM_CACHE_EVICT_INTERVAL', '300'))
+
+# 需求评审分窗口分析配置
+# 文档或模块内容超出单次分析窗口时拆分为多个相互重叠的窗口并发分析，再合并评分并去重问题。
+# 窗口大小 = 模型上下文限制 - 预留token - OUTPUT_TOKENS - 提示词占用，内容在上下文限制内时不拆分
+REQUIREMENT_REVIEW_WINDOW_OVERLAP_TOKENS = int(os.environ.get('REQUIREMENT_REVIEW_WINDOW_OVERLAP_TOKENS', '400'))
+REQUIREMENT_REVIEW_OUTPUT_TOKENS = int(os.environ.get('REQUIREMENT_REVIEW_OUTPUT_TOKENS', '4096'))
+
 # Celery时区设置
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ENABLE_UTC = True
@@ -538,6 +569,16 @@ CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60  # 软超时时间(秒) - 25分钟
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Worker预取任务数量
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000  # Worker执行多少任务后重启
 
+# Celery队列配置
+# 知识库文档入库使用独立队列，由专用 worker 消费（见 supervisord.conf）
+KNOWLEDGE_INGEST_QUEUE = os.environ.get('KNOWLEDGE_INGEST_QUEUE', 'knowledge_ingest')
+CELERY_TASK_ROUTES = {
+    'knowledge.process_document': {'queue': KNOWLEDGE_INGEST_QUEUE},
+    'knowledge.apply_storage_settings': {'queue': KNOWLEDGE_INGEST_QUEUE},
+}
+# 入库任务的优先级（小文档优先）取 0/3/6/9，与 Redis broker 默认的优先级档位一致，
+# 无需修改 broker 的全局 transport options，其他队列的行为不受影响
+
 # Celery日志配置
 CELERY_WORKER_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s] %(message)s'
 CELERY_WORKER_TASK_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s][%(task_name)s(%(task_id)s)] %(message)s'
@@ -546,3 +587,118 @@ CELERY_WORKER_TASK_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s][%(
 # 在Docker环境中应设置为 http://backend:8000
 # 在本地开发环境中可以使用 http://localhost:8000
 BASE_URL = os.environ.get('DJANGO_BASE_URL', 'http://localhost:8000')
+
+# 知识库嵌入向量缓存配置
+# 按 (嵌入模型, 分块文本哈希) 缓存向量，重新处理文档时跳过未变化分块的嵌入请求
+# BACKEND: db（默认，存储在数据库）/ disk（本地 SQLite 文件）/ none（禁用）
+KNOWLEDGE_EMBEDDING_CACHE_BACKEND = os.environ.get('KNOWLEDGE_EMBEDDING_CACHE_BACKEND', 'db')
+KNOWLEDGE_EMBEDDING_CACHE_PATH = os.environ.get(
+    'KNOWLEDGE_EMBEDDING_CACHE_PATH',
+    str(BASE_DIR / '.cache' / 'embedding_cache.sqlite3')
+)
+KNOWLEDGE_EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('KNOWLEDGE_EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+
+# 知识库流式入库配置
+# 每批处理的分块数量：嵌入、写入 Qdrant、保存分块记录后提交一次检查点
+KNOWLEDGE_INGEST_BATCH_SIZE = int(os.environ.get('KNOWLEDGE_INGEST_BATCH_SIZE', '64'))
+
+# 知识库入库队列配置
+# 每个知识库同时处理的文档数量上限（0 表示不限制）
+KNOWLEDGE_INGEST_MAX_CONCURRENCY_PER_KB = int(os.environ.get('KNOWLEDGE_INGEST_MAX_CONCURRENCY_PER_KB', '2'))
+# 并发已满时重新入队的等待时间(秒)
+KNOWLEDGE_INGEST_SLOT_WAIT = int(os.environ.get('KNOWLEDGE_INGEST_SLOT_WAIT', '15'))
+# 失败重试的基础退避时间(秒)，按 2 的指数递增
+KNOWLEDGE_INGEST_RETRY_BACKOFF = int(os.environ.get('KNOWLEDGE_INGEST_RETRY_BACKOFF', '30'))
+
+# 项目级跨知识库检索配置
+# 总耗时预算(秒)，超时未返回的知识库结果被丢弃
+KNOWLEDGE_SEARCH_TIMEOUT = float(os.environ.get('KNOWLEDGE_SEARCH_TIMEOUT', '3.0'))
+# 并发检索线程数（进程内共享）
+KNOWLEDGE_SEARCH_MAX_WORKERS = int(os.environ.get('KNOWLEDGE_SEARCH_MAX_WORKERS', '8'))
+# 服务端融合（fusion_mode=server）是否额外查询稠密、稀疏两路排名以返回完整的 fusion_detail
+# 关闭时 fusion_detail 的 sources 为空、dense_score/sparse_score 为 null；两种融合模式的相似度分数相同，
+# 开启后每次检索的服务端查询量翻倍
+KNOWLEDGE_SERVER_FUSION_DETAIL = os.environ.get('KNOWLEDGE_SERVER_FUSION_DETAIL', 'False') == 'True'
+
+# 查询向量缓存配置
+# 按 (嵌入模型, 归一化查询文本) 缓存稠密/稀疏查询向量，重复查询跳过嵌入服务调用
+# MAX_ENTRIES 为进程内 LRU 容量（0 表示禁用），REDIS_URL 非空时在多个进程间共享
+KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES', '1024'))
+KNOWLEDGE_QUERY_CACHE_TTL = int(os.environ.get('KNOWLEDGE_QUERY_CACHE_TTL', '3600'))
+KNOWLEDGE_QUERY_CACHE_REDIS_URL = os.environ.get('KNOWLEDGE_QUERY_CACHE_REDIS_URL', '')
+
+# 本地嵌入模型配置（embedding_service='local'，FastEmbed/ONNX 在进程内推理）
+# 每个进程的推理线程数，0 表示由 ONNX Runtime 自动决定；
+# 离线部署需预先把模型放入 FASTEMBED_CACHE_PATH
+KNOWLEDGE_LOCAL_EMBEDDING_THREADS = int(os.environ.get('KNOWLEDGE_LOCAL_EMBEDDING_THREADS', '0'))
+# 启动时预热 BM25 稀疏编码器和本地嵌入模型：Web 进程在后台线程中加载，
+# Celery prefork worker 在主进程加载 BM25（子进程 fork 共享）、在各子进程加载本地嵌入模型
+KNOWLEDGE_PRELOAD_MODELS = os.environ.get('KNOWLEDGE_PRELOAD_MODELS', 'True') == 'True'
+
+# 文档解析进程池配置
+# PDF/DOCX/PPTX 等文件在独立进程中解析（0 表示在当前线程内解析）；
+# 超时按单次解析任务计算（非 PDF 为整个文件，PDF 为一个页段）；
+# 内存上限按单个解析进程的常驻内存（RSS）计算，超出后解析进程退出，本次解析的页面记为失败（0 表示不限制）
+KNOWLEDGE_PARSE_WORKERS = int(os.environ.get('KNOWLEDGE_PARSE_WORKERS', '2'))
+KNOWLEDGE_PARSE_TIMEOUT = int(os.environ.get('KNOWLEDGE_PARSE_TIMEOUT', '300'))
+KNOWLEDGE_PARSE_MEMORY_LIMIT_MB = int(os.environ.get('KNOWLEDGE_PARSE_MEMORY_LIMIT_MB', '2048'))
+# 多页 PDF 每个解析任务包含的页数
+KNOWLEDGE_PARSE_PDF_PAGES_PER_TASK = int(os.environ.get('KNOWLEDGE_PARSE_PDF_PAGES_PER_TASK', '8'))
+
+# 文档解析结果缓存配置
+# 按 (解析器, 文件 SHA-256) 缓存压缩后的解析文本，重新处理、内容预览和需求内容提取不再重复解析
+# BACKEND: db（默认，存储在数据库）/ disk（本地目录）/ none（禁用）
+KNOWLEDGE_PARSED_CONTENT_CACHE_BACKEND = os.environ.get('KNOWLEDGE_PARSED_CONTENT_CACHE_BACKEND', 'db')
+KNOWLEDGE_PARSED_CONTENT_CACHE_PATH = os.environ.get(
+    'KNOWLEDGE_PARSED_CONTENT_CACHE_PATH',
+    str(BASE_DIR / '.cache' / 'parsed_content')
+)
+KNOWLEDGE_PARSED_CONTENT_CACHE_MAX_ENTRIES = int(os.environ.get('KNOWLEDGE_PARSED_CONTENT_CACHE_MAX_ENTRIES', '2000'))
+
+# 向量量化检索配置
+# 知识库启用 scalar/binary 量化后，稠密检索先按 top_k × OVERSAMPLING 取量化候选，再用原始向量重排序
+KNOWLEDGE_QUANTIZATION_OVERSAMPLING = float(os.environ.get('KNOWLEDGE_QUANTIZATION_OVERSAMPLING', '2.0'))
+
+# 小知识库共享集合配置
+# 启用后新知识库的向量写入按 knowledge_base_id 分区的共享集合（租户索引，每个知识库单独建 HNSW 图），
+# 减少大量小知识库各自建集合的固定开销；分块数超过 PROMOTE 阈值时自动迁移到独立集合，
+# 低于 DEMOTE 阈值时迁回共享集合（入库完成后检查，也可执行 rebalance_vector_layout 命令）
+KNOWLEDGE_SHARED_COLLECTION_ENABLED = os.environ.get('KNOWLEDGE_SHARED_COLLECTION_ENABLED', 'False') == 'True'
+KNOWLEDGE_SHARED_COLLECTION_PROMOTE_CHUNKS = int(os.environ.get('KNOWLEDGE_SHARED_COLLECTION_PROMOTE_CHUNKS', '20000'))
+KNOWLEDGE_SHARED_COLLECTION_DEMOTE_CHUNKS = int(os.environ.get('KNOWLEDGE_SHARED_COLLECTION_DEMOTE_CHUNKS', '5000'))
+
+# 知识库检索结果缓存配置
+# 相同 (知识库, 查询, top_k, 阈值, 过滤条件) 的检索在 TTL 内直接返回缓存结果（0 表示禁用）；
+# 缓存键包含知识库版本号，文档入库、重新处理、删除后版本号递增，不会命中旧结果。
+# 版本号需要在 Web 进程与入库 worker 之间共享，默认使用 Celery broker 所在的 Redis 实例，
+# 但放在独立的数据库（KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_DB），缓存淘汰和清理不会影响 broker 队列
+KNOWLEDGE_QUERY_RESULT_CACHE_TTL = int(os.environ.get('KNOWLEDGE_QUERY_RESULT_CACHE_TTL', '300'))
+KNOWLEDGE_QUERY_RESULT_CACHE_ALIAS = 'knowledge'
+KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_DB = int(os.environ.get('KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_DB', '2'))
+KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_URL = os.environ.get(
+    'KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_URL',
+    urlsplit(CELERY_BROKER_URL)._replace(path=f'/{KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_DB}').geturl()
+    if CELERY_BROKER_URL.startswith(('redis://', 'rediss://')) else ''
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # 未配置 Redis 时使用进程内缓存，仅适用于 Web 与 worker 同进程的部署
+    'knowledge': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_URL,
+        'KEY_PREFIX': 'wharttest',
+    } if KNOWLEDGE_QUERY_RESULT_CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'knowledge',
+    },
+}
+
+# 查询日志缓冲写入配置
+# 检索请求只把查询日志放入进程内缓冲区，缓冲达到 BUFFER_SIZE 条或每隔 FLUSH_INTERVAL 秒批量写入（BUFFER_SIZE 为 0 表示同步写入）；
+# 进程正常退出时写入剩余日志，MAX_PENDING 为数据库不可用时缓冲区的最大条数
+KNOWLEDGE_QUERY_LOG_BUFFER_SIZE = int(os.environ.get('KNOWLEDGE_QUERY_LOG_BUFFER_SIZE', '100'))
+KNOWLEDGE_QUERY_LOG_FLUSH_INTERVAL = float(os.environ.get('KNOWLEDGE_QUERY_LOG_FLUSH_INTERVAL', '5'))
+KNOWLEDGE_QUERY_LOG_MAX_PENDING = int(os.environ.get('KNOWLEDGE_QUERY_LOG_MAX_PENDING', '10000'))
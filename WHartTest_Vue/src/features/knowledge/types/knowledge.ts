@@ -1,7 +1,7 @@
 /**
  * 嵌入服务类型
  */
-export type EmbeddingServiceType = 'openai' | 'azure_openai' | 'ollama' | 'custom';
+export type EmbeddingServiceType = 'openai' | 'azure_openai' | 'ollama' | 'custom' | 'local';
 
 /**
  * 嵌入服务选项接口
@@ -32,6 +32,11 @@ export const SERVICES_REQUIRING_API_CONFIG: EmbeddingServiceType[] = [
  * 获取字段验证规则
  */
 export const getRequiredFieldsForEmbeddingService = (embedding_service: string): string[] => {
+  // 本地模型在后端进程内推理，不需要API配置
+  if (embedding_service === 'local') {
+    return ['model_name'];
+  }
+
   const required: string[] = ['api_base_url', 'model_name'];
   
   if (embedding_service === 'openai' || embedding_service === 'azure_openai') {
@@ -52,11 +57,24 @@ export interface KnowledgeGlobalConfig {
   model_name: string;
   chunk_size: number;
   chunk_overlap: number;
+  embedding_batch_size?: number;
+  embedding_concurrency?: number;
+  embedding_dimension?: number | null;
   updated_at?: string;
   updated_by?: number;
   updated_by_name?: string;
 }
 
+/**
+ * 混合检索融合方式：client 在应用内 RRF 融合，server 使用 Qdrant Query API 服务端融合
+ */
+export type FusionMode = 'client' | 'server';
+
+/**
+ * 稠密向量量化方式
+ */
+export type QuantizationMode = 'none' | 'scalar' | 'binary';
+
 /**
  * 知识库对象（简化版，嵌入配置统一使用全局配置）
  */
@@ -71,6 +89,14 @@ export interface KnowledgeBase {
   is_active: boolean;
   chunk_size: number;
   chunk_overlap: number;
+  vector_dimension?: number | null;
+  fusion_mode?: FusionMode;
+  quantization?: QuantizationMode;
+  vectors_on_disk?: boolean;
+  payload_on_disk?: boolean;
+  hnsw_m?: number | null;
+  hnsw_ef_construct?: number | null;
+  vector_layout?: 'dedicated' | 'shared';
   document_count: number;
   chunk_count: number;
   created_at: string;
@@ -86,6 +112,12 @@ export interface CreateKnowledgeBaseRequest {
   project: number;
   chunk_size?: number;
   chunk_overlap?: number;
+  fusion_mode?: FusionMode;
+  quantization?: QuantizationMode;
+  vectors_on_disk?: boolean;
+  payload_on_disk?: boolean;
+  hnsw_m?: number | null;
+  hnsw_ef_construct?: number | null;
   is_active?: boolean;
 }
 
@@ -207,6 +239,9 @@ export interface QueryRequest {
   top_k?: number;
   similarity_threshold?: number;
   include_metadata?: boolean;
+  document_ids?: string[];
+  document_types?: DocumentType[];
+  metadata_filters?: Record<string, string | number | boolean | Array<string | number>>;
 }
 
 /**
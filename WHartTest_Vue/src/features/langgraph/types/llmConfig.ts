@@ -11,6 +11,8 @@ export interface LlmConfig {
   system_prompt?: string; // 系统提示词
   supports_vision?: boolean; // 是否支持图片/多模态输入
   context_limit?: number; // 上下文Token限制
+  requests_per_minute?: number; // 每分钟请求数限制，0 表示不限制
+  tokens_per_minute?: number; // 每分钟Token数限制，0 表示不限制
   is_active: boolean;
   created_at: string; // ISO 8601 date string
   updated_at: string; // ISO 8601 date string
@@ -28,6 +30,8 @@ export interface CreateLlmConfigRequest {
   system_prompt?: string; // 系统提示词（可选）
   supports_vision?: boolean; // 是否支持图片/多模态输入（可选）
   context_limit?: number; // 上下文Token限制（可选，默认8000）
+  requests_per_minute?: number; // 每分钟请求数限制（可选，0 表示不限制）
+  tokens_per_minute?: number; // 每分钟Token数限制（可选，0 表示不限制）
   is_active?: boolean; // 可选,布尔值, 默认为 false
 }
 
@@ -48,5 +52,7 @@ export interface PartialUpdateLlmConfigRequest {
   system_prompt?: string; // 系统提示词（可选）
   supports_vision?: boolean; // 是否支持图片/多模态输入（可选）
   context_limit?: number; // 上下文Token限制（可选）
+  requests_per_minute?: number; // 每分钟请求数限制（可选）
+  tokens_per_minute?: number; // 每分钟Token数限制（可选）
   is_active?: boolean;
 }
\ No newline at end of file
@@ -8,6 +8,8 @@ export type PromptType =
   | 'testability_analysis'
   | 'feasibility_analysis'
   | 'clarity_analysis'
+  | 'global_analysis'
+  | 'module_analysis'
   | 'test_case_execution'
   | 'brain_orchestrator'
   | 'diagram_generation';
@@ -22,6 +24,8 @@ export const PROMPT_TYPE_CHOICES = [
   { key: 'testability_analysis', name: '可测性分析', isProgramCall: true },
   { key: 'feasibility_analysis', name: '可行性分析', isProgramCall: true },
   { key: 'clarity_analysis', name: '清晰度分析', isProgramCall: true },
+  { key: 'global_analysis', name: '全局结构分析', isProgramCall: true },
+  { key: 'module_analysis', name: '模块分析', isProgramCall: true },
   { key: 'test_case_execution', name: '测试用例执行', isProgramCall: true },
   { key: 'brain_orchestrator', name: '智能规划', isProgramCall: false },
   { key: 'diagram_generation', name: '图表生成', isProgramCall: true },
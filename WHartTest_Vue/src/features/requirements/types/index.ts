@@ -192,6 +192,7 @@ export interface StartReviewRequest {
   custom_requirements?: string;
   direct_review?: boolean; // 新增直接评审参数
   max_workers?: number; // 新增并发数参数
+  incremental?: boolean; // 增量评审：只重新分析上次评审后变更的模块
   // 新增提示词相关参数
   prompt_ids?: {
     completeness_analysis?: number;